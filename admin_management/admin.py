@@ -2,13 +2,15 @@
 Custom admin registrations for AltarFunds models
 """
 
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.template.response import TemplateResponse
 from django.utils.html import format_html
 from django.db.models import Count, Sum, Avg
 from django.utils.safestring import mark_safe
 from django.urls import reverse
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
 
 from churches.models import Church
 from accounts.models import User
@@ -63,13 +65,14 @@ class ChurchAdmin(admin.ModelAdmin):
     )
     
     readonly_fields = ('member_count', 'total_giving')
+    actions = ['import_envelope_offerings']
     
     def member_count(self, obj):
         return obj.member_count
     member_count.short_description = 'Members'
     
     def total_giving(self, obj):
-        total = obj.givingtransaction_set.aggregate(
+        total = obj.giving_transactions.aggregate(
             total=Sum('amount')
         )['total'] or 0
         return f'${total:,.2f}'
@@ -84,6 +87,59 @@ class ChurchAdmin(admin.ModelAdmin):
             '<span style="color: #f59e0b;">⏳ Pending</span>'
         )
     verification_status.short_description = 'Status'
+    
+    def import_envelope_offerings(self, request, queryset):
+        # Intermediate page: upload a CSV of cash / check envelopes for one church
+        from giving.offerings import OfferingImportError, import_offerings, parse_csv
+        
+        if queryset.count() != 1:
+            self.message_user(request, 'Select exactly one church to import offerings for.', messages.WARNING)
+            return None
+        church = queryset.get()
+        
+        errors = []
+        if request.POST.get('apply'):
+            upload = request.FILES.get('file')
+            if not upload:
+                errors = [{'row': None, 'errors': ['Choose a CSV file to upload.']}]
+            else:
+                try:
+                    service_date = request.POST.get('service_date') or None
+                    summary = import_offerings(
+                        church, request.user, parse_csv(upload),
+                        service_date=date.fromisoformat(service_date) if service_date else None,
+                        notify=bool(request.POST.get('notify')),
+                        dry_run=bool(request.POST.get('dry_run')),
+                        ip_address=request.META.get('REMOTE_ADDR'),
+                    )
+                    if summary['dry_run']:
+                        self.message_user(
+                            request,
+                            f"{summary['count']} offerings (KES {summary['total_amount']:,.2f}) are valid; nothing was saved."
+                        )
+                    else:
+                        self.message_user(
+                            request,
+                            f"Imported {summary['count']} offerings (KES {summary['total_amount']:,.2f}) "
+                            f"for {church.name} as {summary['batch_reference']}."
+                        )
+                    return None
+                except OfferingImportError as e:
+                    errors = e.errors or [{'row': None, 'errors': [str(e)]}]
+                except (ValueError, UnicodeDecodeError) as e:
+                    errors = [{'row': None, 'errors': [f'Could not read the file: {e}']}]
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'Import envelope offerings for {church.name}',
+            'church': church,
+            'errors': errors,
+            'opts': self.model._meta,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            'today': timezone.localdate(),
+        }
+        return TemplateResponse(request, 'admin/giving/import_offerings.html', context)
+    import_envelope_offerings.short_description = 'Import envelope offerings (CSV)'
 
 
 @admin.register(GivingTransaction, site=altar_admin_site)
@@ -166,12 +222,21 @@ class GivingTransactionAdmin(admin.ModelAdmin):
     status_badge.short_description = 'Status'
     
     def mark_as_completed(self, request, queryset):
-        updated = queryset.update(status='completed')
+        # Save individually so the daily giving rollups see the status change
+        updated = 0
+        for giving in queryset.exclude(status='completed'):
+            giving.status = 'completed'
+            giving.save(update_fields=['status', 'updated_at'])
+            updated += 1
         self.message_user(request, f'{updated} transactions marked as completed.')
     mark_as_completed.short_description = 'Mark selected as completed'
     
     def mark_as_failed(self, request, queryset):
-        updated = queryset.update(status='failed')
+        updated = 0
+        for giving in queryset.exclude(status='failed'):
+            giving.status = 'failed'
+            giving.save(update_fields=['status', 'updated_at'])
+            updated += 1
         self.message_user(request, f'{updated} transactions marked as failed.')
     mark_as_failed.short_description = 'Mark selected as failed'
     
@@ -1,22 +1,222 @@
-from django.core.cache import cache
+"""
+Response cache for dashboard and report endpoints.
+
+Cached responses are keyed by endpoint, church scope, role (and optionally
+user) and the query string. Every key also embeds the scope's *version*
+number: writes that change a church's figures (``GivingTransaction``,
+``Expense``, ``Budget``) call ``invalidate_cache(church_id)``, which bumps
+that church's version and the platform-wide version. Old entries are never
+looked up again and simply expire, so invalidation never scans keys.
+
+Misses are computed by a single request per key (a short ``cache.add``
+lock); concurrent requests for the same key wait briefly for the value
+instead of all hitting the database. Hits and misses are counted per
+endpoint — see ``cache_stats()``.
+
+Entries live in the ``responses`` cache alias. The cache is best effort: if
+the backend is unreachable the view is simply computed.
+
+Usage:
+    @api_view(['GET'])
+    @permission_classes([IsAuthenticated])
+    @cache_response(timeout=300, key_prefix='dashboard_summary')
+    def financial_summary(request):
+        ...
+"""
+from django.core.cache import caches
+from django.db import transaction
 from functools import wraps
+from rest_framework.response import Response
 import hashlib
-import json
+import logging
+import time
+
+logger = logging.getLogger('altar_funds')
+
+# Settings alias of the response cache (Redis in production, locmem in tests)
+CACHE_ALIAS = 'responses'
+
+VERSION_KEY = 'cache_version:{scope}'
+STATS_KEY = 'cache_stats:{prefix}:{kind}'
+LOCK_TIMEOUT = 30        # seconds a recompute lock is held at most
+LOCK_WAIT = 2.0          # seconds a request waits for another request's recompute
+LOCK_POLL_INTERVAL = 0.05
+
+# Prefixes registered through cache_response, for cache_stats()
+CACHED_ENDPOINTS = set()
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _scope_name(church_id):
+    return f'church:{church_id}' if church_id else 'all'
+
+
+def _count(prefix, kind):
+    """Increment a hit/miss counter shared by all processes."""
+    key = STATS_KEY.format(prefix=prefix, kind=kind)
+    try:
+        try:
+            _cache().incr(key)
+        except ValueError:
+            # Counter does not exist yet (or was evicted)
+            if not _cache().add(key, 1, timeout=None):
+                _cache().incr(key)
+    except Exception as e:
+        logger.warning(f"Cache counter update failed: {str(e)}")
+
+
+def _seed_version():
+    # Seeded from the clock so that a version key lost to eviction or a
+    # cache flush can never come back as a number used before.
+    return int(time.time() * 1000)
+
+
+def get_version(church_id=None):
+    """Current cache version for a church (``None`` = platform-wide)."""
+    key = VERSION_KEY.format(scope=_scope_name(church_id))
+    version = _cache().get(key)
+    if version is None:
+        _cache().add(key, _seed_version(), timeout=None)
+        version = _cache().get(key) or _seed_version()
+    return version
+
+
+def _bump(scope):
+    key = VERSION_KEY.format(scope=scope)
+    try:
+        _cache().incr(key)
+    except ValueError:
+        if not _cache().add(key, _seed_version(), timeout=None):
+            _cache().incr(key)
 
-def cache_response(timeout=300, key_prefix=''):
-    """Cache decorator for API responses"""
+
+def invalidate_cache(church_id=None):
+    """
+    Invalidate cached responses for a church and the platform-wide views.
+
+    Runs after the current transaction commits, so a rolled-back write does
+    not evict anything and readers never re-cache pre-commit data.
+    """
+    def _invalidate():
+        try:
+            if church_id:
+                _bump(_scope_name(church_id))
+            _bump(_scope_name(None))
+        except Exception as e:
+            logger.warning(f"Cache invalidation failed for church {church_id}: {str(e)}")
+
+    transaction.on_commit(_invalidate)
+
+
+def request_church_scope(request, church_param='church_id'):
+    """
+    Church whose data a request reads.
+
+    System admins may pick a church with ``church_param`` (or see every
+    church when it is absent); everybody else is pinned to their own church.
+    """
+    user = request.user
+    if getattr(user, 'role', None) == 'system_admin':
+        return request.query_params.get(church_param) or None
+    return getattr(user, 'church_id', None)
+
+
+def _cache_key(prefix, request, scope, version, per_user):
+    user = request.user
+    query = '&'.join(f"{key}={value}" for key, value in sorted(request.query_params.lists()))
+    digest = hashlib.md5(f"{request.path}?{query}".encode()).hexdigest()
+    user_part = f":u{user.pk}" if per_user else ''
+    return f"resp:{prefix}:{scope}:v{version}:{getattr(user, 'role', '')}{user_part}:{digest}"
+
+
+def cache_response(timeout=300, key_prefix='', per_user=False, platform_wide=False):
+    """
+    Cache successful DRF responses of a function-based view.
+
+    Apply below ``@api_view``/``@permission_classes`` so the request is
+    already authenticated. ``per_user`` (a bool, or a callable taking the
+    request) adds the user to the key for views whose data depends on who is
+    asking rather than just their church and role;
+    ``platform_wide`` ignores the caller's church for views that aggregate
+    every church.
+    """
     def decorator(func):
+        prefix = key_prefix or func.__name__
+        CACHED_ENDPOINTS.add(prefix)
+
         @wraps(func)
-        def wrapper(*args, **kwargs):
-            cache_key = f"{key_prefix}:{func.__name__}:{hashlib.md5(json.dumps(str(args) + str(kwargs)).encode()).hexdigest()}"
-            result = cache.get(cache_key)
-            if result is None:
-                result = func(*args, **kwargs)
-                cache.set(cache_key, result, timeout)
-            return result
+        def wrapper(request, *args, **kwargs):
+            church_id = None if platform_wide else request_church_scope(request)
+            scope = _scope_name(church_id)
+
+            try:
+                user_scoped = per_user(request) if callable(per_user) else per_user
+                cache_key = _cache_key(prefix, request, scope, get_version(church_id), user_scoped)
+                data = _cache().get(cache_key)
+            except Exception as e:
+                logger.warning(f"Response cache unavailable: {str(e)}")
+                return func(request, *args, **kwargs)
+
+            if data is not None:
+                _count(prefix, 'hits')
+                return Response(data, headers={'X-Cache': 'HIT'})
+
+            # Only one request recomputes a key; the others wait for its result.
+            lock_key = f"{cache_key}:lock"
+            try:
+                locked = _cache().add(lock_key, 1, LOCK_TIMEOUT)
+            except Exception:
+                locked = False
+            if not locked:
+                deadline = time.monotonic() + LOCK_WAIT
+                while time.monotonic() < deadline:
+                    time.sleep(LOCK_POLL_INTERVAL)
+                    data = _cache().get(cache_key)
+                    if data is not None:
+                        _count(prefix, 'hits')
+                        return Response(data, headers={'X-Cache': 'HIT'})
+
+            _count(prefix, 'misses')
+            try:
+                response = func(request, *args, **kwargs)
+                if isinstance(response, Response) and response.status_code == 200:
+                    try:
+                        _cache().set(cache_key, response.data, timeout)
+                    except Exception as e:
+                        logger.warning(f"Failed to cache response for {prefix}: {str(e)}")
+                    response['X-Cache'] = 'MISS'
+                return response
+            finally:
+                if locked:
+                    try:
+                        _cache().delete(lock_key)
+                    except Exception:
+                        pass
+
         return wrapper
     return decorator
 
-def invalidate_cache(key_pattern):
-    """Invalidate cache by pattern"""
-    cache.delete_pattern(key_pattern)
+
+def cache_stats(prefixes=None):
+    """Hit/miss counters per cached endpoint."""
+    prefixes = sorted(prefixes or CACHED_ENDPOINTS)
+    keys = {
+        (prefix, kind): STATS_KEY.format(prefix=prefix, kind=kind)
+        for prefix in prefixes for kind in ('hits', 'misses')
+    }
+    values = _cache().get_many(list(keys.values()))
+
+    stats = {}
+    for prefix in prefixes:
+        hits = values.get(keys[(prefix, 'hits')], 0)
+        misses = values.get(keys[(prefix, 'misses')], 0)
+        total = hits + misses
+        stats[prefix] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total * 100, 2) if total else 0,
+        }
+    return stats
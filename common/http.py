@@ -0,0 +1,263 @@
+"""
+Shared HTTP client for payment provider APIs (Paystack, M-Pesa).
+
+Every provider service talks to its API through a ``ProviderClient``:
+
+* one keep-alive ``requests.Session`` per provider and host, with its own
+  connection pool, so repeated calls reuse TCP/TLS connections instead of
+  paying a new handshake each time (sessions are rebuilt after a fork);
+* a default ``(connect, read)`` timeout on every call;
+* automatic retries with exponential backoff for idempotent methods (GET,
+  HEAD, PUT, DELETE, OPTIONS) on connection errors, read errors, 429 and
+  5xx responses. Non-idempotent calls (POST) are only retried when the
+  connection could not be established, i.e. before anything was sent;
+* per-provider request, error and latency counters, kept in process
+  memory and added to the shared ``responses`` cache at most once per
+  ``METRICS_FLUSH_INTERVAL`` — see ``provider_metrics()``;
+* when ``PROVIDER_SIMULATOR_URL`` is set, every call goes to the offline
+  provider simulator instead (see ``common.provider_simulator``).
+
+Responses and exceptions are plain ``requests`` objects, so callers keep
+their ``raise_for_status()`` / ``RequestException`` handling.
+
+Usage:
+    from common.http import ProviderClient
+
+    http = ProviderClient('paystack')
+    response = http.get(f"{BASE_URL}/bank", headers=headers, params={'country': 'kenya'})
+"""
+from urllib.parse import urlsplit
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger('altar_funds')
+
+DEFAULT_TIMEOUT = getattr(settings, 'PROVIDER_HTTP_TIMEOUT', (5, 30))   # (connect, read) seconds
+POOL_SIZE = getattr(settings, 'PROVIDER_HTTP_POOL_SIZE', 20)             # keep-alive connections per host
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5                 # 0.5s, 1s, 2s between retries
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+SLOW_CALL_SECONDS = 5
+
+METRICS_CACHE_ALIAS = 'responses'
+METRICS_KEY = 'http_stats:{provider}:{field}'
+METRICS_FLUSH_INTERVAL = getattr(settings, 'PROVIDER_METRICS_FLUSH_INTERVAL', 10)   # seconds
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = (100, 300, 1000, 3000)
+
+# Providers with a client in this process, for provider_metrics()
+KNOWN_PROVIDERS = set()
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_sessions_pid = None
+
+# Counter increments not yet added to the cache: (provider, field) -> delta
+_pending_metrics = {}
+_metrics_lock = threading.Lock()
+_metrics_pid = None
+_metrics_flushed_at = 0.0
+
+
+def _retry_policy():
+    return Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=MAX_RETRIES,
+        status=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=IDEMPOTENT_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def _build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=_retry_policy())
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(provider, url):
+    """The pooled session for ``provider`` and the host of ``url``."""
+    global _sessions_pid
+
+    parts = urlsplit(url)
+    key = (provider, parts.scheme, parts.netloc)
+    with _sessions_lock:
+        if _sessions_pid != os.getpid():
+            # Connections must not be shared with a parent process
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = _build_session()
+    return session
+
+
+def close_sessions():
+    """Close every pooled connection of this process."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _metrics_cache():
+    return caches[METRICS_CACHE_ALIAS]
+
+
+def _incr(key, delta=1):
+    cache = _metrics_cache()
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Counter does not exist yet (or was evicted)
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+def _bucket(elapsed_ms):
+    for bound in LATENCY_BUCKETS:
+        if elapsed_ms < bound:
+            return f"lt_{bound}ms"
+    return f"ge_{LATENCY_BUCKETS[-1]}ms"
+
+
+def _take_pending(force):
+    """Swap out the pending increments if a flush is due; called with the lock held."""
+    global _pending_metrics, _metrics_flushed_at
+
+    now = time.monotonic()
+    if not _pending_metrics or (not force and now - _metrics_flushed_at < METRICS_FLUSH_INTERVAL):
+        return None
+    pending, _pending_metrics = _pending_metrics, {}
+    _metrics_flushed_at = now
+    return pending
+
+
+def _flush(pending):
+    try:
+        for (provider, field), delta in pending.items():
+            _incr(METRICS_KEY.format(provider=provider, field=field), delta)
+    except Exception as e:
+        logger.warning(f"HTTP metrics update failed: {str(e)}")
+
+
+def flush_metrics():
+    """Add this process's pending counters to the shared cache now."""
+    with _metrics_lock:
+        pending = _take_pending(force=True)
+    if pending:
+        _flush(pending)
+
+
+def record_call(provider, elapsed, failed):
+    """Count one provider call in memory (best effort; never raises)."""
+    global _metrics_pid
+
+    elapsed_ms = int(elapsed * 1000)
+    fields = [('requests', 1), ('latency_ms', elapsed_ms), (_bucket(elapsed_ms), 1)]
+    if failed:
+        fields.append(('errors', 1))
+    with _metrics_lock:
+        if _metrics_pid != os.getpid():
+            # Counts inherited from a parent process are the parent's to flush
+            _pending_metrics.clear()
+            _metrics_pid = os.getpid()
+        for field, delta in fields:
+            _pending_metrics[(provider, field)] = _pending_metrics.get((provider, field), 0) + delta
+        pending = _take_pending(force=False)
+    # Cache round trips happen outside the lock
+    if pending:
+        _flush(pending)
+
+
+atexit.register(flush_metrics)
+
+
+def provider_metrics(providers=None):
+    """Request count, error count and rate, mean latency and latency histogram per provider."""
+    flush_metrics()
+    providers = sorted(providers or KNOWN_PROVIDERS)
+    buckets = [_bucket(bound - 1) for bound in LATENCY_BUCKETS] + [_bucket(LATENCY_BUCKETS[-1])]
+    fields = ['requests', 'errors', 'latency_ms'] + buckets
+    keys = {
+        (provider, field): METRICS_KEY.format(provider=provider, field=field)
+        for provider in providers for field in fields
+    }
+    values = _metrics_cache().get_many(list(keys.values()))
+
+    metrics = {}
+    for provider in providers:
+        count = values.get(keys[(provider, 'requests')], 0)
+        errors = values.get(keys[(provider, 'errors')], 0)
+        latency = values.get(keys[(provider, 'latency_ms')], 0)
+        metrics[provider] = {
+            'requests': count,
+            'errors': errors,
+            'error_rate': round(errors / count * 100, 2) if count else 0,
+            'avg_latency_ms': round(latency / count, 1) if count else 0,
+            'latency_histogram': {bucket: values.get(keys[(provider, bucket)], 0) for bucket in buckets},
+        }
+    return metrics
+
+
+def simulated_url(provider, url):
+    """``url`` routed to the provider simulator, if ``PROVIDER_SIMULATOR_URL`` is set."""
+    base = getattr(settings, 'PROVIDER_SIMULATOR_URL', '')
+    if not base:
+        return url
+    parts = urlsplit(url)
+    query = f"?{parts.query}" if parts.query else ''
+    return f"{base.rstrip('/')}/{provider}{parts.path}{query}"
+
+
+class ProviderClient:
+    """HTTP calls to one provider's API over pooled, retrying sessions."""
+
+    def __init__(self, provider, timeout=None):
+        self.provider = provider
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        KNOWN_PROVIDERS.add(provider)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        url = simulated_url(self.provider, url)
+        session = get_session(self.provider, url)
+        started = time.monotonic()
+        failed = True
+        try:
+            response = session.request(method, url, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            elapsed = time.monotonic() - started
+            record_call(self.provider, elapsed, failed)
+            if elapsed >= SLOW_CALL_SECONDS:
+                logger.warning(f"Slow {self.provider} call: {method} {urlsplit(url).path} took {elapsed:.1f}s")
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
@@ -0,0 +1,142 @@
+"""
+Idempotency-Key support for endpoints that create payments.
+
+Mobile clients on flaky networks resend POSTs they never saw an answer to.
+A client that sends an ``Idempotency-Key`` header (any unique string, e.g.
+a UUID per checkout attempt) gets the original response back for every
+repeat of the request, instead of a new transaction and a new provider
+call:
+
+* the first response (anything but a 5xx) is stored in the ``responses``
+  cache (Redis in production) for ``IDEMPOTENCY_KEY_TTL_HOURS``, keyed by
+  endpoint, user and key, with a fingerprint of the request body;
+* a repeat with the same body replays it with ``Idempotent-Replayed: true``;
+  the same key with a different body is rejected (422);
+* concurrent duplicates are serialized by a ``cache.add`` lock: the
+  duplicate waits briefly for the first request's response, and gets a 409
+  if it is still running.
+
+Requests without the header behave as before. The store is best effort: if
+the cache backend is unreachable the view simply runs.
+
+Usage:
+    @api_view(['POST'])
+    @permission_classes([IsAuthenticated])
+    @idempotent(key_prefix='create_giving_transaction')
+    def create_giving_transaction(request):
+        ...
+"""
+from django.conf import settings
+from django.core.cache import caches
+from functools import wraps
+from rest_framework import status
+from rest_framework.response import Response
+import hashlib
+import json
+import logging
+import time
+
+logger = logging.getLogger('altar_funds')
+
+CACHE_ALIAS = 'responses'
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+RESULT_KEY = 'idempotency:{prefix}:u{user}:{digest}'
+MAX_KEY_LENGTH = 255
+LOCK_TIMEOUT = 60        # seconds a request holds its key at most (covers provider calls)
+LOCK_WAIT = 10.0         # seconds a duplicate waits for the first request's response
+LOCK_POLL_INTERVAL = 0.1
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _ttl():
+    return int(getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24)) * 3600
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path} {body}".encode()).hexdigest()
+
+
+def _replay(stored, fingerprint):
+    if stored['fingerprint'] != fingerprint:
+        return Response({
+            'success': False,
+            'message': f'{HEADER} was already used for a different request',
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(stored['data'], status=stored['status'], headers={REPLAY_HEADER: 'true'})
+
+
+def idempotent(key_prefix=''):
+    """
+    Replay the stored response of a function-based view for a repeated ``Idempotency-Key``.
+
+    Apply below ``@api_view``/``@permission_classes`` so the request is
+    already authenticated; keys are scoped to the user.
+    """
+    def decorator(func):
+        prefix = key_prefix or func.__name__
+
+        @wraps(func)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return func(request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response({
+                    'success': False,
+                    'message': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters',
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+            result_key = RESULT_KEY.format(prefix=prefix, user=request.user.pk, digest=digest)
+            lock_key = f"{result_key}:lock"
+            fingerprint = _fingerprint(request)
+
+            try:
+                stored = _cache().get(result_key)
+                locked = stored is None and _cache().add(lock_key, 1, LOCK_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"Idempotency store unavailable: {str(e)}")
+                return func(request, *args, **kwargs)
+
+            if stored is not None:
+                return _replay(stored, fingerprint)
+
+            if not locked:
+                # A duplicate of a request still running: wait for its response
+                deadline = time.monotonic() + LOCK_WAIT
+                while time.monotonic() < deadline:
+                    time.sleep(LOCK_POLL_INTERVAL)
+                    stored = _cache().get(result_key)
+                    if stored is not None:
+                        return _replay(stored, fingerprint)
+                return Response({
+                    'success': False,
+                    'message': f'A request with this {HEADER} is still being processed',
+                }, status=status.HTTP_409_CONFLICT)
+
+            try:
+                response = func(request, *args, **kwargs)
+                # Server errors are not stored, so the client can retry with the same key
+                if isinstance(response, Response) and response.status_code < 500:
+                    try:
+                        _cache().set(result_key, {
+                            'fingerprint': fingerprint,
+                            'status': response.status_code,
+                            'data': response.data,
+                        }, _ttl())
+                    except Exception as e:
+                        logger.warning(f"Failed to store idempotent response for {prefix}: {str(e)}")
+                return response
+            finally:
+                try:
+                    _cache().delete(lock_key)
+                except Exception:
+                    pass
+
+        return wrapper
+    return decorator
@@ -0,0 +1,62 @@
+"""
+Management command: serve the offline Paystack / M-Pesa / FCM simulator.
+
+Point a backend at it with ``PROVIDER_SIMULATOR_URL=http://localhost:8765``;
+webhooks go back to ``PROVIDER_SIMULATOR_WEBHOOK_URL`` (or ``--webhook-url``).
+
+Usage:
+    python manage.py run_provider_simulator --port 8765
+
+    # 150 ms per call, 2 % outages, 5 % declined payments and transfers
+    python manage.py run_provider_simulator --latency 0.15 --error-rate 0.02 --decline-rate 0.05
+
+    # Complete every checkout as soon as it is initialized
+    python manage.py run_provider_simulator --auto-pay
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Serve the offline provider simulator (Paystack, M-Pesa Daraja, FCM)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+        parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+        parser.add_argument('--webhook-url', default=None,
+                            help='Base URL of the backend receiving webhooks (default: PROVIDER_SIMULATOR_WEBHOOK_URL)')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every call')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Random extra seconds per call, up to this much')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of calls answered with a 503')
+        parser.add_argument('--decline-rate', type=float, default=0.0, help='Share of payments and transfers that fail')
+        parser.add_argument('--webhook-delay', type=float, default=1.0, help='Seconds before outcomes are reported back')
+        parser.add_argument('--auto-pay', action='store_true', help='Pay every initialized transaction immediately')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed, for reproducible runs')
+
+    def handle(self, *args, **options):
+        from common.provider_simulator import ProviderSimulator
+
+        webhook_url = options['webhook_url'] or getattr(settings, 'PROVIDER_SIMULATOR_WEBHOOK_URL', None)
+        simulator = ProviderSimulator(
+            webhook_target=webhook_url,
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            decline_rate=options['decline_rate'],
+            webhook_delay=options['webhook_delay'],
+            auto_pay=options['auto_pay'],
+            seed=options['seed'],
+        )
+        server = simulator.make_server(options['host'], options['port'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Provider simulator listening on http://{options['host']}:{server.server_port}, "
+            f"webhooks to {webhook_url or 'the callback URLs as given'}"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Stats: {simulator.stats()}")
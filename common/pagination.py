@@ -1,5 +1,12 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -27,3 +34,102 @@ class SmallResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 50
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over a fixed, unique ordering.
+
+    Each page is fetched with a ``WHERE (a, b) < (last_a, last_b)`` style
+    predicate instead of an OFFSET, so page N costs the same as page 1 as
+    long as an index covers ``ordering``. The cursor is an opaque token
+    encoding the ordering values of the last row served.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    # Last field must be unique (normally the primary key) to break ties.
+    ordering = ('-transaction_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request, queryset.model)
+
+        queryset = queryset.order_by(*self.ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self._after_cursor_q(self.cursor))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        self.next_cursor = (
+            self.encode_cursor([self._value(self.page[-1], field) for field in self.ordering])
+            if self.has_next else None
+        )
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'links': {
+                'next': self.get_next_link(),
+                'previous': None
+            },
+            'next_cursor': self.next_cursor,
+            'has_more': self.has_next,
+            'page_size': self.page_size,
+            'results': data
+        })
+
+    # ── cursor encoding ──────────────────────────────────────────────────────
+
+    def encode_cursor(self, values):
+        raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            if len(values) != len(self.ordering):
+                raise ValueError('cursor length mismatch')
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, UnicodeDecodeError, DjangoValidationError):
+            raise NotFound('Invalid cursor')
+
+    # ── helpers ──────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _value(obj, field):
+        return getattr(obj, field.lstrip('-'))
+
+    def _after_cursor_q(self, cursor):
+        """Rows strictly after ``cursor`` in ``ordering`` (lexicographic tuple comparison)."""
+        condition = Q()
+        equal_prefix = Q()
+        for field, value in zip(self.ordering, cursor):
+            name = field.lstrip('-')
+            op = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal_prefix & Q(**{f'{name}__{op}': value})
+            equal_prefix &= Q(**{name: value})
+        return condition
@@ -0,0 +1,169 @@
+"""
+Concurrent status checks against payment provider APIs.
+
+Jobs that ask a provider about many payments or transfers (stuck gift
+verification, disbursement retries) hand ``poll`` a list of items and a
+function doing one provider call per item. ``poll`` runs the calls on a
+thread pool and:
+
+* never runs more than the provider's concurrency limit at once in this
+  process (``PROVIDER_POLL_CONCURRENCY``), shared by all running jobs;
+* starts at most the provider's rate (``PROVIDER_POLL_RATE`` calls per
+  second, token bucket with a one-second burst), per process;
+* stops at the deadline: items not started by then are returned as
+  ``skipped`` for the next run; calls still in flight are abandoned and
+  reported as errors (``DeadlineExceeded``), since their outcome is unknown.
+
+The call function should only talk to the provider — no database work —
+so that the caller can apply all outcomes together afterwards.
+
+Usage:
+    from common.polling import poll
+
+    outcome = poll(references, fetch_status, provider='paystack', deadline=50)
+    for reference, data in outcome.results: ...
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger('altar_funds')
+
+DEFAULT_DEADLINE = 50               # seconds a poll may run
+DEFAULT_CONCURRENCY = {'paystack': 16, 'mpesa': 4}
+DEFAULT_RATE = {'paystack': 25, 'mpesa': 5}      # calls per second
+FALLBACK_CONCURRENCY = 4
+FALLBACK_RATE = 5
+
+PollOutcome = namedtuple('PollOutcome', ['results', 'errors', 'skipped', 'seconds'])
+
+
+class DeadlineExceeded(Exception):
+    """A provider call was still running when the poll's deadline passed."""
+
+_limits = {}
+_limits_lock = threading.Lock()
+
+
+def concurrency(provider):
+    limits = getattr(settings, 'PROVIDER_POLL_CONCURRENCY', DEFAULT_CONCURRENCY)
+    return max(int(limits.get(provider, FALLBACK_CONCURRENCY)), 1)
+
+
+def rate(provider):
+    rates = getattr(settings, 'PROVIDER_POLL_RATE', DEFAULT_RATE)
+    return max(float(rates.get(provider, FALLBACK_RATE)), 0.1)
+
+
+class RateLimiter:
+    """Thread-safe token bucket: ``rate`` calls per second, bursts of up to ``rate``."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """Take a token, waiting for one; False if none is free before ``deadline`` (monotonic)."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+def _provider_limits(provider):
+    """(semaphore, rate limiter) of ``provider``, shared by every poll in this process."""
+    with _limits_lock:
+        limits = _limits.get(provider)
+        if limits is None:
+            limits = _limits[provider] = (
+                threading.BoundedSemaphore(concurrency(provider)),
+                RateLimiter(rate(provider)),
+            )
+    return limits
+
+
+_SKIPPED = object()
+
+
+def poll(items, call, provider, deadline=None):
+    """
+    Run ``call(item)`` for every item, concurrently and within limits.
+
+    Returns a ``PollOutcome``: ``results`` as ``(item, return value)``
+    pairs, ``errors`` as ``(item, exception)`` pairs, ``skipped`` items
+    (not started before the deadline) and the elapsed seconds.
+    """
+    items = list(items)
+    started = time.monotonic()
+    if not items:
+        return PollOutcome([], [], [], 0.0)
+    stop_at = started + (deadline or DEFAULT_DEADLINE)
+    semaphore, limiter = _provider_limits(provider)
+
+    started_calls = set()
+
+    def run(index):
+        if time.monotonic() >= stop_at or not limiter.acquire(stop_at):
+            return _SKIPPED
+        with semaphore:
+            # Counted as started before the last check, so a call racing the
+            # deadline is never reported as safely skipped
+            started_calls.add(index)
+            if time.monotonic() >= stop_at:
+                return _SKIPPED
+            return call(items[index])
+
+    results, errors, skipped = [], [], []
+    finished = set()
+    executor = ThreadPoolExecutor(
+        max_workers=min(concurrency(provider), len(items)),
+        thread_name_prefix=f"poll-{provider}",
+    )
+    futures = {executor.submit(run, index): index for index in range(len(items))}
+    try:
+        for future in as_completed(futures, timeout=max(stop_at - time.monotonic(), 0)):
+            index = futures[future]
+            finished.add(index)
+            try:
+                value = future.result()
+            except Exception as e:
+                errors.append((items[index], e))
+                continue
+            if value is _SKIPPED:
+                skipped.append(items[index])
+            else:
+                results.append((items[index], value))
+    except TimeoutError:
+        for index, item in enumerate(items):
+            if index in finished:
+                continue
+            if index in started_calls:
+                errors.append((item, DeadlineExceeded(f"{provider} call unfinished at the deadline")))
+            else:
+                skipped.append(item)
+        logger.warning(f"{provider} poll reached its deadline with {len(items) - len(finished)} items left")
+    finally:
+        # Calls still in flight finish in the background; their results are dropped
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"{provider} poll: {len(results)} results, {len(errors)} errors, "
+        f"{len(skipped)} skipped in {elapsed:.1f}s"
+    )
+    return PollOutcome(results, errors, skipped, elapsed)
@@ -0,0 +1,661 @@
+"""
+Offline stand-in for the Paystack, M-Pesa Daraja and FCM APIs.
+
+``ProviderSimulator`` is a small WSGI application implementing the subset
+of provider endpoints the backend uses, so the giving flow can be run and
+load-tested without touching the live APIs:
+
+* Paystack: ``transaction/initialize``, ``transaction/verify/<ref>``,
+  ``transaction`` (list), ``bank``, ``transferrecipient``, ``transfer``,
+  ``transfer/bulk`` and ``transfer/verify/<ref>``;
+* Daraja: ``oauth/v1/generate``, STK push and STK query, B2C payment request;
+* FCM HTTP v1: ``v1/projects/<project>/messages:send``.
+
+Routes are the provider's own paths under ``/<provider>/``. Setting
+``PROVIDER_SIMULATOR_URL`` points every ``common.http.ProviderClient`` (and
+push delivery) at the simulator, without other configuration changes.
+
+Latency and failures are configurable per provider: ``latency`` and
+``jitter`` (seconds per call), ``error_rate`` (share of calls answered with
+a 503 before anything happens) and ``decline_rate`` (share of payments,
+transfers and B2C payments that fail; for FCM, of messages rejected as
+unregistered — tokens starting with ``invalid`` always are).
+
+Outcomes are reported back like the real providers do: Paystack webhooks
+signed with ``X-Paystack-Signature`` (HMAC-SHA512 of the body with the
+secret key) to ``paystack_webhook_path``, Daraja callbacks to the
+``CallBackURL``/``ResultURL`` of the request, after ``webhook_delay``
+seconds and retried on failure. ``webhook_target`` is either the base URL
+of a running backend or a WSGI application called in-process.
+
+A customer completing a Paystack checkout is simulated with
+``POST /_sim/paystack/pay/<reference>`` (``{"outcome": "failed"}`` to
+decline); ``auto_pay`` does it for every initialized transaction.
+``GET /_sim/stats`` returns call and webhook counters.
+
+Usage:
+    simulator = ProviderSimulator(webhook_target=get_wsgi_application(), latency=0.05)
+    server, url = simulator.serve()           # background thread
+    ...
+    server.shutdown()
+
+    # or standalone:  python manage.py run_provider_simulator --port 8765
+"""
+from collections import Counter
+from io import BytesIO
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from wsgiref.util import setup_testing_defaults
+import base64
+import hashlib
+import heapq
+import hmac
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger('altar_funds')
+
+PROVIDERS = ('paystack', 'mpesa', 'fcm')
+PAYSTACK_WEBHOOK_PATH = '/api/payments/paystack/webhook/'
+WEBHOOK_RETRIES = 3
+WEBHOOK_RETRY_DELAY = 1.0           # seconds, doubled per attempt
+WEBHOOK_WORKERS = 8
+WEBHOOK_TIMEOUT = 10
+TOKEN_LIFETIME = 3599
+SIMULATED_BANKS = [
+    {'id': 1, 'name': 'Equity Bank', 'slug': 'equity-bank', 'code': '68', 'country': 'Kenya', 'currency': 'KES', 'type': 'kepss', 'active': True},
+    {'id': 2, 'name': 'KCB Bank', 'slug': 'kcb-bank', 'code': '01', 'country': 'Kenya', 'currency': 'KES', 'type': 'kepss', 'active': True},
+    {'id': 3, 'name': 'Co-operative Bank', 'slug': 'co-operative-bank', 'code': '11', 'country': 'Kenya', 'currency': 'KES', 'type': 'kepss', 'active': True},
+]
+
+
+class _Reply(Exception):
+    """Ends a handler with a response."""
+
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+
+def _fail(status, message):
+    raise _Reply(status, {'status': False, 'message': message})
+
+
+def _now_iso():
+    return timezone.now().isoformat()
+
+
+def _wsgi_post(app, path, body, headers):
+    """POST ``body`` to a WSGI application in-process; returns the status code."""
+    parts = urlsplit(path)
+    environ = {}
+    setup_testing_defaults(environ)
+    environ.update({
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': BytesIO(body),
+    })
+    for name, value in headers.items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    reply = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        reply['status'] = int(status.split()[0])
+
+    result = app(environ, start_response)
+    try:
+        for _ in result:
+            pass
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return reply.get('status', 500)
+
+
+class ProviderSimulator:
+    """WSGI stand-in for the provider APIs; see the module docstring."""
+
+    def __init__(self, webhook_target=None, paystack_secret=None, paystack_webhook_path=PAYSTACK_WEBHOOK_PATH,
+                 latency=0.0, jitter=0.0, error_rate=0.0, decline_rate=0.0, profiles=None,
+                 webhook_delay=0.0, auto_pay=False, seed=None):
+        defaults = {'latency': latency, 'jitter': jitter, 'error_rate': error_rate, 'decline_rate': decline_rate}
+        self.profiles = {provider: dict(defaults) for provider in PROVIDERS}
+        for provider, overrides in (profiles or {}).items():
+            self.profiles[provider].update(overrides)
+        self.webhook_target = webhook_target
+        self.paystack_secret = paystack_secret or getattr(settings, 'PAYSTACK_SECRET_KEY', '')
+        self.paystack_webhook_path = paystack_webhook_path
+        self.webhook_delay = webhook_delay
+        self.auto_pay = auto_pay
+        self.random = random.Random(seed)
+        self.ids = itertools.count(1000001)
+        self.lock = threading.Lock()
+        self.transactions = {}        # reference → Paystack transaction object
+        self.recipients = {}          # recipient code → recipient object
+        self.transfers = {}           # reference → Paystack transfer object
+        self.tokens = set()           # issued Daraja access tokens
+        self.stk_requests = {}        # CheckoutRequestID → STK state
+        self.calls = Counter()
+        self.webhooks = Counter()
+        self._queue = []
+        self._queue_ready = threading.Condition()
+        self._workers = []
+        self._running_jobs = 0
+        self._routes = [
+            ('POST', r'/paystack/transaction/initialize', self.paystack_initialize),
+            ('GET', r'/paystack/transaction/verify/(?P<reference>[^/]+)', self.paystack_verify),
+            ('GET', r'/paystack/transaction', self.paystack_list),
+            ('GET', r'/paystack/bank', self.paystack_banks),
+            ('POST', r'/paystack/transferrecipient', self.paystack_recipient),
+            ('POST', r'/paystack/transfer', self.paystack_transfer),
+            ('POST', r'/paystack/transfer/bulk', self.paystack_bulk_transfer),
+            ('GET', r'/paystack/transfer/verify/(?P<reference>[^/]+)', self.paystack_verify_transfer),
+            ('GET', r'/mpesa/oauth/v1/generate', self.mpesa_oauth),
+            ('POST', r'/mpesa/mpesa/stkpush/v1/processrequest', self.mpesa_stk_push),
+            ('POST', r'/mpesa/mpesa/stkpushquery/v1/query', self.mpesa_stk_query),
+            ('POST', r'/mpesa/mpesa/b2c/v1/paymentrequest', self.mpesa_b2c),
+            ('POST', r'/fcm/v1/projects/(?P<project>[^/]+)/messages:send', self.fcm_send),
+            ('POST', r'/_sim/paystack/pay/(?P<reference>[^/]+)', self.sim_pay),
+            ('GET', r'/_sim/stats', self.sim_stats),
+        ]
+
+    # ── WSGI ─────────────────────────────────────────────────────────────
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        path = environ.get('PATH_INFO') or '/'
+        status, body = 404, {'status': False, 'message': f'No simulated endpoint for {method} {path}'}
+        for route_method, pattern, handler in self._routes:
+            match = re.fullmatch(pattern, path)
+            if match and route_method == method:
+                status, body = self._handle(environ, path, handler, match.groupdict())
+                break
+
+        payload = json.dumps(body).encode()
+        start_response(f"{status} {'OK' if status < 400 else 'Error'}", [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(payload))),
+        ])
+        return [payload]
+
+    def _handle(self, environ, path, handler, params):
+        provider = path.strip('/').split('/', 1)[0]
+        with self.lock:
+            self.calls[handler.__name__] += 1
+        profile = self.profiles.get(provider)
+        if profile:
+            delay = profile['latency'] + self.random.uniform(0, profile['jitter'])
+            if delay > 0:
+                time.sleep(delay)
+            if self.random.random() < profile['error_rate']:
+                with self.lock:
+                    self.calls['errors'] += 1
+                return 503, {'status': False, 'message': 'Simulated provider outage'}
+
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            raw = environ['wsgi.input'].read(length) if length else b''
+            request = {
+                'json': json.loads(raw) if raw else {},
+                'query': {k: v[-1] for k, v in parse_qs(environ.get('QUERY_STRING', '')).items()},
+                'authorization': environ.get('HTTP_AUTHORIZATION', ''),
+            }
+        except ValueError:
+            return 400, {'status': False, 'message': 'Invalid JSON body'}
+
+        try:
+            return 200, handler(request, **params)
+        except _Reply as reply:
+            return reply.status, reply.body
+
+    # ── Paystack ─────────────────────────────────────────────────────────
+
+    def _paystack_auth(self, request):
+        if not request['authorization'].startswith('Bearer '):
+            _fail(401, 'Format is Authorization: Bearer [secret key]')
+
+    def _declined(self, provider):
+        return self.random.random() < self.profiles[provider]['decline_rate']
+
+    def paystack_initialize(self, request):
+        self._paystack_auth(request)
+        body = request['json']
+        try:
+            amount = int(body.get('amount'))
+        except (TypeError, ValueError):
+            _fail(400, 'Invalid Amount Sent')
+        if not body.get('email'):
+            _fail(400, 'Invalid Email Address Passed')
+        reference = body.get('reference') or uuid.uuid4().hex[:12]
+        access_code = uuid.uuid4().hex[:15]
+        with self.lock:
+            if reference in self.transactions:
+                _fail(400, 'Duplicate Transaction Reference')
+            self.transactions[reference] = {
+                'id': next(self.ids),
+                'reference': reference,
+                'status': 'abandoned',
+                'amount': amount,
+                'fees': None,
+                'currency': body.get('currency') or getattr(settings, 'PAYSTACK_CURRENCY', 'KES'),
+                'channel': 'card',
+                'gateway_response': 'The transaction was not completed',
+                'customer': {'email': body['email']},
+                'metadata': body.get('metadata') or {},
+                'createdAt': _now_iso(),
+                'paid_at': None,
+            }
+        if self.auto_pay:
+            self.pay(reference)
+        return {
+            'status': True,
+            'message': 'Authorization URL created',
+            'data': {
+                'authorization_url': f"https://checkout.paystack.com/{access_code}",
+                'access_code': access_code,
+                'reference': reference,
+            },
+        }
+
+    def paystack_verify(self, request, reference):
+        self._paystack_auth(request)
+        with self.lock:
+            transaction = self.transactions.get(reference)
+            if transaction is None:
+                _fail(400, 'Transaction reference not found')
+            return {'status': True, 'message': 'Verification successful', 'data': dict(transaction)}
+
+    def paystack_list(self, request):
+        self._paystack_auth(request)
+        query = request['query']
+        per_page = int(query.get('perPage', 50))
+        page = int(query.get('page', 1))
+        with self.lock:
+            start, end = parse_datetime(query.get('from', '')), parse_datetime(query.get('to', ''))
+            rows = [
+                dict(t) for t in self.transactions.values()
+                if (not query.get('status') or t['status'] == query['status'])
+                and (not start or parse_datetime(t['createdAt']) >= start)
+                and (not end or parse_datetime(t['createdAt']) <= end)
+            ]
+        rows.sort(key=lambda t: t['createdAt'], reverse=True)
+        page_count = max((len(rows) + per_page - 1) // per_page, 1)
+        return {
+            'status': True,
+            'message': 'Transactions retrieved',
+            'data': rows[(page - 1) * per_page:page * per_page],
+            'meta': {'total': len(rows), 'perPage': per_page, 'page': page, 'pageCount': page_count},
+        }
+
+    def paystack_banks(self, request):
+        self._paystack_auth(request)
+        return {'status': True, 'message': 'Banks retrieved', 'data': SIMULATED_BANKS, 'meta': {'next': None}}
+
+    def paystack_recipient(self, request):
+        self._paystack_auth(request)
+        body = request['json']
+        if not body.get('account_number') or not body.get('bank_code'):
+            _fail(400, 'Account number and bank code are required')
+        code = f"RCP_{uuid.uuid4().hex[:14]}"
+        recipient = {
+            'id': next(self.ids),
+            'recipient_code': code,
+            'type': body.get('type', 'nuban'),
+            'name': body.get('name', ''),
+            'active': True,
+            'details': {
+                'account_number': body['account_number'],
+                'account_name': body.get('name', ''),
+                'bank_code': body['bank_code'],
+            },
+        }
+        with self.lock:
+            self.recipients[code] = recipient
+        return {'status': True, 'message': 'Transfer recipient created successfully', 'data': recipient}
+
+    def _new_transfer(self, transfer):
+        """Register one transfer request (lock held); returns the transfer object."""
+        reference = transfer.get('reference') or uuid.uuid4().hex
+        if reference in self.transfers:
+            _fail(400, 'Transfer reference already exists')
+        if not str(transfer.get('recipient', '')).startswith('RCP_'):
+            _fail(400, 'Invalid transfer recipient')
+        record = {
+            'id': next(self.ids),
+            'transfer_code': f"TRF_{uuid.uuid4().hex[:14]}",
+            'reference': reference,
+            'amount': int(transfer.get('amount') or 0),
+            'currency': getattr(settings, 'PAYSTACK_CURRENCY', 'KES'),
+            'recipient': transfer.get('recipient'),
+            'reason': transfer.get('reason', ''),
+            'status': 'pending',
+            'createdAt': _now_iso(),
+        }
+        self.transfers[reference] = record
+        return record
+
+    def _settle_transfer_later(self, record):
+        status = 'failed' if self._declined('paystack') else 'success'
+        self._schedule(lambda: self._settle_transfer(record['reference'], status))
+
+    def _settle_transfer(self, reference, status):
+        with self.lock:
+            record = self.transfers[reference]
+            record['status'] = status
+            data = dict(record, gateway_response='Simulated transfer decline' if status == 'failed' else '')
+        self.send_paystack_webhook(f"transfer.{status}", data)
+
+    def paystack_transfer(self, request):
+        self._paystack_auth(request)
+        with self.lock:
+            record = self._new_transfer(request['json'])
+            data = dict(record)
+        self._settle_transfer_later(record)
+        return {'status': True, 'message': 'Transfer has been queued', 'data': data}
+
+    def paystack_bulk_transfer(self, request):
+        self._paystack_auth(request)
+        transfers = request['json'].get('transfers') or []
+        if not transfers or len(transfers) > 100:
+            _fail(400, 'Between 1 and 100 transfers are allowed')
+        with self.lock:
+            records = [self._new_transfer(transfer) for transfer in transfers]
+            data = [
+                {key: r[key] for key in ('reference', 'recipient', 'amount', 'transfer_code', 'currency', 'status')}
+                for r in records
+            ]
+        for record in records:
+            self._settle_transfer_later(record)
+        return {'status': True, 'message': f'{len(records)} transfers queued.', 'data': data}
+
+    def paystack_verify_transfer(self, request, reference):
+        self._paystack_auth(request)
+        with self.lock:
+            record = self.transfers.get(reference)
+            if record is None:
+                _fail(404, 'Transfer not found')
+            return {'status': True, 'message': 'Transfer retrieved', 'data': dict(record)}
+
+    def pay(self, reference, outcome=None):
+        """
+        Complete (or decline) the checkout of an initialized transaction; sends the charge webhook.
+
+        ``outcome`` is ``'success'`` or ``'failed'``; by default the payment
+        is declined at the Paystack ``decline_rate``.
+        """
+        if outcome is None:
+            outcome = 'failed' if self._declined('paystack') else 'success'
+        with self.lock:
+            transaction = self.transactions.get(reference)
+            if transaction is None:
+                _fail(404, 'Transaction reference not found')
+            if transaction['status'] != 'abandoned':
+                return dict(transaction)
+            success = outcome == 'success'
+            transaction.update({
+                'status': 'success' if success else 'failed',
+                'gateway_response': 'Approved' if success else 'Declined',
+                'fees': round(transaction['amount'] * 0.015) if success else None,
+                'paid_at': _now_iso() if success else None,
+            })
+            data = dict(transaction)
+        self._schedule(lambda: self.send_paystack_webhook(f"charge.{'success' if success else 'failed'}", data))
+        return data
+
+    def sim_pay(self, request, reference):
+        data = self.pay(reference, request['json'].get('outcome'))
+        return {'status': True, 'data': data}
+
+    # ── M-Pesa Daraja ────────────────────────────────────────────────────
+
+    def _mpesa_auth(self, request):
+        token = request['authorization'][len('Bearer '):]
+        with self.lock:
+            valid = token in self.tokens
+        if not valid:
+            raise _Reply(401, {'errorCode': '404.001.03', 'errorMessage': 'Invalid Access Token'})
+
+    def mpesa_oauth(self, request):
+        if not request['authorization'].startswith('Basic '):
+            raise _Reply(400, {'errorCode': '400.008.01', 'errorMessage': 'Invalid Authentication passed'})
+        token = base64.b64encode(uuid.uuid4().bytes).decode()[:28]
+        with self.lock:
+            self.tokens.add(token)
+        return {'access_token': token, 'expires_in': str(TOKEN_LIFETIME)}
+
+    def mpesa_stk_push(self, request):
+        self._mpesa_auth(request)
+        body = request['json']
+        checkout_id = f"ws_CO_{timezone.now():%d%m%Y%H%M%S}{next(self.ids)}"
+        merchant_id = f"{self.random.randint(10000, 99999)}-{next(self.ids)}-1"
+        declined = self._declined('mpesa')
+        state = {
+            'MerchantRequestID': merchant_id,
+            'CheckoutRequestID': checkout_id,
+            'ResultCode': 1032 if declined else 0,
+            'ResultDesc': 'Request cancelled by user' if declined else 'The service request is processed successfully.',
+            'Amount': body.get('Amount'),
+            'PhoneNumber': body.get('PhoneNumber'),
+            'Receipt': f"S{uuid.uuid4().hex[:9].upper()}",
+        }
+        with self.lock:
+            self.stk_requests[checkout_id] = state
+        if body.get('CallBackURL'):
+            self._schedule(lambda: self._stk_callback(body['CallBackURL'], state))
+        return {
+            'MerchantRequestID': merchant_id,
+            'CheckoutRequestID': checkout_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing',
+        }
+
+    def _stk_callback(self, url, state):
+        callback = {
+            'MerchantRequestID': state['MerchantRequestID'],
+            'CheckoutRequestID': state['CheckoutRequestID'],
+            'ResultCode': state['ResultCode'],
+            'ResultDesc': state['ResultDesc'],
+        }
+        if state['ResultCode'] == 0:
+            callback['CallbackMetadata'] = {'Item': [
+                {'Name': 'Amount', 'Value': state['Amount']},
+                {'Name': 'MpesaReceiptNumber', 'Value': state['Receipt']},
+                {'Name': 'TransactionDate', 'Value': int(f"{timezone.localtime():%Y%m%d%H%M%S}")},
+                {'Name': 'PhoneNumber', 'Value': state['PhoneNumber']},
+            ]}
+        self.deliver(url, {'Body': {'stkCallback': callback}}, 'mpesa_stk')
+
+    def mpesa_stk_query(self, request):
+        self._mpesa_auth(request)
+        with self.lock:
+            state = self.stk_requests.get(request['json'].get('CheckoutRequestID'))
+        if state is None:
+            raise _Reply(400, {'errorCode': '400.002.02', 'errorMessage': 'Bad Request - Invalid CheckoutRequestID'})
+        return {
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successsfully',
+            'MerchantRequestID': state['MerchantRequestID'],
+            'CheckoutRequestID': state['CheckoutRequestID'],
+            'ResultCode': str(state['ResultCode']),
+            'ResultDesc': state['ResultDesc'],
+        }
+
+    def mpesa_b2c(self, request):
+        self._mpesa_auth(request)
+        body = request['json']
+        conversation_id = f"AG_{timezone.now():%Y%m%d}_{uuid.uuid4().hex[:20]}"
+        originator_id = f"{self.random.randint(10000, 99999)}-{next(self.ids)}-1"
+        declined = self._declined('mpesa')
+        result = {
+            'ResultType': 0,
+            'ResultCode': 2001 if declined else 0,
+            'ResultDesc': 'The initiator information is invalid.' if declined else 'The service request is processed successfully.',
+            'OriginatorConversationID': originator_id,
+            'ConversationID': conversation_id,
+            'TransactionID': f"S{uuid.uuid4().hex[:9].upper()}",
+        }
+        if not declined:
+            result['ResultParameters'] = {'ResultParameter': [
+                {'Key': 'TransactionAmount', 'Value': body.get('Amount')},
+                {'Key': 'TransactionReceipt', 'Value': result['TransactionID']},
+                {'Key': 'ReceiverPartyPublicName', 'Value': f"{body.get('PartyB')} - Simulated Receiver"},
+                {'Key': 'TransactionCompletedDateTime', 'Value': f"{timezone.localtime():%d.%m.%Y %H:%M:%S}"},
+            ]}
+        if body.get('ResultURL'):
+            self._schedule(lambda: self.deliver(body['ResultURL'], {'Result': result}, 'mpesa_b2c'))
+        return {
+            'ConversationID': conversation_id,
+            'OriginatorConversationID': originator_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Accept the service request successfully.',
+        }
+
+    # ── FCM ──────────────────────────────────────────────────────────────
+
+    def fcm_send(self, request, project):
+        if not request['authorization'].startswith('Bearer '):
+            raise _Reply(401, {'error': {'code': 401, 'message': 'Missing credentials', 'status': 'UNAUTHENTICATED'}})
+        message = request['json'].get('message') or {}
+        token = message.get('token', '')
+        if not token:
+            raise _Reply(400, {'error': {'code': 400, 'message': 'Recipient of the message is not set.', 'status': 'INVALID_ARGUMENT'}})
+        if token.startswith('invalid') or self._declined('fcm'):
+            raise _Reply(404, {'error': {
+                'code': 404,
+                'message': 'Requested entity was not found.',
+                'status': 'NOT_FOUND',
+                'details': [{'@type': 'type.googleapis.com/google.firebase.fcm.v1.FcmError', 'errorCode': 'UNREGISTERED'}],
+            }})
+        return {'name': f"projects/{project}/messages/{next(self.ids)}"}
+
+    # ── Webhooks ─────────────────────────────────────────────────────────
+
+    def send_paystack_webhook(self, event, data):
+        body = json.dumps({'event': event, 'data': data}).encode()
+        signature = hmac.new(self.paystack_secret.encode(), body, hashlib.sha512).hexdigest()
+        self.deliver(self.paystack_webhook_path, body, 'paystack', {'X-Paystack-Signature': signature})
+
+    def deliver(self, url, body, kind, headers=None):
+        """POST a webhook to the target, retrying failed deliveries."""
+        import requests
+
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        path = urlsplit(url).path if '://' in url else url
+        for attempt in range(WEBHOOK_RETRIES + 1):
+            try:
+                if callable(self.webhook_target):
+                    status = _wsgi_post(self.webhook_target, path, body, headers)
+                else:
+                    target = f"{self.webhook_target.rstrip('/')}{path}" if self.webhook_target else url
+                    status = requests.post(target, data=body, headers=headers, timeout=WEBHOOK_TIMEOUT).status_code
+            except Exception as e:
+                logger.warning(f"Simulated {kind} webhook to {path} failed: {str(e)}")
+                status = None
+            if status is not None and status < 300:
+                with self.lock:
+                    self.webhooks[f"{kind}:delivered"] += 1
+                return True
+            if attempt < WEBHOOK_RETRIES:
+                time.sleep(WEBHOOK_RETRY_DELAY * 2 ** attempt)
+        with self.lock:
+            self.webhooks[f"{kind}:failed"] += 1
+        return False
+
+    def _schedule(self, job):
+        """Run ``job`` on a webhook worker after ``webhook_delay`` seconds."""
+        self._start_workers()
+        with self._queue_ready:
+            heapq.heappush(self._queue, (time.monotonic() + self.webhook_delay, next(self.ids), job))
+            self._queue_ready.notify()
+
+    def _start_workers(self):
+        with self.lock:
+            if self._workers:
+                return
+            for index in range(WEBHOOK_WORKERS):
+                worker = threading.Thread(target=self._work, name=f"simulator-webhooks-{index}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            with self._queue_ready:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    timeout = self._queue[0][0] - time.monotonic() if self._queue else None
+                    self._queue_ready.wait(timeout)
+                _, _, job = heapq.heappop(self._queue)
+                self._running_jobs += 1
+            try:
+                job()
+            except Exception as e:
+                logger.error(f"Simulated webhook job failed: {str(e)}")
+            finally:
+                from django.db import close_old_connections
+                close_old_connections()
+                with self._queue_ready:
+                    self._running_jobs -= 1
+
+    def pending_webhooks(self):
+        """Webhook and callback jobs queued or being delivered."""
+        with self._queue_ready:
+            return len(self._queue) + self._running_jobs
+
+    # ── Control ──────────────────────────────────────────────────────────
+
+    def stats(self):
+        pending = self.pending_webhooks()
+        with self.lock:
+            return {
+                'calls': dict(self.calls),
+                'webhooks': dict(self.webhooks),
+                'transactions': Counter(t['status'] for t in self.transactions.values()),
+                'transfers': Counter(t['status'] for t in self.transfers.values()),
+                'pending_webhooks': pending,
+            }
+
+    def sim_stats(self, request):
+        return self.stats()
+
+    def make_server(self, host='127.0.0.1', port=0):
+        """A threaded HTTP server for the simulator (not started)."""
+        return make_server(host, port, self, server_class=_ThreadingWSGIServer, handler_class=_QuietHandler)
+
+    def serve(self, host='127.0.0.1', port=0):
+        """Serve the simulator from a background thread; returns ``(server, base_url)``."""
+        server = self.make_server(host, port)
+        thread = threading.Thread(target=server.serve_forever, name='provider-simulator', daemon=True)
+        thread.start()
+        return server, f"http://{host}:{server.server_port}"
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def create_app(**options):
+    """Application factory for WSGI servers, e.g. ``gunicorn 'common.provider_simulator:create_app()'``."""
+    options.setdefault('webhook_target', getattr(settings, 'PROVIDER_SIMULATOR_WEBHOOK_URL', None) or None)
+    return ProviderSimulator(**options)
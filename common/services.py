@@ -151,6 +151,22 @@ class AuditService:
             ip_address='SYSTEM',  # For system-generated transactions
         )
     
+    @staticmethod
+    def log_financial_transactions(user, action, entries, ip_address=None):
+        """Log many financial transactions with one insert; ``entries`` are ``(amount, details)`` pairs"""
+        from audit.models import AuditLog
+        
+        AuditLog.objects.bulk_create([
+            AuditLog(
+                user=user,
+                action=action,
+                amount=amount,
+                details=details,
+                ip_address=ip_address,
+            )
+            for amount, details in entries
+        ], batch_size=500)
+    
     @staticmethod
     def log_user_action(user, action, details, ip_address=None):
         """Log user action for audit"""
@@ -0,0 +1,226 @@
+"""
+Time-bucketed aggregation for financial series.
+
+Every series is produced from a single grouped query: rows are truncated to
+day/week/month in the database (in ``TIME_ZONE`` for datetime columns) and
+month rows are folded into quarters and years in Python so that those
+buckets follow ``FINANCIAL_YEAR_START_MONTH``. Buckets with no rows are
+filled with zeros so charts always get a continuous axis.
+
+Usage:
+    from common.timeseries import income_expense_series, trailing_range
+
+    start, end = trailing_range('month', 12)
+    series = income_expense_series('month', start, end,
+                                   income=completed_giving(Q(church=church)),
+                                   expenses=Expense.objects.filter(user__church=church))
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, DateField, DateTimeField, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+GRANULARITIES = ('day', 'week', 'month', 'quarter', 'year')
+
+# Default (date field, amount field, count aggregate) per model.
+SERIES_FIELDS = {
+    'giving.givingdailyrollup': ('day', 'total_amount', lambda: Sum('transaction_count')),
+    'giving.givingtransaction': ('transaction_date', 'amount', lambda: Count('pk')),
+    'expenses.expense': ('date', 'amount', lambda: Count('pk')),
+}
+
+
+def _financial_year_start_month():
+    month = getattr(settings, 'FINANCIAL_YEAR_START_MONTH', 1) or 1
+    return month if 1 <= month <= 12 else 1
+
+
+def _add_months(day, months):
+    """First day of the month ``months`` after ``day``'s month."""
+    index = day.year * 12 + (day.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value
+
+
+def financial_year_start(day):
+    """Start of the financial year containing ``day``."""
+    start_month = _financial_year_start_month()
+    year = day.year if day.month >= start_month else day.year - 1
+    return date(year, start_month, 1)
+
+
+def bucket_start(day, granularity):
+    """Start date of the bucket containing ``day``."""
+    day = _as_date(day)
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    fy_start = financial_year_start(day)
+    if granularity == 'quarter':
+        months_in = (day.year - fy_start.year) * 12 + day.month - fy_start.month
+        return _add_months(fy_start, months_in - months_in % 3)
+    if granularity == 'year':
+        return fy_start
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def next_bucket(start, granularity):
+    """Start date of the bucket following the one that starts at ``start``."""
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    if granularity == 'week':
+        return start + timedelta(weeks=1)
+    return _add_months(start, {'month': 1, 'quarter': 3, 'year': 12}[granularity])
+
+
+def bucket_label(start, granularity):
+    """
+    Display label for a bucket.
+
+    Financial quarters/years are labelled by the calendar year the financial
+    year starts in, prefixed ``FY`` when it does not start in January.
+    """
+    if granularity == 'day':
+        return start.isoformat()
+    if granularity == 'week':
+        iso_year, iso_week, _ = start.isocalendar()
+        return f"{iso_year}-W{iso_week:02d}"
+    if granularity == 'month':
+        return start.strftime('%Y-%m')
+
+    fy_start = financial_year_start(start)
+    prefix = 'FY' if fy_start.month != 1 else ''
+    if granularity == 'quarter':
+        months_in = (start.year - fy_start.year) * 12 + start.month - fy_start.month
+        return f"{prefix}{fy_start.year}-Q{months_in // 3 + 1}"
+    return f"{prefix}{fy_start.year}"
+
+
+def buckets(start, end, granularity):
+    """Bucket start dates covering ``start``..``end`` (inclusive)."""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    current = bucket_start(start, granularity)
+    end = _as_date(end)
+    result = []
+    while current <= end:
+        result.append(current)
+        current = next_bucket(current, granularity)
+    return result
+
+
+def trailing_range(granularity, count, today=None):
+    """``(start, end)`` of the last ``count`` buckets, ending with the current one."""
+    today = _as_date(today) if today else timezone.localdate()
+    start = bucket_start(today, granularity)
+    for _ in range(count - 1):
+        start = bucket_start(start - timedelta(days=1), granularity)
+    end = next_bucket(bucket_start(today, granularity), granularity) - timedelta(days=1)
+    return start, end
+
+
+def financial_year_range(day=None):
+    """``(start, end)`` of the financial year containing ``day`` (default: today)."""
+    start = financial_year_start(_as_date(day) if day else timezone.localdate())
+    return start, _add_months(start, 12) - timedelta(days=1)
+
+
+def bucketed_totals(queryset, granularity, start, end,
+                    date_field=None, amount_field=None, count=None):
+    """
+    Sum ``amount_field`` per bucket in one grouped query.
+
+    Field names default from ``SERIES_FIELDS`` for the queryset's model.
+    Returns a list of ``{'start', 'end', 'period', 'total', 'count'}`` dicts
+    for every bucket between ``start`` and ``end``, zero-filled.
+    """
+    defaults = SERIES_FIELDS.get(queryset.model._meta.label_lower)
+    if defaults:
+        date_field = date_field or defaults[0]
+        amount_field = amount_field or defaults[1]
+        count = count or defaults[2]()
+    if not date_field or not amount_field:
+        raise ValueError(f"No series fields configured for {queryset.model._meta.label}")
+    count = count or Count('pk')
+
+    start, end = _as_date(start), _as_date(end)
+    is_datetime = isinstance(queryset.model._meta.get_field(date_field), DateTimeField)
+    lookup = f'{date_field}__date' if is_datetime else date_field
+
+    trunc_kind = granularity if granularity in ('day', 'week') else 'month'
+    bucket_expr = Trunc(
+        date_field,
+        trunc_kind,
+        output_field=DateField(),
+        tzinfo=timezone.get_current_timezone() if is_datetime else None,
+    )
+
+    rows = queryset.filter(**{
+        f'{lookup}__gte': bucket_start(start, granularity),
+        f'{lookup}__lte': end,
+    }).annotate(bucket=bucket_expr).values('bucket').annotate(
+        total=Sum(amount_field),
+        count=count
+    ).order_by('bucket')
+
+    series = {
+        key: {'total': Decimal('0.00'), 'count': 0}
+        for key in buckets(start, end, granularity)
+    }
+    for row in rows:
+        key = bucket_start(row['bucket'], granularity)
+        if key in series:
+            series[key]['total'] += row['total'] or Decimal('0.00')
+            series[key]['count'] += row['count'] or 0
+
+    return [
+        {
+            'start': key,
+            'end': next_bucket(key, granularity) - timedelta(days=1),
+            'period': bucket_label(key, granularity),
+            'total': values['total'],
+            'count': values['count'],
+        }
+        for key, values in series.items()
+    ]
+
+
+def income_expense_series(granularity, start, end, income, expenses=None):
+    """
+    Income and expenses side by side per bucket — two grouped queries in total.
+
+    ``income`` and ``expenses`` are querysets (rollups or transactions for
+    income, ``Expense`` rows for expenses). Returns a list of
+    ``{'start', 'end', 'period', 'income', 'expenses', 'net', 'income_count',
+    'expense_count'}`` dicts.
+    """
+    income_series = bucketed_totals(income, granularity, start, end)
+    if expenses is not None:
+        expense_series = bucketed_totals(expenses, granularity, start, end)
+    else:
+        expense_series = [{'total': Decimal('0.00'), 'count': 0}] * len(income_series)
+
+    return [
+        {
+            'start': inc['start'],
+            'end': inc['end'],
+            'period': inc['period'],
+            'income': inc['total'],
+            'expenses': exp['total'],
+            'net': inc['total'] - exp['total'],
+            'income_count': inc['count'],
+            'expense_count': exp['count'],
+        }
+        for inc, exp in zip(income_series, expense_series)
+    ]
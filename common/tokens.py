@@ -0,0 +1,153 @@
+"""
+Shared cache for provider OAuth access tokens (M-Pesa Daraja).
+
+Daraja tokens live for an hour, but the services used to fetch a new one
+per service instance or per call. A ``TokenCache`` keeps the current token
+in the ``responses`` cache (Redis in production), so every worker and
+process reuses it:
+
+* the token is refreshed ``REFRESH_MARGIN`` seconds before it expires;
+* only one process refreshes at a time (a short ``cache.add`` lock). Others
+  keep using the still-valid token, or — once it has expired — wait briefly
+  for the refreshed one instead of all calling the OAuth endpoint;
+* each process also remembers the token it last saw, so most calls do not
+  touch the cache at all;
+* if the cache backend is unreachable, tokens are cached per process and
+  refreshed under a thread lock, so callers keep working.
+
+Call ``invalidate()`` when the provider rejects a token (HTTP 401).
+
+Usage:
+    tokens = TokenCache('mpesa', credentials=consumer_key, fetch=fetch_token)
+    access_token = tokens.get()
+"""
+import hashlib
+import logging
+import threading
+import time
+
+from django.core.cache import caches
+
+logger = logging.getLogger('altar_funds')
+
+CACHE_ALIAS = 'responses'
+TOKEN_KEY = 'oauth_token:{name}:{fingerprint}'
+LOCK_KEY = 'oauth_token_lock:{name}:{fingerprint}'
+REFRESH_MARGIN = 300     # seconds before expiry a token is refreshed
+LOCK_TIMEOUT = 30        # seconds a refresh lock is held at most
+LOCK_WAIT = 5.0          # seconds a caller waits for another process's refresh
+LOCK_POLL_INTERVAL = 0.1
+
+# Cache key → (token, expires_at) last seen by this process
+_local_tokens = {}
+_local_lock = threading.Lock()
+
+
+class TokenCache:
+    """
+    Process-shared access token of one provider account.
+
+    ``fetch`` is called without arguments to obtain a new token and returns
+    ``(access_token, expires_in_seconds)``; it raises on failure.
+    ``credentials`` identifies the account (e.g. the consumer key) and is
+    only stored as a hash.
+    """
+
+    def __init__(self, name, credentials, fetch):
+        fingerprint = hashlib.sha256(str(credentials).encode()).hexdigest()[:16]
+        self.name = name
+        self.fetch = fetch
+        self.key = TOKEN_KEY.format(name=name, fingerprint=fingerprint)
+        self.lock_key = LOCK_KEY.format(name=name, fingerprint=fingerprint)
+
+    def get(self):
+        """A valid access token, fetching a new one only when needed."""
+        now = time.time()
+        cached = _local_tokens.get(self.key)
+        if cached and cached[1] - REFRESH_MARGIN > now:
+            return cached[0]
+
+        try:
+            return self._get_shared(now)
+        except CacheUnavailable as e:
+            logger.warning(f"{self.name} token cache unavailable, using process cache: {str(e)}")
+            return self._get_local()
+
+    def invalidate(self):
+        """Forget the current token everywhere, e.g. after the provider rejected it."""
+        _local_tokens.pop(self.key, None)
+        try:
+            caches[CACHE_ALIAS].delete(self.key)
+        except Exception as e:
+            logger.warning(f"Could not invalidate {self.name} token: {str(e)}")
+
+    def _remember(self, token, expires_at):
+        _local_tokens[self.key] = (token, expires_at)
+        return token
+
+    def _refresh(self):
+        token, expires_in = self.fetch()
+        expires_at = time.time() + int(expires_in)
+        return token, expires_at
+
+    def _get_shared(self, now):
+        cache = caches[CACHE_ALIAS]
+        entry = _cache_call(cache.get, self.key)
+        if entry and entry['expires_at'] - REFRESH_MARGIN > now:
+            return self._remember(entry['token'], entry['expires_at'])
+
+        if _cache_call(cache.add, self.lock_key, 1, LOCK_TIMEOUT):
+            try:
+                token, expires_at = self._refresh()
+                self._store(cache, token, expires_at)
+                logger.info(f"{self.name} access token refreshed")
+                return self._remember(token, expires_at)
+            finally:
+                try:
+                    cache.delete(self.lock_key)
+                except Exception:
+                    pass
+
+        # Another process is refreshing: the current token is still good to use
+        if entry and entry['expires_at'] > now:
+            return self._remember(entry['token'], entry['expires_at'])
+
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            entry = _cache_call(cache.get, self.key)
+            if entry and entry['expires_at'] > time.time():
+                return self._remember(entry['token'], entry['expires_at'])
+
+        # The refreshing process is stuck or died; fetch without the lock
+        token, expires_at = self._refresh()
+        self._store(cache, token, expires_at)
+        return self._remember(token, expires_at)
+
+    def _store(self, cache, token, expires_at):
+        """Share a fresh token with other processes until it expires (best effort)."""
+        try:
+            cache.set(
+                self.key, {'token': token, 'expires_at': expires_at},
+                max(int(expires_at - time.time()), 1),
+            )
+        except Exception as e:
+            logger.warning(f"Could not share {self.name} token: {str(e)}")
+
+    def _get_local(self):
+        with _local_lock:
+            cached = _local_tokens.get(self.key)
+            if cached and cached[1] - REFRESH_MARGIN > time.time():
+                return cached[0]
+            return self._remember(*self._refresh())
+
+
+class CacheUnavailable(Exception):
+    """The shared cache backend could not be reached."""
+
+
+def _cache_call(method, *args):
+    try:
+        return method(*args)
+    except Exception as e:
+        raise CacheUnavailable(str(e)) from e
@@ -4,6 +4,7 @@ Production-ready configuration
 """
 
 import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 from decouple import config
@@ -256,6 +257,9 @@ FIREBASE_DATABASE_URL  = config(
     default='https://sanctum-cf7e7-default-rtdb.firebaseio.com'
 )
 FCM_SERVER_KEY         = config('FCM_SERVER_KEY', default='')
+# Push transport (notifications.transport): FCMBackend, or FakeBackend to
+# send nothing and record messages in memory (local development)
+PUSH_BACKEND           = config('PUSH_BACKEND', default='notifications.transport.FCMBackend')
 
 # --------------------------------------------------
 # MPESA
@@ -279,6 +283,38 @@ PAYSTACK_WEBHOOK_URL   = config('PAYSTACK_WEBHOOK_URL',   default='https://altar
 PLATFORM_FEE_PERCENTAGE = config('PLATFORM_FEE_PERCENTAGE', default=1.5, cast=float)
 # KES for Kenya, NGN for Nigeria — Paystack supports both
 PAYSTACK_CURRENCY      = config('PAYSTACK_CURRENCY', default='KES')
+# Country whose bank directory is used for transfer recipients
+PAYSTACK_COUNTRY       = config('PAYSTACK_COUNTRY', default='kenya')
+
+# 'instant' pays each gift out with its own transfer; 'batched' pays every
+# church once per settlement window with Paystack bulk transfers
+DISBURSEMENT_MODE          = config('DISBURSEMENT_MODE', default='instant')
+SETTLEMENT_WINDOW_MINUTES  = config('SETTLEMENT_WINDOW_MINUTES', default=60, cast=int)
+
+# Local mirror of Paystack transactions: days fetched on the first sync, and
+# minutes each sync re-reads before the last one (late status changes)
+PAYSTACK_SYNC_BACKFILL_DAYS    = config('PAYSTACK_SYNC_BACKFILL_DAYS', default=30, cast=int)
+PAYSTACK_SYNC_OVERLAP_MINUTES  = config('PAYSTACK_SYNC_OVERLAP_MINUTES', default=60, cast=int)
+
+# Concurrent provider status checks (per worker process): calls in flight
+# at once and calls started per second, per provider
+PROVIDER_POLL_CONCURRENCY = {
+    'paystack': config('PAYSTACK_POLL_CONCURRENCY', default=16, cast=int),
+    'mpesa':    config('MPESA_POLL_CONCURRENCY', default=4, cast=int),
+}
+PROVIDER_POLL_RATE = {
+    'paystack': config('PAYSTACK_POLL_RATE', default=25, cast=float),
+    'mpesa':    config('MPESA_POLL_RATE', default=5, cast=float),
+}
+
+# Hours a response is replayed for a repeated Idempotency-Key header
+IDEMPOTENCY_KEY_TTL_HOURS = config('IDEMPOTENCY_KEY_TTL_HOURS', default=24, cast=int)
+
+# Base URL of the offline provider simulator (common.provider_simulator).
+# When set, Paystack, M-Pesa and FCM calls go there instead of the live APIs;
+# the simulator sends its webhooks to PROVIDER_SIMULATOR_WEBHOOK_URL.
+PROVIDER_SIMULATOR_URL          = config('PROVIDER_SIMULATOR_URL', default='')
+PROVIDER_SIMULATOR_WEBHOOK_URL  = config('PROVIDER_SIMULATOR_WEBHOOK_URL', default='http://localhost:8000')
 
 # --------------------------------------------------
 # EMAIL
@@ -305,6 +341,32 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Response cache (common.cache) gets its own alias so that the default cache
+# (DRF throttling, sessions) keeps working when Redis is unavailable.
+# Tests, or CACHE_BACKEND=locmem, run it in process memory instead.
+if config('CACHE_BACKEND', default='redis') == 'locmem' or 'test' in sys.argv[1:2]:
+    _RESPONSE_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'altarfunds-responses',
+    }
+else:
+    _RESPONSE_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'altarfunds',
+        'OPTIONS': {
+            'socket_connect_timeout': 1,
+            'socket_timeout': 1,
+        },
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': _RESPONSE_CACHE,
+}
+
 # --------------------------------------------------
 # CORS & CSRF
 # --------------------------------------------------
@@ -320,6 +382,7 @@ CORS_ALLOW_HEADERS = [
     'accept-encoding',
     'authorization',
     'content-type',
+    'idempotency-key',
     'dnt',
     'origin',
     'user-agent',
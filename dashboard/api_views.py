@@ -6,15 +6,18 @@ from django.utils import timezone
 from datetime import timedelta
 
 from giving.models import GivingTransaction, GivingCategory
+from giving.rollups import completed_giving, total_given, totals_by
+from common.cache import cache_response
+from common.timeseries import income_expense_series, trailing_range
 from expenses.models import Expense, ExpenseCategory
 from budgets.models import Budget
 from accounts.models import User, Member
 
-import calendar
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@cache_response(timeout=300, key_prefix='platform_financial_summary', platform_wide=True)
 def financial_summary(request):
     """Get financial summary for dashboard"""
     user = request.user
@@ -25,10 +28,7 @@ def financial_summary(request):
     current_year_start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
     
     # Total income (this month)
-    total_income = GivingTransaction.objects.filter(
-        transaction_date__gte=current_month_start,
-        status='completed'
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    total_income = total_given(completed_giving(start=current_month_start))
     
     # Total expenses (this month)
     total_expenses = Expense.objects.filter(
@@ -40,10 +40,7 @@ def financial_summary(request):
     balance = total_income - total_expenses
     
     # This year's data
-    yearly_income = GivingTransaction.objects.filter(
-        transaction_date__gte=current_year_start,
-        status='completed'
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    yearly_income = total_given(completed_giving(start=current_year_start))
     
     yearly_expenses = Expense.objects.filter(
         date__gte=current_year_start,
@@ -62,64 +59,47 @@ def financial_summary(request):
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@cache_response(timeout=300, key_prefix='platform_monthly_trend', platform_wide=True)
 def monthly_trend(request):
     """Get monthly income/expense trends"""
     user = request.user
-    now = timezone.now()
     
-    # Get last 12 months data
-    monthly_data = []
-    for i in range(12):
-        month_date = now - timedelta(days=i*30)
-        month_start = month_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        # Get month end
-        _, last_day = calendar.monthrange(month_date.year, month_date.month)
-        month_end = month_date.replace(day=last_day, hour=23, minute=59, second=59, microsecond=999999)
-        
-        income = GivingTransaction.objects.filter(
-            transaction_date__gte=month_start,
-            transaction_date__lte=month_end,
-            status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        expenses = Expense.objects.filter(
-            date__gte=month_start,
-            date__lte=month_end,
-            status='approved'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        monthly_data.append({
-            'month': month_date.strftime('%Y-%m'),
-            'income': income,
-            'expenses': expenses,
-            'balance': income - expenses
-        })
+    # Get last 12 months data (oldest first)
+    start, end = trailing_range('month', 12)
+    monthly_data = [
+        {
+            'month': bucket['period'],
+            'income': bucket['income'],
+            'expenses': bucket['expenses'],
+            'balance': bucket['net']
+        }
+        for bucket in income_expense_series(
+            'month', start, end,
+            income=completed_giving(),
+            expenses=Expense.objects.filter(status='approved')
+        )
+    ]
     
-    return Response(list(reversed(monthly_data)))
+    return Response(monthly_data)
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@cache_response(timeout=300, key_prefix='platform_income_breakdown', platform_wide=True)
 def income_breakdown(request):
     """Get income breakdown by category"""
     user = request.user
     now = timezone.now()
     current_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
-    income_by_category = GivingTransaction.objects.filter(
-        transaction_date__gte=current_month_start,
-        status='completed'
-    ).values('category__name').annotate(
-        total=Sum('amount'),
-        count=Count('id')
-    ).order_by('-total')
+    income_by_category = totals_by(completed_giving(start=current_month_start), 'category__name')
     
     return Response(list(income_by_category))
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@cache_response(timeout=300, key_prefix='platform_expense_breakdown', platform_wide=True)
 def expense_breakdown(request):
     """Get expense breakdown by category"""
     user = request.user
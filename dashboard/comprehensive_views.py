@@ -1,16 +1,20 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, Q
 from django.utils import timezone
 from datetime import timedelta
 
 from giving.models import GivingTransaction, GivingCategory
+from giving.rollups import completed_giving, total_given
+from common.cache import cache_response
+from common.timeseries import income_expense_series, trailing_range
 from expenses.models import Expense
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response(timeout=300, key_prefix='dashboard_comprehensive')
 def comprehensive_dashboard(request):
     """Get comprehensive dashboard data with church information."""
     user = request.user
@@ -34,14 +38,12 @@ def comprehensive_dashboard(request):
     church = user.church
     
     # Financial Summary
-    total_income = GivingTransaction.objects.filter(
-        church=church
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    total_income = total_given(completed_giving(Q(church=church)))
     
-    monthly_income = GivingTransaction.objects.filter(
-        church=church,
-        created_at__gte=timezone.now() - timedelta(days=30)
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    monthly_income = total_given(completed_giving(
+        Q(church=church),
+        start=timezone.now() - timedelta(days=30)
+    ))
     
     total_expenses = Expense.objects.filter(
         user__church=church
@@ -53,28 +55,21 @@ def comprehensive_dashboard(request):
     ).aggregate(total=Sum('amount'))['total'] or 0
     
     # Monthly Trend (simplified for performance)
-    months = 6  # Reduced for better performance
-    trend_data = []
-    for i in range(months):
-        month_start = timezone.now() - timedelta(days=30 * (months - i - 1))
-        month_end = timezone.now() - timedelta(days=30 * (months - i - 2))
-        
-        income = GivingTransaction.objects.filter(
-            church=church,
-            created_at__range=[month_start, month_end]
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        expenses = Expense.objects.filter(
-            user__church=church,
-            date__range=[month_start.date(), month_end.date()]
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        trend_data.append({
-            'month': month_start.strftime('%Y-%m'),
-            'income': income,
-            'expenses': expenses,
-            'net': income - expenses
-        })
+    months = 6
+    start, end = trailing_range('month', months)
+    trend_data = [
+        {
+            'month': bucket['period'],
+            'income': bucket['income'],
+            'expenses': bucket['expenses'],
+            'net': bucket['net']
+        }
+        for bucket in income_expense_series(
+            'month', start, end,
+            income=completed_giving(Q(church=church)),
+            expenses=Expense.objects.filter(user__church=church)
+        )
+    ]
     
     return Response({
         'church': {
@@ -9,6 +9,9 @@ from django.utils import timezone
 from datetime import timedelta
 
 from giving.models import GivingTransaction, GivingCategory
+from giving.rollups import completed_giving, total_given, totals_by
+from common.cache import cache_response
+from common.timeseries import income_expense_series, trailing_range
 from expenses.models import Expense
 from accounts.models import User
 
@@ -19,6 +22,7 @@ def dashboard_view(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response(timeout=300, key_prefix='dashboard_financial_summary')
 def financial_summary(request):
     """Get financial summary for dashboard."""
     user = request.user
@@ -37,15 +41,13 @@ def financial_summary(request):
     
     church = user.church
     
-    # Calculate income (donations)
-    total_income = GivingTransaction.objects.filter(
-        church=church
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    # Calculate income (completed donations, from the daily rollups)
+    total_income = total_given(completed_giving(Q(church=church)))
     
-    monthly_income = GivingTransaction.objects.filter(
-        church=church,
-        transaction_date__gte=timezone.now() - timedelta(days=30)
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    monthly_income = total_given(completed_giving(
+        Q(church=church),
+        start=timezone.now() - timedelta(days=30)
+    ))
     
     # Calculate expenses
     total_expenses = Expense.objects.filter(
@@ -75,6 +77,7 @@ def financial_summary(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response(timeout=300, key_prefix='dashboard_monthly_trend')
 def monthly_trend(request):
     """Get monthly income/expense trend."""
     user = request.user
@@ -91,27 +94,21 @@ def monthly_trend(request):
     church = user.church
     months = 12
     
-    trend_data = []
-    for i in range(months):
-        month_start = timezone.now() - timedelta(days=30 * (months - i - 1))
-        month_end = timezone.now() - timedelta(days=30 * (months - i - 2))
-        
-        income = GivingTransaction.objects.filter(
-            church=church,
-            transaction_date__range=[month_start, month_end]
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        expenses = Expense.objects.filter(
-            user__church=church,
-            date__range=[month_start.date(), month_end.date()]
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        trend_data.append({
-            'month': month_start.strftime('%Y-%m'),
-            'income': income,
-            'expenses': expenses,
-            'net': income - expenses
-        })
+    # Last 12 calendar months, income and expenses in one grouped query each
+    start, end = trailing_range('month', months)
+    trend_data = [
+        {
+            'month': bucket['period'],
+            'income': bucket['income'],
+            'expenses': bucket['expenses'],
+            'net': bucket['net']
+        }
+        for bucket in income_expense_series(
+            'month', start, end,
+            income=completed_giving(Q(church=church)),
+            expenses=Expense.objects.filter(user__church=church)
+        )
+    ]
     
     return Response({
         'trend': trend_data,
@@ -127,6 +124,7 @@ def monthly_trend(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response(timeout=300, key_prefix='dashboard_income_breakdown')
 def income_breakdown(request):
     """Get income breakdown by category."""
     user = request.user
@@ -144,18 +142,20 @@ def income_breakdown(request):
     categories = GivingCategory.objects.filter(church=church)
     breakdown = []
     
+    # One grouped rollup query instead of two aggregates per category
+    totals = {
+        row['category_id']: row['total']
+        for row in totals_by(completed_giving(Q(church=church)), 'category_id')
+    }
+    church_total = max(1, sum(totals.values()) or 1)
+    
     for category in categories:
-        total = GivingTransaction.objects.filter(
-            church=church,
-            category=category
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        total = totals.get(category.id) or 0
         
         breakdown.append({
             'category': category.name,
             'amount': total,
-            'percentage': (total / max(1, GivingTransaction.objects.filter(
-                church=church
-            ).aggregate(total=Sum('amount'))['total'] or 1)) * 100
+            'percentage': (total / church_total) * 100
         })
     
     return Response({
@@ -172,6 +172,7 @@ def income_breakdown(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response(timeout=300, key_prefix='dashboard_expense_breakdown')
 def expense_breakdown(request):
     """Get expense breakdown by category."""
     user = request.user
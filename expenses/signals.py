@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Expense
+from common.cache import invalidate_cache
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def expense_changed(sender, instance, **kwargs):
+    """Invalidate the owning church's cached dashboards and reports"""
+    church_id = instance.user.church_id if instance.user_id else None
+    invalidate_cache(church_id)
@@ -2,3 +2,6 @@ from django.apps import AppConfig
 
 class GivingConfig(AppConfig):
     name = 'giving'
+
+    def ready(self):
+        import giving.signals
@@ -0,0 +1,155 @@
+"""
+Running totals for pledges and campaigns.
+
+``Pledge.paid_amount`` and ``GivingCampaign.current_amount`` are adjusted
+with single ``F()`` UPDATEs as transactions move into or out of
+``completed`` (from ``giving.signals``), so recording a payment costs the
+same no matter how many gifts a pledge or campaign already has.
+
+The adjustment runs inside the caller's database transaction, right after
+the status change (``mark_completed`` and ``refund`` open one), so counter
+and ledger commit together. ``verify_counters`` locks each suspect row
+before re-reading the ledger and therefore never "repairs" a counter whose
+increment is still in flight; the ``verify_giving_counters`` task runs it
+periodically.
+"""
+from decimal import Decimal
+import logging
+
+from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.utils import timezone
+
+from .models import GivingCampaign, GivingTransaction, GivingTransactionCampaign, Pledge
+
+logger = logging.getLogger(__name__)
+
+
+def _pledge_contribution(state):
+    """``(pledge_id, amount)`` a transaction state counts towards, or ``None``."""
+    if not state or state.get('status') != 'completed' or not state.get('pledge_id'):
+        return None
+    if state.get('amount') in (None, ''):
+        return None
+    return state['pledge_id'], Decimal(str(state['amount']))
+
+
+def adjust_pledge(pledge_id, amount):
+    """
+    Atomically add ``amount`` (may be negative) to a pledge and refresh its
+    status the way ``Pledge.update_paid_amount`` does; cancelled pledges keep
+    their status.
+    """
+    new_paid = F('paid_amount') + amount
+    Pledge.objects.filter(pk=pledge_id).update(
+        paid_amount=new_paid,
+        status=Case(
+            When(status='cancelled', then=F('status')),
+            When(pledge_amount__lte=new_paid, then=Value('fully_paid')),
+            When(paid_amount__gt=-amount, then=Value('partially_paid')),
+            When(end_date__lt=timezone.localdate(), then=Value('overdue')),
+            default=F('status'),
+        ),
+    )
+
+
+def adjust_campaign(campaign_id, amount):
+    """Atomically add ``amount`` (may be negative) to a campaign's current amount."""
+    GivingCampaign.objects.filter(pk=campaign_id).update(current_amount=F('current_amount') + amount)
+
+
+def record_transition(transaction_id, old_state, new_state):
+    """
+    Move a transaction's pledge and campaign contributions from ``old_state``
+    to ``new_state`` (either may be ``None`` for create/delete).
+    """
+    old_pledge = _pledge_contribution(old_state)
+    new_pledge = _pledge_contribution(new_state)
+    if old_pledge != new_pledge:
+        if old_pledge:
+            adjust_pledge(old_pledge[0], -old_pledge[1])
+        if new_pledge:
+            adjust_pledge(new_pledge[0], new_pledge[1])
+
+    # Campaigns count the allocated amount of completed transactions.
+    was_completed = bool(old_state) and old_state.get('status') == 'completed'
+    is_completed = bool(new_state) and new_state.get('status') == 'completed'
+    if was_completed != is_completed and transaction_id:
+        sign = 1 if is_completed else -1
+        allocations = GivingTransactionCampaign.objects.filter(
+            transaction_id=transaction_id
+        ).values_list('campaign_id', 'allocated_amount')
+        for campaign_id, allocated in allocations:
+            adjust_campaign(campaign_id, sign * allocated)
+
+
+def _ledger_pledge_totals(pledge_ids=None):
+    rows = GivingTransaction.objects.filter(status='completed', pledge__isnull=False)
+    if pledge_ids is not None:
+        rows = rows.filter(pledge_id__in=pledge_ids)
+    return {
+        row['pledge_id']: row['total']
+        for row in rows.values('pledge_id').annotate(total=Sum('amount')).order_by()
+    }
+
+
+def _ledger_campaign_totals(campaign_ids=None):
+    rows = GivingTransactionCampaign.objects.filter(transaction__status='completed')
+    if campaign_ids is not None:
+        rows = rows.filter(campaign_id__in=campaign_ids)
+    return {
+        row['campaign_id']: row['total']
+        for row in rows.values('campaign_id').annotate(total=Sum('allocated_amount')).order_by()
+    }
+
+
+def _suspects(model, field, ledger_totals):
+    """IDs whose stored counter disagrees with the ledger."""
+    suspects = []
+    for pk, stored in model.objects.values_list('pk', field).iterator():
+        if (stored or Decimal('0.00')) != (ledger_totals.get(pk) or Decimal('0.00')):
+            suspects.append(pk)
+    return suspects
+
+
+def verify_counters(repair=True):
+    """
+    Compare pledge and campaign counters with the ledger and fix drift.
+
+    One grouped query per model finds suspects; each suspect is then locked
+    and re-checked against a fresh ledger read before being corrected.
+    Returns ``{'pledges': [...], 'campaigns': [...]}`` with
+    ``(id, stored, expected)`` tuples for every counter that drifted.
+    """
+    drift = {'pledges': [], 'campaigns': []}
+
+    for pledge_id in _suspects(Pledge, 'paid_amount', _ledger_pledge_totals()):
+        with transaction.atomic():
+            pledge = Pledge.objects.select_for_update().filter(pk=pledge_id).first()
+            if pledge is None:
+                continue
+            expected = _ledger_pledge_totals([pledge_id]).get(pledge_id) or Decimal('0.00')
+            if pledge.paid_amount == expected:
+                continue
+            drift['pledges'].append((pledge_id, pledge.paid_amount, expected))
+            if repair:
+                adjust_pledge(pledge_id, expected - pledge.paid_amount)
+
+    for campaign_id in _suspects(GivingCampaign, 'current_amount', _ledger_campaign_totals()):
+        with transaction.atomic():
+            campaign = GivingCampaign.objects.select_for_update().filter(pk=campaign_id).first()
+            if campaign is None:
+                continue
+            expected = _ledger_campaign_totals([campaign_id]).get(campaign_id) or Decimal('0.00')
+            if campaign.current_amount == expected:
+                continue
+            drift['campaigns'].append((campaign_id, campaign.current_amount, expected))
+            if repair:
+                adjust_campaign(campaign_id, expected - campaign.current_amount)
+
+    if drift['pledges'] or drift['campaigns']:
+        logger.warning(
+            f"Giving counter drift: {len(drift['pledges'])} pledges, {len(drift['campaigns'])} campaigns"
+            f"{' repaired' if repair else ''}"
+        )
+    return drift
@@ -0,0 +1,103 @@
+"""
+Streaming exports of giving transactions.
+
+Rows are read in primary-key order, ``EXPORT_CHUNK_SIZE`` at a time with
+keyset pagination (``pk > last pk seen``), and written straight to a
+``StreamingHttpResponse``. Each chunk is a short indexed query, so memory
+use stays flat and no server-side cursor is held open while a slow client
+downloads the export.
+"""
+import csv
+import json
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+EXPORT_CHUNK_SIZE = 2000
+
+# (output column, queryset lookup)
+EXPORT_COLUMNS = (
+    ('transaction_id', 'transaction_id'),
+    ('transaction_date', 'transaction_date'),
+    ('completed_date', 'completed_date'),
+    ('church_id', 'church_id'),
+    ('church', 'church__name'),
+    ('category', 'category__name'),
+    ('member_id', 'member_id'),
+    ('member_first_name', 'member__user__first_name'),
+    ('member_last_name', 'member__user__last_name'),
+    ('is_anonymous', 'is_anonymous'),
+    ('amount', 'amount'),
+    ('currency', 'currency'),
+    ('payment_method', 'payment_method'),
+    ('payment_reference', 'payment_reference'),
+    ('transaction_type', 'transaction_type'),
+    ('status', 'status'),
+)
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+_ANONYMOUS_COLUMNS = {'member_id', 'member_first_name', 'member_last_name'}
+
+
+class _Echo:
+    """File-like object whose write() just returns the value (for csv.writer)."""
+
+    def write(self, value):
+        return value
+
+
+def iter_export_rows(queryset):
+    """Yield one dict per transaction, hiding donor identity on anonymous gifts."""
+    names = [name for name, _ in EXPORT_COLUMNS]
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    rows = queryset.order_by('pk').values_list('pk', *lookups)
+    last_pk = 0
+    while True:
+        chunk = list(rows.filter(pk__gt=last_pk)[:EXPORT_CHUNK_SIZE])
+        if not chunk:
+            return
+        last_pk = chunk[-1][0]
+        for values in chunk:
+            yield _export_row(names, values[1:])
+        if len(chunk) < EXPORT_CHUNK_SIZE:
+            return
+
+
+def _export_row(names, values):
+    row = dict(zip(names, values))
+    for name in ('transaction_date', 'completed_date'):
+        if isinstance(row[name], datetime) and timezone.is_aware(row[name]):
+            row[name] = timezone.localtime(row[name])
+    if row['is_anonymous']:
+        for column in _ANONYMOUS_COLUMNS:
+            row[column] = None
+    return row
+
+
+def stream_csv(queryset):
+    """Yield CSV lines (header first) for ``queryset``."""
+    writer = csv.writer(_Echo())
+    names = [name for name, _ in EXPORT_COLUMNS]
+    yield writer.writerow(names)
+    for row in iter_export_rows(queryset):
+        yield writer.writerow([
+            value.isoformat() if hasattr(value, 'isoformat') else ('' if value is None else value)
+            for value in (row[name] for name in names)
+        ])
+
+
+def stream_ndjson(queryset):
+    """Yield one JSON document per line for ``queryset``."""
+    for row in iter_export_rows(queryset):
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+}
@@ -0,0 +1,82 @@
+"""
+Management command: generate and email annual giving statements.
+
+Re-running the command for the same church and year resumes the previous
+run — statements already rendered or emailed are skipped.
+
+Usage:
+    # Last calendar year for one church, rendering on every CPU
+    python manage.py generate_giving_statements --church 12
+
+    # Every church in a denomination, 8 render workers, no email
+    python manage.py generate_giving_statements --denomination 3 --year 2025 --workers 8 --no-email
+
+    # Queue one Celery task per church instead of running here
+    python manage.py generate_giving_statements --denomination 3 --year 2025 --async
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Generate annual giving statements (HTML + PDF) for every member of a church and email them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--church', type=int, action='append', default=[], help='Church ID (repeatable)')
+        parser.add_argument('--denomination', type=int, default=None, help='Every verified church in this denomination ID')
+        parser.add_argument('--year', type=int, default=None, help='Calendar year (default: last year)')
+        parser.add_argument('--workers', type=int, default=None, help='Render processes (default: CPU count, 1 = inline)')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Statements per progress checkpoint')
+        parser.add_argument('--no-email', action='store_true', help='Only render statements')
+        parser.add_argument('--force', action='store_true', help='Discard previous progress and start over')
+        parser.add_argument('--async', action='store_true', dest='run_async', help='Queue Celery tasks instead')
+
+    def handle(self, *args, **options):
+        from churches.models import Church
+        from giving.statements import STATEMENT_CHUNK_SIZE, generate_statements
+        from giving.tasks import generate_giving_statements
+
+        year = options['year'] or timezone.localdate().year - 1
+        if year < 1900 or year > timezone.localdate().year:
+            raise CommandError(f"Invalid year: {year}")
+
+        churches = Church.objects.none()
+        if options['church']:
+            churches = Church.objects.filter(id__in=options['church'])
+        if options['denomination']:
+            churches = churches | Church.objects.filter(denomination_id=options['denomination'], status='verified')
+        if not options['church'] and not options['denomination']:
+            raise CommandError("Pass --church and/or --denomination.")
+        churches = list(churches.order_by('id'))
+        if not churches:
+            raise CommandError("No matching churches found.")
+
+        send_email = not options['no_email']
+
+        if options['run_async']:
+            for church in churches:
+                generate_giving_statements.delay(church.id, year, send_email=send_email, force=options['force'])
+            self.stdout.write(self.style.SUCCESS(f"Queued {year} statements for {len(churches)} churches."))
+            return
+
+        def report(run):
+            self.stdout.write(
+                f"  {run.church.name}: {run.generated_count}/{run.total_members} generated, "
+                f"{run.emailed_count} emailed, {run.failed_count} failed"
+            )
+
+        for church in churches:
+            self.stdout.write(f"Generating {year} statements for {church.name}...")
+            run = generate_statements(
+                church, year,
+                send_email=send_email,
+                workers=options['workers'],
+                chunk_size=options['chunk_size'] or STATEMENT_CHUNK_SIZE,
+                force=options['force'],
+                progress=report,
+            )
+            style = self.style.SUCCESS if not run.failed_count else self.style.WARNING
+            self.stdout.write(style(
+                f"{church.name}: {run.generated_count} statements, {run.emailed_count} emailed, "
+                f"{run.failed_count} failed."
+            ))
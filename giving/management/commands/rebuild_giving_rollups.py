@@ -0,0 +1,37 @@
+"""
+Management command: rebuild the daily giving rollup table from the ledger.
+
+Usage:
+    # Rebuild everything
+    python manage.py rebuild_giving_rollups
+
+    # Rebuild one church for a date range
+    python manage.py rebuild_giving_rollups --church 12 --start 2026-01-01 --end 2026-03-31
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Recompute giving_daily_rollups from completed GivingTransaction rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--church', type=int, default=None, help='Only rebuild this church ID')
+        parser.add_argument('--start', default=None, help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end',   default=None, help='Last day to rebuild (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        from giving.rollups import rebuild_rollups
+
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end   = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+
+        if start and end and start > end:
+            raise CommandError("--start must be on or before --end.")
+
+        written = rebuild_rollups(church_id=options['church'], start=start, end=end)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} rollup rows."))
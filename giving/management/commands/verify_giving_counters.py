@@ -0,0 +1,36 @@
+"""
+Management command: compare pledge and campaign totals with the ledger.
+
+Usage:
+    # Report and repair drift
+    python manage.py verify_giving_counters
+
+    # Only report
+    python manage.py verify_giving_counters --dry-run
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Verify Pledge.paid_amount and GivingCampaign.current_amount against completed transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without repairing it')
+
+    def handle(self, *args, **options):
+        from giving.counters import verify_counters
+
+        repair = not options['dry_run']
+        drift = verify_counters(repair=repair)
+
+        for label, rows in (('Pledge', drift['pledges']), ('Campaign', drift['campaigns'])):
+            for pk, stored, expected in rows:
+                self.stdout.write(f"{label} {pk}: stored {stored}, ledger {expected}")
+
+        total = len(drift['pledges']) + len(drift['campaigns'])
+        if not total:
+            self.stdout.write(self.style.SUCCESS("All pledge and campaign counters match the ledger."))
+        elif repair:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {total} counters."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{total} counters differ from the ledger."))
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('churches', '0004_church_accent_color_church_bank_account_name_and_more'),
+        ('giving', '0003_givingtransaction_disbursement_status_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GivingDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_method', models.CharField(choices=[('paystack', 'Paystack'), ('card', 'Credit/Debit Card'), ('bank_transfer', 'Bank Transfer'), ('cash', 'Cash'), ('mobile_money', 'Mobile Money'), ('check', 'Check'), ('other', 'Other')], max_length=20, verbose_name='Payment Method')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=17, verbose_name='Total Amount')),
+                ('transaction_count', models.IntegerField(default=0, verbose_name='Transaction Count')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='giving.givingcategory')),
+                ('church', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='giving_rollups', to='churches.church')),
+            ],
+            options={
+                'verbose_name': 'Giving Daily Rollup',
+                'verbose_name_plural': 'Giving Daily Rollups',
+                'db_table': 'giving_daily_rollups',
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['church', 'day'], name='giving_dail_church__94cae0_idx'), models.Index(fields=['day'], name='giving_dail_day_62c1e1_idx')],
+                'unique_together': {('church', 'category', 'payment_method', 'day')},
+            },
+        ),
+    ]
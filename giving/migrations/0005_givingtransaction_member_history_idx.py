@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('giving', '0004_givingdailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='givingtransaction',
+            index=models.Index(fields=['member', '-transaction_date', '-id'], name='giving_tx_member_history_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('churches', '0004_church_accent_color_church_bank_account_name_and_more'),
+        ('giving', '0005_givingtransaction_member_history_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GivingStatementRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('year', models.PositiveIntegerField(verbose_name='Year')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='Status')),
+                ('send_email', models.BooleanField(default=True, verbose_name='Send Email')),
+                ('total_members', models.PositiveIntegerField(default=0, verbose_name='Total Members')),
+                ('generated_count', models.PositiveIntegerField(default=0, verbose_name='Generated')),
+                ('emailed_count', models.PositiveIntegerField(default=0, verbose_name='Emailed')),
+                ('failed_count', models.PositiveIntegerField(default=0, verbose_name='Failed')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Started At')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished At')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last Error')),
+                ('church', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='giving_statement_runs', to='churches.church')),
+            ],
+            options={
+                'verbose_name': 'Giving Statement Run',
+                'verbose_name_plural': 'Giving Statement Runs',
+                'db_table': 'giving_statement_runs',
+                'ordering': ['-year', '-created_at'],
+                'unique_together': {('church', 'year')},
+            },
+        ),
+        migrations.CreateModel(
+            name='GivingStatement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Total Amount')),
+                ('transaction_count', models.PositiveIntegerField(default=0, verbose_name='Transaction Count')),
+                ('html_file', models.CharField(blank=True, max_length=255, verbose_name='HTML File')),
+                ('pdf_file', models.CharField(blank=True, max_length=255, verbose_name='PDF File')),
+                ('generated_at', models.DateTimeField(blank=True, null=True, verbose_name='Generated At')),
+                ('emailed_at', models.DateTimeField(blank=True, null=True, verbose_name='Emailed At')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='giving_statements', to='accounts.member')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statements', to='giving.givingstatementrun')),
+            ],
+            options={
+                'verbose_name': 'Giving Statement',
+                'verbose_name_plural': 'Giving Statements',
+                'db_table': 'giving_statements',
+                'ordering': ['run', 'member'],
+                'indexes': [models.Index(fields=['member'], name='giving_stat_member__134783_idx')],
+                'unique_together': {('run', 'member')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('giving', '0006_givingstatementrun_givingstatement'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recurringgiving',
+            index=models.Index(fields=['status', 'next_payment_date'], name='giving_recurring_due_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('giving', '0007_recurringgiving_giving_recurring_due_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GivingOutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('giving_completed', 'Giving Completed'), ('giving_refunded', 'Giving Refunded')], max_length=30, verbose_name='Event Type')),
+                ('event_key', models.CharField(max_length=100, unique=True, verbose_name='Event Key')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Payload')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='Status')),
+                ('handled', models.JSONField(blank=True, default=list, verbose_name='Handled By')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Available At')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Locked Until')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Processed At')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox_events', to='giving.givingtransaction')),
+            ],
+            options={
+                'verbose_name': 'Giving Outbox Event',
+                'verbose_name_plural': 'Giving Outbox Events',
+                'db_table': 'giving_outbox_events',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'available_at'], name='giving_outbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_paymentbatch'),
+        ('giving', '0008_givingoutboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='churchdisbursement',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='disbursements', to='payments.paymentbatch'),
+        ),
+        migrations.AddField(
+            model_name='churchdisbursement',
+            name='transaction_count',
+            field=models.PositiveIntegerField(default=1, verbose_name='Transaction Count'),
+        ),
+        migrations.AddField(
+            model_name='churchdisbursement',
+            name='transfer_reference',
+            field=models.CharField(blank=True, help_text='Reference sent with a batched transfer; changes on each retry', max_length=100, verbose_name='Transfer Reference'),
+        ),
+        migrations.AddField(
+            model_name='givingtransaction',
+            name='settlement_disbursement',
+            field=models.ForeignKey(blank=True, help_text='Batched disbursement that paid this gift out to the church', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='settled_transactions', to='giving.churchdisbursement'),
+        ),
+        migrations.AlterField(
+            model_name='churchdisbursement',
+            name='giving_transaction',
+            field=models.OneToOneField(blank=True, help_text='Set for per-gift disbursements; batched ones cover settled_transactions', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='disbursement', to='giving.givingtransaction'),
+        ),
+        migrations.AddIndex(
+            model_name='churchdisbursement',
+            index=models.Index(fields=['transfer_reference'], name='church_disb_transfe_5d59e0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='givingtransaction',
+            index=models.Index(fields=['disbursement_status', 'completed_date'], name='giving_tx_unsettled_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.utils.translation import gettext_lazy as _
+from django.utils import timezone
 from django.core.validators import MinValueValidator
 from common.models import TimeStampedModel, FinancialModel
 from common.validators import validate_amount
@@ -223,6 +224,14 @@ class GivingTransaction(FinancialModel):
         ],
         default='pending'
     )
+    settlement_disbursement = models.ForeignKey(
+        'ChurchDisbursement',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='settled_transactions',
+        help_text=_('Batched disbursement that paid this gift out to the church')
+    )
     
     class Meta:
         db_table = 'giving_transactions'
@@ -239,6 +248,10 @@ class GivingTransaction(FinancialModel):
             models.Index(fields=['payment_method']),
             models.Index(fields=['transaction_date']),
             models.Index(fields=['payment_reference']),
+            # Keyset pagination of a member's history on (transaction_date, id)
+            models.Index(fields=['member', '-transaction_date', '-id'], name='giving_tx_member_history_idx'),
+            # Completed gifts awaiting payout, per settlement window
+            models.Index(fields=['disbursement_status', 'completed_date'], name='giving_tx_unsettled_idx'),
         ]
     
     def __str__(self):
@@ -246,39 +259,25 @@ class GivingTransaction(FinancialModel):
     
     def mark_completed(self, payment_reference=None):
         """Mark transaction as completed"""
+        from django.db import transaction as db_transaction
         from django.utils import timezone
         
         self.status = 'completed'
         self.completed_date = timezone.now()
         if payment_reference:
             self.payment_reference = payment_reference
-        self.save()
-        
-        # Send confirmation notification
-        from common.services import NotificationService
-        NotificationService.send_giving_confirmation(
-            self.member,
-            self.amount,
-            str(self.transaction_id)
-        )
         
-        # Update pledge if applicable
-        if self.pledge:
-            self.pledge.update_paid_amount()
-        
-        # Log completion
-        from common.services import AuditService
-        AuditService.log_financial_transaction(
-            user=self.created_by,
-            action='GIVING_COMPLETED',
-            amount=self.amount,
-            details={
-                'transaction_id': str(self.transaction_id),
-                'member': self.member.user.email,
-                'category': self.category.name,
-                'payment_method': self.payment_method
-            }
-        )
+        # Pledge and campaign totals are adjusted by giving.signals, and the
+        # confirmation email and audit entry are queued in the outbox, in the
+        # same database transaction as the status change.
+        from .outbox import enqueue
+        with db_transaction.atomic():
+            self.save()
+            enqueue(self, 'giving_completed', {
+                'amount': str(self.amount),
+                'payment_method': self.payment_method,
+                'user_id': self.created_by_id,
+            })
     
     def mark_failed(self, reason):
         """Mark transaction as failed"""
@@ -296,25 +295,21 @@ class GivingTransaction(FinancialModel):
     
     def refund(self, amount, reason):
         """Process refund"""
+        from django.db import transaction as db_transaction
         from django.utils import timezone
         
         self.status = 'refunded'
         self.refund_amount = amount
         self.refund_reason = reason
         self.refund_date = timezone.now()
-        self.save()
-        
-        # Log refund
-        from common.services import AuditService
-        AuditService.log_financial_transaction(
-            user=self.updated_by,
-            action='GIVING_REFUND',
-            amount=amount,
-            details={
-                'original_transaction': str(self.transaction_id),
-                'reason': reason
-            }
-        )
+        from .outbox import enqueue
+        with db_transaction.atomic():
+            self.save()
+            enqueue(self, 'giving_refunded', {
+                'amount': str(amount),
+                'reason': reason,
+                'user_id': self.updated_by_id,
+            })
 
 
 class RecurringGiving(FinancialModel):
@@ -411,6 +406,8 @@ class RecurringGiving(FinancialModel):
             models.Index(fields=['status']),
             models.Index(fields=['frequency']),
             models.Index(fields=['next_payment_date']),
+            # Due-schedule lookups by the recurring giving scheduler
+            models.Index(fields=['status', 'next_payment_date'], name='giving_recurring_due_idx'),
         ]
     
     def __str__(self):
@@ -431,31 +428,26 @@ class RecurringGiving(FinancialModel):
         self.status = 'cancelled'
         self.save()
     
-    def update_next_payment_date(self):
+    def update_next_payment_date(self, save=True):
         """Update next payment date based on frequency"""
-        from datetime import timedelta, date
-        
-        current_date = self.next_payment_date
-        
-        if self.frequency == 'weekly':
-            self.next_payment_date = current_date + timedelta(weeks=1)
-        elif self.frequency == 'bi_weekly':
-            self.next_payment_date = current_date + timedelta(weeks=2)
-        elif self.frequency == 'monthly':
-            # Add one month
-            if current_date.month == 12:
-                self.next_payment_date = date(current_date.year + 1, 1, current_date.day)
-            else:
-                self.next_payment_date = date(current_date.year, current_date.month + 1, current_date.day)
-        elif self.frequency == 'quarterly':
-            self.next_payment_date = current_date + timedelta(weeks=13)
-        elif self.frequency == 'yearly':
-            self.next_payment_date = date(current_date.year + 1, current_date.month, current_date.day)
+        from .recurring import next_payment_date
         
-        self.save()
+        self.next_payment_date = next_payment_date(
+            self.next_payment_date,
+            self.frequency,
+            anchor_day=self.start_date.day
+        )
+        
+        if save:
+            self.save(update_fields=['next_payment_date', 'updated_at'])
     
     def process_payment(self):
-        """Process recurring payment"""
+        """
+        Process one recurring payment for this schedule.
+        
+        The scheduler (giving.recurring) does the same for many schedules at
+        once with bulk writes.
+        """
         from django.utils import timezone
         
         if self.status != 'active':
@@ -469,9 +461,10 @@ class RecurringGiving(FinancialModel):
             transaction_type='recurring',
             amount=self.amount,
             payment_method=self.payment_method,
-            transaction_date=timezone.now().date(),
+            transaction_date=timezone.now(),
             recurring_giving=self,
-            created_by=self.member.user
+            created_by=self.member.user,
+            updated_by=self.member.user
         )
         
         # Update statistics
@@ -479,13 +472,15 @@ class RecurringGiving(FinancialModel):
         self.total_transactions += 1
         
         # Update next payment date
-        self.update_next_payment_date()
+        self.update_next_payment_date(save=False)
         
         # Check if end date reached
         if self.end_date and self.next_payment_date > self.end_date:
             self.status = 'completed'
         
-        self.save()
+        self.save(update_fields=[
+            'total_amount_given', 'total_transactions', 'next_payment_date', 'status', 'updated_at'
+        ])
         
         return transaction
 
@@ -604,7 +599,12 @@ class Pledge(TimeStampedModel):
         )
     
     def update_paid_amount(self):
-        """Update paid amount from transactions"""
+        """
+        Recompute paid amount from transactions.
+        
+        Payments adjust ``paid_amount`` incrementally (see giving.counters);
+        this full re-aggregation is only needed to repair drift.
+        """
         total_paid = self.payments.filter(
             status='completed'
         ).aggregate(total=models.Sum('amount'))['total'] or 0
@@ -619,7 +619,7 @@ class Pledge(TimeStampedModel):
         elif self.is_overdue:
             self.status = 'overdue'
         
-        self.save()
+        self.save(update_fields=['paid_amount', 'status', 'updated_at'])
     
     def calculate_installment_amount(self):
         """Calculate installment amount"""
@@ -757,18 +757,26 @@ class GivingCampaign(TimeStampedModel):
         )
     
     def update_current_amount(self):
-        """Update current amount from transactions"""
+        """
+        Recompute current amount from completed transactions.
+        
+        Completed gifts adjust ``current_amount`` incrementally (see
+        giving.counters); this full re-aggregation is only needed to repair drift.
+        """
         total = self.transactions.filter(
-            status='completed'
-        ).aggregate(total=models.Sum('amount'))['total'] or 0
+            transaction__status='completed'
+        ).aggregate(total=models.Sum('allocated_amount'))['total'] or 0
         
         self.current_amount = total
-        self.save()
+        self.save(update_fields=['current_amount', 'updated_at'])
     
-    def add_transaction(self, transaction):
+    def add_transaction(self, transaction, allocated_amount=None):
         """Add transaction to campaign"""
-        self.transactions.add(transaction)
-        self.update_current_amount()
+        GivingTransactionCampaign.objects.get_or_create(
+            transaction=transaction,
+            campaign=self,
+            defaults={'allocated_amount': allocated_amount or transaction.amount}
+        )
 
 
 class GivingTransactionCampaign(models.Model):
@@ -823,8 +831,19 @@ class ChurchDisbursement(TimeStampedModel):
     giving_transaction = models.OneToOneField(
         GivingTransaction,
         on_delete=models.CASCADE,
-        related_name='disbursement'
+        related_name='disbursement',
+        null=True,
+        blank=True,
+        help_text=_('Set for per-gift disbursements; batched ones cover settled_transactions')
     )
+    batch = models.ForeignKey(
+        'payments.PaymentBatch',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='disbursements'
+    )
+    transaction_count = models.PositiveIntegerField(_('Transaction Count'), default=1)
     church = models.ForeignKey(
         'churches.Church',
         on_delete=models.CASCADE,
@@ -881,6 +900,12 @@ class ChurchDisbursement(TimeStampedModel):
         null=True,
         help_text=_('Paystack transfer reference')
     )
+    transfer_reference = models.CharField(
+        _('Transfer Reference'),
+        max_length=100,
+        blank=True,
+        help_text=_('Reference sent with a batched transfer; changes on each retry')
+    )
     
     # Status and Tracking
     status = models.CharField(
@@ -913,11 +938,18 @@ class ChurchDisbursement(TimeStampedModel):
             models.Index(fields=['conversation_id']),
             models.Index(fields=['transfer_code']),
             models.Index(fields=['next_retry_at']),
+            models.Index(fields=['transfer_reference']),
         ]
     
     def __str__(self):
         return f"{self.church.name} - KES {self.amount} ({self.get_status_display()})"
     
+    def covered_transactions(self):
+        """Giving transactions paid out by this disbursement"""
+        if self.giving_transaction_id:
+            return GivingTransaction.objects.filter(id=self.giving_transaction_id)
+        return GivingTransaction.objects.filter(settlement_disbursement=self)
+    
     def save(self, *args, **kwargs):
         # Calculate net amount
         self.net_amount = self.amount - self.platform_fee
@@ -944,8 +976,7 @@ class ChurchDisbursement(TimeStampedModel):
         self.save()
         
         # Update transaction status
-        self.giving_transaction.disbursement_status = 'completed'
-        self.giving_transaction.save()
+        self.covered_transactions().update(disbursement_status='completed')
     
     def mark_failed(self, error_message):
         """Mark disbursement as failed and schedule retry if needed"""
@@ -965,5 +996,210 @@ class ChurchDisbursement(TimeStampedModel):
         
         # Mark transaction as failed if max retries reached
         if self.retry_count >= self.max_retries:
-            self.giving_transaction.disbursement_status = 'failed'
-            self.giving_transaction.save()
+            self.covered_transactions().update(disbursement_status='failed')
+
+
+class GivingDailyRollup(models.Model):
+    """
+    Pre-aggregated completed giving per church, category, payment method
+    and (local) calendar day.
+
+    Maintained incrementally by ``giving.signals`` whenever a transaction
+    moves into or out of ``completed``; ``rebuild_giving_rollups`` recomputes
+    it from the ledger. Reports read from here instead of summing
+    ``GivingTransaction`` on every request.
+    """
+    
+    church = models.ForeignKey(
+        'churches.Church',
+        on_delete=models.CASCADE,
+        related_name='giving_rollups'
+    )
+    category = models.ForeignKey(
+        GivingCategory,
+        on_delete=models.CASCADE,
+        related_name='daily_rollups'
+    )
+    payment_method = models.CharField(
+        _('Payment Method'),
+        max_length=20,
+        choices=GivingTransaction.PAYMENT_METHOD_CHOICES
+    )
+    day = models.DateField(_('Day'))
+    
+    total_amount = models.DecimalField(
+        _('Total Amount'),
+        max_digits=17,
+        decimal_places=2,
+        default=0
+    )
+    transaction_count = models.IntegerField(_('Transaction Count'), default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'giving_daily_rollups'
+        verbose_name = _('Giving Daily Rollup')
+        verbose_name_plural = _('Giving Daily Rollups')
+        ordering = ['-day']
+        unique_together = ['church', 'category', 'payment_method', 'day']
+        indexes = [
+            models.Index(fields=['church', 'day']),
+            models.Index(fields=['day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.church_id} - {self.day} - KES {self.total_amount}"
+
+
+class GivingStatementRun(TimeStampedModel):
+    """A batch of annual giving statements for one church and year"""
+    
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('completed', _('Completed')),
+        ('failed', _('Failed')),
+    ]
+    
+    church = models.ForeignKey(
+        'churches.Church',
+        on_delete=models.CASCADE,
+        related_name='giving_statement_runs'
+    )
+    year = models.PositiveIntegerField(_('Year'))
+    status = models.CharField(
+        _('Status'),
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending'
+    )
+    send_email = models.BooleanField(_('Send Email'), default=True)
+    
+    # Progress
+    total_members = models.PositiveIntegerField(_('Total Members'), default=0)
+    generated_count = models.PositiveIntegerField(_('Generated'), default=0)
+    emailed_count = models.PositiveIntegerField(_('Emailed'), default=0)
+    failed_count = models.PositiveIntegerField(_('Failed'), default=0)
+    
+    started_at = models.DateTimeField(_('Started At'), null=True, blank=True)
+    finished_at = models.DateTimeField(_('Finished At'), null=True, blank=True)
+    last_error = models.TextField(_('Last Error'), blank=True)
+    
+    class Meta:
+        db_table = 'giving_statement_runs'
+        verbose_name = _('Giving Statement Run')
+        verbose_name_plural = _('Giving Statement Runs')
+        ordering = ['-year', '-created_at']
+        unique_together = ['church', 'year']
+    
+    def __str__(self):
+        return f"{self.church.name} - {self.year} - {self.get_status_display()}"
+    
+    @property
+    def progress_percentage(self):
+        """Percentage of members whose statement has been generated"""
+        if not self.total_members:
+            return 0
+        return min(100, (self.generated_count / self.total_members) * 100)
+
+
+class GivingStatement(TimeStampedModel):
+    """One member's annual giving statement within a statement run"""
+    
+    run = models.ForeignKey(
+        GivingStatementRun,
+        on_delete=models.CASCADE,
+        related_name='statements'
+    )
+    member = models.ForeignKey(
+        'accounts.Member',
+        on_delete=models.CASCADE,
+        related_name='giving_statements'
+    )
+    total_amount = models.DecimalField(
+        _('Total Amount'),
+        max_digits=15,
+        decimal_places=2,
+        default=0
+    )
+    transaction_count = models.PositiveIntegerField(_('Transaction Count'), default=0)
+    
+    # Paths relative to MEDIA_ROOT
+    html_file = models.CharField(_('HTML File'), max_length=255, blank=True)
+    pdf_file = models.CharField(_('PDF File'), max_length=255, blank=True)
+    
+    generated_at = models.DateTimeField(_('Generated At'), null=True, blank=True)
+    emailed_at = models.DateTimeField(_('Emailed At'), null=True, blank=True)
+    error = models.TextField(_('Error'), blank=True)
+    
+    class Meta:
+        db_table = 'giving_statements'
+        verbose_name = _('Giving Statement')
+        verbose_name_plural = _('Giving Statements')
+        ordering = ['run', 'member']
+        unique_together = ['run', 'member']
+        indexes = [
+            models.Index(fields=['member']),
+        ]
+    
+    def __str__(self):
+        return f"{self.member} - {self.run.year} - KES {self.total_amount}"
+
+
+class GivingOutboxEvent(models.Model):
+    """
+    Side effect of a giving status change (confirmation email, audit entry)
+    recorded in the same database transaction as the change itself.
+
+    ``giving.outbox`` drains pending events in batches. Delivery is
+    at-least-once; ``handled`` lists the handlers that already ran so a
+    re-delivered event only repeats the work that did not finish.
+    """
+    
+    EVENT_TYPE_CHOICES = [
+        ('giving_completed', _('Giving Completed')),
+        ('giving_refunded', _('Giving Refunded')),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('processing', _('Processing')),
+        ('done', _('Done')),
+        ('failed', _('Failed')),
+    ]
+    
+    event_type = models.CharField(_('Event Type'), max_length=30, choices=EVENT_TYPE_CHOICES)
+    # One event per side effect, e.g. "giving_completed:<transaction uuid>"
+    event_key = models.CharField(_('Event Key'), max_length=100, unique=True)
+    transaction = models.ForeignKey(
+        GivingTransaction,
+        on_delete=models.CASCADE,
+        related_name='outbox_events'
+    )
+    payload = models.JSONField(_('Payload'), default=dict, blank=True)
+    
+    status = models.CharField(
+        _('Status'),
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending'
+    )
+    handled = models.JSONField(_('Handled By'), default=list, blank=True)
+    attempts = models.PositiveIntegerField(_('Attempts'), default=0)
+    available_at = models.DateTimeField(_('Available At'), default=timezone.now)
+    locked_until = models.DateTimeField(_('Locked Until'), null=True, blank=True)
+    processed_at = models.DateTimeField(_('Processed At'), null=True, blank=True)
+    last_error = models.TextField(_('Last Error'), blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'giving_outbox_events'
+        verbose_name = _('Giving Outbox Event')
+        verbose_name_plural = _('Giving Outbox Events')
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='giving_outbox_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_key} - {self.get_status_display()}"
@@ -1,9 +1,11 @@
-import requests
 import json
 from django.conf import settings
 from django.utils import timezone
 from decimal import Decimal
 import logging
+
+from common.http import ProviderClient
+from common.tokens import TokenCache
 from .models import GivingTransaction
 
 logger = logging.getLogger(__name__)
@@ -13,25 +15,35 @@ class MpesaDisbursementService:
     """Service for handling M-Pesa disbursements to churches"""
     
     BASE_URL = "https://api.safaricom.co.ke"
+    http = ProviderClient('mpesa')
+    
+    @classmethod
+    def _fetch_access_token(cls):
+        """Request a new access token from the Daraja OAuth endpoint"""
+        url = f"{cls.BASE_URL}/oauth/v1/generate?grant_type=client_credentials"
+        headers = {
+            "Authorization": f"Basic {settings.MPESA_BASIC_AUTH}"
+        }
+        
+        response = cls.http.get(url, headers=headers)
+        if response.status_code != 200:
+            raise ValueError(f"Failed to get M-Pesa access token: {response.text}")
+        
+        data = response.json()
+        return data["access_token"], data.get("expires_in", 3599)
+    
+    @classmethod
+    def token_cache(cls):
+        """Access token shared by all workers (see common.tokens)"""
+        return TokenCache(
+            'mpesa_b2c', f"{cls.BASE_URL}:{settings.MPESA_BASIC_AUTH}", cls._fetch_access_token
+        )
     
     @classmethod
     def get_access_token(cls):
         """Get M-Pesa API access token"""
         try:
-            url = f"{cls.BASE_URL}/oauth/v1/generate?grant_type=client_credentials"
-            headers = {
-                "Authorization": f"Basic {settings.MPESA_BASIC_AUTH}"
-            }
-            
-            response = requests.get(url, headers=headers)
-            
-            if response.status_code == 200:
-                data = response.json()
-                return data.get("access_token")
-            
-            logger.error(f"Failed to get M-Pesa access token: {response.text}")
-            return None
-            
+            return cls.token_cache().get()
         except Exception as e:
             logger.error(f"M-Pesa access token error: {str(e)}")
             return None
@@ -66,7 +78,9 @@ class MpesaDisbursementService:
                 "Occasion": f"Church Disbursement - {transaction_id}"
             }
             
-            response = requests.post(url, headers=headers, json=payload)
+            response = cls.http.post(url, headers=headers, json=payload)
+            if response.status_code == 401:
+                cls.token_cache().invalidate()
             
             if response.status_code == 200:
                 data = response.json()
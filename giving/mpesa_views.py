@@ -2,10 +2,10 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from django.http import JsonResponse
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-import json
 import logging
 
 from .models import ChurchDisbursement, GivingTransaction
@@ -212,68 +212,34 @@ def church_disbursements(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-@csrf_exempt
-@require_http_methods(["POST"])
-def mpesa_disbursement_result(request):
-    """Handle M-Pesa disbursement result callback"""
+def _store_mpesa_callback(request, source):
+    """Store an M-Pesa callback in the webhook inbox and acknowledge it."""
+    from payments.webhooks import mpesa_event_fields, store_event
+    
     try:
-        # Parse the callback data
-        result_data = json.loads(request.body)
-        
-        logger.info(f"Received M-Pesa disbursement callback: {result_data}")
+        event_type, event_key, reference, data = mpesa_event_fields(source, request.body)
+        store_event('mpesa', source, event_type, event_key, reference, data)
         
-        # Process the result
-        PaystackDisbursementService.handle_transfer_webhook(result_data)
+        logger.info(f"Received M-Pesa {source} callback for {reference or 'unknown conversation'}")
+        return JsonResponse({'ResultCode': 0, 'ResultDesc': 'Success'}, status=200)
         
-        return Response({'ResultCode': 0, 'ResultDesc': 'Success'}, status=status.HTTP_200_OK)
-        
-    except json.JSONDecodeError:
-        logger.error("Invalid JSON in M-Pesa disbursement callback")
-        return Response(
-            {'ResultCode': 1, 'ResultDesc': 'Invalid JSON'}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    except ValueError:
+        logger.error(f"Invalid JSON in M-Pesa {source} callback")
+        return JsonResponse({'ResultCode': 1, 'ResultDesc': 'Invalid JSON'}, status=400)
     except Exception as e:
-        logger.error(f"Error processing M-Pesa disbursement callback: {str(e)}")
-        return Response(
-            {'ResultCode': 1, 'ResultDesc': 'Internal error'}, 
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+        logger.error(f"Error storing M-Pesa {source} callback: {str(e)}")
+        return JsonResponse({'ResultCode': 1, 'ResultDesc': 'Internal error'}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def mpesa_disbursement_result(request):
+    """Handle M-Pesa disbursement result callback"""
+    return _store_mpesa_callback(request, 'mpesa_result')
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def mpesa_disbursement_timeout(request):
     """Handle M-Pesa disbursement timeout callback"""
-    try:
-        # Parse the timeout data
-        timeout_data = json.loads(request.body)
-        
-        logger.warning(f"M-Pesa disbursement timeout: {timeout_data}")
-        
-        # Find the disbursement and mark as failed for retry
-        conversation_id = timeout_data.get('ConversationID')
-        if conversation_id:
-            try:
-                disbursement = ChurchDisbursement.objects.get(
-                    conversation_id=conversation_id
-                )
-                disbursement.mark_failed("Transaction timeout")
-                logger.info(f"Marked disbursement {disbursement.id} for retry due to timeout")
-            except ChurchDisbursement.DoesNotExist:
-                logger.error(f"No disbursement found for timeout conversation ID: {conversation_id}")
-        
-        return Response({'ResultCode': 0, 'ResultDesc': 'Success'}, status=status.HTTP_200_OK)
-        
-    except json.JSONDecodeError:
-        logger.error("Invalid JSON in M-Pesa disbursement timeout")
-        return Response(
-            {'ResultCode': 1, 'ResultDesc': 'Invalid JSON'}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    except Exception as e:
-        logger.error(f"Error processing M-Pesa disbursement timeout: {str(e)}")
-        return Response(
-            {'ResultCode': 1, 'ResultDesc': 'Internal error'}, 
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+    return _store_mpesa_callback(request, 'mpesa_timeout')
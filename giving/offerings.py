@@ -0,0 +1,354 @@
+"""
+Bulk import of offline (cash / check) envelope offerings.
+
+A batch is a list of rows — parsed from CSV or given as JSON — with these
+fields:
+
+    member          membership number, email or member ID (required)
+    category        giving category name or ID (required)
+    amount          positive amount in KES (required)
+    payment_method  ``cash`` (default) or ``check``
+    reference       envelope or check number
+    date            YYYY-MM-DD (defaults to the batch's service date)
+    notes
+
+Members and categories are resolved against lookup maps fetched once per
+batch. A batch is all-or-nothing: every row is validated first, and only a
+fully valid batch is inserted with ``bulk_create`` in one transaction. The
+daily rollups, audit log, response cache and confirmation emails are then
+updated in one step each rather than once per gift.
+
+Usage:
+    from giving.offerings import import_offerings, parse_csv
+
+    result = import_offerings(church, request.user, parse_csv(upload))
+"""
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation
+import csv
+import io
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import Member
+from common.cache import invalidate_cache
+from . import rollups
+from .models import GivingCategory, GivingTransaction
+
+logger = logging.getLogger(__name__)
+
+# Roles allowed to record offerings for their church
+IMPORT_ROLES = ['admin', 'pastor', 'treasurer', 'usher', 'system_admin']
+OFFLINE_PAYMENT_METHODS = ('cash', 'check')
+MAX_BATCH_ROWS = 5000
+# Largest single gift AuditLog.amount can record
+MAX_AMOUNT = Decimal('99999999.99')
+
+# Accepted CSV header spellings → field
+COLUMN_ALIASES = {
+    'member': 'member',
+    'member_id': 'member',
+    'membership_number': 'member',
+    'email': 'member',
+    'category': 'category',
+    'category_id': 'category',
+    'giving_type': 'category',
+    'amount': 'amount',
+    'payment_method': 'payment_method',
+    'method': 'payment_method',
+    'reference': 'reference',
+    'envelope_number': 'reference',
+    'check_number': 'reference',
+    'date': 'date',
+    'transaction_date': 'date',
+    'notes': 'notes',
+}
+
+
+class OfferingImportError(Exception):
+    """Raised when a batch cannot be imported; ``errors`` lists row problems."""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+def parse_csv(upload):
+    """
+    Rows of a CSV upload (file object, bytes or text) as dicts keyed by field name.
+
+    Unknown columns are ignored.
+    """
+    if hasattr(upload, 'read'):
+        upload = upload.read()
+    if isinstance(upload, bytes):
+        upload = upload.decode('utf-8-sig')
+
+    reader = csv.DictReader(io.StringIO(upload))
+    if not reader.fieldnames:
+        raise OfferingImportError('The CSV file is empty')
+    columns = {
+        name: COLUMN_ALIASES.get((name or '').strip().lower())
+        for name in reader.fieldnames
+    }
+    for required in ('member', 'category', 'amount'):
+        if required not in columns.values():
+            raise OfferingImportError(f"Missing required column: {required}")
+
+    return [
+        {columns[name]: (value or '').strip() for name, value in row.items() if columns.get(name)}
+        for row in reader
+    ]
+
+
+def _member_lookup(church):
+    """Map membership number, email and ID (all as lower-case strings) → (member_id, user_id)."""
+    lookup = {}
+    rows = Member.objects.filter(church=church).values_list(
+        'id', 'user_id', 'membership_number', 'user__email'
+    )
+    for member_id, user_id, membership_number, email in rows.iterator():
+        value = (member_id, user_id)
+        lookup[str(member_id)] = value
+        if membership_number:
+            lookup[membership_number.lower()] = value
+        if email:
+            lookup[email.lower()] = value
+    return lookup
+
+
+def _category_lookup(church):
+    """Map category name (lower-case) and ID → category ID for the church's active categories."""
+    lookup = {}
+    for category_id, name in GivingCategory.objects.filter(
+        church=church, is_active=True
+    ).values_list('id', 'name'):
+        lookup[str(category_id)] = category_id
+        lookup[name.strip().lower()] = category_id
+    return lookup
+
+
+def _as_datetime(day):
+    """Local midnight of ``day`` as an aware datetime."""
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def validate_rows(church, rows, service_date=None):
+    """
+    Resolve and validate every row.
+
+    Returns ``(valid, errors)``: ``valid`` holds dicts ready to build
+    transactions, ``errors`` holds ``{'row': n, 'errors': [...]}`` with 1-based
+    row numbers.
+    """
+    if not rows:
+        raise OfferingImportError('The batch contains no offerings')
+    if len(rows) > MAX_BATCH_ROWS:
+        raise OfferingImportError(f"A batch may contain at most {MAX_BATCH_ROWS} offerings")
+
+    members = _member_lookup(church)
+    categories = _category_lookup(church)
+    service_date = service_date or timezone.localdate()
+    today = timezone.localdate()
+
+    valid, errors = [], []
+    for number, row in enumerate(rows, 1):
+        problems = []
+        if not isinstance(row, dict):
+            errors.append({'row': number, 'errors': ['Row must be an object']})
+            continue
+
+        member = members.get(str(row.get('member') or '').strip().lower())
+        if not member:
+            problems.append(f"Unknown member: {row.get('member') or '(blank)'}")
+
+        category_id = categories.get(str(row.get('category') or '').strip().lower())
+        if not category_id:
+            problems.append(f"Unknown or inactive category: {row.get('category') or '(blank)'}")
+
+        try:
+            amount = Decimal(str(row.get('amount') or '').replace(',', '').strip())
+            if not amount.is_finite() or amount <= 0 or amount > MAX_AMOUNT:
+                raise InvalidOperation
+            amount = amount.quantize(Decimal('0.01'))
+        except (InvalidOperation, ValueError):
+            amount = None
+            problems.append(f"Invalid amount: {row.get('amount') or '(blank)'}")
+
+        method = str(row.get('payment_method') or 'cash').strip().lower()
+        if method not in OFFLINE_PAYMENT_METHODS:
+            problems.append(f"payment_method must be one of: {', '.join(OFFLINE_PAYMENT_METHODS)}")
+
+        day = service_date
+        if row.get('date'):
+            try:
+                day = date.fromisoformat(str(row['date']).strip())
+            except ValueError:
+                problems.append(f"Invalid date: {row['date']}")
+        if day > today:
+            problems.append('Date cannot be in the future')
+
+        reference = str(row.get('reference') or '').strip()
+        if len(reference) > 100:
+            problems.append('reference must be at most 100 characters')
+
+        if problems:
+            errors.append({'row': number, 'errors': problems})
+            continue
+
+        valid.append({
+            'member_id': member[0],
+            'user_id': member[1],
+            'category_id': category_id,
+            'amount': amount,
+            'payment_method': method,
+            'payment_reference': reference,
+            'day': day,
+            'notes': str(row.get('notes') or '').strip(),
+        })
+
+    return valid, errors
+
+
+def import_offerings(church, user, rows, service_date=None, notify=True, dry_run=False, ip_address=None):
+    """
+    Validate and insert a batch of envelope offerings for ``church``.
+
+    Raises ``OfferingImportError`` (with per-row ``errors``) if any row is
+    invalid; nothing is written in that case. Returns a summary dict.
+    """
+    valid, errors = validate_rows(church, rows, service_date)
+    if errors:
+        raise OfferingImportError(f"{len(errors)} of {len(rows)} offerings are invalid", errors)
+
+    batch_reference = f"ENV-{timezone.localdate():%Y%m%d}-{uuid.uuid4().hex[:8].upper()}"
+    total = sum((row['amount'] for row in valid), Decimal('0.00'))
+    summary = {
+        'batch_reference': batch_reference,
+        'count': len(valid),
+        'total_amount': total,
+        'dry_run': dry_run,
+    }
+    if dry_run:
+        return summary
+
+    now = timezone.now()
+    transactions = [
+        GivingTransaction(
+            member_id=row['member_id'],
+            church=church,
+            category_id=row['category_id'],
+            transaction_type='one_time',
+            amount=row['amount'],
+            payment_method=row['payment_method'],
+            payment_reference=row['payment_reference'],
+            status='completed',
+            transaction_date=_as_datetime(row['day']),
+            completed_date=now,
+            notes=row['notes'],
+            created_by=user,
+            updated_by=user,
+        )
+        for row in valid
+    ]
+
+    with transaction.atomic():
+        GivingTransaction.objects.bulk_create(transactions, batch_size=500)
+
+        # bulk_create skips model signals, so apply their effects once per batch
+        rollups.record_bulk(transactions)
+        invalidate_cache(church.id)
+
+        from common.services import AuditService
+        AuditService.log_financial_transactions(
+            user=user,
+            action='GIVING_COMPLETED',
+            entries=[
+                (tx.amount, {
+                    'transaction_id': str(tx.transaction_id),
+                    'member_id': tx.member_id,
+                    'category_id': tx.category_id,
+                    'payment_method': tx.payment_method,
+                    'batch_reference': batch_reference,
+                })
+                for tx in transactions
+            ],
+            ip_address=ip_address,
+        )
+        AuditService.log_financial_transactions(
+            user=user,
+            action='OFFERINGS_IMPORTED',
+            entries=[(None, {
+                'batch_reference': batch_reference,
+                'church_id': church.id,
+                'count': len(transactions),
+                'total_amount': str(total),
+            })],
+            ip_address=ip_address,
+        )
+
+        if notify:
+            from .tasks import send_offering_confirmations
+            transaction_ids = [str(tx.transaction_id) for tx in transactions]
+            transaction.on_commit(lambda: send_offering_confirmations.delay(transaction_ids))
+
+    logger.info(
+        f"Imported {len(transactions)} offerings (KES {total}) for church {church.id} as {batch_reference}"
+    )
+    return summary
+
+
+def send_confirmations(transaction_ids):
+    """
+    Email each member one thank-you note covering all of their gifts among
+    ``transaction_ids``, over a single mail connection.
+
+    Returns the number of emails sent.
+    """
+    gifts = {}
+    rows = GivingTransaction.objects.filter(
+        transaction_id__in=transaction_ids, status='completed'
+    ).values_list(
+        'member_id', 'member__user__email', 'member__user__first_name',
+        'church__name', 'category__name', 'amount', 'payment_method', 'transaction_date',
+    ).order_by('member_id', 'transaction_date')
+    for member_id, email, first_name, church_name, category, amount, method, when in rows.iterator():
+        if email:
+            entry = gifts.setdefault(member_id, {
+                'email': email, 'name': first_name or 'Member', 'church': church_name, 'lines': [],
+            })
+            entry['lines'].append((category, amount, method, timezone.localtime(when).date()))
+
+    messages = []
+    for entry in gifts.values():
+        lines = '\n'.join(
+            f"  {day:%Y-%m-%d}  {category}: KES {amount:,.2f} ({method})"
+            for category, amount, method, day in entry['lines']
+        )
+        total = sum(line[1] for line in entry['lines'])
+        messages.append(EmailMessage(
+            subject=f"Thank you for your gift of KES {total:,.2f}",
+            body=(
+                f"Dear {entry['name']},\n\n"
+                f"Thank you for your generous giving to {entry['church']}. "
+                f"We have recorded:\n\n{lines}\n\n"
+                "God bless you!\n\n"
+                "AltarFunds Team"
+            ),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[entry['email']],
+        ))
+
+    if not messages:
+        return 0
+    connection = get_connection()
+    connection.open()
+    try:
+        return connection.send_messages(messages) or 0
+    finally:
+        connection.close()
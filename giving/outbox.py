@@ -0,0 +1,280 @@
+"""
+Transactional outbox for giving side effects.
+
+``GivingTransaction.mark_completed`` and ``refund`` call ``enqueue`` inside
+the same database transaction as the status change, so an event exists if
+and only if the change committed. The request (Paystack webhook, verify
+endpoint, M-Pesa callback) then returns without waiting for SMTP or audit
+writes; ``dispatch`` drains the outbox in batches from the
+``dispatch_giving_outbox`` task, which is kicked right after commit and also
+swept every minute.
+
+Each event type maps to a list of handlers (``EVENT_HANDLERS``). A handler
+receives every event of the batch it applies to at once — audit entries are
+written with one ``bulk_create``, confirmation emails go out over one mail
+connection. The names of finished handlers are stored on the event in the
+same database transaction as the handler's own writes, so:
+
+* delivery is at-least-once: events claimed by a worker that died are
+  picked up again once their lease expires, and failed handlers are retried
+  with exponential backoff until ``MAX_ATTEMPTS``;
+* a re-delivered event only re-runs the handlers that did not finish, and
+  audit entries are never duplicated (an email may be re-sent if the worker
+  dies between sending and recording it).
+
+Pledge and campaign totals are not outbox work: ``giving.counters`` adjusts
+them with single ``F()`` updates inside the status change itself.
+"""
+from datetime import timedelta
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import GivingOutboxEvent, GivingTransaction
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+LEASE = timedelta(minutes=5)        # how long a claimed batch is reserved for its worker
+MAX_ATTEMPTS = 8
+RETRY_BASE_DELAY = 30               # seconds; doubled per attempt
+RETRY_MAX_DELAY = 3600
+KICK_KEY = 'giving_outbox_kick'
+KICK_INTERVAL = 2                   # seconds; commits within this window share one dispatch
+RETENTION_DAYS = 14
+
+# Event type → handlers, run in this order
+EVENT_HANDLERS = {
+    'giving_completed': ('audit', 'notify'),
+    'giving_refunded': ('audit',),
+}
+
+
+def enqueue(giving, event_type, payload=None):
+    """
+    Record a side effect of ``giving``'s status change.
+
+    Call inside the transaction that saves the change. Repeated calls for the
+    same transaction and event type (e.g. a webhook and the verify endpoint
+    both completing a payment) record a single event.
+    """
+    event, created = GivingOutboxEvent.objects.get_or_create(
+        event_key=f"{event_type}:{giving.transaction_id}",
+        defaults={
+            'event_type': event_type,
+            'transaction': giving,
+            'payload': payload or {},
+        },
+    )
+    if created:
+        transaction.on_commit(kick)
+    return event
+
+
+def kick():
+    """Schedule a dispatch soon, at most once per ``KICK_INTERVAL``."""
+    try:
+        if cache.add(KICK_KEY, 1, KICK_INTERVAL):
+            from .tasks import dispatch_giving_outbox
+            dispatch_giving_outbox.apply_async(countdown=KICK_INTERVAL)
+    except Exception as e:
+        # The periodic sweep delivers the event anyway
+        logger.warning(f"Could not schedule giving outbox dispatch: {str(e)}")
+
+
+def claim_batch(batch_size=BATCH_SIZE):
+    """
+    Reserve up to ``batch_size`` due events for this worker.
+
+    Rows are locked with ``SKIP LOCKED`` so concurrent dispatchers take
+    different events; expired leases make events of crashed workers due again.
+    """
+    now = timezone.now()
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    with transaction.atomic():
+        events = list(
+            GivingOutboxEvent.objects.filter(
+                Q(status='pending', available_at__lte=now)
+                | Q(status='processing', locked_until__lt=now)
+            ).select_for_update(skip_locked=skip_locked).order_by('id')[:batch_size]
+        )
+        for event in events:
+            event.status = 'processing'
+            event.locked_until = now + LEASE
+            event.attempts += 1
+        GivingOutboxEvent.objects.bulk_update(events, ['status', 'locked_until', 'attempts'])
+    return events
+
+
+def _transaction_details(events):
+    """Transaction ID → fields the handlers need, in one query."""
+    rows = GivingTransaction.objects.filter(
+        id__in={event.transaction_id for event in events}
+    ).values(
+        'id', 'transaction_id', 'amount', 'payment_method', 'created_by_id', 'updated_by_id',
+        'member__user__email', 'member__user__first_name', 'member__user__last_name',
+        'category__name',
+    )
+    return {row['id']: row for row in rows}
+
+
+def handle_audit(events, details):
+    """Write the audit entries of every event with one insert."""
+    from audit.models import AuditLog
+
+    entries = []
+    for event in events:
+        giving = details[event.transaction_id]
+        payload = event.payload
+        if event.event_type == 'giving_completed':
+            entries.append(AuditLog(
+                user_id=payload.get('user_id', giving['created_by_id']),
+                action='GIVING_COMPLETED',
+                amount=payload.get('amount', giving['amount']),
+                details={
+                    'transaction_id': str(giving['transaction_id']),
+                    'member': giving['member__user__email'],
+                    'category': giving['category__name'],
+                    'payment_method': payload.get('payment_method', giving['payment_method']),
+                },
+            ))
+        elif event.event_type == 'giving_refunded':
+            entries.append(AuditLog(
+                user_id=payload.get('user_id', giving['updated_by_id']),
+                action='GIVING_REFUND',
+                amount=payload.get('amount'),
+                details={
+                    'original_transaction': str(giving['transaction_id']),
+                    'reason': payload.get('reason', ''),
+                },
+            ))
+    AuditLog.objects.bulk_create(entries, batch_size=500)
+    return {}
+
+
+def handle_notify(events, details):
+    """Email giving confirmations over one connection; returns per-event failures."""
+    failures = {}
+    mail = get_connection()
+    mail.open()
+    try:
+        for event in events:
+            giving = details[event.transaction_id]
+            if not giving['member__user__email']:
+                continue
+            name = f"{giving['member__user__first_name']} {giving['member__user__last_name']}".strip()
+            amount = event.payload.get('amount', giving['amount'])
+            message = EmailMessage(
+                subject=f"Thank you for your gift of KES {amount}",
+                body=(
+                    f"Dear {name or 'Member'},\n\n"
+                    f"Thank you for your generous gift of KES {amount}.\n"
+                    f"Transaction ID: {giving['transaction_id']}\n\n"
+                    "God bless you!\n\n"
+                    "AltarFunds Team"
+                ),
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[giving['member__user__email']],
+                connection=mail,
+            )
+            try:
+                mail.send_messages([message])
+            except Exception as e:
+                failures[event.id] = f"notify: {str(e)}"
+    finally:
+        mail.close()
+    return failures
+
+
+HANDLERS = {
+    'audit': handle_audit,
+    'notify': handle_notify,
+}
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), RETRY_MAX_DELAY))
+
+
+def process_batch(events):
+    """Run the outstanding handlers for claimed ``events`` and record the outcome."""
+    if not events:
+        return
+    details = _transaction_details(events)
+    failures = {}
+
+    for event in events:
+        if event.transaction_id not in details:
+            failures[event.id] = 'Transaction no longer exists'
+
+    for name, handler in HANDLERS.items():
+        targets = [
+            event for event in events
+            if name in EVENT_HANDLERS.get(event.event_type, ())
+            and name not in event.handled
+            and event.id not in failures
+        ]
+        if not targets:
+            continue
+        try:
+            # A handler's writes and its "handled" marks commit together
+            with transaction.atomic():
+                handler_failures = handler(targets, details)
+                done = [event for event in targets if event.id not in handler_failures]
+                for event in done:
+                    event.handled = [*event.handled, name]
+                GivingOutboxEvent.objects.bulk_update(done, ['handled'])
+            failures.update(handler_failures)
+        except Exception as e:
+            logger.error(f"Giving outbox handler {name} failed: {str(e)}", exc_info=True)
+            for event in targets:
+                failures[event.id] = f"{name}: {str(e)}"
+
+    now = timezone.now()
+    for event in events:
+        event.locked_until = None
+        if event.id in failures:
+            event.last_error = failures[event.id]
+            if event.attempts >= MAX_ATTEMPTS:
+                event.status = 'failed'
+                logger.error(f"Giving outbox event {event.event_key} failed permanently: {event.last_error}")
+            else:
+                event.status = 'pending'
+                event.available_at = now + _retry_delay(event.attempts)
+        else:
+            event.status = 'done'
+            event.processed_at = now
+            event.last_error = ''
+    GivingOutboxEvent.objects.bulk_update(
+        events, ['status', 'locked_until', 'available_at', 'processed_at', 'last_error']
+    )
+
+
+def dispatch(batch_size=BATCH_SIZE, max_batches=None):
+    """
+    Drain due outbox events batch by batch.
+
+    Returns the number of events processed (including ones that failed and
+    were rescheduled).
+    """
+    processed = batches = 0
+    while max_batches is None or batches < max_batches:
+        events = claim_batch(batch_size)
+        if not events:
+            break
+        process_batch(events)
+        processed += len(events)
+        batches += 1
+    return processed
+
+
+def purge(days=RETENTION_DAYS):
+    """Delete delivered events older than ``days``; returns the number deleted."""
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = GivingOutboxEvent.objects.filter(status='done', processed_at__lt=cutoff).delete()
+    return deleted
@@ -1,9 +1,10 @@
-import requests
 import json
 from django.conf import settings
 from django.utils import timezone
 from decimal import Decimal
 import logging
+
+from common.http import ProviderClient
 from .models import GivingTransaction
 
 logger = logging.getLogger(__name__)
@@ -13,6 +14,7 @@ class PaystackDisbursementService:
     """Service for handling Paystack disbursements to churches"""
     
     BASE_URL = "https://api.paystack.co"
+    http = ProviderClient('paystack')
     
     @classmethod
     def create_transfer_recipient(cls, church):
@@ -26,13 +28,19 @@ class PaystackDisbursementService:
             # Use church bank details or mobile money details
             if church.bank_account_number and church.bank_name:
                 # Bank transfer recipient
+                bank = cls.get_bank(church.bank_name)
+                if not bank:
+                    return {
+                        "success": False,
+                        "error": f"Could not resolve Paystack bank for '{church.bank_name}'"
+                    }
                 payload = {
-                    "type": "nuban",
+                    "type": bank.type or "nuban",
                     "name": church.bank_account_name or church.name,
                     "description": f"{church.name} - Disbursement Account",
                     "account_number": church.bank_account_number,
-                    "bank_code": cls.get_bank_code(church.bank_name),
-                    "currency": "KES"
+                    "bank_code": bank.code,
+                    "currency": bank.currency or "KES"
                 }
             elif church.mpesa_paybill_number or church.mpesa_till_number:
                 # Mobile money recipient
@@ -60,7 +68,7 @@ class PaystackDisbursementService:
                     "error": "No valid payment details configured for church"
                 }
             
-            response = requests.post(
+            response = cls.http.post(
                 f"{cls.BASE_URL}/transferrecipient",
                 headers=headers,
                 json=payload
@@ -88,34 +96,17 @@ class PaystackDisbursementService:
                 "error": str(e)
             }
     
+    @classmethod
+    def get_bank(cls, bank_name):
+        """Paystack bank for a bank name, from the local bank directory (None if unknown)"""
+        from payments.banks import resolve_bank
+        return resolve_bank(bank_name)
+    
     @classmethod
     def get_bank_code(cls, bank_name):
-        """Get bank code from bank name (simplified)"""
-        # This is a simplified mapping - in production, you'd have a complete database
-        bank_codes = {
-            "Safaricom": "63301",
-            "Equity Bank": "63001",
-            "KCB Bank": "63002",
-            "Cooperative Bank": "63003",
-            "Standard Chartered": "63004",
-            "Barclays Bank": "63005",
-            "NCBA Bank": "63006",
-            "Diamond Trust": "63007",
-            "Family Bank": "63008",
-            "I&M Bank": "63009",
-        }
-        
-        # Try to find exact match
-        if bank_name in bank_codes:
-            return bank_codes[bank_name]
-        
-        # Try partial match
-        for bank, code in bank_codes.items():
-            if bank.lower() in bank_name.lower():
-                return code
-        
-        # Default to Equity Bank if not found
-        return "63001"
+        """Paystack bank code for a bank name (None if unknown)"""
+        bank = cls.get_bank(bank_name)
+        return bank.code if bank else None
     
     @classmethod
     def initiate_transfer(cls, recipient_code, amount, reference, reason):
@@ -135,7 +126,7 @@ class PaystackDisbursementService:
                 "currency": "KES"
             }
             
-            response = requests.post(
+            response = cls.http.post(
                 f"{cls.BASE_URL}/transfer",
                 headers=headers,
                 json=payload
@@ -172,7 +163,7 @@ class PaystackDisbursementService:
                 "Content-Type": "application/json"
             }
             
-            response = requests.get(
+            response = cls.http.get(
                 f"{cls.BASE_URL}/transfer/verify/{transfer_code}",
                 headers=headers
             )
@@ -1,9 +1,10 @@
-import requests
 import json
 from django.conf import settings
 from django.utils import timezone
 from decimal import Decimal
 import logging
+
+from common.http import ProviderClient
 from .models import GivingTransaction
 
 logger = logging.getLogger(__name__)
@@ -13,6 +14,7 @@ class PaystackService:
     """Service for handling Paystack payments"""
     
     BASE_URL = "https://api.paystack.co"
+    http = ProviderClient('paystack')
     
     @classmethod
     def initialize_transaction(cls, email, amount, reference, callback_url=None, metadata=None):
@@ -34,7 +36,7 @@ class PaystackService:
             if metadata:
                 payload["metadata"] = metadata
             
-            response = requests.post(
+            response = cls.http.post(
                 f"{cls.BASE_URL}/transaction/initialize",
                 headers=headers,
                 json=payload
@@ -63,14 +65,23 @@ class PaystackService:
     
     @classmethod
     def verify_transaction(cls, reference):
-        """Verify a Paystack transaction"""
+        """Verify a Paystack transaction, from the local mirror when it is final"""
+        from payments.transaction_sync import local_transaction, record_transaction
+        
         try:
+            mirrored = local_transaction(reference)
+            if mirrored:
+                return {
+                    "success": True,
+                    "data": mirrored.data
+                }
+            
             headers = {
                 "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}",
                 "Content-Type": "application/json"
             }
             
-            response = requests.get(
+            response = cls.http.get(
                 f"{cls.BASE_URL}/transaction/verify/{reference}",
                 headers=headers
             )
@@ -78,6 +89,7 @@ class PaystackService:
             if response.status_code == 200:
                 data = response.json()
                 if data.get("status"):
+                    record_transaction(data["data"])
                     return {
                         "success": True,
                         "data": data["data"]
@@ -119,9 +131,11 @@ class PaystackService:
             
             logger.info(f"Created giving transaction: {giving_transaction.transaction_id}")
             
-            # Schedule disbursement to church
-            from .tasks import schedule_church_disbursement
-            schedule_church_disbursement.delay(giving_transaction.id)
+            # Schedule disbursement to church, unless it is paid out with the next settlement batch
+            from payments.settlement import batching_enabled
+            if not batching_enabled():
+                from .tasks import schedule_church_disbursement
+                schedule_church_disbursement.delay(giving_transaction.id)
             
             return {
                 "success": True,
@@ -10,12 +10,14 @@ import logging
 from .models import GivingCategory, GivingTransaction
 from .paystack_service import PaystackService
 from accounts.models import Member
+from common.idempotency import idempotent
 
 logger = logging.getLogger(__name__)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent(key_prefix='giving_initialize_payment')
 def initialize_payment(request):
     """Initialize Paystack payment for giving"""
     try:
@@ -96,7 +98,8 @@ def initialize_payment(request):
                 payment_reference=reference,
                 status='pending',
                 transaction_date=timezone.now(),
-                created_by=user
+                created_by=user,
+                updated_by=user
             )
             
             logger.info(f"Initialized payment {reference} for transaction {transaction.transaction_id}")
@@ -216,66 +219,36 @@ def verify_payment(request):
 @api_view(['POST'])
 @permission_classes([])
 def paystack_webhook(request):
-    """Handle Paystack webhook notifications"""
+    """
+    Handle Paystack webhook notifications
+    
+    Verifies the signature and stores the event in the webhook inbox;
+    payments.webhooks processes it asynchronously.
+    """
+    from payments.paystack_service import paystack_service
+    from payments.webhooks import paystack_event_fields, store_event
+    
     try:
-        # Verify webhook signature (optional but recommended)
-        # You should verify the webhook signature using your Paystack secret key
+        payload = request.body
+        signature = request.headers.get('X-Paystack-Signature')
+        if not signature or not paystack_service.verify_webhook_signature(payload, signature):
+            logger.warning("Invalid Paystack webhook signature")
+            return Response(
+                {'status': 'error', 'message': 'Invalid signature'},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
         
-        event_data = request.data
-        event = event_data.get('event')
-        data = event_data.get('data')
+        event, event_key, reference, data = paystack_event_fields('giving_paystack', payload)
+        store_event('paystack', 'giving_paystack', event, event_key, reference, data)
         
         logger.info(f"Received Paystack webhook: {event}")
-        
-        if event == 'charge.success':
-            # Payment successful - process the transaction
-            reference = data.get('reference')
-            
-            try:
-                transaction = GivingTransaction.objects.get(
-                    payment_reference=reference,
-                    status='pending'
-                )
-                
-                # Process the successful payment
-                result = PaystackService.process_payment(
-                    transaction_id=reference,
-                    user=transaction.member.user,
-                    church=transaction.church,
-                    category=transaction.category,
-                    amount=float(data.get('amount')) / 100,
-                    metadata=data.get('metadata')
-                )
-                
-                if result['success']:
-                    logger.info(f"Webhook processed payment {reference} successfully")
-                else:
-                    logger.error(f"Webhook failed to process payment {reference}: {result['error']}")
-                    
-            except GivingTransaction.DoesNotExist:
-                logger.warning(f"Transaction not found for webhook reference: {reference}")
-        
-        elif event == 'charge.failed':
-            # Payment failed - update transaction status
-            reference = data.get('reference')
-            
-            try:
-                transaction = GivingTransaction.objects.get(
-                    payment_reference=reference,
-                    status='pending'
-                )
-                
-                transaction.status = 'failed'
-                transaction.notes = f"Payment failed: {data.get('gateway_response', 'Unknown error')}"
-                transaction.save()
-                
-                logger.info(f"Webhook marked payment {reference} as failed")
-                
-            except GivingTransaction.DoesNotExist:
-                logger.warning(f"Transaction not found for webhook reference: {reference}")
-        
         return Response({'status': 'success'}, status=status.HTTP_200_OK)
         
+    except ValueError:
+        return Response(
+            {'status': 'error', 'message': 'Invalid JSON'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     except Exception as e:
         logger.error(f"Error processing Paystack webhook: {str(e)}")
         return Response(
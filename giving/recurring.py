@@ -0,0 +1,158 @@
+"""
+Recurring giving scheduler.
+
+``dispatch_due_schedules`` finds every active ``RecurringGiving`` whose
+``next_payment_date`` has arrived (through the ``(status,
+next_payment_date)`` index) and hands the IDs to Celery in chunks.
+``process_schedule_chunk`` then, inside one database transaction:
+
+* locks the chunk's rows with ``SELECT ... FOR UPDATE SKIP LOCKED`` and
+  re-checks that each is still due, so overlapping or re-delivered chunks
+  and concurrent workers never charge a schedule twice;
+* creates the pending ``GivingTransaction`` rows with one ``bulk_create``;
+* advances ``next_payment_date`` (and completes schedules past their end
+  date) with one ``bulk_update``.
+
+Each run charges a schedule at most once and advances it by one period, so a
+schedule that fell behind catches up over the following runs.
+
+Dates follow the calendar: monthly, quarterly and yearly schedules keep the
+day of month of their ``start_date`` and fall back to the last day of
+shorter months (31 Jan → 28/29 Feb → 31 Mar).
+"""
+import calendar
+from datetime import timedelta
+import logging
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import Member
+from .models import GivingTransaction, RecurringGiving
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_CHUNK_SIZE = 500
+
+# Frequency → (months, weeks) per period
+FREQUENCY_PERIODS = {
+    'weekly': (0, 1),
+    'bi_weekly': (0, 2),
+    'monthly': (1, 0),
+    'quarterly': (3, 0),
+    'yearly': (12, 0),
+}
+
+
+def add_months(day, months, anchor_day=None):
+    """
+    ``day`` moved by ``months`` calendar months.
+
+    The result keeps ``anchor_day`` (default: ``day.day``), clamped to the
+    length of the target month.
+    """
+    anchor_day = anchor_day or day.day
+    index = day.year * 12 + (day.month - 1) + months
+    year, month = index // 12, index % 12 + 1
+    return day.replace(year=year, month=month, day=min(anchor_day, calendar.monthrange(year, month)[1]))
+
+
+def next_payment_date(current, frequency, anchor_day=None):
+    """Date of the payment following ``current`` for a schedule of ``frequency``."""
+    if frequency not in FREQUENCY_PERIODS:
+        raise ValueError(f"Unknown frequency: {frequency}")
+    months, weeks = FREQUENCY_PERIODS[frequency]
+    if months:
+        return add_months(current, months, anchor_day)
+    return current + timedelta(weeks=weeks)
+
+
+def due_schedules(run_date=None):
+    """Active schedules whose next payment falls on or before ``run_date``."""
+    run_date = run_date or timezone.localdate()
+    return RecurringGiving.objects.filter(status='active', next_payment_date__lte=run_date)
+
+
+def dispatch_due_schedules(run_date=None, chunk_size=SCHEDULE_CHUNK_SIZE):
+    """
+    Queue one ``process_recurring_giving_chunk`` task per ``chunk_size`` due schedules.
+
+    Returns the number of schedules queued.
+    """
+    from .tasks import process_recurring_giving_chunk
+
+    run_date = run_date or timezone.localdate()
+    ids = list(due_schedules(run_date).order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), chunk_size):
+        process_recurring_giving_chunk.delay(ids[start:start + chunk_size], run_date.isoformat())
+    logger.info(f"Queued {len(ids)} recurring giving schedules due by {run_date}")
+    return len(ids)
+
+
+def _advance(schedule, now):
+    """Apply one processed payment to ``schedule`` in memory."""
+    schedule.total_amount_given += schedule.amount
+    schedule.total_transactions += 1
+    schedule.next_payment_date = next_payment_date(
+        schedule.next_payment_date, schedule.frequency, schedule.start_date.day
+    )
+    if schedule.end_date and schedule.next_payment_date > schedule.end_date:
+        schedule.status = 'completed'
+    schedule.updated_at = now
+
+
+def process_schedule_chunk(schedule_ids, run_date=None):
+    """
+    Charge and advance the still-due schedules among ``schedule_ids``.
+
+    Safe to run concurrently and to retry: rows are claimed with row locks
+    (skipping rows another worker holds) and re-checked under the lock.
+    Returns the number of transactions created.
+    """
+    run_date = run_date or timezone.localdate()
+    now = timezone.now()
+    skip_locked = connection.features.has_select_for_update_skip_locked
+
+    with transaction.atomic():
+        schedules = list(
+            due_schedules(run_date).filter(id__in=schedule_ids)
+            .select_for_update(skip_locked=skip_locked)
+            .order_by('id')
+        )
+        if not schedules:
+            return 0
+
+        member_users = dict(
+            Member.objects.filter(
+                id__in={schedule.member_id for schedule in schedules}
+            ).values_list('id', 'user_id')
+        )
+
+        transactions = []
+        for schedule in schedules:
+            user_id = member_users[schedule.member_id]
+            transactions.append(GivingTransaction(
+                member_id=schedule.member_id,
+                church_id=schedule.church_id,
+                category_id=schedule.category_id,
+                transaction_type='recurring',
+                amount=schedule.amount,
+                payment_method=schedule.payment_method,
+                transaction_date=now,
+                recurring_giving_id=schedule.id,
+                created_by_id=user_id,
+                updated_by_id=user_id,
+            ))
+            _advance(schedule, now)
+
+        # New transactions are pending, so they do not touch rollups or
+        # pledge/campaign counters until payment completes.
+        GivingTransaction.objects.bulk_create(transactions, batch_size=1000)
+        RecurringGiving.objects.bulk_update(
+            schedules,
+            ['next_payment_date', 'status', 'total_amount_given', 'total_transactions', 'updated_at'],
+            batch_size=1000,
+        )
+
+    logger.info(f"Created {len(transactions)} recurring giving transactions for {run_date}")
+    return len(transactions)
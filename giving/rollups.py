@@ -0,0 +1,218 @@
+"""
+Daily giving rollups.
+
+``GivingDailyRollup`` holds the sum and count of *completed* giving per
+(church, category, payment method, local day). Rows are adjusted
+incrementally from ``giving.signals`` as transactions move into or out of
+``completed`` and can be recomputed from the ledger with
+``python manage.py rebuild_giving_rollups``.
+
+Report and dashboard endpoints should read totals through the helpers here
+rather than running ``Sum('amount')`` over ``GivingTransaction``.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from common.cache import invalidate_cache
+from .models import GivingDailyRollup, GivingTransaction
+
+logger = logging.getLogger(__name__)
+
+# Fields that decide whether — and where — a transaction is counted
+# (in rollups, pledge and campaign totals).
+TRACKED_FIELDS = ('status', 'amount', 'church_id', 'category_id', 'payment_method', 'transaction_date', 'pledge_id')
+
+
+def local_day(value):
+    """Return the calendar day (in ``TIME_ZONE``) that a date/datetime/ISO string falls on."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = GivingTransaction._meta.get_field('transaction_date').to_python(value)
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            return timezone.localtime(value).date()
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return None
+
+
+def snapshot(instance):
+    """
+    Capture the tracked fields of a transaction without touching the DB.
+
+    Returns ``None`` when any field is deferred (e.g. loaded with ``only()``),
+    in which case callers fall back to reading the stored row.
+    """
+    values = instance.__dict__
+    if any(field not in values for field in TRACKED_FIELDS):
+        return None
+    return {field: values[field] for field in TRACKED_FIELDS}
+
+
+def _contribution(state):
+    """Return ``((church_id, category_id, payment_method, day), amount)`` for a completed state."""
+    if not state or state.get('status') != 'completed':
+        return None
+    day = local_day(state.get('transaction_date'))
+    if day is None or state.get('amount') in (None, ''):
+        return None
+    key = (state['church_id'], state['category_id'], state['payment_method'], day)
+    return key, Decimal(str(state['amount']))
+
+
+def apply_delta(church_id, category_id, payment_method, day, amount, count):
+    """Atomically add ``amount``/``count`` to one rollup row, creating it if needed."""
+    lookup = dict(
+        church_id=church_id,
+        category_id=category_id,
+        payment_method=payment_method,
+        day=day,
+    )
+    changes = dict(
+        total_amount=F('total_amount') + amount,
+        transaction_count=F('transaction_count') + count,
+        updated_at=timezone.now(),
+    )
+    if GivingDailyRollup.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            GivingDailyRollup.objects.create(total_amount=amount, transaction_count=count, **lookup)
+    except IntegrityError:
+        # Another writer created the row between our UPDATE and INSERT.
+        GivingDailyRollup.objects.filter(**lookup).update(**changes)
+
+
+def record_transition(old_state, new_state):
+    """
+    Move a transaction's contribution from ``old_state`` to ``new_state``.
+
+    Either state may be ``None`` (created / deleted). The adjustment runs on
+    commit so a rolled-back status change never reaches the rollup.
+    """
+    old = _contribution(old_state)
+    new = _contribution(new_state)
+    if old == new:
+        return
+
+    def _apply():
+        try:
+            if old:
+                apply_delta(*old[0], -old[1], -1)
+            if new:
+                apply_delta(*new[0], new[1], 1)
+        except Exception as e:
+            # The ledger is authoritative; rebuild_giving_rollups repairs drift.
+            logger.error(f"Failed to update giving rollup: {str(e)}", exc_info=True)
+
+    transaction.on_commit(_apply)
+
+
+def record_bulk(transactions):
+    """
+    Count newly created completed transactions (e.g. from ``bulk_create``,
+    which sends no signals) with one adjustment per rollup row.
+    """
+    deltas = {}
+    for instance in transactions:
+        contribution = _contribution(snapshot(instance))
+        if contribution:
+            key, amount = contribution
+            total, count = deltas.get(key, (Decimal('0.00'), 0))
+            deltas[key] = (total + amount, count + 1)
+    if not deltas:
+        return
+
+    def _apply():
+        try:
+            for key, (amount, count) in deltas.items():
+                apply_delta(*key, amount, count)
+        except Exception as e:
+            logger.error(f"Failed to update giving rollup: {str(e)}", exc_info=True)
+
+    transaction.on_commit(_apply)
+
+
+def rebuild_rollups(church_id=None, start=None, end=None):
+    """
+    Recompute rollups from the ledger for a church and/or day range.
+
+    Returns the number of rollup rows written.
+    """
+    givings = GivingTransaction.objects.filter(status='completed')
+    rollups = GivingDailyRollup.objects.all()
+
+    if church_id:
+        givings = givings.filter(church_id=church_id)
+        rollups = rollups.filter(church_id=church_id)
+    if start:
+        givings = givings.filter(transaction_date__date__gte=start)
+        rollups = rollups.filter(day__gte=start)
+    if end:
+        givings = givings.filter(transaction_date__date__lte=end)
+        rollups = rollups.filter(day__lte=end)
+
+    grouped = givings.annotate(
+        day=TruncDate('transaction_date', tzinfo=timezone.get_current_timezone())
+    ).values('church_id', 'category_id', 'payment_method', 'day').annotate(
+        total=Sum('amount'),
+        count=Count('id')
+    ).order_by()
+
+    rows = [
+        GivingDailyRollup(
+            church_id=row['church_id'],
+            category_id=row['category_id'],
+            payment_method=row['payment_method'],
+            day=row['day'],
+            total_amount=row['total'],
+            transaction_count=row['count'],
+        )
+        for row in grouped.iterator()
+    ]
+
+    with transaction.atomic():
+        rollups.delete()
+        GivingDailyRollup.objects.bulk_create(rows, batch_size=1000)
+        invalidate_cache(church_id)
+
+    return len(rows)
+
+
+def completed_giving(church_filter=None, start=None, end=None, **filters):
+    """
+    Rollup rows for completed giving between ``start`` and ``end`` (inclusive).
+
+    ``church_filter`` is a ``Q`` built against ``church``/``church_id`` — the
+    same shape the report views already use for ``GivingTransaction``.
+    ``start``/``end`` accept dates, datetimes or ISO strings.
+    """
+    rollups = GivingDailyRollup.objects.filter(**filters)
+    if church_filter is not None:
+        rollups = rollups.filter(church_filter)
+    if start:
+        rollups = rollups.filter(day__gte=local_day(start))
+    if end:
+        rollups = rollups.filter(day__lte=local_day(end))
+    return rollups
+
+
+def total_given(rollups):
+    """Sum of ``total_amount`` over a rollup queryset."""
+    return rollups.aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
+
+
+def totals_by(rollups, *fields):
+    """Group a rollup queryset by ``fields`` → ``total``/``count``, largest first."""
+    return rollups.values(*fields).annotate(
+        total=Sum('total_amount'),
+        count=Sum('transaction_count')
+    ).order_by('-total')
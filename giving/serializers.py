@@ -11,6 +11,27 @@ class GivingTransactionSerializer(serializers.ModelSerializer):
         model = GivingTransaction
         fields = '__all__'
 
+class GivingHistorySerializer(serializers.ModelSerializer):
+    """Read-only, slim row for the member giving history feed"""
+    category_name = serializers.CharField(source='category.name', read_only=True)
+    church_name = serializers.CharField(source='church.name', read_only=True)
+    
+    # Columns the history queryset loads with only(); keep in sync with fields.
+    QUERY_FIELDS = (
+        'id', 'transaction_id', 'amount', 'currency', 'status', 'payment_method',
+        'payment_reference', 'transaction_type', 'transaction_date', 'completed_date',
+        'is_anonymous', 'category__id', 'category__name', 'church__id', 'church__name',
+    )
+    
+    class Meta:
+        model = GivingTransaction
+        fields = [
+            'id', 'transaction_id', 'amount', 'currency', 'status', 'payment_method',
+            'payment_reference', 'transaction_type', 'transaction_date', 'completed_date',
+            'is_anonymous', 'category', 'category_name', 'church', 'church_name',
+        ]
+        read_only_fields = fields
+
 class RecurringGivingSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecurringGiving
@@ -0,0 +1,93 @@
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import GivingTransaction, GivingTransactionCampaign
+from . import counters, rollups
+from common.cache import invalidate_cache
+import logging
+
+logger = logging.getLogger('altar_funds')
+
+
+@receiver(post_init, sender=GivingTransaction)
+def giving_transaction_loaded(sender, instance, **kwargs):
+    """Remember the rollup-relevant state the instance was loaded with"""
+    instance._rollup_state = rollups.snapshot(instance)
+
+
+@receiver(pre_save, sender=GivingTransaction)
+def giving_transaction_pre_save(sender, instance, **kwargs):
+    """Read the stored state if it was not captured at load time (deferred fields)"""
+    if instance._state.adding or instance.pk is None:
+        instance._rollup_state = None
+        return
+    if getattr(instance, '_rollup_state', None) is None:
+        instance._rollup_state = GivingTransaction.objects.filter(pk=instance.pk).values(
+            *rollups.TRACKED_FIELDS
+        ).first()
+
+
+@receiver(post_save, sender=GivingTransaction)
+def giving_transaction_saved(sender, instance, created, **kwargs):
+    """Keep daily rollups in step with transactions entering or leaving 'completed'"""
+    new_state = rollups.snapshot(instance)
+    if new_state is None:
+        new_state = GivingTransaction.objects.filter(pk=instance.pk).values(
+            *rollups.TRACKED_FIELDS
+        ).first()
+    old_state = getattr(instance, '_rollup_state', None)
+    rollups.record_transition(old_state, new_state)
+    counters.record_transition(instance.pk, old_state, new_state)
+    instance._rollup_state = new_state
+    
+    # Cached dashboards/reports only depend on the tracked fields
+    if old_state != new_state:
+        _invalidate_churches(old_state, new_state)
+
+
+@receiver(post_delete, sender=GivingTransaction)
+def giving_transaction_deleted(sender, instance, **kwargs):
+    """Remove a deleted completed transaction from the rollups"""
+    old_state = getattr(instance, '_rollup_state', None) or rollups.snapshot(instance)
+    rollups.record_transition(old_state, None)
+    counters.record_transition(instance.pk, old_state, None)
+    _invalidate_churches(old_state, None)
+
+
+def _invalidate_churches(*states):
+    """Invalidate cached responses of every church a transaction moved between"""
+    for church_id in {state['church_id'] for state in states if state}:
+        invalidate_cache(church_id)
+
+
+@receiver(pre_save, sender=GivingTransactionCampaign)
+def campaign_allocation_pre_save(sender, instance, **kwargs):
+    """Remember the stored allocation so edits move only the difference"""
+    instance._stored_allocation = None
+    if instance.pk and not instance._state.adding:
+        instance._stored_allocation = GivingTransactionCampaign.objects.filter(pk=instance.pk).values_list(
+            'campaign_id', 'allocated_amount'
+        ).first()
+
+
+@receiver(post_save, sender=GivingTransactionCampaign)
+def campaign_allocation_saved(sender, instance, created, **kwargs):
+    """Count an allocation towards its campaign when the transaction is already completed"""
+    if not _transaction_completed(instance.transaction_id):
+        return
+    stored = getattr(instance, '_stored_allocation', None)
+    if stored == (instance.campaign_id, instance.allocated_amount):
+        return
+    if stored:
+        counters.adjust_campaign(stored[0], -stored[1])
+    counters.adjust_campaign(instance.campaign_id, instance.allocated_amount)
+
+
+@receiver(post_delete, sender=GivingTransactionCampaign)
+def campaign_allocation_deleted(sender, instance, **kwargs):
+    """Remove a deleted allocation of a completed transaction from its campaign"""
+    if _transaction_completed(instance.transaction_id):
+        counters.adjust_campaign(instance.campaign_id, -instance.allocated_amount)
+
+
+def _transaction_completed(transaction_id):
+    return GivingTransaction.objects.filter(pk=transaction_id, status='completed').exists()
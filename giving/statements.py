@@ -0,0 +1,436 @@
+"""
+Annual giving statements.
+
+A statement run covers every member with at least one completed gift to a
+church in a calendar year. Per-member, per-category totals come from a single
+grouped query over ``GivingTransaction``; statements are rendered to HTML and
+PDF in a process pool, written under
+``MEDIA_ROOT/statements/<church_id>/<year>/`` and emailed over one SMTP
+connection.
+
+Progress lives on ``GivingStatementRun`` / ``GivingStatement``, so running
+the same church and year again resumes: members already rendered are not
+rendered again and members already emailed are not emailed again.
+
+Usage:
+    from giving.statements import generate_statements
+
+    run = generate_statements(church, 2025, workers=4)
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+import logging
+import multiprocessing
+import os
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections
+from django.db.models import Count, Q, Sum
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from accounts.models import Member
+from .models import GivingStatement, GivingStatementRun, GivingTransaction
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_CHUNK_SIZE = 500
+STATEMENT_DIR = 'statements'
+STATEMENT_TEMPLATE = 'giving/annual_statement.html'
+
+# A4 portrait, 10pt Courier (monospaced so columns line up) on a 14pt leading
+PDF_PAGE_SIZE = (595, 842)
+PDF_MARGIN = 50
+PDF_LEADING = 14
+PDF_LINES_PER_PAGE = (PDF_PAGE_SIZE[1] - 2 * PDF_MARGIN) // PDF_LEADING
+
+
+def year_bounds(year):
+    """Aware ``(start, end)`` datetimes of a calendar year in ``TIME_ZONE`` (end exclusive)."""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime(year, 1, 1), tz),
+        timezone.make_aware(datetime(year + 1, 1, 1), tz),
+    )
+
+
+def statement_givings(church, year):
+    """Completed giving to ``church`` during ``year``."""
+    start, end = year_bounds(year)
+    return GivingTransaction.objects.filter(
+        church=church,
+        status='completed',
+        transaction_date__gte=start,
+        transaction_date__lt=end,
+    )
+
+
+def collect_statement_lines(givings):
+    """``{member_id: [line, ...]}`` from one query grouped by member and category."""
+    rows = givings.values(
+        'member_id', 'category__name', 'category__is_tax_deductible'
+    ).annotate(
+        total=Sum('amount'),
+        count=Count('id')
+    ).order_by('member_id', 'category__name')
+
+    lines = {}
+    for row in rows.iterator():
+        lines.setdefault(row['member_id'], []).append({
+            'category': row['category__name'],
+            'is_tax_deductible': row['category__is_tax_deductible'],
+            'total': row['total'] or Decimal('0.00'),
+            'count': row['count'],
+        })
+    return lines
+
+
+def collect_members(givings):
+    """``{member_id: details}`` for every member who gave, in one query."""
+    rows = Member.objects.filter(
+        pk__in=givings.values('member_id')
+    ).values(
+        'id', 'membership_number', 'kra_pin',
+        'user__first_name', 'user__last_name', 'user__email'
+    )
+    return {
+        row['id']: {
+            'name': f"{row['user__first_name']} {row['user__last_name']}".strip() or row['user__email'],
+            'email': row['user__email'],
+            'membership_number': row['membership_number'] or '',
+            'kra_pin': row['kra_pin'] or '',
+        }
+        for row in rows.iterator()
+    }
+
+
+def _church_details(church):
+    address = ', '.join(
+        part for part in (church.address_line1, church.address_line2, church.city, church.county) if part
+    )
+    return {
+        'name': church.name,
+        'address': address,
+        'email': church.email,
+        'phone_number': church.phone_number,
+    }
+
+
+def statement_context(church_info, member, lines, year):
+    """Template context for one statement — plain values only, so it pickles cheaply."""
+    total = sum((line['total'] for line in lines), Decimal('0.00'))
+    deductible = sum((line['total'] for line in lines if line['is_tax_deductible']), Decimal('0.00'))
+    return {
+        'church': church_info,
+        'member': member,
+        'year': year,
+        'period_start': f"{year}-01-01",
+        'period_end': f"{year}-12-31",
+        'currency': 'KES',
+        'lines': [dict(line, total=f"{line['total']:,.2f}") for line in lines],
+        'total': f"{total:,.2f}",
+        'total_amount': total,
+        'tax_deductible_total': f"{deductible:,.2f}",
+        'transaction_count': sum(line['count'] for line in lines),
+        'generated_on': timezone.localdate().isoformat(),
+    }
+
+
+def statement_text(context):
+    """Plain-text layout of a statement, one entry per PDF line."""
+    church, member = context['church'], context['member']
+    text = [
+        church['name'],
+        church['address'],
+        '',
+        f"Annual Giving Statement {context['year']}",
+        f"Period: {context['period_start']} to {context['period_end']}",
+        '',
+        member['name'],
+    ]
+    if member['membership_number']:
+        text.append(f"Membership No: {member['membership_number']}")
+    if member['kra_pin']:
+        text.append(f"KRA PIN: {member['kra_pin']}")
+    text += ['', f"{'Category':<40}{'Gifts':>8}{'Amount (' + context['currency'] + ')':>22}", '-' * 70]
+    for line in context['lines']:
+        text.append(f"{line['category'][:40]:<40}{line['count']:>8}{line['total']:>22}")
+    text += [
+        '-' * 70,
+        f"{'Total':<40}{context['transaction_count']:>8}{context['total']:>22}",
+        f"{'Tax deductible total':<48}{context['tax_deductible_total']:>22}",
+        '',
+        f"Generated {context['generated_on']}. Thank you for your faithful giving.",
+    ]
+    return text
+
+
+def _pdf_escape(value):
+    return value.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def text_pdf(lines):
+    """
+    Build a minimal PDF with one Courier text line per entry of ``lines``.
+
+    Statements are simple tabular text, so this avoids pulling a PDF
+    rendering library into the worker processes.
+    """
+    width, height = PDF_PAGE_SIZE
+    pages = [lines[i:i + PDF_LINES_PER_PAGE] for i in range(0, len(lines), PDF_LINES_PER_PAGE)] or [[]]
+
+    # 1: catalog, 2: page tree (filled in below), 3: font, then content/page pairs
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        None,
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>',
+    ]
+    kids = []
+    for page_lines in pages:
+        stream = ['BT', '/F1 10 Tf', f'{PDF_LEADING} TL', f'{PDF_MARGIN} {height - PDF_MARGIN} Td']
+        stream += [f'({_pdf_escape(line)}) Tj T*' for line in page_lines]
+        stream.append('ET')
+        content = '\n'.join(stream).encode('cp1252', 'replace')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream')
+        objects.append((
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>'
+        ).encode())
+        kids.append(len(objects))
+    objects[1] = (
+        f'<< /Type /Pages /Kids [{" ".join(f"{kid} 0 R" for kid in kids)}] /Count {len(kids)} >>'
+    ).encode()
+
+    output = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(output)
+    output += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        output += b'%010d 00000 n \n' % offset
+    output += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(output)
+
+
+def _init_worker():
+    """Process pool initializer: make Django usable under spawn/forkserver start methods."""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def render_statement(payload):
+    """
+    Render one statement to HTML and PDF files. Runs in a worker process.
+
+    Returns ``(member_id, html_file, pdf_file, error)`` with paths relative
+    to ``MEDIA_ROOT``; never raises so one bad statement cannot sink a chunk.
+    """
+    member_id, basename, context = payload['member_id'], payload['basename'], payload['context']
+    try:
+        html = render_to_string(STATEMENT_TEMPLATE, context)
+        html_file, pdf_file = f"{basename}.html", f"{basename}.pdf"
+        with open(os.path.join(settings.MEDIA_ROOT, html_file), 'w', encoding='utf-8') as handle:
+            handle.write(html)
+        with open(os.path.join(settings.MEDIA_ROOT, pdf_file), 'wb') as handle:
+            handle.write(text_pdf(statement_text(context)))
+        return member_id, html_file, pdf_file, ''
+    except Exception as e:
+        return member_id, '', '', str(e)
+
+
+def _executor(workers):
+    """Process pool for rendering, or ``None`` to render inline."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and multiprocessing.current_process().daemon:
+        # Celery prefork children are daemonic and may not start processes.
+        logger.info("Rendering giving statements inline inside a daemon process")
+        workers = 1
+    if workers <= 1:
+        return None
+    # Forked workers must not inherit open DB sockets.
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+
+def _statement_email(run, member, statement, connection):
+    message = EmailMessage(
+        subject=f"Your {run.year} giving statement from {run.church.name}",
+        body=(
+            f"Dear {member['name']},\n\n"
+            f"Thank you for your faithful giving to {run.church.name} in {run.year}.\n"
+            f"Your annual giving statement (KES {statement.total_amount:,.2f} across "
+            f"{statement.transaction_count} gifts) is attached.\n\n"
+            "God bless you!\n\n"
+            "AltarFunds Team"
+        ),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[member['email']],
+        connection=connection,
+    )
+    message.attach_file(os.path.join(settings.MEDIA_ROOT, statement.pdf_file), 'application/pdf')
+    return message
+
+
+def update_run_progress(run):
+    """Refresh the run's counters from its statement rows."""
+    counts = run.statements.aggregate(
+        generated=Count('id', filter=Q(generated_at__isnull=False)),
+        emailed=Count('id', filter=Q(emailed_at__isnull=False)),
+        failed=Count('id', filter=~Q(error='')),
+    )
+    run.generated_count = counts['generated']
+    run.emailed_count = counts['emailed']
+    run.failed_count = counts['failed']
+    run.save(update_fields=['generated_count', 'emailed_count', 'failed_count', 'updated_at'])
+
+
+def generate_statements(church, year, send_email=True, workers=None,
+                        chunk_size=STATEMENT_CHUNK_SIZE, force=False, progress=None):
+    """
+    Generate (and optionally email) annual statements for every member of ``church``.
+
+    Resumes an existing run for the same church and year unless ``force`` is
+    set, in which case all statements are rendered and sent again.
+    ``progress`` is called with the run after every chunk.
+    """
+    run, _ = GivingStatementRun.objects.get_or_create(church=church, year=year)
+    if force:
+        run.statements.all().delete()
+    run.status = 'running'
+    run.send_email = send_email
+    run.started_at = timezone.now()
+    run.finished_at = None
+    run.last_error = ''
+    run.save()
+
+    try:
+        _process_run(run, send_email, workers, chunk_size, progress)
+    except Exception as e:
+        run.status = 'failed'
+        run.last_error = str(e)
+        run.finished_at = timezone.now()
+        run.save(update_fields=['status', 'last_error', 'finished_at', 'updated_at'])
+        raise
+
+    run.status = 'completed'
+    run.finished_at = timezone.now()
+    run.save(update_fields=['status', 'finished_at', 'updated_at'])
+    logger.info(
+        f"Giving statements for church {church.id} ({year}): "
+        f"{run.generated_count} generated, {run.emailed_count} emailed, {run.failed_count} failed"
+    )
+    return run
+
+
+def _process_run(run, send_email, workers, chunk_size, progress):
+    givings = statement_givings(run.church, run.year)
+    lines = collect_statement_lines(givings)
+    members = collect_members(givings)
+
+    # Statement rows double as the work queue for this and later invocations.
+    GivingStatement.objects.bulk_create(
+        [GivingStatement(run=run, member_id=member_id) for member_id in lines],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    run.total_members = len(lines)
+    run.save(update_fields=['total_members', 'updated_at'])
+
+    outstanding = Q(generated_at__isnull=True) | ~Q(error='')
+    if send_email:
+        outstanding |= Q(emailed_at__isnull=True)
+    pending = run.statements.filter(outstanding).order_by('member_id')
+
+    church_info = _church_details(run.church)
+    directory = os.path.join(STATEMENT_DIR, str(run.church_id), str(run.year))
+    os.makedirs(os.path.join(settings.MEDIA_ROOT, directory), exist_ok=True)
+
+    executor = _executor(workers)
+    connection = get_connection() if send_email else None
+    try:
+        if connection:
+            connection.open()
+        chunk = []
+        for statement in pending.iterator(chunk_size=chunk_size):
+            if statement.member_id not in lines or statement.member_id not in members:
+                continue
+            chunk.append(statement)
+            if len(chunk) >= chunk_size:
+                _process_chunk(run, chunk, lines, members, church_info, directory, executor, connection)
+                chunk = []
+                if progress:
+                    progress(run)
+        if chunk:
+            _process_chunk(run, chunk, lines, members, church_info, directory, executor, connection)
+        update_run_progress(run)
+        if progress:
+            progress(run)
+    finally:
+        if executor:
+            executor.shutdown()
+        if connection:
+            connection.close()
+
+
+def _process_chunk(run, chunk, lines, members, church_info, directory, executor, connection):
+    """Render the chunk's missing statements, email the unsent ones and save both in bulk."""
+    by_member = {statement.member_id: statement for statement in chunk}
+
+    payloads = []
+    for statement in chunk:
+        if statement.generated_at and not statement.error:
+            continue
+        context = statement_context(
+            church_info, members[statement.member_id], lines[statement.member_id], run.year
+        )
+        statement.total_amount = context.pop('total_amount')
+        statement.transaction_count = context['transaction_count']
+        payloads.append({
+            'member_id': statement.member_id,
+            'basename': os.path.join(directory, f"statement-{run.year}-{statement.member_id}"),
+            'context': context,
+        })
+
+    if payloads:
+        results = executor.map(render_statement, payloads, chunksize=25) if executor else map(render_statement, payloads)
+        rendered_at = timezone.now()
+        for member_id, html_file, pdf_file, error in results:
+            statement = by_member[member_id]
+            statement.error = error
+            if not error:
+                statement.html_file = html_file
+                statement.pdf_file = pdf_file
+                statement.generated_at = rendered_at
+            else:
+                logger.error(f"Failed to render giving statement for member {member_id}: {error}")
+
+    if connection:
+        for statement in chunk:
+            member = members[statement.member_id]
+            if statement.error or not statement.generated_at or statement.emailed_at or not member['email']:
+                continue
+            try:
+                if connection.send_messages([_statement_email(run, member, statement, connection)]):
+                    statement.emailed_at = timezone.now()
+            except Exception as e:
+                statement.error = f"Email failed: {str(e)}"
+                logger.error(f"Failed to email giving statement to member {statement.member_id}: {str(e)}")
+
+    now = timezone.now()
+    for statement in chunk:
+        statement.updated_at = now
+    GivingStatement.objects.bulk_update(
+        chunk,
+        ['total_amount', 'transaction_count', 'html_file', 'pdf_file',
+         'generated_at', 'emailed_at', 'error', 'updated_at'],
+        batch_size=500,
+    )
+    update_run_progress(run)
@@ -85,6 +85,11 @@ def retry_disbursement(disbursement_id):
             logger.error(f"Disbursement {disbursement_id} not found")
             return
         
+        # Batched settlement disbursements are retried by payments.settlement
+        if disbursement.batch_id:
+            logger.warning(f"Disbursement {disbursement_id} belongs to a settlement batch")
+            return
+        
         # Check if it can be retried
         if not disbursement.can_retry:
             logger.warning(f"Disbursement {disbursement_id} cannot be retried")
@@ -163,6 +168,129 @@ def send_disbursement_reminders():
         logger.error(f"Error sending disbursement reminders: {str(e)}")
 
 
+@shared_task
+def generate_giving_statements(church_id, year, send_email=True, force=False):
+    """Generate and email annual giving statements for every member of a church"""
+    try:
+        from churches.models import Church
+        from .statements import generate_statements
+        
+        logger.info(f"Generating {year} giving statements for church {church_id}")
+        
+        try:
+            church = Church.objects.get(id=church_id)
+        except Church.DoesNotExist:
+            logger.error(f"Church {church_id} not found")
+            return
+        
+        run = generate_statements(church, year, send_email=send_email, force=force)
+        
+        logger.info(
+            f"Giving statements for church {church_id} ({year}): "
+            f"{run.generated_count}/{run.total_members} generated, {run.emailed_count} emailed"
+        )
+        return run.id
+        
+    except Exception as e:
+        logger.error(f"Error generating giving statements for church {church_id}: {str(e)}")
+
+
+@shared_task
+def verify_giving_counters():
+    """Re-verify pledge and campaign totals against the ledger and repair drift"""
+    try:
+        from .counters import verify_counters
+        
+        logger.info("Verifying pledge and campaign counters")
+        
+        drift = verify_counters(repair=True)
+        
+        logger.info(
+            f"Counter verification done: repaired {len(drift['pledges'])} pledges "
+            f"and {len(drift['campaigns'])} campaigns"
+        )
+        
+    except Exception as e:
+        logger.error(f"Error verifying giving counters: {str(e)}")
+
+
+@shared_task
+def dispatch_recurring_giving(run_date=None):
+    """Queue chunked processing of every recurring giving schedule that is due"""
+    try:
+        from datetime import date
+        from .recurring import dispatch_due_schedules
+        
+        run_date = date.fromisoformat(run_date) if run_date else None
+        count = dispatch_due_schedules(run_date)
+        
+        logger.info(f"Dispatched {count} due recurring giving schedules")
+        return count
+        
+    except Exception as e:
+        logger.error(f"Error dispatching recurring giving: {str(e)}")
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def process_recurring_giving_chunk(self, schedule_ids, run_date):
+    """Create transactions and advance next payment dates for a chunk of schedules"""
+    from datetime import date
+    from .recurring import process_schedule_chunk
+    
+    try:
+        created = process_schedule_chunk(schedule_ids, date.fromisoformat(run_date))
+        logger.info(f"Processed recurring giving chunk: {created} transactions created")
+        return created
+        
+    except Exception as e:
+        # The chunk is all-or-nothing and re-checks due dates, so retrying is safe
+        logger.error(f"Error processing recurring giving chunk: {str(e)}")
+        raise self.retry(exc=e)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=300)
+def send_offering_confirmations(self, transaction_ids):
+    """Email giving confirmations for an imported batch of envelope offerings"""
+    from .offerings import send_confirmations
+    
+    try:
+        sent = send_confirmations(transaction_ids)
+        logger.info(f"Sent {sent} offering confirmations for {len(transaction_ids)} transactions")
+        return sent
+        
+    except Exception as e:
+        logger.error(f"Error sending offering confirmations: {str(e)}")
+        raise self.retry(exc=e)
+
+
+@shared_task
+def dispatch_giving_outbox(max_batches=None):
+    """Deliver queued giving side effects (confirmation emails, audit entries)"""
+    try:
+        from .outbox import dispatch
+        
+        processed = dispatch(max_batches=max_batches)
+        if processed:
+            logger.info(f"Dispatched {processed} giving outbox events")
+        return processed
+        
+    except Exception as e:
+        logger.error(f"Error dispatching giving outbox: {str(e)}")
+
+
+@shared_task
+def purge_giving_outbox():
+    """Delete delivered giving outbox events past their retention period"""
+    try:
+        from .outbox import purge
+        
+        deleted = purge()
+        logger.info(f"Purged {deleted} delivered giving outbox events")
+        
+    except Exception as e:
+        logger.error(f"Error purging giving outbox: {str(e)}")
+
+
 # Schedule periodic tasks
 from celery.schedules import crontab
 from celery import current_app
@@ -176,6 +304,34 @@ def setup_periodic_tasks(sender, **kwargs):
         name='cleanup-old-disbursements'
     )
     
+    # Re-verify pledge/campaign counters daily at 3 AM
+    sender.add_periodic_task(
+        crontab(hour=3, minute=0),
+        verify_giving_counters.s(),
+        name='verify-giving-counters'
+    )
+    
+    # Charge due recurring giving schedules daily at 00:30
+    sender.add_periodic_task(
+        crontab(hour=0, minute=30),
+        dispatch_recurring_giving.s(),
+        name='dispatch-recurring-giving'
+    )
+    
+    # Sweep the giving outbox every minute (commits also kick it directly)
+    sender.add_periodic_task(
+        crontab(),
+        dispatch_giving_outbox.s(),
+        name='dispatch-giving-outbox'
+    )
+    
+    # Purge delivered outbox events daily at 2:30 AM
+    sender.add_periodic_task(
+        crontab(hour=2, minute=30),
+        purge_giving_outbox.s(),
+        name='purge-giving-outbox'
+    )
+    
     # Run reminders every 6 hours
     sender.add_periodic_task(
         crontab(minute=0, hour='*/6'),
@@ -10,6 +10,8 @@ from .views import (
     giving_categories,
     create_giving_transaction,
     retry_giving_payment,
+    export_giving_transactions,
+    import_offerings,
 )
 
 app_name = 'giving'
@@ -24,6 +26,10 @@ router.register(r'campaigns', GivingCampaignViewSet)
 urlpatterns = [
     path('categories/', giving_categories, name='giving_categories'),
     path('transactions/', create_giving_transaction, name='create_giving_transaction'),
+    # Streaming CSV / NDJSON export for treasurers and auditors
+    path('transactions/export/', export_giving_transactions, name='export_giving_transactions'),
+    # Bulk import of cash / check envelope offerings (JSON or CSV upload)
+    path('transactions/import/', import_offerings, name='import_offerings'),
     # Retry Paystack payment for a pending transaction
     path('transactions/<str:transaction_id>/retry-payment/', retry_giving_payment, name='retry_payment'),
     path('', include(router.urls)),
@@ -2,21 +2,30 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound
 from django.db.models import Sum, Count, Q
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from django.db import transaction
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 
 from .models import GivingCategory, GivingTransaction, RecurringGiving, Pledge, GivingCampaign
+from .exports import EXPORT_FORMATS, STREAMERS
+from .offerings import IMPORT_ROLES, OfferingImportError, import_offerings as import_offering_batch, parse_csv
 from .serializers import (
     GivingCategorySerializer, 
     GivingTransactionSerializer, 
     RecurringGivingSerializer, 
     PledgeSerializer, 
-    GivingCampaignSerializer
+    GivingCampaignSerializer,
+    GivingHistorySerializer
 )
 from common.permissions import IsMember, IsChurchAdmin, IsSystemAdmin, IsOwnerOrChurchAdmin
+from common.idempotency import idempotent
+from common.timeseries import bucketed_totals
+from common.pagination import KeysetPagination
 from payments.models import Payment
 import logging
 
@@ -118,6 +127,7 @@ def _normalize_payment_method(raw: str) -> str:
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent(key_prefix='create_giving_transaction')
 def create_giving_transaction(request):
     """Create a giving transaction from mobile app"""
     try:
@@ -312,6 +322,20 @@ def retry_giving_payment(request, transaction_id):
                         status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def scoped_giving_transactions(user):
+    """Giving transactions visible to ``user`` according to their role"""
+    # System admins see all transactions
+    if user.role == 'system_admin':
+        return GivingTransaction.objects.all()
+    
+    # Church admins see their church's transactions
+    if user.role in ['pastor', 'treasurer', 'auditor']:
+        return GivingTransaction.objects.filter(church=user.church)
+    
+    # Members see only their own transactions
+    return GivingTransaction.objects.filter(member__user=user)
+
+
 class GivingCategoryViewSet(viewsets.ModelViewSet):
     queryset = GivingCategory.objects.all()
     serializer_class = GivingCategorySerializer
@@ -333,18 +357,7 @@ class GivingTransactionViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter giving transactions based on user role"""
-        user = self.request.user
-        
-        # System admins see all transactions
-        if user.role == 'system_admin':
-            return GivingTransaction.objects.all()
-        
-        # Church admins see their church's transactions
-        if user.role in ['pastor', 'treasurer', 'auditor']:
-            return GivingTransaction.objects.filter(church=user.church)
-        
-        # Members see only their own transactions
-        return GivingTransaction.objects.filter(member__user=user)
+        return scoped_giving_transactions(self.request.user)
     
     def perform_create(self, serializer):
         """Create giving transaction and link with payment"""
@@ -352,7 +365,13 @@ class GivingTransactionViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def history(self, request):
-        """Get user's giving history"""
+        """
+        Get user's giving history, newest first.
+        
+        Keyset-paginated on (transaction_date, id): pass the returned
+        ``next_cursor`` back as ``?cursor=`` to fetch the next page.
+        Totals are computed on the first page only.
+        """
         try:
             user = request.user
             
@@ -375,24 +394,37 @@ class GivingTransactionViewSet(viewsets.ModelViewSet):
             if church_id:
                 givings = givings.filter(church_id=church_id)
             
-            # Order by date
-            givings = givings.order_by('-transaction_date')
+            paginator = KeysetPagination()
             
-            # Calculate totals
-            total_given = givings.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+            # Calculate totals in a single aggregate (first page only)
+            totals = None
+            if not request.query_params.get(paginator.cursor_query_param):
+                totals = givings.aggregate(
+                    total=Sum('amount', filter=Q(status='completed')),
+                    count=Count('id')
+                )
             
-            # Serialize data
-            serializer = self.get_serializer(givings, many=True)
+            page = paginator.paginate_queryset(
+                givings.select_related('category', 'church').only(*GivingHistorySerializer.QUERY_FIELDS),
+                request,
+                view=self
+            )
+            serializer = GivingHistorySerializer(page, many=True)
             
             return Response({
                 'success': True,
                 'data': {
-                    'total_given': float(total_given),
-                    'transaction_count': givings.count(),
-                    'givings': serializer.data
+                    'total_given': float(totals['total'] or Decimal('0.00')) if totals else None,
+                    'transaction_count': totals['count'] if totals else None,
+                    'givings': serializer.data,
+                    'next_cursor': paginator.next_cursor,
+                    'next': paginator.get_next_link(),
+                    'has_more': paginator.has_next
                 }
             }, status=status.HTTP_200_OK)
             
+        except NotFound:
+            raise
         except Exception as e:
             logger.error(f"Error fetching giving history: {str(e)}")
             return Response({
@@ -407,7 +439,7 @@ class GivingTransactionViewSet(viewsets.ModelViewSet):
             user = request.user
             
             # Get givings for the current year
-            current_year = timezone.now().year
+            current_year = timezone.localdate().year
             givings = GivingTransaction.objects.filter(
                 member__user=user,
                 transaction_date__year=current_year,
@@ -420,26 +452,28 @@ class GivingTransactionViewSet(viewsets.ModelViewSet):
                 count=Count('id')
             )
             
-            # Calculate monthly totals
-            monthly_totals = []
-            for month in range(1, 13):
-                month_givings = givings.filter(transaction_date__month=month)
-                total = month_givings.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-                monthly_totals.append({
-                    'month': month,
-                    'total': float(total),
-                    'count': month_givings.count()
-                })
+            # Calculate monthly totals (one grouped query, empty months filled)
+            monthly_totals = [
+                {
+                    'month': bucket['start'].month,
+                    'total': float(bucket['total']),
+                    'count': bucket['count']
+                }
+                for bucket in bucketed_totals(
+                    givings, 'month', date(current_year, 1, 1), date(current_year, 12, 31)
+                )
+            ]
             
             # Overall totals
-            total_given = givings.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+            totals = givings.aggregate(total=Sum('amount'), count=Count('id'))
+            total_given = totals['total'] or Decimal('0.00')
             
             return Response({
                 'success': True,
                 'data': {
                     'year': current_year,
                     'total_given': float(total_given),
-                    'transaction_count': givings.count(),
+                    'transaction_count': totals['count'],
                     'by_category': list(by_category),
                     'monthly_totals': monthly_totals
                 }
@@ -598,3 +632,148 @@ def church_givings(request, church_id):
             'success': False,
             'message': 'Failed to fetch church givings'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_giving_transactions(request):
+    """
+    GET /api/giving/transactions/export/?file_format=csv|ndjson
+    
+    Streams every matching transaction in one response. Accepts the same
+    start_date, end_date, category, giving_type, status and church_id
+    filters as the listing endpoints; rows are limited to what the user's
+    role may see.
+    """
+    user = request.user
+    file_format = request.query_params.get('file_format', 'csv').lower()
+    if file_format not in EXPORT_FORMATS:
+        return Response({
+            'success': False,
+            'message': f"file_format must be one of: {', '.join(EXPORT_FORMATS)}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Get query parameters
+    start_date = request.query_params.get('start_date')
+    end_date = request.query_params.get('end_date')
+    category_id = request.query_params.get('category')
+    giving_type = request.query_params.get('giving_type')
+    giving_status = request.query_params.get('status')
+    church_id = request.query_params.get('church_id')
+    
+    givings = scoped_giving_transactions(user)
+    
+    # Apply filters
+    try:
+        if start_date:
+            givings = givings.filter(transaction_date__gte=start_date)
+        if end_date:
+            givings = givings.filter(transaction_date__lte=end_date)
+        if category_id:
+            givings = givings.filter(category_id=int(category_id))
+        if giving_type:
+            givings = givings.filter(category__name=giving_type)
+        if giving_status:
+            givings = givings.filter(status=giving_status)
+        if church_id:
+            givings = givings.filter(church_id=int(church_id))
+    except (ValueError, DjangoValidationError):
+        return Response({
+            'success': False,
+            'message': 'Invalid filter value'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    content_type, extension = EXPORT_FORMATS[file_format]
+    filename = f"giving-{timezone.localdate().isoformat()}.{extension}"
+    
+    response = StreamingHttpResponse(STREAMERS[file_format](givings), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    
+    logger.info(f"Giving export ({file_format}) started by {user.email}")
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_offerings(request):
+    """
+    POST /api/giving/transactions/import/
+    
+    Records a batch of cash / check envelope offerings. Send either JSON
+    ``{"offerings": [...], "service_date", "notify", "dry_run"}`` or a
+    multipart upload with a CSV ``file`` (same optional fields). System
+    admins must pass ``church_id``. The batch is validated as a whole and
+    saved only if every row is valid.
+    """
+    user = request.user
+    if user.role not in IMPORT_ROLES:
+        return Response({
+            'success': False,
+            'message': 'Only church staff can import offerings'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        from churches.models import Church
+        
+        if user.role == 'system_admin':
+            church = Church.objects.filter(id=request.data.get('church_id') or None).first()
+        else:
+            church = user.church
+        if church is None:
+            return Response({
+                'success': False,
+                'message': 'church_id is required' if user.role == 'system_admin' else 'User is not associated with any church'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        service_date = request.data.get('service_date')
+        try:
+            service_date = date.fromisoformat(service_date) if service_date else None
+        except ValueError:
+            return Response({
+                'success': False,
+                'message': 'service_date must be YYYY-MM-DD'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        upload = request.FILES.get('file')
+        rows = parse_csv(upload) if upload else request.data.get('offerings')
+        if not isinstance(rows, list):
+            return Response({
+                'success': False,
+                'message': 'Provide an offerings list or a CSV file'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        def _flag(name, default):
+            value = request.data.get(name, default)
+            return value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes')
+        
+        from accounts.views import get_client_ip
+        summary = import_offering_batch(
+            church, user, rows,
+            service_date=service_date,
+            notify=_flag('notify', True),
+            dry_run=_flag('dry_run', False),
+            ip_address=get_client_ip(request),
+        )
+        
+        return Response({
+            'success': True,
+            'message': (
+                f"{summary['count']} offerings are valid" if summary['dry_run']
+                else f"Imported {summary['count']} offerings"
+            ),
+            'data': summary
+        }, status=status.HTTP_200_OK if summary['dry_run'] else status.HTTP_201_CREATED)
+        
+    except OfferingImportError as e:
+        return Response({
+            'success': False,
+            'message': str(e),
+            'errors': e.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error importing offerings: {str(e)}")
+        return Response({
+            'success': False,
+            'message': 'Failed to import offerings'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
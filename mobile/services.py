@@ -14,6 +14,9 @@ from common.services import NotificationService, AuditService
 
 logger = logging.getLogger('altar_funds')
 
+# Placeholder device_token stored when the app registers without one (views.py)
+ANONYMOUS_TOKEN_PREFIX = 'anon-'
+
 
 class MobileAuthService:
     """Mobile authentication service"""
@@ -231,43 +234,58 @@ class MobileNotificationService:
     @staticmethod
     def _send_push_to_device(device, title, message, data, notification_type):
         """Send push notification to specific device"""
-        # This would integrate with push notification services
-        # For now, we'll simulate the push notification
-        
         if device.device_type == 'android':
             return MobileNotificationService._send_android_push(
-                device.device_token, title, message, data
+                device.device_token, title, message, data, notification_type
             )
         elif device.device_type == 'ios':
             return MobileNotificationService._send_ios_push(
-                device.device_token, title, message, data
+                device.device_token, title, message, data, notification_type
             )
         else:
             return {'success': False, 'error': 'Unsupported device type'}
     
     @staticmethod
-    def _send_android_push(device_token, title, message, data):
+    def _send_android_push(device_token, title, message, data, notification_type='system'):
         """Send Android push notification using FCM"""
-        try:
-            # Placeholder for push notification implementation
-            logger.info(f"Would send Android push to {device_token}: {title}")
-            return {'success': True, 'message_id': 'placeholder'}
-            
-        except Exception as e:
-            logger.error(f"Android push failed: {e}")
-            return {'success': False, 'error': str(e)}
+        return MobileNotificationService._send_via_transport(
+            device_token, title, message, data, notification_type
+        )
+    
+    @staticmethod
+    def _send_ios_push(device_token, title, message, data, notification_type='system'):
+        """Send iOS push notification (APNs, through FCM)"""
+        return MobileNotificationService._send_via_transport(
+            device_token, title, message, data, notification_type
+        )
     
     @staticmethod
-    def _send_ios_push(device_token, title, message, data):
-        """Send iOS push notification using APNs"""
+    def _send_via_transport(device_token, title, message, data, notification_type):
+        """Send through the configured push transport (notifications.transport)"""
+        from notifications.transport import PushMessage, get_backend
+        
+        # Devices registered without a push token get an 'anon-' placeholder
+        if device_token.startswith(ANONYMOUS_TOKEN_PREFIX):
+            return {'success': False, 'error': 'No push token'}
+        
         try:
-            # Placeholder for push notification implementation
-            logger.info(f"Would send iOS push to {device_token}: {title}")
-            return {'success': True, 'message_id': 'placeholder'}
-            
+            result = get_backend().send([device_token], PushMessage(
+                title=title,
+                message=message,
+                notification_type=notification_type,
+                data=data or {},
+            ))[0]
         except Exception as e:
-            logger.error(f"iOS push failed: {e}")
+            logger.error(f"Push to device failed: {e}")
             return {'success': False, 'error': str(e)}
+        
+        if result.success:
+            return {'success': True, 'message_id': result.message_id}
+        
+        if result.invalid_token:
+            # A real registration token that will never work again; stop targeting this device
+            MobileDevice.objects.filter(device_token=device_token).update(status='inactive')
+        return {'success': False, 'error': result.error}
     
     @staticmethod
     def mark_notification_delivered(notification_id):
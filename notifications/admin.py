@@ -36,7 +36,10 @@ class PushNotificationAdmin(admin.ModelAdmin):
 
     @admin.action(description='Mark selected notifications as read')
     def mark_as_read(self, request, queryset):
+        from .inbox import invalidate_inbox
+        user_ids = set(queryset.filter(is_read=False).values_list('user_id', flat=True))
         updated = queryset.update(is_read=True)
+        invalidate_inbox(user_ids)
         self.message_user(request, f'{updated} notification(s) marked as read.')
 
     @admin.action(description='Retry delivery for selected notifications')
@@ -10,11 +10,14 @@ class NotificationsConfig(AppConfig):
     def ready(self):
         """
         Called once when Django starts up.
-        Pre-warm the Firebase Admin SDK so the first real notification
+        Connects the signal handlers (preference cache invalidation), then
+        pre-warms the Firebase Admin SDK so the first real notification
         doesn't pay the initialisation cost, and so any misconfiguration
         (missing credentials file, wrong project ID) surfaces immediately
         at startup rather than silently failing on the first send.
         """
+        import notifications.signals
+
         try:
             from .firebase_service import get_firebase_app
             get_firebase_app()
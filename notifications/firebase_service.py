@@ -23,6 +23,8 @@ Bug fixes vs the original:
   8.  Invalid / expired tokens automatically deactivated after delivery.
   9.  Notification record always created BEFORE FCM send (audit trail).
  10.  Notification body and title never exceed FCM limits (1024 / 4096 bytes).
+ 11.  Messages leave through the push transport (notifications.transport):
+      FCM in production, an in-memory fake for development and benchmarks.
 """
 from __future__ import annotations
 
@@ -35,17 +37,6 @@ from django.db import transaction
 
 logger = logging.getLogger(__name__)
 
-# Firebase error codes that mean the token is permanently invalid and
-# should be deactivated in the database immediately.
-_INVALID_TOKEN_ERRORS = frozenset({
-    'registration-token-not-registered',
-    'invalid-registration-token',
-    'invalid-argument',
-    'mismatched-credential',
-    'unregistered',
-})
-
-
 # ── Firebase Admin SDK initialisation ────────────────────────────────────────
 
 _firebase_app = None
@@ -123,6 +114,56 @@ def get_firebase_app():
         raise
 
 
+# ── Delivery ─────────────────────────────────────────────────────────────────
+
+SIMULATOR_PROJECT = 'altarfunds-simulator'
+
+
+def send_each_for_multicast(multicast_msg, app=None):
+    """
+    Deliver a MulticastMessage; returns the SDK's BatchResponse.
+
+    Goes through the Firebase Admin SDK, or — when ``PROVIDER_SIMULATOR_URL``
+    is set — to the provider simulator's FCM endpoint, one HTTP v1 request
+    per token, without Firebase credentials. ``app`` may be a callable
+    returning the Firebase app, so it is only initialised for live sends.
+    """
+    from firebase_admin import messaging as fb
+
+    if not getattr(settings, 'PROVIDER_SIMULATOR_URL', ''):
+        return fb.send_each_for_multicast(multicast_msg, app=app() if callable(app) else app)
+
+    from firebase_admin import exceptions
+    from common.http import ProviderClient
+
+    http = ProviderClient('fcm')
+    project = getattr(settings, 'FIREBASE_PROJECT_ID', None) or SIMULATOR_PROJECT
+    notification = multicast_msg.notification
+    responses = []
+    for token in multicast_msg.tokens:
+        message = {'token': token, 'data': multicast_msg.data or {}}
+        if notification:
+            message['notification'] = {'title': notification.title, 'body': notification.body}
+        try:
+            response = http.post(
+                f"https://fcm.googleapis.com/v1/projects/{project}/messages:send",
+                json={'message': message},
+                headers={'Authorization': 'Bearer simulator'},
+            )
+            if response.status_code == 200:
+                responses.append(fb.SendResponse(response.json(), None))
+                continue
+            error = response.json().get('error') or {}
+            if response.status_code == 404:
+                exc = fb.UnregisteredError(error.get('message', 'Requested entity was not found.'))
+            else:
+                exc = exceptions.FirebaseError(error.get('status', 'UNKNOWN'), error.get('message', response.text))
+        except Exception as e:
+            exc = exceptions.UnavailableError(str(e))
+        responses.append(fb.SendResponse(None, exc))
+    return fb.BatchResponse(responses)
+
+
 # ── Low-level sender ─────────────────────────────────────────────────────────
 
 def _send_multicast(
@@ -134,115 +175,65 @@ def _send_multicast(
     priority: str = 'normal',
 ) -> Dict[str, int]:
     """
-    Send one FCM multicast to a list of FCMToken objects.
+    Send one notification to a list of FCMToken objects through the
+    configured push transport (notifications.transport).
 
     Returns {success: int, failure: int, invalid_deactivated: int}.
 
-    Key design decisions:
-    - Uses send_each_for_multicast (Firebase Admin SDK ≥ 6.0) which
-      gives per-token success/failure responses.
-    - All data-payload values coerced to str (FCM requirement).
-    - Never raises — all exceptions are caught and logged so a single
-      bad token does not stop the rest from being notified.
+    Never raises — all exceptions are caught and logged so a single
+    bad token does not stop the rest from being notified.
     """
-    from firebase_admin import messaging as fb
+    from django.utils import timezone
+    from .models import FCMToken
+    from .transport import PushMessage, get_backend
 
     if not token_objects:
         return {'success': 0, 'failure': 0, 'invalid_deactivated': 0}
 
-    # Truncate to FCM limits (title 1024 B, body 4096 B)
-    title = title[:1000]
-    body  = body[:4000]
-
-    # Coerce every data value to str — FCM rejects non-strings
-    safe_data: Dict[str, str] = {
-        'type':    notification_type,
-        'title':   title,
-        'message': body,
-    }
-    if data:
-        for k, v in data.items():
-            safe_data[str(k)] = str(v)
-
     token_strings = [t.token for t in token_objects]
-    token_map     = {t.token: t for t in token_objects}
-
-    android_priority = 'high' if priority == 'high' else 'normal'
-    channel_id = _channel_for_type(notification_type)
-
-    multicast_msg = fb.MulticastMessage(
-        tokens=token_strings,
-        # notification block — shown by the system tray when the app is
-        # in background or killed (iOS + Android foreground service)
-        notification=fb.Notification(title=title, body=body),
-        # data block — preferred; our Android FirebaseMessagingService
-        # handles this for full client-side control of display
-        data=safe_data,
-        android=fb.AndroidConfig(
-            priority=android_priority,
-            ttl=86400,  # 24 hours in seconds
-            notification=fb.AndroidNotification(
-                icon='ic_notifications',
-                color='#B8935A',
-                channel_id=channel_id,
-                default_sound=True,
-                default_vibrate_timings=True,
-            ),
-        ),
-        apns=fb.APNSConfig(
-            payload=fb.APNSPayload(
-                aps=fb.Aps(sound='default', badge=1, content_available=True)
-            )
-        ),
+    message = PushMessage(
+        title=title,
+        message=body,
+        notification_type=notification_type,
+        priority=priority,
+        data=data or {},
     )
 
     try:
-        app = get_firebase_app()
-        response = fb.send_each_for_multicast(multicast_msg, app=app)
+        results = get_backend().send(token_strings, message)
     except Exception as exc:
-        logger.exception(
-            "send_each_for_multicast raised an exception: %s", exc
-        )
+        logger.exception("Push transport raised an exception: %s", exc)
         return {'success': 0, 'failure': len(token_strings), 'invalid_deactivated': 0}
 
-    success_count   = response.success_count
-    failure_count   = response.failure_count
+    delivered_pks: List[int] = []
     invalid_pks: List[int] = []
-
-    for idx, resp in enumerate(response.responses):
-        if resp.success:
-            # Touch last_used on the token
-            try:
-                from django.utils import timezone
-                token_objects[idx].mark_used()
-            except Exception:
-                pass
+    for token, result in zip(token_objects, results):
+        if result.success:
+            delivered_pks.append(token.pk)
         else:
-            error_code = getattr(resp.exception, 'code', '') or ''
             logger.warning(
-                "FCM delivery failed for token %s…: %s",
-                token_strings[idx][:24], error_code
+                "Push delivery failed for token %s…: %s",
+                token.token[:24], result.error
             )
-            if error_code in _INVALID_TOKEN_ERRORS:
-                fcm_obj = token_map.get(token_strings[idx])
-                if fcm_obj:
-                    invalid_pks.append(fcm_obj.pk)
+            if result.invalid_token:
+                invalid_pks.append(token.pk)
 
+    if delivered_pks:
+        FCMToken.objects.filter(pk__in=delivered_pks).update(last_used=timezone.now())
     # Bulk-deactivate invalid tokens
     if invalid_pks:
-        from .models import FCMToken
         deactivated = FCMToken.objects.filter(pk__in=invalid_pks).update(is_active=False)
         logger.info("Deactivated %d invalid FCM token(s)", deactivated)
     else:
         deactivated = 0
 
     logger.info(
-        "FCM multicast complete: %d sent, %d failed, %d tokens deactivated",
-        success_count, failure_count, deactivated,
+        "Push multicast complete: %d sent, %d failed, %d tokens deactivated",
+        results.success_count, results.failure_count, deactivated,
     )
     return {
-        'success': success_count,
-        'failure': failure_count,
+        'success': results.success_count,
+        'failure': results.failure_count,
         'invalid_deactivated': deactivated,
     }
 
@@ -257,7 +248,7 @@ class FirebaseNotificationService:
     - Create a PushNotification record first (audit trail).
     - Respect per-user NotificationPreference opt-outs.
     - Use the correct FCMToken relationship (user.fcm_tokens).
-    - Use send_each_for_multicast for efficient multi-device delivery.
+    - Send through the push transport, one multicast per 500 devices.
     - Do NOT block: call these from a Celery task for production use.
       For immediate ad-hoc sends (e.g. from a Celery task body), calling
       directly is fine.
@@ -279,17 +270,16 @@ class FirebaseNotificationService:
         Send a notification to a single user across all their active devices.
         Returns send statistics dict.
         """
-        from .models import FCMToken, PushNotification, NotificationPreference
+        from .models import FCMToken, PushNotification
+        from .preferences import get_preferences
 
-        # ── Preference gate ───────────────────────────────────────────────
-        try:
-            prefs = user.notification_preferences
-        except NotificationPreference.DoesNotExist:
-            prefs, _ = NotificationPreference.objects.get_or_create(user=user)
+        # ── Preference gate (shared per-user cache) ───────────────────────
+        prefs = get_preferences([user])[user.pk]
 
-        if not prefs.push_enabled:
+        if not prefs.allows_type(notification_type):
             logger.debug(
-                "Push notifications disabled for user %s — skipping", user.pk
+                "Push notifications disabled for user %s type=%s — skipping",
+                user.pk, notification_type
             )
             return {'success': 0, 'failure': 0, 'skipped': 1}
 
@@ -353,8 +343,8 @@ class FirebaseNotificationService:
         exclude_user=None,
     ) -> Dict[str, int]:
         """
-        Send a notification to all active members of a church.
-        Uses bulk DB reads to avoid N+1 queries.
+        Send a notification to all active members of a church who accept
+        this notification type. Uses bulk DB reads to avoid N+1 queries.
         """
         from .models import FCMToken
 
@@ -375,6 +365,11 @@ class FirebaseNotificationService:
             )
             return {'success': 0, 'failure': 0, 'db_error': 1}
 
+        # Drop members who opted out, resolved in one batch
+        from .preferences import get_preferences
+        preferences = get_preferences({t.user_id for t in tokens})
+        tokens = [t for t in tokens if preferences[t.user_id].allows_type(notification_type)]
+
         if not tokens:
             logger.info("No active FCM tokens found for church %s", church.pk)
             return {'success': 0, 'failure': 0, 'no_tokens': 1}
@@ -396,6 +391,8 @@ class FirebaseNotificationService:
                     delivery_status='queued',
                 ))
         PushNotification.objects.bulk_create(records_to_create, ignore_conflicts=True)
+        from .inbox import invalidate_inbox
+        transaction.on_commit(lambda: invalidate_inbox(user_ids_seen))
 
         result = _send_multicast(
             token_objects=tokens,
@@ -533,14 +530,3 @@ def _user_name(user) -> str:
         return user.get_full_name() or user.email
     except Exception:
         return 'Someone'
-
-
-def _channel_for_type(notification_type: str) -> str:
-    return {
-        'devotional_new':      'ch_devotionals',
-        'devotional_shared':   'ch_devotionals',
-        'announcement_posted': 'ch_announcements',
-        'church_event':        'ch_events',
-        'giving_reminder':     'ch_giving',
-        'payment_received':    'ch_giving',
-    }.get(notification_type, 'ch_general')
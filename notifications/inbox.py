@@ -0,0 +1,176 @@
+"""
+Per-user unread counter and recent-inbox cache.
+
+Mobile clients poll the inbox on every app foreground. Without a cache each
+poll costs a query on push_notifications plus an UPDATE marking rows read,
+even when nothing new arrived. Two entries per user in the shared
+``responses`` cache (Redis in production) avoid that:
+
+  - ``notification_unread:u{pk}`` — number of unread PushNotification rows,
+    changed with atomic INCR/DECR when rows are created (notifications.signals,
+    bulk inserts via notifications_created()) and marked read
+    (notifications_read()). A missing counter is recomputed from the table on
+    the next read; an increment against a missing counter is dropped, since
+    the recount includes it.
+  - ``notification_inbox:u{pk}`` — the serialized first page of the inbox
+    (``push/all/``), dropped whenever the user's rows change.
+
+get_notifications answers from the counter alone while it is zero, and
+``push/unread-count/`` never touches the table on a cache hit.
+
+Counters can drift (a cache write lost between commit and INCR, rows changed
+with queryset.update() outside this module); check_unread_counters(),
+scheduled every 15 minutes, compares the counters of recently notified users
+with the table and corrects them.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+from typing import Callable, Dict, Iterable, Optional
+
+from django.core.cache import caches
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import PushNotification
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'responses'
+UNREAD_KEY = 'notification_unread:u{user_pk}'
+INBOX_KEY = 'notification_inbox:u{user_pk}'
+UNREAD_TTL = 24 * 3600        # seconds; a missing counter is simply recounted
+INBOX_TTL = 15 * 60           # also bounds how stale delivery_status in a cached page gets
+
+DRIFT_CHECK_WINDOW = timedelta(hours=24)
+DRIFT_CHECK_LIMIT = 5000      # users per run
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _count_unread(user_pks: Iterable[int]) -> Dict[int, int]:
+    user_pks = list(user_pks)
+    counts = dict(
+        PushNotification.objects
+        .filter(user_id__in=user_pks, is_read=False)
+        .values('user_id')
+        .annotate(unread=Count('pk'))
+        .values_list('user_id', 'unread')
+    )
+    return {pk: counts.get(pk, 0) for pk in user_pks}
+
+
+def unread_count(user_pk: int) -> int:
+    """Unread notifications of a user — one cache read, one COUNT on a miss."""
+    key = UNREAD_KEY.format(user_pk=user_pk)
+    try:
+        count = _cache().get(key)
+    except Exception as e:
+        logger.warning("Unread counter cache unavailable: %s", e)
+        return _count_unread([user_pk])[user_pk]
+    if count is not None:
+        return count
+
+    count = _count_unread([user_pk])[user_pk]
+    try:
+        # add(): a counter set meanwhile is more recent than our count
+        _cache().add(key, count, UNREAD_TTL)
+    except Exception as e:
+        logger.warning("Could not cache unread counter: %s", e)
+    return count
+
+
+def _adjust(counts: Dict[int, int], sign: int) -> None:
+    cache = _cache()
+    keys = {UNREAD_KEY.format(user_pk=pk): pk for pk, delta in counts.items() if delta}
+    try:
+        # Only cached counters are adjusted; the rest are recounted on read
+        cached = cache.get_many(list(keys))
+    except Exception as e:
+        logger.warning("Unread counter cache unavailable: %s", e)
+        cached = {}
+    for key in cached:
+        try:
+            value = cache.incr(key, sign * counts[keys[key]])
+        except ValueError:
+            continue      # expired meanwhile
+        except Exception as e:
+            logger.warning("Could not update unread counter %s: %s", key, e)
+            continue
+        if value < 0:
+            cache.delete(key)
+    try:
+        cache.delete_many([INBOX_KEY.format(user_pk=pk) for pk in counts])
+    except Exception as e:
+        logger.warning("Could not invalidate inbox cache: %s", e)
+
+
+def notifications_created(counts: Dict[int, int]) -> None:
+    """Record ``{user_pk: new unread rows}``; call once the rows are committed."""
+    _adjust(counts, 1)
+
+
+def notifications_read(counts: Dict[int, int]) -> None:
+    """Record ``{user_pk: rows marked read}``; call once the update is committed."""
+    _adjust(counts, -1)
+
+
+def invalidate_inbox(user_pks: Iterable[int]) -> None:
+    """Drop counters and cached inboxes, e.g. after a queryset.update() across users."""
+    keys = []
+    for pk in set(user_pks):
+        keys += [UNREAD_KEY.format(user_pk=pk), INBOX_KEY.format(user_pk=pk)]
+    try:
+        _cache().delete_many(keys)
+    except Exception as e:
+        logger.warning("Could not invalidate inbox cache: %s", e)
+
+
+def recent_inbox(user_pk: int, build: Callable[[], dict]) -> dict:
+    """First inbox page of a user from the cache, built with ``build()`` on a miss."""
+    key = INBOX_KEY.format(user_pk=user_pk)
+    try:
+        page = _cache().get(key)
+    except Exception as e:
+        logger.warning("Inbox cache unavailable: %s", e)
+        return build()
+    if page is None:
+        page = build()
+        try:
+            _cache().set(key, page, INBOX_TTL)
+        except Exception as e:
+            logger.warning("Could not cache inbox: %s", e)
+    return page
+
+
+def check_unread_counters(window: timedelta = DRIFT_CHECK_WINDOW,
+                          limit: Optional[int] = DRIFT_CHECK_LIMIT) -> Dict[str, int]:
+    """
+    Compare the cached counters of users notified within ``window`` with the
+    table and overwrite the ones that drifted. Two queries and a few cache
+    round trips per run.
+    """
+    since = timezone.now() - window
+    user_pks = list(
+        PushNotification.objects
+        .filter(created_at__gte=since)
+        .order_by()
+        .values_list('user_id', flat=True)
+        .distinct()[:limit]
+    )
+    if not user_pks:
+        return {'checked': 0, 'cached': 0, 'drifted': 0}
+
+    keys = {UNREAD_KEY.format(user_pk=pk): pk for pk in user_pks}
+    cached = {keys[key]: value for key, value in _cache().get_many(list(keys)).items()}
+    actual = _count_unread(cached)
+
+    drifted = {pk: actual[pk] for pk, value in cached.items() if value != actual[pk]}
+    if drifted:
+        _cache().set_many({UNREAD_KEY.format(user_pk=pk): count for pk, count in drifted.items()}, UNREAD_TTL)
+        _cache().delete_many([INBOX_KEY.format(user_pk=pk) for pk in drifted])
+        logger.warning("Unread counters drifted for %d of %d users; corrected", len(drifted), len(cached))
+    return {'checked': len(user_pks), 'cached': len(cached), 'drifted': len(drifted)}
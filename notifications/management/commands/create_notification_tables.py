@@ -50,6 +50,7 @@ TABLES_SQL = [
             `max_retries`       SMALLINT UNSIGNED NOT NULL DEFAULT 3,
             `dedup_key`         VARCHAR(255) DEFAULT NULL,
             `scheduled_for`     DATETIME(6) DEFAULT NULL,
+            `dispatched_at`     DATETIME(6) DEFAULT NULL,
             `created_at`        DATETIME(6) NOT NULL,
             `sent_at`           DATETIME(6) DEFAULT NULL,
             `expires_at`        DATETIME(6) DEFAULT NULL,
@@ -111,6 +112,7 @@ ALTER_SQL = [
     ("push_notifications", "max_retries",     "SMALLINT UNSIGNED NOT NULL DEFAULT 3"),
     ("push_notifications", "dedup_key",       "VARCHAR(255) DEFAULT NULL"),
     ("push_notifications", "scheduled_for",   "DATETIME(6) DEFAULT NULL"),
+    ("push_notifications", "dispatched_at",   "DATETIME(6) DEFAULT NULL"),
     ("push_notifications", "sent_at",         "DATETIME(6) DEFAULT NULL"),
     ("push_notifications", "expires_at",      "DATETIME(6) DEFAULT NULL"),
 ]
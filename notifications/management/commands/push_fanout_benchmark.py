@@ -0,0 +1,229 @@
+"""
+Management command: fan-out throughput of the church broadcast pipeline.
+
+Builds a synthetic ``PUSHBENCH`` church of N members with M FCM tokens each
+and sends one announcement through the real pipeline: recipient resolution,
+bulk inbox inserts and token chunking (broadcast_to_church), then chunk
+delivery and result write-back (deliver_chunk) on ``--workers`` threads,
+standing in for Celery workers. Pushes go to the in-memory FakeBackend
+(notifications.transport), so Firebase is never called; its latency,
+transient failures and invalid tokens are configurable.
+
+Members and tokens are removed afterwards unless ``--keep-data`` is given.
+Never run against a production database.
+
+Usage:
+    python manage.py push_fanout_benchmark --members 10000 --tokens 2 --workers 8
+
+    # Slow provider with 1 % dead tokens and 0.5 % transient failures
+    python manage.py push_fanout_benchmark --latency 0.4 --jitter 0.2 --invalid-rate 0.01 --failure-rate 0.005
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import random
+import threading
+import time
+
+BENCH_CHURCH_CODE = 'PUSHBENCH'
+INSERT_BATCH_SIZE = 1000
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Measure push fan-out throughput for a synthetic church of N members with M tokens each'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=1000, help='Members in the synthetic church')
+        parser.add_argument('--tokens', type=int, default=2, help='Active FCM tokens per member')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent chunk deliveries (Celery workers)')
+        parser.add_argument('--latency', type=float, default=0.1, help='Simulated seconds per provider call')
+        parser.add_argument('--jitter', type=float, default=0.05, help='Random extra seconds per provider call')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of tokens failing transiently')
+        parser.add_argument('--invalid-rate', type=float, default=0.0, help='Share of tokens that are unregistered')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed, for reproducible runs')
+        parser.add_argument('--keep-data', action='store_true', help='Keep the PUSHBENCH church, members and inbox rows')
+        parser.add_argument('--force', action='store_true', help='Run even with DEBUG off')
+
+    def handle(self, *args, **options):
+        from notifications.transport import FakeBackend, use_backend
+
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('Refusing to run with DEBUG off; pass --force to confirm a test database')
+        if min(options['members'], options['tokens'], options['workers']) < 1:
+            raise CommandError('--members, --tokens and --workers must be positive')
+
+        backend = FakeBackend(
+            latency=options['latency'],
+            jitter=options['jitter'],
+            failure_rate=options['failure_rate'],
+            seed=options['seed'],
+        )
+        church = self._create_fixtures(options)
+        try:
+            with use_backend(backend):
+                report = self._run(church, options['workers'])
+        finally:
+            if not options['keep_data']:
+                self._remove_fixtures(church)
+
+        self._print_report(report, backend, options)
+
+    # ── Fixtures ─────────────────────────────────────────────────────────
+
+    def _create_fixtures(self, options):
+        from accounts.models import User
+        from churches.models import Church
+        from notifications.models import FCMToken
+
+        church, _ = Church.objects.get_or_create(
+            church_code=BENCH_CHURCH_CODE,
+            defaults={
+                'name': 'Push Benchmark Church',
+                'phone_number': '0700000000',
+                'email': 'pushbench@altarfunds.invalid',
+                'address_line1': 'Push benchmark',
+                'city': 'Nairobi',
+                'county': 'Nairobi',
+                'senior_pastor_name': 'Push Benchmark',
+                'senior_pastor_phone': '0700000000',
+            },
+        )
+        # Leftovers of an interrupted run would skew the counts
+        User.objects.filter(church=church).delete()
+
+        self.stdout.write(f"Creating {options['members']} members with {options['tokens']} tokens each...")
+        User.objects.bulk_create([
+            User(
+                email=f"pushbench-{index}@altarfunds.invalid",
+                username=f"pushbench-{index}@altarfunds.invalid",
+                password='!',             # unusable; nobody logs in as these
+                first_name='Push',
+                last_name=f"Bench {index}",
+                role='member',
+                church=church,
+            )
+            for index in range(options['members'])
+        ], batch_size=INSERT_BATCH_SIZE)
+
+        rng = random.Random(options['seed'])
+        user_pks = User.objects.filter(church=church).values_list('pk', flat=True)
+        FCMToken.objects.bulk_create([
+            FCMToken(
+                user_id=user_pk,
+                token=f"{'invalid' if rng.random() < options['invalid_rate'] else 'bench'}-{user_pk}-{index}",
+            )
+            for user_pk in user_pks
+            for index in range(options['tokens'])
+        ], batch_size=INSERT_BATCH_SIZE)
+        return church
+
+    def _remove_fixtures(self, church):
+        from accounts.models import User
+        from churches.models import Church
+
+        # Cascades to tokens and inbox rows; Model.delete() on Church is a soft delete
+        try:
+            User.objects.filter(church=church).delete()
+            Church.objects.filter(pk=church.pk).delete()
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f"Could not remove benchmark data: {str(e)}"))
+
+    # ── Run ──────────────────────────────────────────────────────────────
+
+    def _run(self, church, workers):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import close_old_connections
+        from django.db.models import Count
+        from notifications.broadcast import broadcast_to_church, deliver_chunk
+        from notifications.models import FCMToken, PushNotification
+
+        pending = []
+        chunk_seconds = []
+        errors = []
+        lock = threading.Lock()
+
+        def deliver(payload_chunk):
+            payload, chunk = payload_chunk
+            clock = time.monotonic()
+            try:
+                deliver_chunk(payload, chunk)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+            finally:
+                with lock:
+                    chunk_seconds.append(time.monotonic() - clock)
+                close_old_connections()
+
+        started = time.monotonic()
+        result = broadcast_to_church(
+            church.pk,
+            title='Push benchmark',
+            message='Synthetic announcement',
+            notification_type='announcement_posted',
+            deliver=lambda payload, chunk: pending.append((payload, chunk)),
+        )
+        persist_seconds = time.monotonic() - started
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(deliver, pending))
+        total_seconds = time.monotonic() - started
+
+        statuses = dict(
+            PushNotification.objects
+            .filter(user__church=church)
+            .values_list('delivery_status')
+            .annotate(count=Count('pk'))
+            .order_by()
+        )
+        return {
+            **result,
+            'workers': workers,
+            'persist_seconds': persist_seconds,
+            'delivery_seconds': total_seconds - persist_seconds,
+            'total_seconds': total_seconds,
+            'chunk_seconds': chunk_seconds,
+            'errors': errors,
+            'statuses': statuses,
+            'deactivated': FCMToken.objects.filter(user__church=church, is_active=False).count(),
+        }
+
+    # ── Report ───────────────────────────────────────────────────────────
+
+    def _print_report(self, report, backend, options):
+        chunks = report['chunk_seconds']
+        sent = report['statuses'].get('sent', 0)
+
+        self.stdout.write(
+            f"Recipients: {report['recipients']}  tokens: {report['tokens']}  chunks: {report['chunks']}  "
+            f"workers: {report['workers']}"
+        )
+        self.stdout.write(f"Persist + chunking: {report['persist_seconds']:.2f}s  "
+                          f"delivery: {report['delivery_seconds']:.2f}s  total: {report['total_seconds']:.2f}s")
+        if chunks:
+            self.stdout.write(
+                f"Chunk delivery: p50 {_percentile(chunks, 50):.3f}s  p90 {_percentile(chunks, 90):.3f}s  "
+                f"max {max(chunks):.3f}s"
+            )
+        total = max(report['total_seconds'], 0.001)
+        self.stdout.write(
+            f"Throughput: {report['recipients'] / total:.1f} notifications/s, "
+            f"{report['tokens'] / total:.1f} tokens/s end to end; "
+            f"{report['tokens'] / max(sum(chunks), 0.001):.1f} tokens/s per worker"
+        )
+        self.stdout.write(f"Inbox rows by status: {report['statuses']}  tokens deactivated: {report['deactivated']}")
+        self.stdout.write(f"Transport: {backend.stats()}")
+
+        if report['errors']:
+            self.stdout.write(self.style.WARNING(
+                f"{len(report['errors'])} chunks failed, e.g. {report['errors'][0]}"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"All {report['chunks']} chunks delivered; {sent} notifications sent."))
@@ -91,8 +91,10 @@ class PushNotification(models.Model):
     dedup_key         = models.CharField(max_length=255, blank=True, null=True,
                                          db_index=True)
 
-    # Scheduling
+    # Scheduling — rows with a future scheduled_for are handed to delivery
+    # by the scheduled-notification sweeper, which sets dispatched_at
     scheduled_for     = models.DateTimeField(null=True, blank=True, db_index=True)
+    dispatched_at     = models.DateTimeField(null=True, blank=True)
 
     # Timestamps
     created_at        = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -154,6 +156,16 @@ class NotificationPreference(models.Model):
     event_notifications       = models.BooleanField(default=True)
     updated_at                = models.DateTimeField(auto_now=True)
 
+    # Opt-out field per notification type; unmapped types (e.g. 'general')
+    # only depend on push_enabled
+    TYPE_FIELDS = {
+        'devotional_new':      'devotional_notifications',
+        'devotional_shared':   'devotional_notifications',
+        'announcement_posted': 'announcement_notifications',
+        'giving_reminder':     'giving_notifications',
+        'church_event':        'event_notifications',
+    }
+
     class Meta:
         db_table = 'notification_preferences'
 
@@ -161,15 +173,8 @@ class NotificationPreference(models.Model):
         """Return True if the user has opted in to this notification type."""
         if not self.push_enabled:
             return False
-        type_map = {
-            'devotional_new':    self.devotional_notifications,
-            'devotional_shared': self.devotional_notifications,
-            'announcement_posted': self.announcement_notifications,
-            'giving_reminder':   self.giving_notifications,
-            'church_event':      self.event_notifications,
-        }
-        # Default to True for unmapped types (e.g. 'general')
-        return type_map.get(notification_type, True)
+        field = self.TYPE_FIELDS.get(notification_type)
+        return getattr(self, field) if field else True
 
 
 class DevotionalShare(models.Model):
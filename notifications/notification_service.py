@@ -2,7 +2,7 @@
 NotificationService — single entry point for all notification sending.
 
 Design principles:
-  - All FCM sends are dispatched to Celery tasks so the caller's HTTP
+  - All push sends are dispatched to Celery tasks so the caller's HTTP
     response is never blocked.
   - Every notification is persisted to the DB BEFORE being enqueued,
     so we have an audit trail even if the task queue is lost.
@@ -23,21 +23,13 @@ from django.db import transaction
 from django.utils import timezone
 
 from .models import (
-    FCMToken, PushNotification, NotificationPreference,
+    FCMToken, PushNotification,
     PRIORITY_NORMAL, PRIORITY_HIGH,
     NOTIFICATION_TYPE_CHOICES,
 )
 
 logger = logging.getLogger(__name__)
 
-# Token errors from Firebase that mean the token is permanently invalid
-INVALID_TOKEN_ERRORS = frozenset({
-    'registration-token-not-registered',
-    'invalid-registration-token',
-    'invalid-argument',
-    'mismatched-credential',
-})
-
 
 class NotificationService:
     """
@@ -77,7 +69,8 @@ class NotificationService:
         or None if the notification was deduplicated / preference-blocked.
         """
         # ── 1. Preference check ───────────────────────────────────────────
-        prefs = cls._get_preferences(user)
+        resolution = cls.resolve_recipients([user], {user.pk: dedup_key} if dedup_key else None)
+        prefs = resolution.preferences[user.pk]
         if not prefs.allows_type(notification_type):
             logger.debug(
                 "Notification suppressed by user preference: "
@@ -86,7 +79,7 @@ class NotificationService:
             return None
 
         # ── 2. Deduplication ──────────────────────────────────────────────
-        if dedup_key:
+        if (user.pk, dedup_key) in resolution.sent_dedup_keys:
             existing = PushNotification.objects.filter(
                 user=user,
                 dedup_key=dedup_key,
@@ -98,10 +91,45 @@ class NotificationService:
                 )
                 return existing
 
+        return cls._persist_and_enqueue(
+            user=user,
+            title=title,
+            message=message,
+            notification_type=notification_type,
+            data=data,
+            target_url=target_url,
+            priority=priority,
+            dedup_key=dedup_key,
+            scheduled_for=scheduled_for,
+            expires_in_hours=expires_in_hours,
+        )
+
+    @classmethod
+    def _persist_and_enqueue(
+        cls,
+        user,
+        title: str,
+        message: str,
+        notification_type: str,
+        data: Optional[Dict[str, Any]],
+        target_url: Optional[str],
+        priority: str,
+        dedup_key: Optional[str],
+        scheduled_for: Optional[datetime] = None,
+        expires_in_hours: Optional[int] = 48,
+    ) -> PushNotification:
+        """
+        Create the PushNotification row and enqueue its delivery (no checks).
+
+        A row scheduled for the future is only persisted; the scheduled
+        notification sweeper (notifications.scheduler) delivers it once due.
+        """
         # ── 3. Persist before enqueue ─────────────────────────────────────
+        now = timezone.now()
+        scheduled = bool(scheduled_for and scheduled_for > now)
         expires_at = None
         if expires_in_hours:
-            expires_at = timezone.now() + timedelta(hours=expires_in_hours)
+            expires_at = max(scheduled_for or now, now) + timedelta(hours=expires_in_hours)
 
         notification = PushNotification.objects.create(
             user=user,
@@ -113,21 +141,16 @@ class NotificationService:
             target_url=target_url,
             dedup_key=dedup_key,
             scheduled_for=scheduled_for,
+            dispatched_at=None if scheduled else now,
             expires_at=expires_at,
             delivery_status='queued',
         )
 
         # ── 4. Enqueue delivery ───────────────────────────────────────────
-        if scheduled_for and scheduled_for > timezone.now():
-            delay = (scheduled_for - timezone.now()).total_seconds()
-            from .tasks import deliver_notification
-            deliver_notification.apply_async(
-                args=[notification.pk],
-                countdown=int(delay),
-            )
+        if scheduled:
             logger.info(
                 "Notification %d scheduled for %s (%.0fs from now)",
-                notification.pk, scheduled_for, delay
+                notification.pk, scheduled_for, (scheduled_for - now).total_seconds()
             )
         else:
             from .tasks import deliver_notification
@@ -152,12 +175,24 @@ class NotificationService:
     ) -> int:
         """
         Send the same notification to multiple users efficiently.
+        Preferences and dedup keys are resolved for the whole list up front
+        (see resolve_recipients) instead of per user.
         Returns the number of notifications actually enqueued.
         """
+        users = list(users)
+        dedup_keys = {user.pk: f"{dedup_key_prefix}:{user.pk}" for user in users} if dedup_key_prefix else {}
+        resolution = cls.resolve_recipients(users, dedup_keys)
+
         count = 0
         for user in users:
-            dedup_key = f"{dedup_key_prefix}:{user.pk}" if dedup_key_prefix else None
-            result = cls.send(
+            if not resolution.preferences[user.pk].allows_type(notification_type):
+                continue
+            dedup_key = dedup_keys.get(user.pk)
+            if (user.pk, dedup_key) in resolution.sent_dedup_keys:
+                # Already queued or sent — counted like send() returning the existing row
+                count += 1
+                continue
+            cls._persist_and_enqueue(
                 user=user,
                 title=title,
                 message=message,
@@ -167,10 +202,21 @@ class NotificationService:
                 priority=priority,
                 dedup_key=dedup_key,
             )
-            if result:
-                count += 1
+            count += 1
         return count
 
+    @staticmethod
+    def resolve_recipients(users: List, dedup_keys: Optional[Dict[int, str]] = None):
+        """
+        Batch-resolve recipients before a fan-out: returns a Resolution with
+        ``preferences`` ({user_pk: NotificationPreference}, cached per user,
+        missing rows bulk-created) and ``sent_dedup_keys`` (the
+        (user_pk, dedup_key) pairs of ``dedup_keys`` already queued or sent).
+        Two queries at most; see notifications.preferences.
+        """
+        from .preferences import resolve
+        return resolve(users, dedup_keys)
+
     @classmethod
     def send_to_church(
         cls,
@@ -185,18 +231,14 @@ class NotificationService:
     ) -> int:
         """
         Send a notification to all members of a church.
-        Uses prefetch to avoid N+1 queries.
+        Goes through the broadcast pipeline (notifications.broadcast): bulk
+        inbox inserts and chunked multicast delivery.
+        Returns the number of notifications created.
         """
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
+        from .broadcast import broadcast_to_church
 
-        users = (
-            User.objects
-            .filter(church=church, is_active=True)
-            .prefetch_related('notification_preferences', 'fcm_tokens')
-        )
-        return cls.send_bulk(
-            users=list(users),
+        result = broadcast_to_church(
+            church.pk,
             title=title,
             message=message,
             notification_type=notification_type,
@@ -205,6 +247,7 @@ class NotificationService:
             priority=priority,
             dedup_key_prefix=dedup_key_prefix,
         )
+        return result['recipients']
 
     # ── FCM delivery (called from the Celery task) ────────────────────────
 
@@ -251,7 +294,7 @@ class NotificationService:
             notification.mark_failed(increment_retry=False)
             return False
 
-        success = cls._dispatch_to_fcm(notification, list(tokens))
+        success = cls._dispatch(notification, list(tokens))
 
         if success:
             notification.mark_sent()
@@ -265,122 +308,115 @@ class NotificationService:
 
         return success
 
+    @classmethod
+    def deliver_batch(cls, notification_pks: List[int]) -> Dict[str, int]:
+        """
+        Deliver a batch of notifications claimed by the scheduled-notification
+        sweeper: one query for the rows, one for their users' tokens, one
+        multicast per notification and bulk status updates.
+
+        Rows that fail (no token, or every token failed) are put back to
+        'queued' for the next sweep, or 'failed' once max_retries is used up.
+        """
+        from django.db.models import Case, F, Value, When
+        from django.db.models.lookups import GreaterThanOrEqual
+
+        now = timezone.now()
+        notifications = list(
+            PushNotification.objects.filter(pk__in=notification_pks, delivery_status='queued')
+        )
+        expired = [n.pk for n in notifications if n.is_expired]
+        notifications = [n for n in notifications if not n.is_expired]
+
+        tokens_by_user: Dict[int, List[FCMToken]] = {}
+        for token in FCMToken.objects.filter(
+            user_id__in={n.user_id for n in notifications}, is_active=True
+        ).only('id', 'token', 'user_id'):
+            tokens_by_user.setdefault(token.user_id, []).append(token)
+
+        sent, failed = [], []
+        for notification in notifications:
+            tokens = tokens_by_user.get(notification.user_id)
+            if tokens and cls._dispatch(notification, tokens):
+                sent.append(notification.pk)
+            else:
+                failed.append(notification.pk)
+
+        if expired:
+            PushNotification.objects.filter(pk__in=expired).update(delivery_status='expired')
+        if sent:
+            PushNotification.objects.filter(pk__in=sent).update(delivery_status='sent', sent_at=now)
+        if failed:
+            # delivery_status is assigned first and compares retry_count + 1:
+            # MySQL evaluates SET assignments left to right, so the CASE must
+            # run before the increment, and max_retries - 1 would underflow
+            # the unsigned column when max_retries is 0
+            PushNotification.objects.filter(pk__in=failed, delivery_status='queued').update(
+                delivery_status=Case(
+                    When(GreaterThanOrEqual(F('retry_count') + 1, F('max_retries')), then=Value('failed')),
+                    default=Value('queued'),
+                ),
+                retry_count=F('retry_count') + 1,
+                dispatched_at=None,
+            )
+
+        logger.info(
+            "Scheduled batch: %d sent, %d failed, %d expired",
+            len(sent), len(failed), len(expired)
+        )
+        return {'sent': len(sent), 'failed': len(failed), 'expired': len(expired)}
+
     # ── Internal helpers ──────────────────────────────────────────────────
 
     @classmethod
-    def _dispatch_to_fcm(
+    def _dispatch(
         cls,
         notification: PushNotification,
         tokens: List[FCMToken],
     ) -> bool:
         """
-        Build a Firebase MulticastMessage and send to all tokens at once.
-        Deactivates invalid tokens automatically.
+        Send the notification to all tokens through the push transport
+        (notifications.transport). Deactivates invalid tokens automatically.
         Returns True if at least one token received the message.
         """
-        try:
-            from firebase_admin import messaging as fb_messaging
-        except ImportError:
-            logger.error("firebase_admin not installed — cannot deliver notification")
-            return False
+        from .transport import PushMessage, get_backend
 
-        token_strings = [t.token for t in tokens]
-        token_map     = {t.token: t for t in tokens}
-
-        # Always use data-only payload so the Android app controls display.
-        # Include a 'notification' block as well so iOS / background handling
-        # works out of the box.
-        android_priority = 'high' if notification.priority == PRIORITY_HIGH else 'normal'
-
-        multicast = fb_messaging.MulticastMessage(
-            tokens=token_strings,
-            # notification block — used by system tray on iOS and when app is killed on Android
-            notification=fb_messaging.Notification(
-                title=notification.title,
-                body=notification.message,
-            ),
-            # data block — used by our Android service for full client control
+        message = PushMessage(
+            title=notification.title,
+            message=notification.message,
+            notification_type=notification.notification_type,
+            priority=notification.priority,
             data={
-                'type':              notification.notification_type,
-                'title':             notification.title,
-                'message':           notification.message,
-                'notification_id':   str(notification.pk),
-                'target_url':        notification.target_url or '',
-                **{k: str(v) for k, v in notification.data.items()},
+                'notification_id': str(notification.pk),
+                'target_url':      notification.target_url or '',
+                **notification.data,
             },
-            android=fb_messaging.AndroidConfig(
-                priority=android_priority,
-                ttl=timedelta(hours=48),
-                notification=fb_messaging.AndroidNotification(
-                    icon='ic_notifications',
-                    color='#B8935A',
-                    channel_id=cls._channel_id_for_type(notification.notification_type),
-                    default_sound=True,
-                    default_vibrate_timings=True,
-                ),
-            ),
-            apns=fb_messaging.APNSConfig(
-                payload=fb_messaging.APNSPayload(
-                    aps=fb_messaging.Aps(
-                        sound='default',
-                        badge=1,
-                        content_available=True,
-                    )
-                )
-            ),
         )
 
         try:
-            batch_response = fb_messaging.send_each_for_multicast(multicast)
+            results = get_backend().send([t.token for t in tokens], message)
         except Exception as exc:
             logger.exception(
-                "Firebase send_each_for_multicast raised an exception for notification %d: %s",
+                "Push transport raised an exception for notification %d: %s",
                 notification.pk, exc
             )
             return False
 
-        success_count = batch_response.success_count
-        failure_count = batch_response.failure_count
-
         logger.info(
-            "FCM multicast for notification %d: %d sent, %d failed",
-            notification.pk, success_count, failure_count
+            "Push for notification %d: %d sent, %d failed",
+            notification.pk, results.success_count, results.failure_count
         )
 
-        # Deactivate any invalid tokens returned in the responses
-        if failure_count > 0:
-            invalid_tokens: List[int] = []
-            for idx, resp in enumerate(batch_response.responses):
-                if not resp.success:
-                    error_code = getattr(resp.exception, 'code', '') or ''
-                    if error_code in INVALID_TOKEN_ERRORS:
-                        token_str = token_strings[idx]
-                        fcm_obj   = token_map.get(token_str)
-                        if fcm_obj:
-                            invalid_tokens.append(fcm_obj.pk)
-                            logger.info(
-                                "Deactivating invalid FCM token (pk=%d) for user %s: %s",
-                                fcm_obj.pk, notification.user.pk, error_code
-                            )
-
-            if invalid_tokens:
-                FCMToken.objects.filter(pk__in=invalid_tokens).update(is_active=False)
-
-        return success_count > 0
-
-    @staticmethod
-    def _channel_id_for_type(notification_type: str) -> str:
-        """Return the Android notification channel ID matching the type."""
-        return {
-            'devotional_new':    'ch_devotionals',
-            'devotional_shared': 'ch_devotionals',
-            'announcement_posted': 'ch_announcements',
-            'church_event':      'ch_events',
-            'giving_reminder':   'ch_giving',
-        }.get(notification_type, 'ch_general')
+        # Deactivate any invalid tokens returned in the results
+        invalid_tokens: List[int] = []
+        for token, result in zip(tokens, results):
+            if result.invalid_token:
+                invalid_tokens.append(token.pk)
+                logger.info(
+                    "Deactivating invalid FCM token (pk=%d) for user %s: %s",
+                    token.pk, notification.user_id, result.error
+                )
+        if invalid_tokens:
+            FCMToken.objects.filter(pk__in=invalid_tokens).update(is_active=False)
 
-    @staticmethod
-    def _get_preferences(user) -> NotificationPreference:
-        """Return (or create with defaults) the user's notification preferences."""
-        prefs, _ = NotificationPreference.objects.get_or_create(user=user)
-        return prefs
+        return results.success_count > 0
@@ -0,0 +1,137 @@
+"""
+Batch preference and dedup resolution for notification fan-out.
+
+Every send path needs, per recipient, the effective NotificationPreference
+and whether a dedup key was already used. Looking them up per user costs a
+get_or_create and a PushNotification query each; these helpers resolve a
+whole list of users at once:
+
+  - get_preferences(users): preferences from the per-user cache, the misses
+    in one query, rows still missing created with one bulk_create;
+  - sent_dedup_keys(keyed_users): the (user_pk, dedup_key) pairs that
+    already have a queued or sent notification, in one query;
+  - resolve(users, dedup_keys): both at once — two queries at most.
+
+Preferences are cached in the shared ``responses`` cache (Redis in
+production) as plain field dicts. Saving or deleting a NotificationPreference
+invalidates its entry (notifications.signals); code that changes rows with
+queryset.update() must call invalidate_preferences() itself. Dedup keys are
+not cached, since every send adds new ones.
+"""
+from __future__ import annotations
+
+import logging
+from collections import namedtuple
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from django.core.cache import caches
+
+from .models import NotificationPreference, PushNotification
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'responses'
+PREFERENCE_KEY = 'notification_prefs:u{user_pk}'
+PREFERENCE_TTL = 6 * 3600     # seconds; entries are invalidated on save anyway
+
+PREFERENCE_FIELDS = (
+    'push_enabled', 'email_enabled',
+    'devotional_notifications', 'announcement_notifications',
+    'giving_notifications', 'event_notifications',
+)
+
+Resolution = namedtuple('Resolution', ['preferences', 'sent_dedup_keys'])
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _user_pk(user) -> int:
+    return getattr(user, 'pk', user)
+
+
+def _from_cache(user_pk: int, fields: dict) -> NotificationPreference:
+    prefs = NotificationPreference(user_id=user_pk, **fields)
+    prefs._state.adding = False
+    return prefs
+
+
+def get_preferences(users: Iterable) -> Dict[int, NotificationPreference]:
+    """
+    Effective preferences of ``users`` (User instances or pks), keyed by user pk.
+
+    One cache round trip, one query for the misses and one bulk insert for
+    users without a preference row.
+    """
+    user_pks = list(dict.fromkeys(_user_pk(user) for user in users))
+    if not user_pks:
+        return {}
+
+    keys = {PREFERENCE_KEY.format(user_pk=pk): pk for pk in user_pks}
+    try:
+        cached = _cache().get_many(list(keys))
+    except Exception as e:
+        logger.warning("Notification preference cache unavailable: %s", e)
+        cached = {}
+
+    preferences = {keys[key]: _from_cache(keys[key], fields) for key, fields in cached.items()}
+    missing = [pk for pk in user_pks if pk not in preferences]
+    if not missing:
+        return preferences
+
+    for prefs in NotificationPreference.objects.filter(user_id__in=missing):
+        preferences[prefs.user_id] = prefs
+
+    new_rows = [NotificationPreference(user_id=pk) for pk in missing if pk not in preferences]
+    if new_rows:
+        # A row created concurrently keeps its values; ours are the defaults either way
+        NotificationPreference.objects.bulk_create(new_rows, ignore_conflicts=True)
+        for prefs in new_rows:
+            prefs._state.adding = False
+            preferences[prefs.user_id] = prefs
+
+    try:
+        _cache().set_many({
+            PREFERENCE_KEY.format(user_pk=pk): {field: getattr(preferences[pk], field) for field in PREFERENCE_FIELDS}
+            for pk in missing
+        }, PREFERENCE_TTL)
+    except Exception as e:
+        logger.warning("Could not cache notification preferences: %s", e)
+    return preferences
+
+
+def invalidate_preferences(user_pks: Iterable[int]) -> None:
+    """Drop cached preferences, e.g. after a queryset.update() on NotificationPreference."""
+    try:
+        _cache().delete_many([PREFERENCE_KEY.format(user_pk=pk) for pk in user_pks])
+    except Exception as e:
+        logger.warning("Could not invalidate notification preferences: %s", e)
+
+
+def sent_dedup_keys(keyed_users: Dict[int, str]) -> Set[Tuple[int, str]]:
+    """
+    The ``(user_pk, dedup_key)`` pairs of ``keyed_users`` ({user_pk: dedup_key})
+    that already have a queued or sent notification — one query.
+    """
+    if not keyed_users:
+        return set()
+    rows = PushNotification.objects.filter(
+        user_id__in=list(keyed_users),
+        dedup_key__in=set(keyed_users.values()),
+        delivery_status__in=['queued', 'sent'],
+    ).values_list('user_id', 'dedup_key').distinct()
+    return {(user_pk, key) for user_pk, key in rows if keyed_users.get(user_pk) == key}
+
+
+def resolve(users: Iterable, dedup_keys: Optional[Dict[int, str]] = None) -> Resolution:
+    """
+    Preferences and already-used dedup keys for a batch of recipients.
+
+    ``dedup_keys`` maps user pk → the dedup key the new notification would
+    carry (users without one are not deduplicated).
+    """
+    return Resolution(
+        preferences=get_preferences(users),
+        sent_dedup_keys=sent_dedup_keys(dedup_keys or {}),
+    )
@@ -0,0 +1,143 @@
+"""
+Scheduled-notification sweeper.
+
+A notification sent with a future ``scheduled_for`` is only persisted; no
+Celery countdown task is created for it (ETA tasks live in worker memory
+and are redelivered on every worker restart). Instead the periodic
+``dispatch_scheduled_notifications`` task:
+
+  1. claims due rows (queued, scheduled_for reached, not yet dispatched) in
+     batches of BATCH_SIZE, oldest first, locked with ``SKIP LOCKED`` where
+     the database supports it so concurrent sweepers take different rows,
+     and stamps them with dispatched_at;
+  2. hands each batch to one deliver_notification_batch task
+     (NotificationService.deliver_batch: two queries for the rows and their
+     tokens, one multicast per notification, bulk status updates).
+
+Deliveries that fail (no token, or every token failed) clear dispatched_at
+so the next sweep retries them, until max_retries is reached. Rows claimed
+by a task that never ran become due again after CLAIM_LEASE.
+
+Every sweep records its dispatch lag (claim time − scheduled_for) in the
+``responses`` cache; scheduler_metrics() combines it with the current
+backlog.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import PushNotification
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500                    # notifications per delivery task
+MAX_BATCHES = 40                    # per sweep; the next sweep takes the rest
+CLAIM_LEASE = timedelta(minutes=10)
+
+CACHE_ALIAS = 'responses'
+METRICS_KEY = 'notification_scheduler:last_sweep'
+METRICS_TTL = 24 * 3600
+
+
+def _due(now):
+    return PushNotification.objects.filter(
+        Q(dispatched_at__isnull=True) | Q(dispatched_at__lt=now - CLAIM_LEASE),
+        delivery_status='queued',
+        scheduled_for__lte=now,
+    )
+
+
+def claim_batch(batch_size: int = BATCH_SIZE, now=None) -> List[tuple]:
+    """
+    Reserve up to ``batch_size`` due notifications for delivery.
+
+    Returns ``(pk, scheduled_for)`` pairs of the claimed rows.
+    """
+    now = now or timezone.now()
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    with transaction.atomic():
+        rows = list(
+            _due(now)
+            .select_for_update(skip_locked=skip_locked)
+            .order_by('scheduled_for')
+            .values_list('pk', 'scheduled_for')[:batch_size]
+        )
+        if rows:
+            PushNotification.objects.filter(pk__in=[pk for pk, _ in rows]).update(dispatched_at=now)
+    return rows
+
+
+def dispatch_due(batch_size: int = BATCH_SIZE, max_batches: Optional[int] = MAX_BATCHES) -> Dict:
+    """
+    Claim due notifications batch by batch and queue their delivery.
+
+    Returns the sweep's metrics (also stored for scheduler_metrics()).
+    """
+    from .tasks import deliver_notification_batch
+
+    started = timezone.now()
+    lags: List[float] = []
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        now = timezone.now()
+        rows = claim_batch(batch_size, now)
+        if not rows:
+            break
+        deliver_notification_batch.delay([pk for pk, _ in rows])
+        lags.extend(max((now - scheduled_for).total_seconds(), 0.0) for _, scheduled_for in rows)
+        batches += 1
+        if len(rows) < batch_size:
+            break
+
+    lags.sort()
+    metrics = {
+        'swept_at': started.isoformat(),
+        'duration_seconds': round((timezone.now() - started).total_seconds(), 3),
+        'dispatched': len(lags),
+        'batches': batches,
+        'lag_seconds': {
+            'avg': round(sum(lags) / len(lags), 3) if lags else None,
+            'p95': round(lags[min(int(len(lags) * 0.95), len(lags) - 1)], 3) if lags else None,
+            'max': round(lags[-1], 3) if lags else None,
+        },
+    }
+    try:
+        caches[CACHE_ALIAS].set(METRICS_KEY, metrics, METRICS_TTL)
+    except Exception as e:
+        logger.warning("Could not store scheduler metrics: %s", e)
+
+    if lags:
+        logger.info(
+            "Scheduled notifications: dispatched %d in %d batches, max lag %.1fs",
+            len(lags), batches, lags[-1]
+        )
+    return metrics
+
+
+def scheduler_metrics() -> Dict:
+    """
+    Last sweep's metrics plus the current backlog: due rows waiting for a
+    sweep, the age of the oldest one, and rows scheduled for later.
+    """
+    now = timezone.now()
+    backlog = _due(now).aggregate(count=Count('pk'), oldest=Min('scheduled_for'))
+    upcoming = PushNotification.objects.filter(
+        delivery_status='queued', scheduled_for__gt=now
+    ).count()
+    try:
+        last_sweep = caches[CACHE_ALIAS].get(METRICS_KEY)
+    except Exception:
+        last_sweep = None
+    return {
+        'backlog': backlog['count'],
+        'oldest_due_seconds': round((now - backlog['oldest']).total_seconds(), 3) if backlog['oldest'] else None,
+        'upcoming': upcoming,
+        'last_sweep': last_sweep,
+    }
@@ -0,0 +1,26 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .inbox import invalidate_inbox, notifications_created
+from .models import NotificationPreference, PushNotification
+from .preferences import invalidate_preferences
+
+
+@receiver(post_save, sender=NotificationPreference)
+@receiver(post_delete, sender=NotificationPreference)
+def notification_preference_changed(sender, instance, **kwargs):
+    """Drop the cached preferences once the change is committed"""
+    transaction.on_commit(lambda: invalidate_preferences([instance.user_id]))
+
+
+@receiver(post_save, sender=PushNotification)
+def push_notification_saved(sender, instance, created, **kwargs):
+    """Count a new unread notification in the user's cached inbox"""
+    if created and not instance.is_read:
+        transaction.on_commit(lambda: notifications_created({instance.user_id: 1}))
+
+
+@receiver(post_delete, sender=PushNotification)
+def push_notification_deleted(sender, instance, **kwargs):
+    """Recount the user's inbox after a deletion"""
+    transaction.on_commit(lambda: invalidate_inbox([instance.user_id]))
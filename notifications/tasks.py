@@ -6,11 +6,19 @@ Design:
                             Used by NotificationService.send() for immediate delivery.
   - retry_failed_notifications: Periodic task that picks up failed/stuck notifications
                             and re-queues them if they haven't exceeded max_retries.
-  - send_church_notification: Fan-out task for broadcast sends — creates one
-                            deliver_notification task per user to avoid one long
-                            blocking task holding a worker.
-
-All tasks use autoretry_for + exponential backoff so transient Firebase
+  - send_church_notification: Broadcast to a whole church — bulk-creates the
+                            inbox rows and fans out one deliver_broadcast_chunk
+                            task per 500 tokens (see notifications.broadcast).
+  - deliver_broadcast_chunk: Sends one chunk as a single FCM multicast and
+                            writes the results back in bulk.
+  - dispatch_scheduled_notifications: Periodic sweeper (every minute) that
+                            claims due scheduled notifications in batches
+                            (see notifications.scheduler).
+  - deliver_notification_batch: Delivers one batch claimed by the sweeper.
+  - check_unread_counters:  Periodic drift check of the cached per-user
+                            unread counters (see notifications.inbox).
+
+Delivery tasks use autoretry_for + exponential backoff so transient Firebase
 outages are handled automatically without manual intervention.
 """
 from __future__ import annotations
@@ -108,43 +116,121 @@ def send_church_notification(
     target_url: str | None = None,
     priority: str = 'normal',
     exclude_user_pk: int | None = None,
+    dedup_key_prefix: str | None = None,
 ) -> dict:
     """
-    Fan-out task: sends a notification to all members of a church.
+    Broadcast task: sends a notification to all members of a church.
 
-    Instead of one big multicast that blocks a worker for minutes on large
-    churches, this creates one deliver_notification task per user so the
-    load is spread across workers and individual failures don't affect others.
+    Recipients, preferences and inbox rows are handled in a few set-based
+    queries; delivery is split into deliver_broadcast_chunk tasks of up to
+    500 tokens each, so large churches neither block a worker for minutes
+    nor flood the queue with one task per member.
     """
-    from django.contrib.auth import get_user_model
-    from .notification_service import NotificationService
+    from .broadcast import broadcast_to_church
+
+    result = broadcast_to_church(
+        church_pk,
+        title=title,
+        message=message,
+        notification_type=notification_type,
+        data=data,
+        target_url=target_url,
+        priority=priority,
+        exclude_user_pk=exclude_user_pk,
+        dedup_key_prefix=dedup_key_prefix,
+    )
+
+    logger.info(
+        "send_church_notification: church=%d sent=%d chunks=%d type=%s",
+        church_pk, result['recipients'], result['chunks'], notification_type
+    )
+    return {'church_pk': church_pk, 'sent': result['recipients'], **result}
 
-    User = get_user_model()
 
-    users = (
-        User.objects
-        .filter(church_id=church_pk, is_active=True)
-        .select_related('notification_preferences')
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_backoff_max=300,
+    max_retries=3,
+    name='notifications.deliver_broadcast_chunk',
+)
+def deliver_broadcast_chunk(self, payload: dict, chunk: list) -> dict:
+    """
+    Deliver one broadcast chunk ([token_pk, token, notification_pk] targets)
+    with a single push-transport call (one FCM multicast).
+
+    A failed multicast is retried as a whole; notifications already sent by
+    an earlier attempt are skipped.
+    """
+    from .broadcast import deliver_chunk
+
+    logger.info(
+        "Task deliver_broadcast_chunk: %d tokens attempt=%d",
+        len(chunk), self.request.retries + 1
     )
-    if exclude_user_pk:
-        users = users.exclude(pk=exclude_user_pk)
+    return deliver_chunk(payload, chunk)
 
-    count = 0
-    for user in users:
-        notif = NotificationService.send(
-            user=user,
-            title=title,
-            message=message,
-            notification_type=notification_type,
-            data=data,
-            target_url=target_url,
-            priority=priority,
-        )
-        if notif:
-            count += 1
 
+@shared_task(name='notifications.dispatch_scheduled_notifications')
+def dispatch_scheduled_notifications() -> dict:
+    """
+    Periodic sweeper — hands notifications whose scheduled_for has passed to
+    deliver_notification_batch, up to 500 per task. Replaces one countdown
+    task per scheduled notification.
+    """
+    from .scheduler import dispatch_due
+
+    return dispatch_due()
+
+
+@shared_task(name='notifications.deliver_notification_batch')
+def deliver_notification_batch(notification_pks: list) -> dict:
+    """
+    Deliver a batch of scheduled notifications claimed by the sweeper.
+
+    Not autoretried: failed rows go back to the sweeper with their retry
+    count incremented, and rows of a batch that never ran are reclaimed
+    once their claim lease expires.
+    """
+    from .notification_service import NotificationService
+
+    logger.info("Task deliver_notification_batch: %d notifications", len(notification_pks))
+    return NotificationService.deliver_batch(notification_pks)
+
+
+@shared_task(name='notifications.check_unread_counters')
+def check_unread_counters() -> dict:
+    """
+    Periodic drift check — compares the cached unread counters of recently
+    notified users with push_notifications and corrects the ones that drifted.
+    """
+    from .inbox import check_unread_counters as check
+
+    result = check()
     logger.info(
-        "send_church_notification: church=%d sent=%d type=%s",
-        church_pk, count, notification_type
+        "check_unread_counters: %d users, %d cached counters, %d corrected",
+        result['checked'], result['cached'], result['drifted']
+    )
+    return result
+
+
+# Periodic task schedule
+from celery.schedules import crontab
+from celery import current_app
+
+@current_app.on_after_finalize.connect
+def setup_periodic_tasks(sender, **kwargs):
+    # Deliver scheduled notifications that have come due, every minute
+    sender.add_periodic_task(
+        crontab(minute='*'),
+        dispatch_scheduled_notifications.s(),
+        name='dispatch-scheduled-notifications'
+    )
+    
+    # Correct drifted unread counters every 15 minutes
+    sender.add_periodic_task(
+        crontab(minute='*/15'),
+        check_unread_counters.s(),
+        name='check-unread-counters'
     )
-    return {'church_pk': church_pk, 'sent': count}
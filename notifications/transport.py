@@ -0,0 +1,253 @@
+"""
+Push transports — the one place push messages leave the backend.
+
+Every sender (NotificationService, the church broadcast pipeline,
+FirebaseNotificationService, mobile.services.MobileNotificationService)
+hands a PushMessage and a list of device tokens to the backend named by
+``settings.PUSH_BACKEND``:
+
+  - FCMBackend (default): Firebase Admin SDK send_each_for_multicast, up to
+    500 tokens per call, Android and iOS (APNs through FCM) alike. Honours
+    PROVIDER_SIMULATOR_URL like the rest of the provider clients.
+  - FakeBackend: in memory, records every message, and simulates per-call
+    latency, invalid tokens (those starting with ``invalid``) and random
+    transient failures. For local development, tests and the
+    ``push_fanout_benchmark`` command.
+
+A backend returns one TokenResult per token, in order, with invalid tokens
+already classified, so callers only decide what to deactivate and which
+notifications count as delivered. A failure of the whole call raises.
+
+    from notifications.transport import PushMessage, get_backend
+
+    results = get_backend().send(tokens, PushMessage(title='Hi', message='…'))
+"""
+from __future__ import annotations
+
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = 'notifications.transport.FCMBackend'
+
+# Firebase error codes that mean the token is permanently invalid
+INVALID_TOKEN_ERRORS = frozenset({
+    'registration-token-not-registered',
+    'invalid-registration-token',
+    'invalid-argument',
+    'mismatched-credential',
+    'unregistered',
+})
+
+
+@dataclass
+class PushMessage:
+    """One notification payload, sent identically to every token."""
+    title: str
+    message: str
+    notification_type: str = 'general'
+    priority: str = 'normal'
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+class TokenResult(NamedTuple):
+    success: bool
+    message_id: Optional[str] = None
+    error: Optional[str] = None
+    invalid_token: bool = False   # never retry this token; deactivate it
+
+
+class SendResults(list):
+    """TokenResults of one send, in token order."""
+
+    @property
+    def success_count(self) -> int:
+        return sum(1 for result in self if result.success)
+
+    @property
+    def failure_count(self) -> int:
+        return len(self) - self.success_count
+
+
+class PushBackend:
+    """Base class of push transports."""
+
+    max_batch = 500               # tokens per provider call
+
+    def send(self, tokens: List[str], message: PushMessage) -> SendResults:
+        """Send ``message`` to every token; one TokenResult per token, in order."""
+        results = SendResults()
+        for start in range(0, len(tokens), self.max_batch):
+            results.extend(self.send_batch(tokens[start:start + self.max_batch], message))
+        return results
+
+    def send_batch(self, tokens: List[str], message: PushMessage) -> List[TokenResult]:
+        raise NotImplementedError
+
+
+class FCMBackend(PushBackend):
+    """Firebase Cloud Messaging through the Admin SDK."""
+
+    def send_batch(self, tokens, message):
+        from .firebase_service import get_firebase_app, send_each_for_multicast
+
+        batch_response = send_each_for_multicast(self.build_multicast(tokens, message), app=get_firebase_app)
+        return [
+            TokenResult(True, message_id=resp.message_id) if resp.success else TokenResult(
+                False,
+                error=getattr(resp.exception, 'code', None) or str(resp.exception),
+                invalid_token=self.is_invalid_token_error(resp.exception),
+            )
+            for resp in batch_response.responses
+        ]
+
+    @staticmethod
+    def build_multicast(tokens: List[str], message: PushMessage):
+        """
+        Build the Firebase MulticastMessage for one payload.
+
+        The data block drives display in our Android app; the notification
+        block covers iOS and killed apps. Title and body are cut to FCM's
+        limits, data values coerced to str (FCM rejects anything else).
+        """
+        from firebase_admin import messaging as fb
+
+        title = message.title[:1000]
+        body = message.message[:4000]
+        return fb.MulticastMessage(
+            tokens=tokens,
+            notification=fb.Notification(title=title, body=body),
+            data={
+                'type':    message.notification_type,
+                'title':   title,
+                'message': body,
+                **{str(k): str(v) for k, v in message.data.items()},
+            },
+            android=fb.AndroidConfig(
+                priority='high' if message.priority == 'high' else 'normal',
+                ttl=timedelta(hours=48),
+                notification=fb.AndroidNotification(
+                    icon='ic_notifications',
+                    color='#B8935A',
+                    channel_id=channel_for_type(message.notification_type),
+                    default_sound=True,
+                    default_vibrate_timings=True,
+                ),
+            ),
+            apns=fb.APNSConfig(
+                payload=fb.APNSPayload(
+                    aps=fb.Aps(sound='default', badge=1, content_available=True)
+                )
+            ),
+        )
+
+    @staticmethod
+    def is_invalid_token_error(exc) -> bool:
+        """True if a per-token send error means the token will never work again."""
+        from firebase_admin import messaging as fb
+
+        if isinstance(exc, (fb.UnregisteredError, fb.SenderIdMismatchError)):
+            return True
+        return (getattr(exc, 'code', '') or '') in INVALID_TOKEN_ERRORS
+
+
+class FakeBackend(PushBackend):
+    """
+    In-memory transport. Each send_batch() sleeps ``latency`` (+ up to
+    ``jitter``) seconds like one provider round trip; tokens starting with
+    ``invalid_prefix`` are rejected as unregistered, and a ``failure_rate``
+    share of the others fails transiently. Delivered messages are kept in
+    ``sent`` as (token, PushMessage) pairs.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 invalid_prefix: str = 'invalid', seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.invalid_prefix = invalid_prefix
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.sent = []
+            self.calls = 0
+            self.failed = 0
+            self.invalid = 0
+
+    def send_batch(self, tokens, message):
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter) if self.jitter else self.latency
+            draws = [self._random.random() for _ in tokens]
+        if delay:
+            time.sleep(delay)
+
+        results = []
+        for token, draw in zip(tokens, draws):
+            if token.startswith(self.invalid_prefix):
+                results.append(TokenResult(False, error='registration-token-not-registered', invalid_token=True))
+            elif draw < self.failure_rate:
+                results.append(TokenResult(False, error='unavailable'))
+            else:
+                results.append(TokenResult(True, message_id=f"fake/{uuid.uuid4().hex}"))
+
+        with self._lock:
+            self.calls += 1
+            self.sent.extend((token, message) for token, result in zip(tokens, results) if result.success)
+            self.invalid += sum(1 for result in results if result.invalid_token)
+            self.failed += sum(1 for result in results if not result.success)
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'calls': self.calls, 'sent': len(self.sent), 'failed': self.failed, 'invalid': self.invalid}
+
+
+def channel_for_type(notification_type: str) -> str:
+    """Return the Android notification channel ID matching the type."""
+    return {
+        'devotional_new':      'ch_devotionals',
+        'devotional_shared':   'ch_devotionals',
+        'announcement_posted': 'ch_announcements',
+        'church_event':        'ch_events',
+        'giving_reminder':     'ch_giving',
+        'payment_received':    'ch_giving',
+    }.get(notification_type, 'ch_general')
+
+
+# ── Backend selection ────────────────────────────────────────────────────────
+
+_backends: Dict[str, PushBackend] = {}
+_override: Optional[PushBackend] = None
+
+
+def get_backend() -> PushBackend:
+    """The configured push backend (one instance per process and class path)."""
+    if _override is not None:
+        return _override
+    path = getattr(settings, 'PUSH_BACKEND', None) or DEFAULT_BACKEND
+    backend = _backends.get(path)
+    if backend is None:
+        backend = _backends[path] = import_string(path)()
+    return backend
+
+
+@contextmanager
+def use_backend(backend: PushBackend):
+    """Route every send in this process through ``backend`` for the block."""
+    global _override
+    previous, _override = _override, backend
+    try:
+        yield backend
+    finally:
+        _override = previous
@@ -19,6 +19,10 @@ urlpatterns = [
     path('push/',       views.get_notifications,    name='get-notifications'),
     path('push/all/',   views.get_all_notifications, name='get-all-notifications'),
     path('push/read/',  views.mark_all_read,         name='mark-all-read'),
+    path('push/unread-count/', views.get_unread_count, name='unread-count'),
+
+    # Scheduled-notification sweeper backlog and lag (system admins)
+    path('scheduler-metrics/', views.scheduled_notification_metrics, name='scheduler-metrics'),
 
     # User preferences (GET + POST)
     path('preferences/', views.notification_preferences, name='preferences'),
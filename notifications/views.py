@@ -17,15 +17,23 @@ Notification API views — production-ready fixes:
      Fixed to only touch fields explicitly present in the request.
 
   5. Consistent error response shape: {'success': False, 'message': '...'}.
+
+  6. Inbox polling: unread counts and the first inbox page come from the
+     per-user cache in notifications.inbox; push/unread-count/ is the cheap
+     badge endpoint.
 """
 from rest_framework import generics, viewsets, status
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
 
+from common.permissions import IsSystemAdmin
+
+from .inbox import invalidate_inbox, notifications_read, recent_inbox, unread_count
 from .models import FCMToken, DevotionalShare, PushNotification, NotificationPreference
 from .serializers import (
     FCMTokenSerializer, DevotionalShareSerializer,
@@ -145,8 +153,14 @@ def get_notifications(request):
     which returned 0 because the queryset was already evaluated and
     .count() on an updated queryset reflects the post-update state.
     Fixed by evaluating the queryset, capturing the count, then marking read.
+
+    Polls with nothing unread are answered from the cached unread counter
+    without touching the table (see notifications.inbox).
     """
     try:
+        if unread_count(request.user.pk) == 0:
+            return Response({'success': True, 'count': 0, 'results': []})
+
         qs = (
             PushNotification.objects
             .filter(user=request.user, is_read=False)
@@ -160,7 +174,11 @@ def get_notifications(request):
         # Mark as read in bulk
         ids = [n.pk for n in notifications]
         if ids:
-            PushNotification.objects.filter(pk__in=ids).update(is_read=True)
+            updated = PushNotification.objects.filter(pk__in=ids, is_read=False).update(is_read=True)
+            transaction.on_commit(lambda: notifications_read({request.user.pk: updated}))
+        else:
+            # The counter said otherwise — recount on the next poll
+            invalidate_inbox([request.user.pk])
 
         serializer = PushNotificationSerializer(notifications, many=True)
 
@@ -181,16 +199,31 @@ def get_notifications(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_all_notifications(request):
-    """Paginated list of all notifications (read + unread) for the user."""
-    paginator = NotificationPagination()
-    qs = (
-        PushNotification.objects
-        .filter(user=request.user)
-        .order_by('-created_at')
-    )
-    page = paginator.paginate_queryset(qs, request)
-    serializer = PushNotificationSerializer(page, many=True)
-    return paginator.get_paginated_response(serializer.data)
+    """
+    Paginated list of all notifications (read + unread) for the user.
+    The default first page is cached until the user's notifications change.
+    """
+    def build():
+        paginator = NotificationPagination()
+        qs = (
+            PushNotification.objects
+            .filter(user=request.user)
+            .order_by('-created_at')
+        )
+        page = paginator.paginate_queryset(qs, request)
+        serializer = PushNotificationSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data).data
+
+    if set(request.query_params) <= {'page'} and request.query_params.get('page', '1') == '1':
+        return Response(recent_inbox(request.user.pk, build))
+    return Response(build())
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_unread_count(request):
+    """Number of unread notifications, from the cached counter."""
+    return Response({'success': True, 'unread': unread_count(request.user.pk)})
 
 
 @api_view(['POST'])
@@ -200,9 +233,30 @@ def mark_all_read(request):
     updated = PushNotification.objects.filter(
         user=request.user, is_read=False
     ).update(is_read=True)
+    transaction.on_commit(lambda: notifications_read({request.user.pk: updated}))
     return Response({'success': True, 'marked_read': updated})
 
 
+@api_view(['GET'])
+@permission_classes([IsSystemAdmin])
+def scheduled_notification_metrics(request):
+    """
+    GET /api/notifications/scheduler-metrics/
+
+    Backlog and dispatch lag of the scheduled-notification sweeper.
+    """
+    from .scheduler import scheduler_metrics
+
+    try:
+        return Response({'success': True, 'data': scheduler_metrics()})
+    except Exception as e:
+        logger.error("Error reading scheduler metrics: %s", e)
+        return Response(
+            {'success': False, 'message': 'Failed to read scheduler metrics'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+
 # ── Notification preferences ──────────────────────────────────────────────────
 
 @api_view(['GET', 'POST'])
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import PaymentRequest, Payment, Transaction
+from .models import (
+    PaymentRequest, Payment, Transaction, WebhookEvent, PaymentBatch, PaystackBank,
+    SettlementStatement, StatementLine, PaystackTransaction, ProviderSyncState,
+)
 
 @admin.register(PaymentRequest)
 class PaymentRequestAdmin(admin.ModelAdmin):
@@ -21,3 +24,104 @@ class TransactionAdmin(admin.ModelAdmin):
     list_filter = ('status', 'created_at')
     search_fields = ('payment__transaction_reference', 'amount')
     ordering = ('-created_at',)
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('source', 'event_type', 'reference', 'status', 'attempts', 'duplicate_count', 'received_at')
+    list_filter = ('status', 'provider', 'source', 'received_at')
+    search_fields = ('reference', 'event_key', 'event_type')
+    ordering = ('-received_at',)
+    readonly_fields = ('event_key', 'payload', 'result', 'received_at', 'processed_at')
+    actions = ['requeue_events']
+
+    def requeue_events(self, request, queryset):
+        from .webhooks import requeue_dead_events
+        count = requeue_dead_events(queryset)
+        self.message_user(request, f'{count} dead-lettered events requeued.')
+    requeue_events.short_description = 'Requeue selected dead-lettered events'
+
+@admin.register(PaymentBatch)
+class PaymentBatchAdmin(admin.ModelAdmin):
+    list_display = ('batch_id', 'batch_type', 'status', 'disbursement_count', 'transaction_count', 'net_amount', 'window_end', 'reconciled_at')
+    list_filter = ('batch_type', 'status', 'created_at')
+    search_fields = ('batch_id', 'provider_reference')
+    ordering = ('-created_at',)
+    readonly_fields = ('response_data', 'reconciliation', 'reconciled_at', 'processed_at', 'created_at')
+    actions = ['submit_batches', 'reconcile_batches']
+
+    def submit_batches(self, request, queryset):
+        from .settlement import submit_batch
+        accepted = sum(submit_batch(batch) for batch in queryset.filter(batch_type='settlement'))
+        self.message_user(request, f'{accepted} transfers accepted by Paystack.')
+    submit_batches.short_description = 'Submit due transfers of selected settlement batches'
+
+    def reconcile_batches(self, request, queryset):
+        from .settlement import reconcile_batch
+        results = [reconcile_batch(batch) for batch in queryset.filter(batch_type='settlement')]
+        mismatched = sum(1 for result in results if result['mismatches'])
+        self.message_user(request, f'{len(results)} batches reconciled, {mismatched} with mismatches.')
+    reconcile_batches.short_description = 'Reconcile selected settlement batches'
+
+@admin.register(PaystackBank)
+class PaystackBankAdmin(admin.ModelAdmin):
+    list_display = ('name', 'code', 'country', 'currency', 'type', 'is_active', 'synced_at')
+    list_filter = ('country', 'currency', 'type', 'is_active')
+    search_fields = ('name', 'slug', 'code')
+    ordering = ('country', 'name')
+    actions = ['sync_directory']
+
+    def sync_directory(self, request, queryset):
+        from .banks import sync_banks
+        countries = sorted(set(queryset.values_list('country', flat=True))) or None
+        self.message_user(request, f'{sync_banks(countries)} banks synced from Paystack.')
+    sync_directory.short_description = 'Sync the bank directory of the selected countries'
+
+@admin.register(SettlementStatement)
+class SettlementStatementAdmin(admin.ModelAdmin):
+    list_display = ('id', 'provider', 'file_name', 'period_start', 'period_end', 'line_count', 'total_amount', 'reconciled_at')
+    list_filter = ('provider', 'created_at')
+    search_fields = ('file_name',)
+    ordering = ('-created_at',)
+    readonly_fields = ('summary', 'reconciled_at', 'created_at')
+    actions = ['reconcile_statements']
+
+    def reconcile_statements(self, request, queryset):
+        from .reconciliation import reconcile
+        result = reconcile(statements=queryset, user=request.user)
+        self.message_user(
+            request,
+            f"{result['matched']} payments matched, {result['manual_review']} for review, "
+            f"{result['unmatched_lines']} statement lines unmatched."
+        )
+    reconcile_statements.short_description = 'Reconcile open lines of selected statements'
+
+@admin.register(StatementLine)
+class StatementLineAdmin(admin.ModelAdmin):
+    list_display = ('reference', 'statement', 'amount', 'fee', 'transaction_date', 'payer', 'match_status', 'matched_count')
+    list_filter = ('match_status', 'statement__provider')
+    search_fields = ('reference', 'provider_transaction_id', 'account_reference', 'payer')
+    ordering = ('-transaction_date',)
+    raw_id_fields = ('statement',)
+
+@admin.register(PaystackTransaction)
+class PaystackTransactionAdmin(admin.ModelAdmin):
+    list_display = ('reference', 'paystack_id', 'status', 'amount', 'currency', 'channel', 'customer_email', 'paid_at', 'synced_at')
+    list_filter = ('status', 'channel', 'currency')
+    search_fields = ('reference', 'customer_email')
+    ordering = ('-transaction_date',)
+    readonly_fields = ('data', 'synced_at')
+
+@admin.register(ProviderSyncState)
+class ProviderSyncStateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'high_water_mark', 'window_end', 'next_page', 'records_synced', 'last_success_at', 'last_error')
+    readonly_fields = ('records_synced', 'last_run_at', 'last_success_at', 'last_error', 'locked_until')
+    actions = ['run_sync']
+
+    def run_sync(self, request, queryset):
+        from .transaction_sync import sync_state, sync_transactions
+        result = sync_transactions()
+        if result['success']:
+            self.message_user(request, f"{result['stored']} Paystack transactions synced.")
+        else:
+            self.message_user(request, f"Sync did not finish: {result.get('message') or sync_state().last_error}")
+    run_sync.short_description = 'Sync Paystack transactions now'
@@ -0,0 +1,335 @@
+"""
+Local Paystack bank directory.
+
+``sync_banks`` copies Paystack's bank list (``GET /bank``, all pages) into
+``PaystackBank`` — daily from the ``sync_bank_directory`` task, and on
+first use of an empty directory. Each process keeps an in-memory index per
+country, rebuilt only when a sync changed the directory (a version number in
+the shared cache), so listing banks and resolving bank codes costs no API
+call and, most of the time, no query.
+
+Bank names typed by church admins ("KCB", "Co-op Bank", "Equity Bank Ltd")
+are resolved through:
+
+1. the normalized name (lower case, punctuation, "&" and legal suffixes
+   such as "Ltd"/"PLC" removed) and slug of every bank;
+2. aliases: the name without generic words ("bank", "kenya", ...), its
+   acronyms with and without those words other than "bank" ("Kenya
+   Commercial Bank" → "kcb", "Diamond Trust Bank Kenya" → "dtb") and
+   ``BANK_ALIASES``;
+3. fuzzy matching (``difflib``) over all of the above, accepted only when
+   one bank is clearly the closest.
+
+Anything ambiguous resolves to None, so callers report the problem rather
+than paying the wrong bank. Aliases shared by several banks are dropped.
+
+Account lookups (``GET /bank/resolve``) are cached in the ``responses``
+cache: successful ones for a day, definite "not found" answers briefly.
+
+Usage:
+    from payments.banks import resolve_bank
+
+    bank = resolve_bank(bank_account.bank_name)     # PaystackBank or None
+"""
+from difflib import SequenceMatcher
+import hashlib
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PaystackBank
+
+logger = logging.getLogger('altar_funds')
+
+CACHE_ALIAS = 'responses'
+VERSION_KEY = 'bank_directory_version'
+VERIFY_KEY = 'bank_account:{digest}'
+VERIFY_TIMEOUT = 24 * 3600          # seconds a resolved account name is reused
+VERIFY_NOT_FOUND_TIMEOUT = 600      # seconds a definite "could not resolve" is reused
+VERSION_CHECK_INTERVAL = 60         # seconds between checks for a newer directory
+PAGE_SIZE = 100
+FUZZY_CUTOFF = 0.85                 # minimum similarity for a fuzzy match
+FUZZY_MARGIN = 0.05                 # the best match must beat the runner-up by this much
+FUZZY_MIN_LENGTH = 5                # shorter keys (acronyms) only match exactly
+
+# Dropped when normalizing names
+LEGAL_SUFFIXES = {'ltd', 'limited', 'plc', 'inc', 'company'}
+# Dropped when building short aliases ("equity bank kenya" → "equity")
+GENERIC_WORDS = {'bank', 'banks', 'kenya', 'nigeria', 'ghana', 'the', 'of', 'and', 'group', 'holdings'}
+
+# Colloquial or former names → words of the directory name they refer to
+BANK_ALIASES = {
+    'barclays': 'absa',
+    'barclays bank': 'absa',
+    'coop': 'co operative',
+    'co op': 'co operative',
+    'coop bank': 'co operative',
+    'cba': 'ncba',
+    'nic': 'ncba',
+    'nic bank': 'ncba',
+    'stanchart': 'standard chartered',
+    'scb': 'standard chartered',
+    'gt bank': 'guaranty trust',
+    'gtbank': 'guaranty trust',
+    'mpesa': 'm pesa',
+    'safaricom': 'm pesa',
+}
+
+# country → {'version', 'checked_at', 'banks', 'index'}
+_directories = {}
+_directories_lock = threading.Lock()
+
+
+def default_country():
+    return getattr(settings, 'PAYSTACK_COUNTRY', 'kenya')
+
+
+def normalize(name):
+    """Lower-case ``name`` with punctuation and legal suffixes removed."""
+    name = (name or '').lower().replace('&', ' and ')
+    words = re.sub(r'[^a-z0-9]+', ' ', name).split()
+    return ' '.join(word for word in words if word not in LEGAL_SUFFIXES)
+
+
+def _short_name(normalized):
+    return ' '.join(word for word in normalized.split() if word not in GENERIC_WORDS)
+
+
+def _acronym(words):
+    return ''.join(word[0] for word in words) if len(words) > 1 else ''
+
+
+def _acronyms(normalized):
+    """
+    Acronyms of a normalized name: of every word ("kenya commercial bank" →
+    "kcb"), and of the words left without generic ones other than "bank"
+    ("diamond trust bank kenya" → "dtb").
+    """
+    words = [word for word in normalized.split() if word not in ('of', 'the', 'and')]
+    significant = [word for word in words if word in ('bank', 'banks') or word not in GENERIC_WORDS]
+    return {_acronym(words), _acronym(significant)}
+
+
+def _keys(bank):
+    """Lookup keys of one directory entry."""
+    normalized = normalize(bank.name)
+    keys = {normalized, normalize(bank.slug.replace('-', ' ')), _short_name(normalized), *_acronyms(normalized)}
+    return {key for key in keys if key}
+
+
+def build_index(banks):
+    """Key → bank for ``banks``; keys shared by several banks are left out."""
+    index, ambiguous = {}, set()
+    for bank in banks:
+        for key in _keys(bank):
+            if key in index and index[key].id != bank.id:
+                ambiguous.add(key)
+            index.setdefault(key, bank)
+    for key in ambiguous:
+        del index[key]
+    return index
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _directory_version():
+    try:
+        return _cache().get(VERSION_KEY, 0)
+    except Exception as e:
+        logger.warning(f"Bank directory version check failed: {str(e)}")
+        return None
+
+
+def _bump_version():
+    try:
+        _cache().set(VERSION_KEY, time.time(), None)
+    except Exception as e:
+        logger.warning(f"Could not publish bank directory update: {str(e)}")
+
+
+def directory(country=None):
+    """``(banks, index)`` of the active banks of ``country``, from memory when current."""
+    country = (country or default_country()).lower()
+    now = time.monotonic()
+    entry = _directories.get(country)
+    if entry and now - entry['checked_at'] < VERSION_CHECK_INTERVAL:
+        return entry['banks'], entry['index']
+
+    version = _directory_version()
+    if entry and entry['banks'] and (version is None or version == entry['version']):
+        entry['checked_at'] = now
+        return entry['banks'], entry['index']
+
+    with _directories_lock:
+        banks = list(PaystackBank.objects.filter(country=country, is_active=True).order_by('name'))
+        if not banks:
+            # Empty directory: fill it from Paystack (retried at most once per check interval)
+            if sync_banks([country]):
+                banks = list(PaystackBank.objects.filter(country=country, is_active=True).order_by('name'))
+                version = _directory_version()
+        entry = _directories[country] = {
+            'version': version,
+            'checked_at': now,
+            'banks': banks,
+            'index': build_index(banks),
+        }
+    return entry['banks'], entry['index']
+
+
+def list_banks(country=None):
+    """Active banks of ``country`` in Paystack's ``/bank`` format."""
+    banks, _ = directory(country)
+    return [
+        {
+            'id': bank.paystack_id,
+            'name': bank.name,
+            'slug': bank.slug,
+            'code': bank.code,
+            'longcode': bank.longcode,
+            'country': bank.country,
+            'currency': bank.currency,
+            'type': bank.type,
+        }
+        for bank in banks
+    ]
+
+
+def resolve_bank(name, country=None):
+    """The directory entry ``name`` refers to, or None if unknown or ambiguous."""
+    key = normalize(name)
+    if not _short_name(key):
+        # Empty, or only generic words such as "Bank"
+        return None
+    banks, index = directory(country)
+
+    candidates = [key, _short_name(key), BANK_ALIASES.get(key), BANK_ALIASES.get(_short_name(key))]
+    for candidate in candidates:
+        if candidate and candidate in index:
+            return index[candidate]
+
+    # Fuzzy: closest key, if clearly closer than any other bank's
+    scores = {}
+    for candidate in {key, _short_name(key)}:
+        if len(candidate) < FUZZY_MIN_LENGTH:
+            continue
+        for index_key, bank in index.items():
+            if len(index_key) < FUZZY_MIN_LENGTH:
+                continue
+            ratio = SequenceMatcher(None, candidate, index_key).ratio()
+            if ratio > scores.get(bank.id, (0, None))[0]:
+                scores[bank.id] = (ratio, bank)
+    ranked = sorted(scores.values(), key=lambda item: item[0], reverse=True)
+    if ranked and ranked[0][0] >= FUZZY_CUTOFF:
+        if len(ranked) == 1 or ranked[0][0] - ranked[1][0] >= FUZZY_MARGIN:
+            return ranked[0][1]
+        logger.warning(f"Bank name '{name}' is ambiguous: {ranked[0][1].name} / {ranked[1][1].name}")
+    return None
+
+
+def resolve_bank_code(name, country=None):
+    bank = resolve_bank(name, country)
+    return bank.code if bank else None
+
+
+def sync_banks(countries=None):
+    """
+    Refresh the directory from Paystack for ``countries``.
+
+    Banks Paystack no longer lists are deactivated. Returns the number of
+    banks stored, or 0 if Paystack could not be reached.
+    """
+    from .paystack_service import paystack_transfer_service as service
+
+    countries = [country.lower() for country in (countries or [default_country()])]
+    stored = 0
+    for country in countries:
+        rows, cursor = [], None
+        try:
+            while True:
+                params = {'country': country, 'perPage': PAGE_SIZE, 'use_cursor': 'true'}
+                if cursor:
+                    params['next'] = cursor
+                response = service.http.get(f"{service.BASE_URL}/bank", params=params, headers=service.headers)
+                response.raise_for_status()
+                data = response.json()
+                if not data.get('status'):
+                    raise ValueError(data.get('message', 'Bank list request failed'))
+                rows.extend(data.get('data') or [])
+                cursor = (data.get('meta') or {}).get('next')
+                if not cursor:
+                    break
+        except Exception as e:
+            logger.error(f"Bank directory sync failed for {country}: {str(e)}")
+            continue
+
+        now = timezone.now()
+        banks = [
+            PaystackBank(
+                paystack_id=row['id'],
+                country=country,
+                name=row.get('name', '').strip(),
+                slug=row.get('slug') or '',
+                code=row.get('code') or '',
+                longcode=row.get('longcode') or '',
+                currency=row.get('currency') or '',
+                type=row.get('type') or '',
+                is_active=bool(row.get('active', True)) and not row.get('is_deleted'),
+                synced_at=now,
+            )
+            for row in rows if row.get('id') and row.get('code')
+        ]
+        with transaction.atomic():
+            PaystackBank.objects.bulk_create(
+                banks,
+                update_conflicts=True,
+                unique_fields=['paystack_id'],
+                update_fields=['country', 'name', 'slug', 'code', 'longcode', 'currency', 'type', 'is_active', 'synced_at'],
+                batch_size=500,
+            )
+            PaystackBank.objects.filter(country=country, is_active=True).exclude(
+                paystack_id__in=[bank.paystack_id for bank in banks]
+            ).update(is_active=False, synced_at=now)
+        stored += len(banks)
+        logger.info(f"Bank directory synced for {country}: {len(banks)} banks")
+
+    if stored:
+        _bump_version()
+    return stored
+
+
+def verify_account(account_number, bank_code):
+    """
+    ``paystack_transfer_service.verify_bank_account`` with its answers cached.
+
+    Connection errors are not cached.
+    """
+    from .paystack_service import paystack_transfer_service
+
+    digest = hashlib.sha256(f"{bank_code}:{account_number}".encode()).hexdigest()[:32]
+    key = VERIFY_KEY.format(digest=digest)
+    try:
+        cached = _cache().get(key)
+    except Exception as e:
+        logger.warning(f"Bank account cache unavailable: {str(e)}")
+        cached = None
+    if cached is not None:
+        return cached
+
+    result = paystack_transfer_service.verify_bank_account(account_number, bank_code)
+    timeout = VERIFY_TIMEOUT if result['success'] else (
+        VERIFY_NOT_FOUND_TIMEOUT if result.get('definite') else None
+    )
+    if timeout:
+        try:
+            _cache().set(key, result, timeout)
+        except Exception as e:
+            logger.warning(f"Could not cache bank account lookup: {str(e)}")
+    return result
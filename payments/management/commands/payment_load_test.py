@@ -0,0 +1,296 @@
+"""
+Management command: end-to-end load test of the giving flow against the provider simulator.
+
+Each simulated gift goes through the real code path: ``POST
+/api/giving/transactions/`` (``create_giving_transaction`` → Paystack
+initialize), a simulated checkout, the signed ``charge.success`` webhook,
+inbox processing, the transfer to the church and the ``transfer.success``
+webhook. Latency is measured from the create request to
+``ChurchDisbursement.completed_at``.
+
+Paystack is replaced by an in-process ``ProviderSimulator`` whose webhooks
+are delivered straight to the Django WSGI application; Celery tasks run
+eagerly. Test data lives in a ``LOADTEST`` church that is removed afterwards
+unless ``--keep-data`` is given. Never run against a production database.
+
+Usage:
+    python manage.py payment_load_test --gifts 500 --concurrency 16
+
+    # Slow, flaky provider
+    python manage.py payment_load_test --latency 0.3 --jitter 0.2 --error-rate 0.02 --decline-rate 0.05
+"""
+from decimal import Decimal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import threading
+import time
+import uuid
+
+LOADTEST_CHURCH_CODE = 'LOADTEST'
+LOADTEST_RECIPIENT = 'RCP_loadtest'
+DRAIN_INTERVAL = 0.2      # seconds between webhook inbox drains
+POLL_INTERVAL = 0.5       # seconds between completion checks
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Measure giving throughput and latency from create_giving_transaction to disbursement completion'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gifts', type=int, default=200, help='Number of gifts to create')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent API clients')
+        parser.add_argument('--members', type=int, default=20, help='Number of giving members')
+        parser.add_argument('--latency', type=float, default=0.05, help='Simulated provider seconds per call')
+        parser.add_argument('--jitter', type=float, default=0.05, help='Random extra provider seconds per call')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of provider calls answered with a 503')
+        parser.add_argument('--decline-rate', type=float, default=0.0, help='Share of payments and transfers declined')
+        parser.add_argument('--webhook-delay', type=float, default=1.0, help='Seconds before the provider reports outcomes')
+        parser.add_argument('--timeout', type=float, default=300, help='Seconds to wait for disbursements to complete')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed, for reproducible runs')
+        parser.add_argument('--keep-data', action='store_true', help='Keep the LOADTEST church and its gifts')
+
+    def handle(self, *args, **options):
+        from celery import current_app
+        from django.core.wsgi import get_wsgi_application
+        from django.test.utils import override_settings
+        from common.provider_simulator import ProviderSimulator
+
+        if not settings.DEBUG and not getattr(settings, 'PROVIDER_SIMULATOR_URL', ''):
+            raise CommandError('Refusing to run with DEBUG off; set PROVIDER_SIMULATOR_URL to confirm a test environment')
+        if min(options['gifts'], options['concurrency'], options['members']) < 1:
+            raise CommandError('--gifts, --concurrency and --members must be positive')
+
+        simulator = ProviderSimulator(
+            webhook_target=get_wsgi_application(),
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            decline_rate=options['decline_rate'],
+            webhook_delay=options['webhook_delay'],
+            seed=options['seed'],
+        )
+        server, url = simulator.serve()
+        eager = current_app.conf.task_always_eager
+        current_app.conf.task_always_eager = True
+        try:
+            with override_settings(PROVIDER_SIMULATOR_URL=url, DISBURSEMENT_MODE='instant'):
+                church, category, members = self._create_fixtures(options['members'])
+                try:
+                    report = self._run(simulator, category, members, options)
+                finally:
+                    if not options['keep_data']:
+                        self._remove_fixtures(church, members)
+        finally:
+            current_app.conf.task_always_eager = eager
+            server.shutdown()
+            server.server_close()
+
+        self._print_report(report, simulator)
+
+    # ── Fixtures ─────────────────────────────────────────────────────────
+
+    def _create_fixtures(self, member_count):
+        from accounts.models import Member, User
+        from churches.models import Church, ChurchBankAccount
+        from giving.models import GivingCategory
+
+        church, _ = Church.objects.get_or_create(
+            church_code=LOADTEST_CHURCH_CODE,
+            defaults={
+                'name': 'Load Test Church',
+                'phone_number': '0700000000',
+                'email': 'loadtest@altarfunds.invalid',
+                'address_line1': 'Load test',
+                'city': 'Nairobi',
+                'county': 'Nairobi',
+                'senior_pastor_name': 'Load Test',
+                'senior_pastor_phone': '0700000000',
+            },
+        )
+        category, _ = GivingCategory.objects.get_or_create(church=church, name='Load Test Offering')
+        members = []
+        for index in range(member_count):
+            email = f"loadtest-{index}@altarfunds.invalid"
+            user = User.objects.filter(email=email).first() or User.objects.create_user(
+                email=email,
+                password=uuid.uuid4().hex,
+                first_name='Load',
+                last_name=f"Tester {index}",
+                role='member',
+                church=church,
+            )
+            Member.objects.get_or_create(user=user, defaults={'church': church})
+            members.append(user)
+
+        if not church.bank_accounts.filter(paystack_recipient_code=LOADTEST_RECIPIENT).exists():
+            ChurchBankAccount.objects.create(
+                church=church,
+                account_name='Load Test Church',
+                account_number='0000000000',
+                bank_name='Equity Bank',
+                is_primary=True,
+                paystack_recipient_code=LOADTEST_RECIPIENT,
+                created_by=members[0],
+                updated_by=members[0],
+            )
+        return church, category, members
+
+    def _remove_fixtures(self, church, members):
+        from accounts.models import User
+        from churches.models import Church
+        from giving.models import ChurchDisbursement, GivingTransaction
+
+        # Querysets delete for real; Model.delete() is a soft delete
+        try:
+            ChurchDisbursement.objects.filter(church=church).delete()
+            GivingTransaction.objects.filter(church=church).delete()
+            church.bank_accounts.all().delete()
+            User.objects.filter(pk__in=[user.pk for user in members]).delete()
+            Church.objects.filter(pk=church.pk).delete()
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f"Could not remove load test data: {str(e)}"))
+
+    # ── Run ──────────────────────────────────────────────────────────────
+
+    def _run(self, simulator, category, members, options):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import close_old_connections
+        from django.utils import timezone
+        from rest_framework.test import APIClient
+        from giving.models import ChurchDisbursement
+        from payments.models import WebhookEvent
+
+        started = {}                  # payment reference → request start
+        create_latencies = []
+        failures = []
+        lock = threading.Lock()
+        running = threading.Event()
+        running.set()
+
+        def drain():
+            from payments.tasks import drain_webhook_inbox
+
+            # Stands in for the Celery worker and the periodic inbox sweep
+            while running.is_set():
+                drain_webhook_inbox()
+                close_old_connections()
+                time.sleep(DRAIN_INTERVAL)
+
+        def give(index):
+            client = APIClient()
+            client.force_authenticate(members[index % len(members)])
+            began = timezone.now()
+            clock = time.monotonic()
+            try:
+                response = client.post('/api/giving/transactions/', {
+                    'category': category.id,
+                    'amount': str(Decimal(100 + index % 900)),
+                    'payment_method': 'card',
+                }, format='json')
+                reference = response.data.get('payment_reference') if response.status_code == 201 else None
+                if not reference:
+                    raise RuntimeError(response.data.get('warning') or response.data.get('message') or response.status_code)
+                with lock:
+                    started[reference] = began
+                    create_latencies.append(time.monotonic() - clock)
+                # The member completes the checkout
+                simulator.pay(reference)
+            except Exception as e:
+                with lock:
+                    failures.append(str(e))
+            finally:
+                close_old_connections()
+
+        drainer = threading.Thread(target=drain, name='loadtest-drain', daemon=True)
+        drainer.start()
+        run_started = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                list(pool.map(give, range(options['gifts'])))
+            created_seconds = time.monotonic() - run_started
+
+            # Wait until nothing is in flight: no webhook queued at the provider
+            # or unprocessed in the inbox, no transfer awaiting its outcome
+            deadline = time.monotonic() + options['timeout']
+            references = list(started)
+            while time.monotonic() < deadline:
+                in_flight = (
+                    simulator.pending_webhooks()
+                    or WebhookEvent.objects.filter(status__in=['pending', 'processing']).exists()
+                    or ChurchDisbursement.objects.filter(
+                        giving_transaction__payment_reference__in=references,
+                        status__in=['pending', 'processing'],
+                    ).exists()
+                )
+                if not in_flight:
+                    break
+                time.sleep(POLL_INTERVAL)
+            total_seconds = time.monotonic() - run_started
+        finally:
+            running.clear()
+            drainer.join()
+
+        end_to_end = []
+        statuses = {}
+        rows = ChurchDisbursement.objects.filter(
+            giving_transaction__payment_reference__in=list(started)
+        ).values_list('giving_transaction__payment_reference', 'status', 'completed_at')
+        for reference, disbursement_status, completed_at in rows:
+            statuses[disbursement_status] = statuses.get(disbursement_status, 0) + 1
+            if disbursement_status == 'completed' and completed_at:
+                end_to_end.append((completed_at - started[reference]).total_seconds())
+
+        return {
+            'gifts': options['gifts'],
+            'created': len(started),
+            'create_failures': failures,
+            'create_seconds': created_seconds,
+            'total_seconds': total_seconds,
+            'create_latencies': create_latencies,
+            'end_to_end': end_to_end,
+            'disbursements': statuses,
+        }
+
+    # ── Report ───────────────────────────────────────────────────────────
+
+    def _print_report(self, report, simulator):
+        from common.http import provider_metrics
+
+        def line(label, values):
+            if not values:
+                return f"{label}: no samples"
+            return (
+                f"{label}: p50 {_percentile(values, 50):.3f}s  p90 {_percentile(values, 90):.3f}s  "
+                f"p99 {_percentile(values, 99):.3f}s  max {max(values):.3f}s"
+            )
+
+        completed = len(report['end_to_end'])
+        self.stdout.write(f"Gifts created: {report['created']}/{report['gifts']} "
+                          f"in {report['create_seconds']:.1f}s "
+                          f"({report['created'] / max(report['create_seconds'], 0.001):.1f}/s)")
+        self.stdout.write(line('Create latency', report['create_latencies']))
+        self.stdout.write(f"Disbursements completed: {completed} in {report['total_seconds']:.1f}s "
+                          f"({completed / max(report['total_seconds'], 0.001):.1f}/s); by status: {report['disbursements']}")
+        self.stdout.write(line('End-to-end latency', report['end_to_end']))
+        if report['create_failures']:
+            self.stdout.write(self.style.WARNING(
+                f"{len(report['create_failures'])} gifts failed to start, e.g. {report['create_failures'][0]}"
+            ))
+
+        stats = simulator.stats()
+        self.stdout.write(f"Provider calls: {stats['calls']}")
+        self.stdout.write(f"Webhooks: {stats['webhooks']}")
+        self.stdout.write(f"Client metrics: {provider_metrics(['paystack'])}")
+
+        expected = report['created'] - stats['transactions'].get('failed', 0) - stats['transfers'].get('failed', 0)
+        if completed >= expected:
+            self.stdout.write(self.style.SUCCESS('All paid gifts were disbursed.'))
+        else:
+            self.stdout.write(self.style.WARNING(f"{expected - completed} paid gifts were not disbursed before the timeout."))
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:38
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(choices=[('paystack', 'Paystack'), ('mpesa', 'M-Pesa')], max_length=20)),
+                ('source', models.CharField(choices=[('paystack', 'Paystack Webhook'), ('giving_paystack', 'Giving Paystack Webhook'), ('mpesa_result', 'M-Pesa Disbursement Result'), ('mpesa_timeout', 'M-Pesa Disbursement Timeout')], max_length=30)),
+                ('event_type', models.CharField(blank=True, max_length=100)),
+                ('event_key', models.CharField(max_length=255, unique=True)),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('processed', 'Processed'), ('dead', 'Dead Letter')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('duplicate_count', models.PositiveIntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Webhook Event',
+                'verbose_name_plural': 'Webhook Events',
+                'db_table': 'payments_webhook_events',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'available_at'], name='webhook_due_idx'), models.Index(fields=['provider', 'reference'], name='webhook_reference_idx')],
+            },
+        ),
+    ]
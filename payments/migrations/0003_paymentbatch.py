@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('churches', '0004_church_accent_color_church_bank_account_name_and_more'),
+        ('payments', '0002_webhookevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(max_length=50, unique=True)),
+                ('batch_type', models.CharField(choices=[('settlement', 'Settlement'), ('payout', 'Payout')], default='settlement', max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('partial', 'Partially Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('window_start', models.DateTimeField(blank=True, null=True)),
+                ('window_end', models.DateTimeField(blank=True, null=True)),
+                ('scheduled_for', models.DateTimeField(default=django.utils.timezone.now)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('disbursement_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('platform_fee', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('net_amount', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('provider_reference', models.CharField(blank=True, max_length=100)),
+                ('response_data', models.JSONField(blank=True, default=dict)),
+                ('error_message', models.TextField(blank=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('reconciliation', models.JSONField(blank=True, default=dict)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('church', models.ForeignKey(blank=True, help_text='Set for single-church batches; settlement batches span churches', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payment_batches', to='churches.church')),
+            ],
+            options={
+                'verbose_name': 'Payment Batch',
+                'verbose_name_plural': 'Payment Batches',
+                'db_table': 'payments_batches',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'scheduled_for'], name='payment_batch_due_idx'), models.Index(fields=['batch_type', 'window_end'], name='payment_batch_window_idx')],
+            },
+        ),    ]
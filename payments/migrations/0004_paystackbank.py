@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_paymentbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaystackBank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paystack_id', models.PositiveIntegerField(unique=True)),
+                ('country', models.CharField(max_length=50)),
+                ('name', models.CharField(max_length=200)),
+                ('slug', models.CharField(blank=True, max_length=200)),
+                ('code', models.CharField(max_length=20)),
+                ('longcode', models.CharField(blank=True, max_length=50)),
+                ('currency', models.CharField(blank=True, max_length=10)),
+                ('type', models.CharField(blank=True, help_text='Recipient type, e.g. kepss, nuban, mobile_money', max_length=30)),
+                ('is_active', models.BooleanField(default=True)),
+                ('synced_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Paystack Bank',
+                'verbose_name_plural': 'Paystack Banks',
+                'db_table': 'payments_paystack_banks',
+                'ordering': ['country', 'name'],
+                'indexes': [models.Index(fields=['country', 'is_active'], name='paystack_bank_country_idx')],
+            },
+        ),
+    ]
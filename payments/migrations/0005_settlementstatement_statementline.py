@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('payments', '0004_paystackbank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SettlementStatement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(choices=[('paystack', 'Paystack'), ('mpesa', 'M-Pesa')], max_length=20)),
+                ('file_name', models.CharField(blank=True, max_length=255)),
+                ('period_start', models.DateTimeField(blank=True, null=True)),
+                ('period_end', models.DateTimeField(blank=True, null=True)),
+                ('line_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('summary', models.JSONField(blank=True, default=dict)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('uploaded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Settlement Statement',
+                'verbose_name_plural': 'Settlement Statements',
+                'db_table': 'payments_settlement_statements',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StatementLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('provider_transaction_id', models.CharField(blank=True, max_length=100)),
+                ('account_reference', models.CharField(blank=True, max_length=100)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('fee', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('transaction_date', models.DateTimeField()),
+                ('payer', models.CharField(blank=True, max_length=200)),
+                ('raw', models.JSONField(blank=True, default=dict)),
+                ('match_status', models.CharField(choices=[('unmatched', 'Unmatched'), ('matched', 'Matched'), ('manual_review', 'Manual Review')], default='unmatched', max_length=20)),
+                ('matched_count', models.PositiveIntegerField(default=0)),
+                ('statement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='payments.settlementstatement')),
+            ],
+            options={
+                'verbose_name': 'Statement Line',
+                'verbose_name_plural': 'Statement Lines',
+                'db_table': 'payments_statement_lines',
+                'ordering': ['transaction_date', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='statementline',
+            index=models.Index(fields=['reference'], name='statement_line_reference_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statementline',
+            index=models.Index(fields=['match_status', 'transaction_date'], name='statement_line_open_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-17 10:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_settlementstatement_statementline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaystackTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paystack_id', models.BigIntegerField(unique=True)),
+                ('reference', models.CharField(db_index=True, max_length=100)),
+                ('status', models.CharField(max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('fees', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True)),
+                ('currency', models.CharField(blank=True, max_length=10)),
+                ('channel', models.CharField(blank=True, max_length=30)),
+                ('customer_email', models.CharField(blank=True, max_length=254)),
+                ('transaction_date', models.DateTimeField(blank=True, null=True)),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('synced_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Paystack Transaction',
+                'verbose_name_plural': 'Paystack Transactions',
+                'db_table': 'payments_paystack_transactions',
+                'ordering': ['-transaction_date'],
+                'indexes': [models.Index(fields=['status', 'paid_at'], name='paystack_tx_paid_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProviderSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('high_water_mark', models.DateTimeField(blank=True, null=True)),
+                ('window_start', models.DateTimeField(blank=True, null=True)),
+                ('window_end', models.DateTimeField(blank=True, null=True)),
+                ('next_page', models.PositiveIntegerField(default=1)),
+                ('records_synced', models.PositiveBigIntegerField(default=0)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('last_success_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Provider Sync State',
+                'verbose_name_plural': 'Provider Sync States',
+                'db_table': 'payments_provider_sync_state',
+            },
+        ),
+    ]
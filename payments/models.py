@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class PaystackAccount(models.Model):
     """Paystack account configuration for churches"""
@@ -142,6 +143,13 @@ class PaymentReconciliation(models.Model):
     payment_request = models.OneToOneField(PaymentRequest, on_delete=models.CASCADE)
     bank_transaction_id = models.CharField(max_length=100, blank=True, null=True)
     bank_reference = models.CharField(max_length=100, blank=True, null=True)
+    statement_line = models.ForeignKey(
+        'StatementLine',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='reconciliations'
+    )
     
     # Reconciliation details
     reconciliation_status = models.CharField(
@@ -236,3 +244,310 @@ class PaymentDetail(models.Model):
     
     def __str__(self):
         return f"Payment details for {self.payment_request}"
+
+
+class WebhookEvent(models.Model):
+    """
+    Raw Paystack / M-Pesa callback, stored by the webhook view and processed
+    asynchronously by ``payments.webhooks``.
+
+    ``event_key`` is unique, so provider retries of the same event are
+    stored once. Events sharing a ``(provider, reference)`` are processed in
+    the order they were received.
+    """
+    
+    PROVIDER_CHOICES = [
+        ('paystack', 'Paystack'),
+        ('mpesa', 'M-Pesa'),
+    ]
+    
+    SOURCE_CHOICES = [
+        ('paystack', 'Paystack Webhook'),
+        ('giving_paystack', 'Giving Paystack Webhook'),
+        ('mpesa_result', 'M-Pesa Disbursement Result'),
+        ('mpesa_timeout', 'M-Pesa Disbursement Timeout'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('processed', 'Processed'),
+        ('dead', 'Dead Letter'),
+    ]
+    
+    provider = models.CharField(max_length=20, choices=PROVIDER_CHOICES)
+    source = models.CharField(max_length=30, choices=SOURCE_CHOICES)
+    event_type = models.CharField(max_length=100, blank=True)
+    event_key = models.CharField(max_length=255, unique=True)
+    reference = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField(default=dict)
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    duplicate_count = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'payments_webhook_events'
+        verbose_name = 'Webhook Event'
+        verbose_name_plural = 'Webhook Events'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='webhook_due_idx'),
+            models.Index(fields=['provider', 'reference'], name='webhook_reference_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.source} {self.event_type} {self.reference} - {self.status}"
+
+
+class PaymentBatch(models.Model):
+    """
+    A group of transfers paid out together.
+
+    Settlement batches collect the completed online giving of one settlement
+    window (see ``payments.settlement``) and pay every church its share with
+    Paystack bulk transfers: one ``giving.ChurchDisbursement`` per church,
+    each covering many giving transactions.
+    """
+    
+    BATCH_TYPES = [
+        ('settlement', 'Settlement'),
+        ('payout', 'Payout'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('partial', 'Partially Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    batch_id = models.CharField(max_length=50, unique=True)
+    batch_type = models.CharField(max_length=20, choices=BATCH_TYPES, default='settlement')
+    church = models.ForeignKey(
+        'churches.Church',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='payment_batches',
+        help_text='Set for single-church batches; settlement batches span churches'
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    
+    # Settlement window covered by the batch
+    window_start = models.DateTimeField(null=True, blank=True)
+    window_end = models.DateTimeField(null=True, blank=True)
+    scheduled_for = models.DateTimeField(default=timezone.now)
+    
+    # Totals at creation
+    transaction_count = models.PositiveIntegerField(default=0)
+    disbursement_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    platform_fee = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    net_amount = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    
+    # Provider submission
+    provider_reference = models.CharField(max_length=100, blank=True)
+    response_data = models.JSONField(default=dict, blank=True)
+    error_message = models.TextField(blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    # Latest reconciliation result
+    reconciliation = models.JSONField(default=dict, blank=True)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'payments_batches'
+        verbose_name = 'Payment Batch'
+        verbose_name_plural = 'Payment Batches'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'scheduled_for'], name='payment_batch_due_idx'),
+            models.Index(fields=['batch_type', 'window_end'], name='payment_batch_window_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_batch_type_display()} {self.batch_id} - {self.get_status_display()}"
+    
+    def mark_processed(self, provider_reference, response_data):
+        """Record that the batch was handed to the provider"""
+        self.status = 'processing'
+        self.provider_reference = provider_reference
+        self.response_data = response_data or {}
+        self.processed_at = timezone.now()
+        self.save(update_fields=[
+            'status', 'provider_reference', 'response_data', 'processed_at', 'updated_at'
+        ])
+
+
+class PaystackBank(models.Model):
+    """
+    Local copy of Paystack's bank directory (``GET /bank``).
+
+    Synced periodically by ``payments.banks.sync_banks``; bank codes for
+    transfer recipients are resolved against it instead of calling Paystack.
+    """
+    
+    paystack_id = models.PositiveIntegerField(unique=True)
+    country = models.CharField(max_length=50)
+    name = models.CharField(max_length=200)
+    slug = models.CharField(max_length=200, blank=True)
+    code = models.CharField(max_length=20)
+    longcode = models.CharField(max_length=50, blank=True)
+    currency = models.CharField(max_length=10, blank=True)
+    type = models.CharField(max_length=30, blank=True, help_text='Recipient type, e.g. kepss, nuban, mobile_money')
+    is_active = models.BooleanField(default=True)
+    synced_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'payments_paystack_banks'
+        verbose_name = 'Paystack Bank'
+        verbose_name_plural = 'Paystack Banks'
+        ordering = ['country', 'name']
+        indexes = [
+            models.Index(fields=['country', 'is_active'], name='paystack_bank_country_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.code})"
+
+
+class SettlementStatement(models.Model):
+    """An imported provider statement (Paystack settlement export, M-Pesa statement)"""
+    
+    PROVIDER_CHOICES = [
+        ('paystack', 'Paystack'),
+        ('mpesa', 'M-Pesa'),
+    ]
+    
+    provider = models.CharField(max_length=20, choices=PROVIDER_CHOICES)
+    file_name = models.CharField(max_length=255, blank=True)
+    period_start = models.DateTimeField(null=True, blank=True)
+    period_end = models.DateTimeField(null=True, blank=True)
+    line_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    uploaded_by = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, blank=True)
+    # Result of the latest reconciliation run over this statement
+    summary = models.JSONField(default=dict, blank=True)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'payments_settlement_statements'
+        verbose_name = 'Settlement Statement'
+        verbose_name_plural = 'Settlement Statements'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.get_provider_display()} statement {self.file_name or self.id}"
+
+
+class StatementLine(models.Model):
+    """One credit on an imported statement"""
+    
+    MATCH_STATUS = [
+        ('unmatched', 'Unmatched'),
+        ('matched', 'Matched'),
+        ('manual_review', 'Manual Review'),
+    ]
+    
+    statement = models.ForeignKey(SettlementStatement, on_delete=models.CASCADE, related_name='lines')
+    reference = models.CharField(max_length=100, blank=True)
+    provider_transaction_id = models.CharField(max_length=100, blank=True)
+    account_reference = models.CharField(max_length=100, blank=True)
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    fee = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    transaction_date = models.DateTimeField()
+    payer = models.CharField(max_length=200, blank=True)
+    raw = models.JSONField(default=dict, blank=True)
+    
+    match_status = models.CharField(max_length=20, choices=MATCH_STATUS, default='unmatched')
+    matched_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'payments_statement_lines'
+        verbose_name = 'Statement Line'
+        verbose_name_plural = 'Statement Lines'
+        ordering = ['transaction_date', 'id']
+        indexes = [
+            models.Index(fields=['reference'], name='statement_line_reference_idx'),
+            models.Index(fields=['match_status', 'transaction_date'], name='statement_line_open_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.reference or self.provider_transaction_id} - {self.amount}"
+
+
+class PaystackTransaction(models.Model):
+    """
+    Local mirror of Paystack transactions (``GET /transaction``).
+
+    Filled incrementally by ``payments.transaction_sync.sync_transactions``
+    and by charge webhooks; verification and reconciliation read it before
+    calling Paystack. ``data`` is Paystack's transaction object as returned.
+    """
+    
+    paystack_id = models.BigIntegerField(unique=True)
+    reference = models.CharField(max_length=100, db_index=True)
+    status = models.CharField(max_length=20)
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    fees = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    currency = models.CharField(max_length=10, blank=True)
+    channel = models.CharField(max_length=30, blank=True)
+    customer_email = models.CharField(max_length=254, blank=True)
+    transaction_date = models.DateTimeField(null=True, blank=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+    data = models.JSONField(default=dict, blank=True)
+    synced_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'payments_paystack_transactions'
+        verbose_name = 'Paystack Transaction'
+        verbose_name_plural = 'Paystack Transactions'
+        ordering = ['-transaction_date']
+        indexes = [
+            models.Index(fields=['status', 'paid_at'], name='paystack_tx_paid_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.reference} - {self.amount} ({self.status})"
+
+
+class ProviderSyncState(models.Model):
+    """
+    Progress of an incremental provider sync job.
+
+    ``high_water_mark`` is the time up to which everything is synced. A run
+    in progress syncs ``window_start``–``window_end`` page by page and
+    records ``next_page`` after each stored page, so a failed run resumes
+    where it stopped. ``locked_until`` keeps runs from overlapping.
+    """
+    
+    name = models.CharField(max_length=50, unique=True)
+    high_water_mark = models.DateTimeField(null=True, blank=True)
+    window_start = models.DateTimeField(null=True, blank=True)
+    window_end = models.DateTimeField(null=True, blank=True)
+    next_page = models.PositiveIntegerField(default=1)
+    records_synced = models.PositiveBigIntegerField(default=0)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_success_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    
+    class Meta:
+        db_table = 'payments_provider_sync_state'
+        verbose_name = 'Provider Sync State'
+        verbose_name_plural = 'Provider Sync States'
+    
+    def __str__(self):
+        return f"{self.name} (through {self.high_water_mark})"
@@ -11,6 +11,9 @@ from django.db.models import Q as models_Q
 from decimal import Decimal
 import logging
 
+from common.http import ProviderClient
+from .transaction_sync import local_transaction, record_transaction
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,6 +21,7 @@ class PaystackService:
     """Service class for Paystack payment operations"""
     
     BASE_URL = "https://api.paystack.co"
+    http = ProviderClient('paystack')
     
     def __init__(self, church_account=None):
         # Use church account keys if provided, otherwise use default settings
@@ -69,11 +73,10 @@ class PaystackService:
             if callback_url:
                 payload["callback_url"] = callback_url
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.BASE_URL}/transaction/initialize",
                 json=payload,
                 headers=self.headers,
-                timeout=30
             )
             
             response.raise_for_status()
@@ -107,21 +110,29 @@ class PaystackService:
                 "message": "Payment initialization failed"
             }
     
-    def verify_payment(self, reference):
+    def verify_payment(self, reference, use_local=True):
         """
         Verify a payment transaction
         
+        The local transaction mirror answers for transactions in a final
+        state; others are verified with Paystack and mirrored.
+        
         Args:
             reference (str): Transaction reference
+            use_local (bool): Read the local mirror first
             
         Returns:
             dict: Payment verification details
         """
         try:
-            response = requests.get(
+            if use_local:
+                mirrored = local_transaction(reference)
+                if mirrored:
+                    return self._verification_result(mirrored.data, source='local')
+            
+            response = self.http.get(
                 f"{self.BASE_URL}/transaction/verify/{reference}",
                 headers=self.headers,
-                timeout=30
             )
             
             response.raise_for_status()
@@ -129,22 +140,10 @@ class PaystackService:
             
             if data.get("status"):
                 transaction_data = data["data"]
-                
-                # Convert amount from smallest unit back to base currency
-                amount = Decimal(transaction_data["amount"]) / 100
+                record_transaction(transaction_data)
                 
                 logger.info(f"Payment verified successfully: {reference}")
-                return {
-                    "success": True,
-                    "status": transaction_data["status"],
-                    "amount": amount,
-                    "currency": transaction_data["currency"],
-                    "reference": transaction_data["reference"],
-                    "paid_at": transaction_data.get("paid_at"),
-                    "channel": transaction_data.get("channel"),
-                    "customer": transaction_data.get("customer"),
-                    "metadata": transaction_data.get("metadata", {})
-                }
+                return self._verification_result(transaction_data, source='paystack')
             else:
                 logger.error(f"Payment verification failed: {data.get('message')}")
                 return {
@@ -165,6 +164,22 @@ class PaystackService:
                 "message": "Payment verification failed"
             }
     
+    def _verification_result(self, transaction_data, source):
+        """verify_payment's answer for a Paystack transaction object"""
+        return {
+            "success": True,
+            "status": transaction_data["status"],
+            # Convert amount from smallest unit back to base currency
+            "amount": Decimal(transaction_data["amount"]) / 100,
+            "currency": transaction_data["currency"],
+            "reference": transaction_data["reference"],
+            "paid_at": transaction_data.get("paid_at"),
+            "channel": transaction_data.get("channel"),
+            "customer": transaction_data.get("customer"),
+            "metadata": transaction_data.get("metadata", {}),
+            "source": source
+        }
+    
     def verify_webhook_signature(self, payload, signature):
         """
         Verify Paystack webhook signature
@@ -188,13 +203,15 @@ class PaystackService:
             logger.error(f"Webhook signature verification error: {str(e)}")
             return False
     
-    def process_webhook(self, event_type, data):
+    def process_webhook(self, event_type, data, raise_errors=False):
         """
         Process Paystack webhook events
         
         Args:
             event_type (str): Type of webhook event
             data (dict): Event data
+            raise_errors (bool): Re-raise processing errors (so the webhook
+                inbox can retry) instead of returning a failure result
             
         Returns:
             dict: Processing result
@@ -214,6 +231,8 @@ class PaystackService:
                 
         except Exception as e:
             logger.error(f"Webhook processing error: {str(e)}")
+            if raise_errors:
+                raise
             return {"success": False, "message": "Webhook processing failed"}
     
     def _handle_successful_charge(self, data):
@@ -226,12 +245,11 @@ class PaystackService:
 
         # ── Update Payment record ─────────────────────────────────────────
         try:
-            payment = Payment.objects.get(reference=reference)
+            payment = Payment.objects.get(transaction_reference=reference)
             if payment.status != "completed":
                 payment.status         = "completed"
-                payment.paid_at        = timezone.now()
+                payment.processed_at   = timezone.now()
                 payment.payment_method = data.get("channel", "paystack")
-                payment.transaction_id = data.get("id")
                 payment.save()
         except Payment.DoesNotExist:
             logger.warning(f"Payment record not found for reference: {reference}")
@@ -256,7 +274,7 @@ class PaystackService:
         reference = data.get("reference")
         
         try:
-            payment = Payment.objects.get(reference=reference)
+            payment = Payment.objects.get(transaction_reference=reference)
             payment.status = "failed"
             payment.failure_reason = data.get("gateway_response", "Payment failed")
             payment.save()
@@ -298,10 +316,9 @@ class PaystackService:
             dict: Transaction details
         """
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.BASE_URL}/transaction/{transaction_id}",
                 headers=self.headers,
-                timeout=30
             )
             
             response.raise_for_status()
@@ -325,15 +342,20 @@ class PaystackService:
                 "message": "Failed to fetch transaction"
             }
     
-    def list_transactions(self, per_page=50, page=1, status=None, customer=None):
+    def list_transactions(self, per_page=50, page=1, status=None, customer=None, from_date=None, to_date=None):
         """
         List transactions with filters
         
+        One page of Paystack's list; ``payments.transaction_sync`` mirrors
+        all of them locally.
+        
         Args:
             per_page (int): Number of records per page
             page (int): Page number
             status (str): Filter by status (success, failed, abandoned)
             customer (str): Filter by customer ID
+            from_date (datetime): Only transactions created from this time
+            to_date (datetime): Only transactions created up to this time
             
         Returns:
             dict: List of transactions
@@ -348,12 +370,15 @@ class PaystackService:
                 params["status"] = status
             if customer:
                 params["customer"] = customer
+            if from_date:
+                params["from"] = from_date.isoformat()
+            if to_date:
+                params["to"] = to_date.isoformat()
             
-            response = requests.get(
+            response = self.http.get(
                 f"{self.BASE_URL}/transaction",
                 headers=self.headers,
                 params=params,
-                timeout=30
             )
             
             response.raise_for_status()
@@ -412,6 +437,7 @@ class PaystackTransferService:
     """
 
     BASE_URL = "https://api.paystack.co"
+    http = ProviderClient('paystack')
 
     def __init__(self):
         self.secret_key = settings.PAYSTACK_SECRET_KEY
@@ -432,10 +458,12 @@ class PaystackTransferService:
 
         Docs: https://paystack.com/docs/transfers/creating-transfer-recipient/
         """
+        from .banks import resolve_bank
+
         try:
-            # Look up Paystack bank code from bank name
-            bank_code = self._resolve_bank_code(bank_account.bank_name)
-            if not bank_code:
+            # Look up the Paystack bank from the local bank directory
+            bank = resolve_bank(bank_account.bank_name)
+            if not bank:
                 return {
                     "success": False,
                     "message": (
@@ -446,11 +474,11 @@ class PaystackTransferService:
                 }
 
             payload = {
-                "type":           "nuban",          # Nigeria/Kenya inter-bank
+                "type":           bank.type or "nuban",
                 "name":           bank_account.account_name,
                 "account_number": bank_account.account_number,
-                "bank_code":      bank_code,
-                "currency":       "KES",            # adjust if multi-currency
+                "bank_code":      bank.code,
+                "currency":       bank.currency or getattr(settings, "PAYSTACK_CURRENCY", "KES"),
                 "description":    f"Church account – {bank_account.church.name}",
                 "metadata": {
                     "church_id":         bank_account.church.id,
@@ -459,11 +487,10 @@ class PaystackTransferService:
                 },
             }
 
-            response = requests.post(
+            response = self.http.post(
                 f"{self.BASE_URL}/transferrecipient",
                 json=payload,
                 headers=self.headers,
-                timeout=30,
             )
             response.raise_for_status()
             data = response.json()
@@ -503,23 +530,19 @@ class PaystackTransferService:
             logger.error(f"create_transfer_recipient error: {e}")
             return {"success": False, "message": str(e)}
 
-    def list_banks(self, country="nigeria"):
+    def list_banks(self, country=None):
         """
-        Fetch Paystack's list of supported banks + their codes.
+        Paystack's list of supported banks + their codes, from the local
+        bank directory (see payments.banks).
         Use this to find the bank_code for a church's bank.
         """
+        from .banks import list_banks
+
         try:
-            response = requests.get(
-                f"{self.BASE_URL}/bank",
-                params={"country": country, "perPage": 100},
-                headers=self.headers,
-                timeout=30,
-            )
-            response.raise_for_status()
-            data = response.json()
-            if data.get("status"):
-                return {"success": True, "banks": data["data"]}
-            return {"success": False, "message": data.get("message")}
+            banks = list_banks(country)
+            if banks:
+                return {"success": True, "banks": banks}
+            return {"success": False, "message": "Bank directory is unavailable"}
         except Exception as e:
             logger.error(f"list_banks error: {e}")
             return {"success": False, "message": str(e)}
@@ -530,12 +553,15 @@ class PaystackTransferService:
         Useful for confirming a church's bank account before creating a recipient.
         """
         try:
-            response = requests.get(
+            response = self.http.get(
                 f"{self.BASE_URL}/bank/resolve",
                 params={"account_number": account_number, "bank_code": bank_code},
                 headers=self.headers,
-                timeout=30,
             )
+            if response.status_code in (400, 422):
+                # Paystack's answer for accounts it cannot resolve
+                data = response.json()
+                return {"success": False, "message": data.get("message"), "definite": True}
             response.raise_for_status()
             data = response.json()
             if data.get("status"):
@@ -544,7 +570,7 @@ class PaystackTransferService:
                     "account_name": data["data"]["account_name"],
                     "account_number": data["data"]["account_number"],
                 }
-            return {"success": False, "message": data.get("message")}
+            return {"success": False, "message": data.get("message"), "definite": True}
         except Exception as e:
             logger.error(f"verify_bank_account error: {e}")
             return {"success": False, "message": str(e)}
@@ -635,11 +661,10 @@ class PaystackTransferService:
                 "reference": reference,
             }
 
-            response = requests.post(
+            response = self.http.post(
                 f"{self.BASE_URL}/transfer",
                 json=payload,
                 headers=self.headers,
-                timeout=30,
             )
             response.raise_for_status()
             data = response.json()
@@ -682,6 +707,67 @@ class PaystackTransferService:
             logger.error(f"initiate_transfer error: {e}")
             return False, str(e)
 
+    def initiate_bulk_transfer(self, transfers):
+        """
+        Queue up to 100 transfers from the AltarFunds balance in one call.
+
+        ``transfers`` are dicts with amount (kobo), recipient, reference and
+        reason. Returns (success, data | message); ``data`` holds Paystack's
+        per-transfer result (reference, transfer_code, status). ``success`` is
+        False when Paystack declined the request and None when the call failed
+        without an answer (timeout, connection error, 5xx): the transfers may
+        have been queued, so they must be verified before being sent again.
+        """
+        try:
+            response = self.http.post(
+                f"{self.BASE_URL}/transfer/bulk",
+                json={
+                    "currency":  getattr(settings, "PAYSTACK_CURRENCY", "KES"),
+                    "source":    "balance",
+                    "transfers": transfers,
+                },
+                headers=self.headers,
+            )
+            if response.status_code >= 500:
+                response.raise_for_status()
+            data = response.json()
+            if data.get("status"):
+                return True, data.get("data") or []
+            return False, data.get("message", "Bulk transfer failed")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Paystack API error (initiate_bulk_transfer): {e}")
+            return None, "Unable to connect to Paystack"
+
+    def verify_transfer(self, reference):
+        """
+        Look up a transfer by the reference it was sent with.
+
+        Returns {"success": True, "status": ..., "amount": kobo, "transfer_code": ...},
+        {"success": False, "not_found": True} if Paystack has no such transfer,
+        or {"success": False, "message": ...}.
+        """
+        try:
+            response = self.http.get(
+                f"{self.BASE_URL}/transfer/verify/{reference}",
+                headers=self.headers,
+            )
+            if response.status_code == 404:
+                return {"success": False, "not_found": True}
+            response.raise_for_status()
+            data = response.json()
+            if data.get("status"):
+                transfer = data["data"]
+                return {
+                    "success":       True,
+                    "status":        transfer.get("status"),
+                    "amount":        transfer.get("amount"),
+                    "transfer_code": transfer.get("transfer_code", ""),
+                }
+            return {"success": False, "message": data.get("message")}
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Paystack API error (verify_transfer): {e}")
+            return {"success": False, "message": str(e)}
+
     # ── Webhook handlers ──────────────────────────────────────────────────
 
     def handle_transfer_success(self, data):
@@ -695,6 +781,9 @@ class PaystackTransferService:
         qs = ChurchDisbursement.objects.filter(
             models_Q(transfer_code=transfer_code) | models_Q(conversation_id=str(data.get("id", "")))
         )
+        if not qs.exists() and reference:
+            # Batched transfers may report back before their transfer code is stored
+            qs = ChurchDisbursement.objects.filter(transfer_reference=reference)
         if not qs.exists():
             # Try matching by reference embedded in the reason field
             qs = ChurchDisbursement.objects.filter(
@@ -708,9 +797,11 @@ class PaystackTransferService:
             d.paystack_receipt = data.get("reference", transfer_code)
             d.save()
 
-            # Mark the giving transaction's disbursement_status
-            d.giving_transaction.disbursement_status = "completed"
-            d.giving_transaction.save(update_fields=["disbursement_status"])
+            # Mark the giving transactions' disbursement_status
+            d.covered_transactions().update(disbursement_status="completed")
+            if d.batch_id:
+                from .settlement import refresh_batch_status
+                refresh_batch_status(d.batch)
 
             logger.info(f"Disbursement completed: {transfer_code} → {d.church.name}")
         else:
@@ -727,6 +818,8 @@ class PaystackTransferService:
         qs = ChurchDisbursement.objects.filter(
             models_Q(transfer_code=transfer_code) | models_Q(conversation_id=str(data.get("id", "")))
         )
+        if not qs.exists() and data.get("reference"):
+            qs = ChurchDisbursement.objects.filter(transfer_reference=data["reference"])
         if qs.exists():
             d = qs.first()
             d.status        = "failed"
@@ -743,80 +836,42 @@ class PaystackTransferService:
                 d.save()
                 logger.info(f"Disbursement {transfer_code} scheduled for retry #{d.retry_count}")
             else:
+                d.covered_transactions().update(disbursement_status="failed")
                 logger.error(
                     f"Disbursement {transfer_code} permanently failed after "
                     f"{d.retry_count} attempts"
                 )
 
+            if d.batch_id:
+                from .settlement import refresh_batch_status
+                refresh_batch_status(d.batch)
+
         return {"success": True, "message": "Transfer failure processed"}
 
-    def retry_failed_disbursements(self):
+    def retry_failed_disbursements(self, deadline=None):
         """
         Called by a periodic task (e.g. Celery beat) to retry failed disbursements.
+
+        Transfers left in ``processing`` without a webhook are first settled
+        from Paystack's record; due retries are then resent concurrently
+        (see ``payments.status_polling``), within one shared deadline.
+        Batched settlement disbursements are retried by ``payments.settlement``.
         """
-        from giving.models import ChurchDisbursement
-        from django.utils import timezone
+        import time
+        from common.polling import DEFAULT_DEADLINE
+        from .status_polling import retry_due_disbursements, verify_stalled_disbursements
 
-        due = ChurchDisbursement.objects.filter(
-            status="pending_retry",
-            next_retry_at__lte=timezone.now(),
-            retry_count__lt=models_F("max_retries"),
-        ).select_related("giving_transaction", "church")
-
-        retried, failed = 0, 0
-        for d in due:
-            success, msg = self.initiate_transfer(d.giving_transaction)
-            if success:
-                retried += 1
-            else:
-                failed += 1
-                logger.error(f"Retry failed for disbursement {d.id}: {msg}")
+        stop_at = time.monotonic() + (deadline or DEFAULT_DEADLINE)
+        verify_stalled_disbursements(deadline=(deadline or DEFAULT_DEADLINE) / 2)
+        retried, failed = retry_due_disbursements(deadline=max(stop_at - time.monotonic(), 1))
 
         logger.info(f"Disbursement retries: {retried} succeeded, {failed} failed")
         return retried, failed
 
-    # ── Internal helpers ──────────────────────────────────────────────────
-
-    def _resolve_bank_code(self, bank_name):
-        """
-        Simple lookup of common Kenyan / Nigerian bank names → Paystack bank codes.
-        Extend this dict or use the live list_banks() API for exhaustive coverage.
-        """
-        # Common Kenyan banks (Paystack Kenya)
-        KENYA_BANK_CODES = {
-            "equity bank":              "E001",
-            "equity":                   "E001",
-            "kcb":                      "K001",
-            "kcb bank":                 "K001",
-            "kenya commercial bank":    "K001",
-            "cooperative bank":         "C001",
-            "co-operative bank":        "C001",
-            "ncba":                     "N001",
-            "ncba bank":                "N001",
-            "family bank":              "F001",
-            "dtb":                      "D001",
-            "diamond trust bank":       "D001",
-            "stanbic bank":             "S001",
-            "standard chartered":       "SC01",
-            "standard chartered bank":  "SC01",
-            "absa bank":                "A001",
-            "absa":                     "A001",
-            "i&m bank":                 "I001",
-            "i&m":                      "I001",
-            "prime bank":               "P001",
-            "sidian bank":              "SI01",
-            "gt bank":                  "GT01",
-            "guaranty trust bank":      "GT01",
-            "mpesa":                    "M001",
-            "safaricom":                "M001",
-        }
-        return KENYA_BANK_CODES.get(bank_name.lower().strip())
-
 
 # Helper imports needed only inside class methods — pulled to module level
 # so they don't cause circular imports
 from django.db.models import Q  as models_Q
-from django.db.models import F  as models_F
 
 
 # ── Module-level singleton ────────────────────────────────────────────────
@@ -0,0 +1,621 @@
+"""
+Reconciliation of completed payments against provider statements.
+
+Statements are CSV exports uploaded by finance staff:
+
+* Paystack transaction / settlement exports (``Reference``, ``Amount``,
+  ``Fees``, ``Paid At`` or ``Settlement Date``, ...);
+* M-Pesa statements (``Receipt No.``, ``Completion Time``, ``Paid In``,
+  ``A/C No.``, ``Other Party Info``, ...). Only completed credits are kept.
+
+``import_statement`` stores each credit as a ``StatementLine``; lines already
+imported from an earlier statement (same provider and reference) are skipped.
+``import_paystack_mirror`` does the same for successful transactions of the
+local Paystack mirror (``payments.transaction_sync``), so reconciliation
+needs no export for them.
+
+``reconcile`` then matches every open line against completed payment
+requests without a settled reconciliation. Both sides are loaded once as
+plain values and indexed in dicts, so a month of platform-wide data is
+matched in memory in a few passes:
+
+1. exact — the line reference is the payment's transaction or account
+   reference. Same amount → matched (100); different amount → manual review;
+2. fuzzy — same amount within ``DATE_WINDOW_DAYS`` of each other (index on
+   amount and day). A pair that is the only candidate for both sides is
+   matched; otherwise the closest pair goes to manual review. A matching
+   payer phone number raises the confidence, a different one rules the
+   line out;
+3. many-to-one — a settlement line equal to the total (gross, or net plus
+   fees) of one day's remaining payments, per Paystack account or for the
+   whole platform, on the settlement day or the days before.
+
+Payments of the reconciled period still without a line are recorded as
+unmatched. Results are written with ``bulk_create`` / ``bulk_update`` in one
+transaction, with one audit entry per run.
+
+Usage:
+    from payments.reconciliation import import_statement, reconcile
+
+    statement = import_statement('mpesa', request.FILES['file'], request.user)
+    result = reconcile(statements=[statement], user=request.user)
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+import csv
+import io
+import logging
+import re
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from common.services import AuditService
+from .models import (
+    PaymentReconciliation, PaymentRequest, PaystackTransaction, SettlementStatement, StatementLine,
+)
+
+logger = logging.getLogger('altar_funds')
+
+DATE_WINDOW_DAYS = 1         # days a statement date may differ from the payment date
+SETTLEMENT_LAG_DAYS = 2      # days a settlement may trail the payments it covers
+MAX_STATEMENT_ROWS = 200000
+BATCH_SIZE = 1000
+# file_name of statements built from the local Paystack transaction mirror
+MIRROR_FILE_NAME = 'paystack-mirror'
+
+EXACT_CONFIDENCE = 100
+AMOUNT_MISMATCH_CONFIDENCE = 50
+FUZZY_CONFIDENCE = 85
+FUZZY_AMBIGUOUS_CONFIDENCE = 60
+PHONE_BONUS = 10
+GROUP_CONFIDENCE = 80
+MATCHED_THRESHOLD = 80       # confidence from which a match needs no review
+
+# Reconciliations a new run may overwrite
+OPEN_STATUSES = ('pending', 'unmatched')
+
+# Accepted CSV header spellings → field, per provider
+COLUMN_ALIASES = {
+    'paystack': {
+        'reference': 'reference',
+        'transaction reference': 'reference',
+        'settlement reference': 'reference',
+        'id': 'provider_transaction_id',
+        'transaction id': 'provider_transaction_id',
+        'settlement id': 'provider_transaction_id',
+        'amount': 'amount',
+        'total amount': 'amount',
+        'fees': 'fee',
+        'fee': 'fee',
+        'total fees': 'fee',
+        'settled amount': 'net',
+        'net amount': 'net',
+        'paid at': 'date',
+        'paid_at': 'date',
+        'transaction date': 'date',
+        'settlement date': 'date',
+        'settled at': 'date',
+        'date': 'date',
+        'created at': 'date',
+        'customer email': 'payer',
+        'email': 'payer',
+        'customer': 'payer',
+        'status': 'status',
+    },
+    'mpesa': {
+        'receipt no.': 'reference',
+        'receipt no': 'reference',
+        'receipt number': 'reference',
+        'transaction id': 'reference',
+        'completion time': 'date',
+        'transaction date': 'date',
+        'date': 'date',
+        'paid in': 'amount',
+        'amount': 'amount',
+        'withdrawn': 'withdrawn',
+        'a/c no.': 'account_reference',
+        'a/c no': 'account_reference',
+        'account no.': 'account_reference',
+        'account reference': 'account_reference',
+        'bill reference': 'account_reference',
+        'other party info': 'payer',
+        'details': 'details',
+        'transaction status': 'status',
+    },
+}
+REQUIRED_COLUMNS = ('amount', 'date')
+# Status column values of lines that did not move money
+FAILED_STATUSES = {'failed', 'abandoned', 'reversed', 'cancelled', 'declined', 'pending'}
+
+DATE_FORMATS = (
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d-%m-%Y %H:%M:%S', '%d-%m-%Y %H:%M',
+    '%Y-%m-%d %H:%M', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d', '%d %b %Y %H:%M', '%d %b %Y',
+)
+
+
+class StatementImportError(Exception):
+    """Raised when a statement cannot be imported; ``errors`` lists row problems."""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+def normalize_reference(value):
+    """Upper-case ``value`` with everything but letters and digits removed."""
+    return re.sub(r'[^A-Z0-9]', '', (value or '').upper())
+
+
+def normalize_phone(value):
+    """Last nine digits of the first phone number in ``value`` ('' if none)."""
+    match = re.search(r'(?:\+?254|0)?([17]\d{8})', re.sub(r'[\s-]', '', value or ''))
+    return match.group(1) if match else ''
+
+
+def parse_amount(value):
+    text = re.sub(r'[^0-9.\-]', '', (value or '').replace(',', ''))
+    if not text:
+        return None
+    try:
+        return Decimal(text).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return None
+
+
+def parse_date(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    parsed = None
+    try:
+        parsed = parse_datetime(value.replace(' ', 'T', 1) if 'T' not in value else value)
+    except ValueError:
+        pass
+    if parsed is None:
+        for date_format in DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(value, date_format)
+                break
+            except ValueError:
+                continue
+    if parsed is None:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.get_current_timezone())
+    return parsed
+
+
+def parse_csv(provider, upload):
+    """
+    Statement lines of a CSV export as dicts ready for ``StatementLine``.
+
+    Debits, failed transactions and unknown columns are skipped; rows with an
+    unreadable amount or date are reported.
+    """
+    aliases = COLUMN_ALIASES.get(provider)
+    if aliases is None:
+        raise StatementImportError(f"Unsupported provider: {provider}")
+    if hasattr(upload, 'read'):
+        upload = upload.read()
+    if isinstance(upload, bytes):
+        upload = upload.decode('utf-8-sig')
+
+    reader = csv.DictReader(io.StringIO(upload))
+    if not reader.fieldnames:
+        raise StatementImportError('The CSV file is empty')
+    columns = {name: aliases.get((name or '').strip().lower()) for name in reader.fieldnames}
+    for required in REQUIRED_COLUMNS:
+        if required not in columns.values():
+            raise StatementImportError(f"Missing required column: {required}")
+
+    lines, errors = [], []
+    for number, row in enumerate(reader, start=2):
+        if number > MAX_STATEMENT_ROWS + 1:
+            raise StatementImportError(f"A statement can have at most {MAX_STATEMENT_ROWS} rows")
+        values = {columns[name]: (value or '').strip() for name, value in row.items() if columns.get(name)}
+        if values.get('status', '').lower() in FAILED_STATUSES:
+            continue
+        amount = parse_amount(values.get('amount'))
+        if amount is None and values.get('withdrawn'):
+            continue
+        fee = parse_amount(values.get('fee')) or Decimal('0.00')
+        net = parse_amount(values.get('net'))
+        if amount is None and net is not None:
+            amount = net + fee
+        transaction_date = parse_date(values.get('date'))
+        if amount is None or transaction_date is None:
+            errors.append({'row': number, 'error': 'Unreadable amount or date'})
+            continue
+        if amount <= 0:
+            continue
+        lines.append({
+            'reference': values.get('reference', '')[:100],
+            'provider_transaction_id': values.get('provider_transaction_id', '')[:100],
+            'account_reference': values.get('account_reference', '')[:100],
+            'amount': amount,
+            'fee': abs(fee),
+            'transaction_date': transaction_date,
+            'payer': values.get('payer', '')[:200],
+            'raw': row,
+        })
+    if errors:
+        raise StatementImportError(f"{len(errors)} rows could not be read", errors)
+    return lines
+
+
+def _new_rows(provider, rows):
+    """``rows`` without lines already imported for ``provider`` (or repeated in ``rows``)."""
+    references = list({row['reference'] for row in rows if row['reference']})
+    existing = set()
+    for start in range(0, len(references), BATCH_SIZE):
+        existing.update(StatementLine.objects.filter(
+            statement__provider=provider,
+            reference__in=references[start:start + BATCH_SIZE],
+        ).values_list('reference', flat=True))
+    seen = set()
+    new_rows = []
+    for row in rows:
+        reference = row['reference']
+        if reference and (reference in existing or reference in seen):
+            continue
+        seen.add(reference)
+        new_rows.append(row)
+    return new_rows
+
+
+def _create_statement(provider, rows, new_rows, user, file_name):
+    dates = [row['transaction_date'] for row in new_rows]
+    statement = SettlementStatement.objects.create(
+        provider=provider,
+        file_name=file_name[:255],
+        period_start=min(dates) if dates else None,
+        period_end=max(dates) if dates else None,
+        line_count=len(new_rows),
+        total_amount=sum((row['amount'] for row in new_rows), Decimal('0.00')),
+        uploaded_by=user,
+        summary={'duplicates': len(rows) - len(new_rows)},
+    )
+    StatementLine.objects.bulk_create(
+        [StatementLine(statement=statement, **row) for row in new_rows],
+        batch_size=BATCH_SIZE,
+    )
+    logger.info(
+        f"Imported {provider} statement {statement.id}: {len(new_rows)} lines, "
+        f"{len(rows) - len(new_rows)} duplicates skipped"
+    )
+    return statement
+
+
+@transaction.atomic
+def import_statement(provider, upload, user=None, file_name=''):
+    """Store the credits of a statement CSV; returns the ``SettlementStatement``."""
+    rows = parse_csv(provider, upload)
+    file_name = file_name or getattr(upload, 'name', '') or ''
+    return _create_statement(provider, rows, _new_rows(provider, rows), user, file_name)
+
+
+@transaction.atomic
+def import_paystack_mirror(since=None, user=None):
+    """
+    Add successful transactions of the local Paystack mirror as statement lines.
+
+    Covers transactions mirrored since ``since`` (by default since the
+    previous mirror import). Returns the new ``SettlementStatement``, or None
+    when there is nothing new.
+    """
+    from .transaction_sync import overlap
+
+    if since is None:
+        previous = SettlementStatement.objects.filter(
+            provider='paystack', file_name=MIRROR_FILE_NAME
+        ).order_by('-created_at').values_list('created_at', flat=True).first()
+        since = previous - overlap() if previous else None
+    transactions = PaystackTransaction.objects.filter(status='success')
+    if since:
+        transactions = transactions.filter(synced_at__gte=since)
+
+    rows = [
+        {
+            'reference': row['reference'],
+            'provider_transaction_id': str(row['paystack_id']),
+            'amount': row['amount'],
+            'fee': row['fees'] or Decimal('0.00'),
+            'transaction_date': row['paid_at'] or row['transaction_date'],
+            'payer': row['customer_email'],
+        }
+        for row in transactions.values(
+            'paystack_id', 'reference', 'amount', 'fees', 'paid_at', 'transaction_date', 'customer_email',
+        ).iterator(chunk_size=5000)
+        if row['paid_at'] or row['transaction_date']
+    ]
+    new_rows = _new_rows('paystack', rows)
+    if not new_rows:
+        return None
+    return _create_statement('paystack', rows, new_rows, user, MIRROR_FILE_NAME)
+
+
+def _cents(amount):
+    return int((amount * 100).to_integral_value())
+
+
+def _day(moment, tz):
+    return moment.astimezone(tz).date()
+
+
+def _load_lines(statements, start, end):
+    tz = timezone.get_current_timezone()
+    lines = StatementLine.objects.filter(match_status='unmatched')
+    if statements is not None:
+        lines = lines.filter(statement__in=statements)
+    if start:
+        lines = lines.filter(transaction_date__gte=start)
+    if end:
+        lines = lines.filter(transaction_date__lt=end)
+    return {
+        row['id']: dict(row, cents=_cents(row['amount']), fee_cents=_cents(row['fee']),
+                        day=_day(row['transaction_date'], tz), phone=normalize_phone(row['payer']))
+        for row in lines.values(
+            'id', 'statement_id', 'reference', 'provider_transaction_id', 'account_reference',
+            'amount', 'fee', 'transaction_date', 'payer',
+        ).iterator(chunk_size=5000)
+    }
+
+
+def _load_payments(start, end, payment_ids=None):
+    tz = timezone.get_current_timezone()
+    window = timedelta(days=DATE_WINDOW_DAYS + SETTLEMENT_LAG_DAYS)
+    payments = PaymentRequest.objects.filter(
+        status='completed',
+        created_at__gte=start - window,
+        created_at__lt=end + window,
+    )
+    if payment_ids is not None:
+        payments = payments.filter(id__in=payment_ids)
+    payments = payments.filter(
+        Q(paymentreconciliation__isnull=True) |
+        Q(paymentreconciliation__reconciliation_status__in=OPEN_STATUSES)
+    )
+    return {
+        row['id']: dict(row, cents=_cents(row['amount']), day=_day(row['created_at'], tz),
+                        phone=normalize_phone(row['phone_number']))
+        for row in payments.values(
+            'id', 'amount', 'created_at', 'transaction_reference', 'account_reference',
+            'phone_number', 'paystack_account_id', 'paymentreconciliation__id',
+        ).iterator(chunk_size=5000)
+    }
+
+
+def _unique_index(rows, fields):
+    """Normalized reference → row ID; references shared by several rows are left out."""
+    index, ambiguous = {}, set()
+    for row in rows:
+        for field in fields:
+            key = normalize_reference(row[field])
+            if not key:
+                continue
+            if key in index and index[key] != row['id']:
+                ambiguous.add(key)
+            index.setdefault(key, row['id'])
+    for key in ambiguous:
+        del index[key]
+    return index
+
+
+def _exact_pass(lines, payments, results):
+    by_reference = _unique_index(payments.values(), ('transaction_reference', 'account_reference'))
+    # Account numbers typed by payers ("TITHE") are only trusted when unique
+    line_accounts = _unique_index(lines.values(), ('account_reference',))
+
+    for line in list(lines.values()):
+        payment_id = None
+        for field in ('reference', 'account_reference', 'provider_transaction_id'):
+            key = normalize_reference(line[field])
+            if field == 'account_reference' and key not in line_accounts:
+                continue
+            if key and by_reference.get(key) in payments:
+                payment_id = by_reference[key]
+                break
+        if payment_id is None:
+            continue
+        payment = payments.pop(payment_id)
+        del lines[line['id']]
+        if payment['cents'] == line['cents']:
+            results.append((payment, line, EXACT_CONFIDENCE, 'Reference and amount match'))
+        else:
+            results.append((payment, line, AMOUNT_MISMATCH_CONFIDENCE,
+                            f"Reference matches but statement amount is {line['amount']}"))
+
+
+def _window_days(day, before, after):
+    return [day + timedelta(days=offset) for offset in range(-before, after + 1)]
+
+
+def _fuzzy_pass(lines, payments, results):
+    lines_by_key = defaultdict(list)
+    for line in lines.values():
+        lines_by_key[(line['cents'], line['day'])].append(line['id'])
+    payments_by_key = defaultdict(list)
+    for payment in payments.values():
+        payments_by_key[(payment['cents'], payment['day'])].append(payment['id'])
+
+    for payment in sorted(payments.values(), key=lambda item: item['created_at']):
+        candidates = [
+            lines[line_id]
+            for day in _window_days(payment['day'], DATE_WINDOW_DAYS, DATE_WINDOW_DAYS)
+            for line_id in lines_by_key.get((payment['cents'], day), ())
+            if line_id in lines
+        ]
+        if not candidates:
+            continue
+        if payment['phone']:
+            # A statement naming another payer's phone is not this payment
+            candidates = [line for line in candidates if line['phone'] in ('', payment['phone'])]
+            if not candidates:
+                continue
+        line = min(candidates, key=lambda item: abs(item['transaction_date'] - payment['created_at']))
+
+        competitors = sum(
+            1
+            for day in _window_days(line['day'], DATE_WINDOW_DAYS, DATE_WINDOW_DAYS)
+            for payment_id in payments_by_key.get((line['cents'], day), ())
+            if payment_id in payments
+        )
+        phone_match = bool(payment['phone']) and line['phone'] == payment['phone']
+        if len(candidates) == 1 and competitors == 1:
+            confidence = FUZZY_CONFIDENCE
+            note = 'Amount matches the only statement line within the date window'
+        else:
+            confidence = FUZZY_AMBIGUOUS_CONFIDENCE
+            note = f"Amount matches {len(candidates)} statement lines; closest in time chosen"
+        if phone_match:
+            confidence += PHONE_BONUS
+            note += '; payer phone matches'
+
+        del payments[payment['id']]
+        del lines[line['id']]
+        results.append((payment, line, confidence, note))
+
+
+def _group_pass(lines, payments, results):
+    groups = defaultdict(list)
+    for payment in payments.values():
+        groups[(payment['day'], None)].append(payment['id'])
+        if payment['paystack_account_id']:
+            groups[(payment['day'], payment['paystack_account_id'])].append(payment['id'])
+    groups_by_total = defaultdict(list)
+    for key, payment_ids in groups.items():
+        if len(payment_ids) > 1:
+            total = sum(payments[payment_id]['cents'] for payment_id in payment_ids)
+            groups_by_total[(total, key[0])].append(key)
+
+    for line in sorted(lines.values(), key=lambda item: item['transaction_date']):
+        found = set()
+        for total in {line['cents'], line['cents'] + line['fee_cents']}:
+            for day in _window_days(line['day'], SETTLEMENT_LAG_DAYS, 0):
+                for key in groups_by_total.get((total, day), ()):
+                    if all(payment_id in payments for payment_id in groups[key]):
+                        found.add(tuple(groups[key]))
+        if len(found) != 1:
+            continue
+        payment_ids = found.pop()
+        del lines[line['id']]
+        for payment_id in payment_ids:
+            results.append((payments.pop(payment_id), line, GROUP_CONFIDENCE,
+                            f"Part of a settlement of {len(payment_ids)} payments"))
+
+
+def _status(confidence):
+    if confidence >= MATCHED_THRESHOLD:
+        return 'matched'
+    return 'manual_review' if confidence else 'unmatched'
+
+
+def reconcile(statements=None, start=None, end=None, payment_ids=None, user=None):
+    """
+    Match open statement lines with unreconciled completed payments.
+
+    ``statements`` limits the lines to those statements; ``start``/``end``
+    limit them to a date range and ``payment_ids`` the payments considered.
+    Payments created in the reconciled period (``start``–``end``, or the
+    dates of the lines) that match no line are recorded as unmatched.
+    Returns counts per pass and outcome.
+    """
+    started = timezone.now()
+    lines = _load_lines(statements, start, end)
+    if not lines and (start is None or end is None):
+        return {'success': True, 'lines': 0, 'payments': 0, 'matched': 0,
+                'manual_review': 0, 'unmatched': 0, 'unmatched_lines': 0}
+    dates = [line['transaction_date'] for line in lines.values()]
+    period_start = start or min(dates) - timedelta(days=DATE_WINDOW_DAYS)
+    period_end = end or max(dates) + timedelta(days=DATE_WINDOW_DAYS)
+    payments = _load_payments(period_start, period_end, payment_ids)
+    line_count, payment_count = len(lines), len(payments)
+    all_lines = dict(lines)
+
+    results = []
+    _exact_pass(lines, payments, results)
+    exact = len(results)
+    _fuzzy_pass(lines, payments, results)
+    fuzzy = len(results) - exact
+    _group_pass(lines, payments, results)
+    grouped = len(results) - exact - fuzzy
+    for payment in payments.values():
+        if period_start <= payment['created_at'] < period_end:
+            results.append((payment, None, 0, 'No statement line found'))
+
+    grouped_lines = {line['id'] for _, line, _, _ in results[exact + fuzzy:] if line}
+    now = timezone.now()
+    new, existing = [], []
+    line_updates = defaultdict(lambda: ['', 0])
+    for payment, line, confidence, note in results:
+        status = _status(confidence)
+        grouped_line = bool(line) and line['id'] in grouped_lines
+        reconciliation = PaymentReconciliation(
+            id=payment['paymentreconciliation__id'],
+            payment_request_id=payment['id'],
+            statement_line_id=line['id'] if line else None,
+            bank_transaction_id=(line['provider_transaction_id'] or line['reference'] or None) if line else None,
+            bank_reference=(line['reference'] or line['account_reference'] or None) if line else None,
+            reconciliation_status=status,
+            # A settlement line covers several payments: each matched its own amount
+            matched_amount=(payment['amount'] if grouped_line else line['amount']) if line else None,
+            matched_date=line['transaction_date'] if line and status == 'matched' else None,
+            confidence_score=confidence,
+            reconciliation_notes=note,
+            updated_at=now,
+        )
+        (existing if reconciliation.id else new).append(reconciliation)
+        if line:
+            update = line_updates[line['id']]
+            update[0] = 'matched' if status == 'matched' else 'manual_review'
+            update[1] += 1
+
+    with transaction.atomic():
+        PaymentReconciliation.objects.bulk_create(new, batch_size=BATCH_SIZE)
+        PaymentReconciliation.objects.bulk_update(existing, [
+            'statement_line', 'bank_transaction_id', 'bank_reference', 'reconciliation_status',
+            'matched_amount', 'matched_date', 'confidence_score', 'reconciliation_notes', 'updated_at',
+        ], batch_size=BATCH_SIZE)
+        # Lines take few distinct values: one UPDATE per value and batch of IDs
+        lines_by_value = defaultdict(list)
+        for line_id, value in line_updates.items():
+            lines_by_value[tuple(value)].append(line_id)
+        for (match_status, matched_count), line_ids in lines_by_value.items():
+            for index in range(0, len(line_ids), BATCH_SIZE):
+                StatementLine.objects.filter(id__in=line_ids[index:index + BATCH_SIZE]).update(
+                    match_status=match_status, matched_count=matched_count,
+                )
+
+        counts = defaultdict(int)
+        for reconciliation in new + existing:
+            counts[reconciliation.reconciliation_status] += 1
+        summary = {
+            'lines': line_count,
+            'payments': payment_count,
+            'exact': exact,
+            'fuzzy': fuzzy,
+            'grouped': grouped,
+            'matched': counts['matched'],
+            'manual_review': counts['manual_review'],
+            'unmatched': counts['unmatched'],
+            'unmatched_lines': len(lines),
+            'seconds': round((timezone.now() - started).total_seconds(), 2),
+        }
+        statement_ids = {line['statement_id'] for line in all_lines.values()}
+        SettlementStatement.objects.filter(id__in=statement_ids).update(summary=summary, reconciled_at=now)
+        # A month of statements can exceed what AuditLog.amount holds
+        total = sum((line['amount'] for line in all_lines.values()), Decimal('0.00'))
+        AuditService.log_financial_transactions(user, 'PAYMENT_RECONCILIATION', [(
+            None, dict(summary, statements=sorted(statement_ids), total_amount=str(total)),
+        )])
+
+    logger.info(
+        f"Reconciliation: {summary['matched']} matched, {summary['manual_review']} for review, "
+        f"{summary['unmatched']} unmatched payments, {summary['unmatched_lines']} unmatched lines "
+        f"in {summary['seconds']}s"
+    )
+    return dict(summary, success=True)
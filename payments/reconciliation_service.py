@@ -1,14 +1,16 @@
 """
 Auto-Reconciliation Service for Payment Processing
-Automatically matches payments with bank records and handles reconciliation
+Matches payments with imported provider statements (see payments.reconciliation)
 """
 
 import logging
 from datetime import datetime, timedelta
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import Avg, Sum
 from decimal import Decimal
 from .models import PaymentRequest, PaymentReconciliation, PaymentDetail
+from .reconciliation import DATE_WINDOW_DAYS, SETTLEMENT_LAG_DAYS, import_paystack_mirror, reconcile
 from common.services import AuditService
 
 logger = logging.getLogger(__name__)
@@ -19,29 +21,16 @@ class AutoReconciliationService:
     
     @staticmethod
     def run_daily_reconciliation():
-        """Run daily reconciliation for all pending payments"""
+        """Match every open statement line (and the Paystack mirror) with the pending payments"""
         try:
-            # Get all completed payment requests without reconciliation
-            pending_payments = PaymentRequest.objects.filter(
-                status='completed',
-                paymentreconciliation__isnull=True
-            ).select_related('user', 'paystack_account')
-            
-            reconciled_count = 0
-            for payment_request in pending_payments:
-                try:
-                    result = AutoReconciliationService.reconcile_payment(payment_request)
-                    if result['success']:
-                        reconciled_count += 1
-                        logger.info(f"Auto-reconciled payment: {payment_request.transaction_reference}")
-                except Exception as e:
-                    logger.error(f"Error reconciling payment {payment_request.id}: {str(e)}")
-            
-            logger.info(f"Daily reconciliation completed. Reconciled {reconciled_count} payments.")
+            import_paystack_mirror()
+            result = reconcile()
+            logger.info(f"Daily reconciliation completed. Reconciled {result['matched']} payments.")
             return {
                 'success': True,
-                'reconciled_count': reconciled_count,
-                'total_pending': pending_payments.count()
+                'reconciled_count': result['matched'],
+                'total_pending': result['payments'],
+                'summary': result
             }
             
         except Exception as e:
@@ -49,49 +38,19 @@ class AutoReconciliationService:
             return {'success': False, 'error': str(e)}
     
     @staticmethod
-    @transaction.atomic
     def reconcile_payment(payment_request):
-        """Reconcile a single payment request"""
+        """Reconcile a single payment request against the imported statements"""
         try:
-            # Create reconciliation record
-            reconciliation = PaymentReconciliation.objects.create(
-                payment_request=payment_request,
-                reconciliation_status='pending'
-            )
-            
-            # Try to match with bank records (simulated)
-            match_result = AutoReconciliationService._match_with_bank_records(payment_request)
-            
-            # Update reconciliation with match results
-            reconciliation.bank_transaction_id = match_result.get('transaction_id')
-            reconciliation.bank_reference = match_result.get('reference')
-            reconciliation.matched_amount = match_result.get('matched_amount')
-            reconciliation.confidence_score = match_result.get('confidence_score', 0)
-            reconciliation.reconciliation_notes = match_result.get('notes', '')
-            
-            # Set status based on confidence score
-            if match_result.get('confidence_score', 0) >= 80:
-                reconciliation.reconciliation_status = 'matched'
-                reconciliation.matched_date = timezone.now()
-            elif match_result.get('confidence_score', 0) >= 50:
-                reconciliation.reconciliation_status = 'manual_review'
-            else:
-                reconciliation.reconciliation_status = 'unmatched'
-            
-            reconciliation.save()
-            
-            # Log reconciliation
-            AuditService.log_user_action(
-                user=payment_request.user,
-                action='PAYMENT_RECONCILIATION',
-                details={
-                    'payment_request_id': payment_request.id,
-                    'transaction_reference': payment_request.transaction_reference,
-                    'reconciliation_status': reconciliation.reconciliation_status,
-                    'confidence_score': reconciliation.confidence_score,
-                    'matched_amount': float(reconciliation.matched_amount or 0)
-                }
+            window = timedelta(days=DATE_WINDOW_DAYS + SETTLEMENT_LAG_DAYS)
+            import_paystack_mirror()
+            reconcile(
+                start=payment_request.created_at - window,
+                end=payment_request.created_at + window,
+                payment_ids=[payment_request.id]
             )
+            reconciliation = PaymentReconciliation.objects.filter(payment_request=payment_request).first()
+            if reconciliation is None:
+                return {'success': False, 'error': 'Payment is not completed or already reconciled'}
             
             return {
                 'success': True,
@@ -104,39 +63,6 @@ class AutoReconciliationService:
             logger.error(f"Error reconciling payment {payment_request.id}: {str(e)}")
             return {'success': False, 'error': str(e)}
     
-    @staticmethod
-    def _match_with_bank_records(payment_request):
-        """Simulate matching with bank records"""
-        # This would integrate with actual bank APIs in production
-        # For now, we'll simulate the matching process
-        
-        amount = payment_request.amount
-        reference = payment_request.transaction_reference
-        date_created = payment_request.created_at
-        
-        # Simulate bank record lookup
-        confidence_score = 85  # Default high confidence for completed payments
-        matched_amount = amount
-        transaction_id = f"BANK_{reference}"
-        bank_reference = reference
-        
-        # Add some randomness for demo
-        import random
-        if random.random() < 0.1:  # 10% chance of low confidence
-            confidence_score = random.randint(30, 60)
-            matched_amount = amount * Decimal('0.95')  # Slight amount difference
-            bank_reference = f"ADJUSTED_{reference}"
-        
-        notes = f"Auto-matched with bank records. Confidence: {confidence_score}%"
-        
-        return {
-            'transaction_id': transaction_id,
-            'reference': bank_reference,
-            'matched_amount': matched_amount,
-            'confidence_score': confidence_score,
-            'notes': notes
-        }
-    
     @staticmethod
     def get_reconciliation_summary(church=None):
         """Get reconciliation summary statistics"""
@@ -155,14 +81,14 @@ class AutoReconciliationService:
         total_amount_reconciled = queryset.filter(
             reconciliation_status='matched'
         ).aggregate(
-            total=models.Sum('matched_amount')
+            total=Sum('matched_amount')
         )['total'] or Decimal('0')
         
         # Calculate average confidence score
         avg_confidence = queryset.filter(
             confidence_score__gt=0
         ).aggregate(
-            avg=models.Avg('confidence_score')
+            avg=Avg('confidence_score')
         )['avg'] or 0
         
         return {
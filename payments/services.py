@@ -2,14 +2,16 @@ import logging
 import requests
 import json
 import base64
-from datetime import datetime, timedelta
+from datetime import datetime
 from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
-from .models import PaymentRequest, PaymentCallback, PaymentReversal, PaymentBatch
+from .models import PaymentRequest
 from giving.models import GivingTransaction
 from common.services import AuditService, NotificationService
 from common.exceptions import AltarFundsException
+from common.http import ProviderClient
+from common.tokens import TokenCache
 
 logger = logging.getLogger('altar_funds')
 
@@ -17,6 +19,8 @@ logger = logging.getLogger('altar_funds')
 class MpesaService:
     """M-Pesa Daraja API service"""
     
+    http = ProviderClient('mpesa')
+    
     def __init__(self):
         self.consumer_key = settings.MPESA_CONSUMER_KEY
         self.consumer_secret = settings.MPESA_CONSUMER_SECRET
@@ -24,40 +28,35 @@ class MpesaService:
         self.shortcode = settings.MPESA_SHORTCODE
         self.callback_url = settings.MPESA_CALLBACK_URL
         self.base_url = settings.MPESA_BASE_URL
-        self.access_token = None
-        self.token_expires_at = None
+        self.tokens = TokenCache(
+            'mpesa', f"{self.base_url}:{self.consumer_key}", self._fetch_access_token
+        )
     
-    def get_access_token(self):
-        """Get M-Pesa access token"""
-        if self.access_token and self.token_expires_at > timezone.now():
-            return self.access_token
-        
+    def _fetch_access_token(self):
+        """Request a new access token from the Daraja OAuth endpoint"""
         url = f"{self.base_url}/oauth/v1/generate?grant_type=client_credentials"
         
+        # Create basic auth credentials
+        credentials = base64.b64encode(
+            f"{self.consumer_key}:{self.consumer_secret}".encode()
+        ).decode()
+        
+        headers = {
+            'Authorization': f'Basic {credentials}',
+            'Content-Type': 'application/json'
+        }
+        
+        response = self.http.get(url, headers=headers)
+        response.raise_for_status()
+        
+        data = response.json()
+        return data['access_token'], data.get('expires_in', 3599)
+    
+    def get_access_token(self):
+        """Get M-Pesa access token, shared by all workers until shortly before it expires"""
         try:
-            # Create basic auth credentials
-            credentials = base64.b64encode(
-                f"{self.consumer_key}:{self.consumer_secret}".encode()
-            ).decode()
-            
-            headers = {
-                'Authorization': f'Basic {credentials}',
-                'Content-Type': 'application/json'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.access_token = data['access_token']
-            
-            # Token expires in 1 hour, set expiry 5 minutes early
-            self.token_expires_at = timezone.now() + timedelta(minutes=55)
-            
-            logger.info("M-Pesa access token obtained successfully")
-            return self.access_token
-            
-        except requests.exceptions.RequestException as e:
+            return self.tokens.get()
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
             logger.error(f"Failed to get M-Pesa access token: {e}")
             raise AltarFundsException("Failed to connect to M-Pesa")
     
@@ -96,7 +95,9 @@ class MpesaService:
                 'Content-Type': 'application/json'
             }
             
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            response = self.http.post(url, json=payload, headers=headers)
+            if response.status_code == 401:
+                self.tokens.invalidate()
             response.raise_for_status()
             
             data = response.json()
@@ -135,7 +136,9 @@ class MpesaService:
                 'Content-Type': 'application/json'
             }
             
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            response = self.http.post(url, json=payload, headers=headers)
+            if response.status_code == 401:
+                self.tokens.invalidate()
             response.raise_for_status()
             
             data = response.json()
@@ -178,7 +181,9 @@ class MpesaService:
                 'Content-Type': 'application/json'
             }
             
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            response = self.http.post(url, json=payload, headers=headers)
+            if response.status_code == 401:
+                self.tokens.invalidate()
             response.raise_for_status()
             
             data = response.json()
@@ -599,49 +604,19 @@ class PaymentSchedulerService:
                 logger.error(f"Payment retry failed: {payment_request.request_id} - {e}")
     
     @staticmethod
-    def check_transaction_status():
-        """Check status of pending transactions"""
-        # Find transactions that have been processing for too long
-        cutoff_time = timezone.now() - timedelta(minutes=30)
-        
-        payment_requests = PaymentRequest.objects.filter(
-            status='processing',
-            processing_started_at__lte=cutoff_time
-        ).select_related('giving_transaction')
+    def check_transaction_status(deadline=None):
+        """Verify gifts pending for too long with the provider, concurrently"""
+        from .status_polling import poll_pending_payments
         
-        for payment_request in payment_requests:
-            try:
-                mpesa_service = MpesaService()
-                response = mpesa_service.transaction_status(
-                    payment_request.checkout_request_id
-                )
-                
-                # Process status response
-                result_code = response.get('ResultCode')
-                if result_code == '0':
-                    payment_request.giving_transaction.mark_completed(
-                        response.get('MpesaReceiptNumber', '')
-                    )
-                else:
-                    payment_request.giving_transaction.mark_failed(
-                        response.get('ResultDesc', 'Transaction failed')
-                    )
-                
-                logger.info(f"Transaction status checked: {payment_request.request_id}")
-                
-            except Exception as e:
-                logger.error(f"Transaction status check failed: {payment_request.request_id} - {e}")
+        return poll_pending_payments(deadline=deadline)
     
     @staticmethod
     def process_payment_batches():
         """Process scheduled payment batches"""
-        now = timezone.now()
+        from .settlement import batches_due_for_submission
         
-        # Find batches scheduled for processing
-        batches = PaymentBatch.objects.filter(
-            status='pending',
-            scheduled_for__lte=now
-        ).select_related('church')
+        # Find batches scheduled for processing, and settlements with transfers to retry
+        batches = batches_due_for_submission().select_related('church')
         
         for batch in batches:
             try:
@@ -662,9 +637,9 @@ class SettlementService:
     
     @staticmethod
     def process_settlement_batch(batch):
-        """Process settlement batch"""
-        # This would implement settlement logic
-        batch.mark_processed(f"SETTLE_{batch.batch_id}", {'status': 'completed'})
+        """Pay out a settlement batch through Paystack bulk transfers"""
+        from .settlement import submit_batch
+        return submit_batch(batch)
 
 
 class PayoutService:
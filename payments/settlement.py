@@ -0,0 +1,458 @@
+"""
+Batched church payouts through settlement windows.
+
+With ``DISBURSEMENT_MODE = 'batched'`` a successful charge no longer starts
+its own Paystack transfer. Completed online gifts wait (``disbursement_status
+= 'pending'``) until their settlement window closes; ``close_window`` then
+creates one settlement ``PaymentBatch`` holding one ``ChurchDisbursement``
+per church, each linked to all of that church's gifts through
+``GivingTransaction.settlement_disbursement``. ``submit_batch`` pays the
+disbursements with Paystack bulk transfers, up to ``BULK_TRANSFER_SIZE`` per
+API call, so a busy Sunday costs one transfer (and one fee) per church
+instead of one per gift.
+
+Transfers are confirmed by the ``transfer.*`` webhooks. Failed ones are
+retried with a fresh reference until the disbursement's ``max_retries``.
+``reconcile_batch`` checks every disbursement against the gifts it covers,
+asks Paystack about transfers that have been in flight too long, and stores
+the outcome on the batch.
+
+Windows are ``SETTLEMENT_WINDOW_MINUTES`` long (default 60; 1440 settles
+daily) and aligned to local midnight.
+
+Usage:
+    batch = close_window()          # settle everything before the current window
+    submit_batch(batch)
+    reconcile_batch(batch)
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+import logging
+import uuid
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from giving.models import ChurchDisbursement, GivingTransaction
+from .models import PaymentBatch
+
+logger = logging.getLogger('altar_funds')
+
+BULK_TRANSFER_SIZE = 100            # Paystack's limit per bulk transfer request
+VERIFY_AFTER = timedelta(minutes=30)  # in-flight transfers older than this are checked with Paystack
+RETRY_DELAY = timedelta(minutes=30)   # multiplied by the retry count
+IN_FLIGHT_STATUSES = ('pending', 'processing', 'pending_retry')
+
+
+def batching_enabled():
+    return getattr(settings, 'DISBURSEMENT_MODE', 'instant') == 'batched'
+
+
+def window_minutes():
+    return max(int(getattr(settings, 'SETTLEMENT_WINDOW_MINUTES', 60)), 1)
+
+
+def settlement_payment_methods():
+    """Payment methods collected into the AltarFunds Paystack balance."""
+    return getattr(settings, 'SETTLEMENT_PAYMENT_METHODS', ('paystack', 'card'))
+
+
+def window_bounds(moment=None, minutes=None):
+    """``(start, end)`` of the settlement window containing ``moment``."""
+    moment = timezone.localtime(moment or timezone.now())
+    minutes = minutes or window_minutes()
+    midnight = timezone.make_aware(
+        datetime.combine(moment.date(), time.min), timezone.get_current_timezone()
+    )
+    if minutes >= 1440:
+        days = minutes // 1440
+        start = midnight - timedelta(days=moment.date().toordinal() % days)
+        return start, start + timedelta(days=days)
+    elapsed = int((moment - midnight).total_seconds() // 60)
+    start = midnight + timedelta(minutes=elapsed - elapsed % minutes)
+    return start, min(start + timedelta(minutes=minutes), midnight + timedelta(days=1))
+
+
+def unsettled_transactions(before):
+    """Completed online gifts up to ``before`` that no disbursement covers yet."""
+    return GivingTransaction.objects.filter(
+        status='completed',
+        disbursement_status='pending',
+        payment_method__in=settlement_payment_methods(),
+        completed_date__lt=before,
+        settlement_disbursement__isnull=True,
+        disbursement__isnull=True,
+    )
+
+
+def recipient_codes(church_ids):
+    """Church ID → Paystack recipient code of its preferred active bank account."""
+    from churches.models import ChurchBankAccount
+
+    codes = {}
+    rows = ChurchBankAccount.objects.filter(
+        church_id__in=church_ids, is_active=True, paystack_recipient_code__isnull=False
+    ).exclude(paystack_recipient_code='').order_by('-is_primary', 'id').values_list(
+        'church_id', 'paystack_recipient_code'
+    )
+    for church_id, code in rows:
+        codes.setdefault(church_id, code)
+    return codes
+
+
+def _cents(amount):
+    return Decimal(str(amount)).quantize(Decimal('0.01'))
+
+
+def _platform_fee(amount):
+    pct = Decimal(str(getattr(settings, 'PLATFORM_FEE_PERCENTAGE', 1.5))) / Decimal('100')
+    return (amount * pct).quantize(Decimal('0.01'))
+
+
+def close_window(now=None):
+    """
+    Create the settlement batch for all gifts completed before the current window.
+
+    Gifts of churches without a Paystack recipient stay pending and are
+    picked up by a later window once one is configured. Returns the batch,
+    or None if there was nothing to settle.
+    """
+    window_start, _ = window_bounds(now)
+    previous_start, _ = window_bounds(window_start - timedelta(seconds=1))
+    skip_locked = connection.features.has_select_for_update_skip_locked
+
+    with transaction.atomic():
+        rows = list(
+            unsettled_transactions(window_start)
+            .select_for_update(skip_locked=skip_locked, of=('self',))
+            .order_by('id')
+            .values_list('id', 'church_id', 'amount')
+        )
+        if not rows:
+            return None
+
+        by_church = {}
+        for tx_id, church_id, amount in rows:
+            entry = by_church.setdefault(church_id, {'ids': [], 'amount': Decimal('0.00')})
+            entry['ids'].append(tx_id)
+            entry['amount'] += amount
+
+        recipients = recipient_codes(by_church)
+        for church_id in set(by_church) - set(recipients):
+            logger.warning(
+                f"Church {church_id} has no Paystack recipient; "
+                f"{len(by_church[church_id]['ids'])} gifts left for a later settlement"
+            )
+            del by_church[church_id]
+        if not by_church:
+            return None
+
+        batch = PaymentBatch.objects.create(
+            batch_id=f"STL-{timezone.localtime(window_start):%Y%m%d-%H%M}-{uuid.uuid4().hex[:6].upper()}",
+            batch_type='settlement',
+            window_start=previous_start,
+            window_end=window_start,
+        )
+
+        # One row per church; create() rather than bulk_create(), which
+        # leaves pk unset on MySQL and the gifts need it for their link
+        disbursements = []
+        for church_id, entry in by_church.items():
+            fee = _platform_fee(entry['amount'])
+            disbursement = ChurchDisbursement.objects.create(
+                church_id=church_id,
+                batch=batch,
+                amount=entry['amount'],
+                platform_fee=fee,
+                net_amount=entry['amount'] - fee,
+                transaction_count=len(entry['ids']),
+                disbursement_method='paystack',
+                status='pending',
+            )
+            GivingTransaction.objects.filter(
+                id__in=entry['ids']
+            ).update(settlement_disbursement=disbursement, disbursement_status='processing')
+            disbursements.append(disbursement)
+
+        batch.disbursement_count = len(disbursements)
+        batch.transaction_count = sum(d.transaction_count for d in disbursements)
+        batch.total_amount = sum((d.amount for d in disbursements), Decimal('0.00'))
+        batch.platform_fee = sum((d.platform_fee for d in disbursements), Decimal('0.00'))
+        batch.net_amount = batch.total_amount - batch.platform_fee
+        batch.save(update_fields=[
+            'disbursement_count', 'transaction_count', 'total_amount', 'platform_fee', 'net_amount'
+        ])
+
+        from .tasks import submit_settlement_batch
+        transaction.on_commit(lambda: submit_settlement_batch.delay(batch.id))
+
+    logger.info(
+        f"Settlement batch {batch.batch_id}: {batch.transaction_count} gifts, "
+        f"{batch.disbursement_count} churches, KES {batch.net_amount} net"
+    )
+    return batch
+
+
+def _transfer_reference(batch, disbursement):
+    # Paystack wants 16-50 lowercase alphanumerics, '-' or '_', unique per transfer
+    return f"{batch.batch_id}-{disbursement.church_id}-{disbursement.retry_count}".lower()
+
+
+def _schedule_retry(disbursement, error, now):
+    """Record a failed transfer; retry later or give up after ``max_retries``."""
+    disbursement.error_message = error
+    disbursement.retry_count += 1
+    if disbursement.retry_count < disbursement.max_retries:
+        disbursement.status = 'pending_retry'
+        disbursement.next_retry_at = now + RETRY_DELAY * disbursement.retry_count
+    else:
+        disbursement.status = 'failed'
+        disbursement.covered_transactions().update(disbursement_status='failed')
+        logger.error(f"Settlement disbursement {disbursement.id} failed permanently: {error}")
+
+
+def _claim_due(batch, now):
+    """Reserve the batch's disbursements that are due for (re)submission."""
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    with transaction.atomic():
+        due = list(
+            batch.disbursements.filter(
+                Q(status='pending') | Q(status='pending_retry', next_retry_at__lte=now)
+            ).select_for_update(skip_locked=skip_locked).order_by('id')
+        )
+        for disbursement in due:
+            disbursement.status = 'processing'
+            disbursement.processed_at = now
+            disbursement.transfer_reference = _transfer_reference(batch, disbursement)
+            disbursement.transfer_code = ''
+        ChurchDisbursement.objects.bulk_update(
+            due, ['status', 'processed_at', 'transfer_reference', 'transfer_code']
+        )
+    return due
+
+
+def submit_batch(batch):
+    """
+    Send the batch's due disbursements to Paystack as bulk transfers.
+
+    Disbursements are marked ``processing`` with their transfer reference
+    before the API call, so webhooks arriving early find them. Only transfers
+    Paystack declined are scheduled for a retry; a call that timed out leaves
+    its transfers ``processing`` for reconcile_batch to verify. Returns the
+    number of transfers Paystack accepted.
+    """
+    from .paystack_service import paystack_transfer_service
+
+    now = timezone.now()
+    due = _claim_due(batch, now)
+    if not due:
+        refresh_batch_status(batch)
+        return 0
+
+    recipients = recipient_codes({d.church_id for d in due})
+    failed = []
+    sendable = []
+    for disbursement in due:
+        if disbursement.church_id in recipients:
+            sendable.append(disbursement)
+        else:
+            _schedule_retry(disbursement, 'No Paystack recipient configured', now)
+            failed.append(disbursement)
+
+    accepted = []
+    unconfirmed = []
+    for start in range(0, len(sendable), BULK_TRANSFER_SIZE):
+        chunk = sendable[start:start + BULK_TRANSFER_SIZE]
+        success, result = paystack_transfer_service.initiate_bulk_transfer([
+            {
+                'amount': int(d.net_amount * 100),
+                'recipient': recipients[d.church_id],
+                'reference': d.transfer_reference,
+                'reason': f"AltarFunds settlement {batch.batch_id} ({d.transaction_count} gifts)",
+            }
+            for d in chunk
+        ])
+        if success is None:
+            # Possibly queued: keep the references so reconcile_batch checks
+            # them with Paystack before anything is sent again
+            unconfirmed.extend(chunk)
+            logger.error(f"Settlement batch {batch.batch_id}: bulk transfer of {len(chunk)} unconfirmed: {result}")
+            continue
+        if not success:
+            for disbursement in chunk:
+                _schedule_retry(disbursement, result, now)
+            failed.extend(chunk)
+            continue
+
+        results = {item.get('reference'): item for item in result}
+        for disbursement in chunk:
+            item = results.get(disbursement.transfer_reference)
+            if item is None:
+                _schedule_retry(disbursement, 'Transfer missing from bulk response', now)
+                failed.append(disbursement)
+                continue
+            disbursement.transfer_code = item.get('transfer_code', '')
+            accepted.append(disbursement)
+
+    ChurchDisbursement.objects.bulk_update(accepted, ['transfer_code'])
+    # Only touch rows a webhook has not already settled
+    for disbursement in failed:
+        ChurchDisbursement.objects.filter(id=disbursement.id, status='processing').update(
+            status=disbursement.status,
+            error_message=disbursement.error_message,
+            retry_count=disbursement.retry_count,
+            next_retry_at=disbursement.next_retry_at,
+            updated_at=now,
+        )
+
+    if batch.status == 'pending':
+        batch.mark_processed(batch.batch_id, {
+            'submitted': len(due), 'accepted': len(accepted), 'unconfirmed': len(unconfirmed),
+        })
+    refresh_batch_status(batch)
+    logger.info(f"Settlement batch {batch.batch_id}: {len(accepted)}/{len(due)} transfers accepted")
+    return len(accepted)
+
+
+def refresh_batch_status(batch):
+    """Derive the batch status from its disbursements."""
+    counts = dict(batch.disbursements.values_list('status').annotate(count=Count('id')))
+    if not counts:
+        return batch.status
+    if any(counts.get(status) for status in IN_FLIGHT_STATUSES):
+        status = 'processing' if batch.status != 'pending' else 'pending'
+    elif counts.get('failed'):
+        status = 'partial' if counts.get('completed') else 'failed'
+    else:
+        status = 'completed'
+    if status != batch.status:
+        batch.status = status
+        batch.save(update_fields=['status', 'updated_at'])
+    return status
+
+
+def _verify_in_flight(disbursement, now):
+    """
+    Settle a transfer whose webhook has not arrived, from Paystack's record.
+
+    Returns the amount (kobo) Paystack reports, or None.
+    """
+    from .paystack_service import paystack_transfer_service
+
+    result = paystack_transfer_service.verify_transfer(disbursement.transfer_reference)
+    if result.get('not_found'):
+        # Claimed but never sent (worker died before the API call): due again now,
+        # with the same attempt number so the reference does not change
+        ChurchDisbursement.objects.filter(id=disbursement.id, status='processing').update(
+            status='pending_retry', next_retry_at=now, updated_at=now
+        )
+        return None
+    if not result['success']:
+        return None
+
+    if result['status'] == 'success':
+        disbursement.mark_completed(disbursement.transfer_reference)
+    elif result['status'] in ('failed', 'reversed'):
+        _schedule_retry(disbursement, f"Transfer {result['status']}", now)
+        disbursement.save()
+    return result.get('amount')
+
+
+def reconcile_batch(batch, verify=True):
+    """
+    Check a settlement batch end to end and store the result on it.
+
+    For every disbursement, the gifts linked to it must add up to its amount
+    and count; completed transfers must have paid the net amount. With
+    ``verify``, transfers in flight for longer than ``VERIFY_AFTER`` are
+    looked up on Paystack and settled from its answer.
+    """
+    now = timezone.now()
+    disbursements = list(batch.disbursements.order_by('id'))
+    covered = {
+        row['settlement_disbursement']: row
+        for row in GivingTransaction.objects.filter(
+            settlement_disbursement__batch=batch
+        ).values('settlement_disbursement').annotate(total=Sum('amount'), count=Count('id'))
+    }
+
+    mismatches = []
+    verified = 0
+    for disbursement in disbursements:
+        linked = covered.get(disbursement.id, {'total': Decimal('0.00'), 'count': 0})
+        if linked['total'] != disbursement.amount or linked['count'] != disbursement.transaction_count:
+            mismatches.append({
+                'disbursement_id': disbursement.id,
+                'church_id': disbursement.church_id,
+                'issue': 'gifts_do_not_match',
+                'expected': f"{disbursement.transaction_count} gifts / KES {disbursement.amount}",
+                'actual': f"{linked['count']} gifts / KES {_cents(linked['total'] or 0)}",
+            })
+
+        in_flight = (
+            disbursement.status == 'processing'
+            and disbursement.processed_at
+            and disbursement.processed_at <= now - VERIFY_AFTER
+        )
+        if verify and in_flight:
+            paid = _verify_in_flight(disbursement, now)
+            verified += 1
+            if paid is not None and paid != int(disbursement.net_amount * 100):
+                mismatches.append({
+                    'disbursement_id': disbursement.id,
+                    'church_id': disbursement.church_id,
+                    'issue': 'transfer_amount_differs',
+                    'expected': int(disbursement.net_amount * 100),
+                    'actual': paid,
+                })
+
+    statuses = dict(batch.disbursements.values_list('status').annotate(count=Count('id')))
+    paid_net = batch.disbursements.filter(status='completed').aggregate(total=Sum('net_amount'))['total']
+    batch.reconciliation = {
+        'disbursements': len(disbursements),
+        'statuses': statuses,
+        'transactions': sum(row['count'] for row in covered.values()),
+        'gross_amount': str(_cents(sum((row['total'] for row in covered.values()), Decimal('0.00')))),
+        'expected_net': str(_cents(batch.net_amount)),
+        'paid_net': str(_cents(paid_net or Decimal('0.00'))),
+        'verified_with_provider': verified,
+        'mismatches': mismatches,
+    }
+    batch.reconciled_at = now
+    batch.save(update_fields=['reconciliation', 'reconciled_at', 'updated_at'])
+    refresh_batch_status(batch)
+
+    if mismatches:
+        logger.error(f"Settlement batch {batch.batch_id} has {len(mismatches)} reconciliation mismatches")
+    return batch.reconciliation
+
+
+def batches_due_for_submission(now=None):
+    """New settlement batches and ones with transfers due for a retry."""
+    now = now or timezone.now()
+    return PaymentBatch.objects.filter(
+        Q(status='pending', scheduled_for__lte=now)
+        | Q(
+            batch_type='settlement',
+            status='processing',
+            disbursements__status='pending_retry',
+            disbursements__next_retry_at__lte=now,
+        )
+    ).distinct()
+
+
+def batches_to_reconcile(now=None):
+    """
+    Settlement batches with transfers in flight, finished ones never
+    reconciled, and any batch whose transfers have been ``processing`` for
+    longer than ``VERIFY_AFTER`` (e.g. a submission that died before the
+    batch was marked processed).
+    """
+    now = now or timezone.now()
+    return PaymentBatch.objects.filter(batch_type='settlement').filter(
+        Q(status='processing')
+        | Q(reconciled_at__isnull=True, status__in=['completed', 'partial', 'failed'])
+        | Q(disbursements__status='processing', disbursements__processed_at__lte=now - VERIFY_AFTER)
+    ).distinct()
@@ -0,0 +1,387 @@
+"""
+Status checks for payments and disbursements that never heard back.
+
+Gifts stay ``pending`` and per-gift disbursements stay ``processing`` when
+the provider's webhook is lost. The periodic jobs here ask Paystack about
+them concurrently through ``common.polling.poll`` (per-provider concurrency
+and rate limits, bounded by a deadline) and apply all outcomes together:
+
+* ``poll_pending_payments`` verifies stuck gifts. References already final
+  in the local transaction mirror are resolved without an API call; the
+  rest are verified with Paystack and written through to the mirror.
+  Paid gifts are completed (outbox, signals and disbursement as usual),
+  failed ones and checkouts abandoned for a day are marked failed.
+* ``retry_due_disbursements`` resends per-gift transfers due for a retry,
+  each attempt with a new reference. Transfers whose outcome is unknown
+  (timeouts) stay ``processing`` with their reference, and
+  ``verify_stalled_disbursements`` later settles them from Paystack's record.
+
+Items not reached before the deadline are left for the next run.
+
+Usage:
+    from payments.status_polling import poll_pending_payments
+
+    poll_pending_payments(deadline=50)
+"""
+from datetime import timedelta
+import logging
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from common.polling import poll
+from .transaction_sync import FINAL_STATUSES, store_transactions
+from .models import PaystackTransaction
+
+logger = logging.getLogger('altar_funds')
+
+PROVIDER = 'paystack'
+STUCK_AFTER = timedelta(minutes=30)      # pending longer than this gets checked
+LOOKBACK = timedelta(days=7)             # older pending gifts are left alone
+ABANDON_AFTER = timedelta(hours=24)      # unpaid checkouts older than this are failed
+STALLED_AFTER = timedelta(minutes=30)    # processing transfers without a webhook
+RETRY_DELAY = timedelta(minutes=30)
+CHECK_LIMIT = 1000
+REQUEST_TIMEOUT = (3, 15)                # (connect, read) seconds per provider call
+# Payment methods never sent to a provider
+OFFLINE_METHODS = ('cash', 'check')
+
+
+def _paystack():
+    from .paystack_service import paystack_service
+    return paystack_service
+
+
+def _transfers():
+    from .paystack_service import paystack_transfer_service
+    return paystack_transfer_service
+
+
+def _kobo(amount):
+    return int(round(amount * 100))
+
+
+# ── Stuck gifts ───────────────────────────────────────────────────────────
+
+def stuck_payments(now=None):
+    """Pending online gifts old enough to have heard back from Paystack."""
+    from giving.models import GivingTransaction
+
+    now = now or timezone.now()
+    return GivingTransaction.objects.filter(
+        status='pending',
+        transaction_date__lte=now - STUCK_AFTER,
+        transaction_date__gte=now - LOOKBACK,
+    ).exclude(payment_reference='').exclude(payment_reference__isnull=True).exclude(
+        payment_method__in=OFFLINE_METHODS
+    ).order_by('transaction_date')
+
+
+def _fetch_transaction(reference):
+    """Paystack's transaction object for ``reference``; None if Paystack has no such transaction."""
+    service = _paystack()
+    response = service.http.get(
+        f"{service.BASE_URL}/transaction/verify/{reference}",
+        headers=service.headers,
+        timeout=REQUEST_TIMEOUT,
+    )
+    if response.status_code in (400, 404):
+        return None
+    response.raise_for_status()
+    data = response.json()
+    return data.get('data') if data.get('status') else None
+
+
+def _classify(gift, data, now):
+    """('complete' | 'fail' | None, reason) for a gift and its Paystack transaction."""
+    status = (data or {}).get('status')
+    if status == 'success':
+        if data.get('amount') != _kobo(gift.amount):
+            logger.warning(
+                f"Paystack amount {data.get('amount')} does not match gift "
+                f"{gift.transaction_id} ({gift.amount}); left pending"
+            )
+            return None, ''
+        return 'complete', ''
+    if status in ('failed', 'reversed'):
+        return 'fail', f"Payment {status}: {data.get('gateway_response') or 'declined'}"
+    if gift.transaction_date <= now - ABANDON_AFTER and status in (None, 'abandoned'):
+        return 'fail', 'Payment not completed' if status else 'Payment not found at Paystack'
+    return None, ''
+
+
+def poll_pending_payments(deadline=None, limit=CHECK_LIMIT):
+    """
+    Verify up to ``limit`` stuck gifts with Paystack and apply the outcomes.
+
+    Returns counts of gifts checked, completed, failed, left pending,
+    errors and skipped (deadline).
+    """
+    now = timezone.now()
+    gifts = list(stuck_payments(now)[:limit])
+    if not gifts:
+        return {'checked': 0, 'completed': 0, 'failed': 0, 'pending': 0, 'errors': 0, 'skipped': 0}
+
+    # References already final in the mirror need no API call
+    mirrored = {
+        row.reference: row.data
+        for row in PaystackTransaction.objects.filter(
+            reference__in=[g.payment_reference for g in gifts], status__in=FINAL_STATUSES
+        ).only('reference', 'data')
+    }
+    found = {g.id: mirrored[g.payment_reference] for g in gifts if g.payment_reference in mirrored}
+
+    outcome = poll(
+        [g for g in gifts if g.id not in found],
+        lambda gift: _fetch_transaction(gift.payment_reference),
+        provider=PROVIDER,
+        deadline=deadline,
+    )
+    for gift, error in outcome.errors:
+        logger.error(f"Status check failed for {gift.payment_reference}: {str(error)}")
+    fetched = [data for _, data in outcome.results if data]
+    found.update((gift.id, data) for gift, data in outcome.results)
+
+    to_complete, to_fail = [], {}
+    for gift in gifts:
+        if gift.id not in found:
+            continue
+        action, reason = _classify(gift, found[gift.id], now)
+        if action == 'complete':
+            to_complete.append(gift.id)
+        elif action == 'fail':
+            to_fail.setdefault(reason, []).append(gift.id)
+
+    completed, failed = _apply_payment_outcomes(fetched, to_complete, to_fail)
+    result = {
+        'checked': len(found),
+        'completed': completed,
+        'failed': failed,
+        'pending': len(found) - len(to_complete) - sum(len(ids) for ids in to_fail.values()),
+        'errors': len(outcome.errors),
+        'skipped': len(outcome.skipped),
+    }
+    logger.info(f"Pending payment poll: {result} in {outcome.seconds:.1f}s")
+    return result
+
+
+def _apply_payment_outcomes(fetched, to_complete, to_fail):
+    from giving.models import GivingTransaction
+    from giving.tasks import schedule_church_disbursement
+    from .settlement import batching_enabled
+
+    completed = failed = 0
+    with transaction.atomic():
+        if fetched:
+            store_transactions(fetched)
+
+        # Rows a webhook settled meanwhile are no longer pending and are skipped.
+        # Completion stays per gift: it writes the outbox entry and fires the
+        # signals that keep pledge, campaign and rollup totals.
+        gifts = GivingTransaction.objects.select_for_update().filter(id__in=to_complete, status='pending')
+        for gift in gifts:
+            gift.mark_completed()
+            completed += 1
+            if not batching_enabled():
+                transaction.on_commit(lambda gift_id=gift.id: schedule_church_disbursement.delay(gift_id))
+
+        for reason, ids in to_fail.items():
+            failed += GivingTransaction.objects.filter(id__in=ids, status='pending').update(
+                status='failed', notes=f"Failed: {reason}", updated_at=timezone.now()
+            )
+    return completed, failed
+
+
+# ── Per-gift disbursements ────────────────────────────────────────────────
+
+def _transfer_reference(disbursement):
+    # Paystack wants 16-50 lowercase alphanumerics, '-' or '_', unique per transfer
+    return f"disb-{disbursement.giving_transaction.transaction_id}-{disbursement.retry_count}".lower()
+
+
+def _schedule_retry(disbursement, error, now):
+    """Record a declined transfer; retry later or give up after ``max_retries``."""
+    disbursement.error_message = error
+    disbursement.retry_count += 1
+    if disbursement.retry_count < disbursement.max_retries:
+        disbursement.status = 'pending_retry'
+        disbursement.next_retry_at = now + RETRY_DELAY * disbursement.retry_count
+    else:
+        disbursement.status = 'failed'
+        logger.error(f"Disbursement {disbursement.id} failed permanently: {error}")
+
+
+def _save_disbursements(disbursements, now):
+    """Write back claimed disbursements, unless a webhook settled them meanwhile."""
+    from giving.models import ChurchDisbursement, GivingTransaction
+
+    fields = (
+        'status', 'error_message', 'retry_count', 'next_retry_at', 'conversation_id',
+        'transfer_code', 'completed_at', 'paystack_receipt',
+    )
+    with transaction.atomic():
+        current = set(
+            ChurchDisbursement.objects.select_for_update().filter(
+                id__in=[d.id for d in disbursements], status='processing'
+            ).values_list('id', flat=True)
+        )
+        rows = [d for d in disbursements if d.id in current]
+        for d in rows:
+            d.updated_at = now
+        ChurchDisbursement.objects.bulk_update(rows, fields + ('updated_at',), batch_size=500)
+
+        for status in ('completed', 'failed'):
+            GivingTransaction.objects.filter(
+                id__in=[d.giving_transaction_id for d in rows if d.status == status]
+            ).update(disbursement_status=status)
+    return rows
+
+
+def _claim_due_disbursements(now, limit):
+    """Reserve per-gift disbursements due for a retry, with a fresh transfer reference each."""
+    from giving.models import ChurchDisbursement
+
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    with transaction.atomic():
+        due = list(
+            ChurchDisbursement.objects.filter(
+                batch__isnull=True,
+                giving_transaction__isnull=False,
+                status='pending_retry',
+                next_retry_at__lte=now,
+                retry_count__lt=F('max_retries'),
+            ).select_related('giving_transaction__category', 'church')
+            .select_for_update(skip_locked=skip_locked, of=('self',))
+            .order_by('next_retry_at')[:limit]
+        )
+        for disbursement in due:
+            disbursement.status = 'processing'
+            disbursement.processed_at = now
+            disbursement.transfer_reference = _transfer_reference(disbursement)
+            disbursement.transfer_code = ''
+        ChurchDisbursement.objects.bulk_update(
+            due, ['status', 'processed_at', 'transfer_reference', 'transfer_code']
+        )
+    return due
+
+
+def _send_transfer(item):
+    """POST one transfer; Paystack's response body (declines included)."""
+    _, payload = item
+    service = _transfers()
+    response = service.http.post(
+        f"{service.BASE_URL}/transfer",
+        json=payload,
+        headers=service.headers,
+        timeout=REQUEST_TIMEOUT,
+    )
+    if response.status_code >= 500:
+        response.raise_for_status()
+    return response.json()
+
+
+def retry_due_disbursements(deadline=None, limit=CHECK_LIMIT):
+    """
+    Resend per-gift transfers due for a retry, concurrently.
+
+    Batched settlement disbursements are retried by ``payments.settlement``.
+    Returns ``(retried, failed)``: transfers Paystack accepted and transfers
+    declined or impossible to send. Calls that timed out count as neither.
+    """
+    from .settlement import recipient_codes
+
+    now = timezone.now()
+    due = _claim_due_disbursements(now, limit)
+    if not due:
+        return 0, 0
+
+    recipients = recipient_codes({d.church_id for d in due})
+    items, declined = [], []
+    for d in due:
+        if d.church_id not in recipients:
+            _schedule_retry(d, 'No Paystack recipient configured', now)
+            declined.append(d)
+            continue
+        items.append((d, {
+            'source': 'balance',
+            'amount': _kobo(d.net_amount),
+            'recipient': recipients[d.church_id],
+            'reason': f"{d.church.name} – {d.giving_transaction.category.name} – {d.giving_transaction.transaction_id}",
+            'reference': d.transfer_reference,
+        }))
+
+    outcome = poll(items, _send_transfer, provider=PROVIDER, deadline=deadline)
+
+    accepted = []
+    for (d, _), data in outcome.results:
+        if data.get('status'):
+            transfer = data.get('data') or {}
+            d.conversation_id = str(transfer.get('id', ''))
+            d.transfer_code = transfer.get('transfer_code', '')
+            if transfer.get('status') == 'success':
+                d.status, d.completed_at, d.paystack_receipt = 'completed', now, d.transfer_reference
+            accepted.append(d)
+        else:
+            _schedule_retry(d, data.get('message', 'Transfer initiation failed'), now)
+            declined.append(d)
+    for (d, _), error in outcome.errors:
+        # Possibly sent: keep the reference so verification (or a webhook) settles it
+        logger.error(f"Transfer retry for disbursement {d.id} unconfirmed: {str(error)}")
+    unsent = [d for d, _ in outcome.skipped]
+    for d in unsent:
+        # Not sent: due again with the same attempt number
+        d.status, d.next_retry_at = 'pending_retry', now
+
+    _save_disbursements(accepted + declined + unsent, now)
+    logger.info(f"Disbursement retries: {len(accepted)} accepted, {len(declined)} failed, {len(unsent)} deferred")
+    return len(accepted), len(declined)
+
+
+def verify_stalled_disbursements(deadline=None, limit=CHECK_LIMIT):
+    """
+    Settle per-gift transfers stuck in ``processing`` from Paystack's record.
+
+    Returns counts of transfers completed, rescheduled (failed, reversed or
+    never received by Paystack) and still pending.
+    """
+    from giving.models import ChurchDisbursement
+
+    now = timezone.now()
+    stalled = list(
+        ChurchDisbursement.objects.filter(
+            batch__isnull=True,
+            giving_transaction__isnull=False,
+            status='processing',
+            updated_at__lte=now - STALLED_AFTER,
+        ).select_related('giving_transaction').order_by('updated_at')[:limit]
+    )
+    # Transfers sent before retries had their own reference used DISB-<transaction id>
+    references = {
+        d.id: d.transfer_reference or f"DISB-{d.giving_transaction.transaction_id}" for d in stalled
+    }
+    outcome = poll(
+        stalled, lambda d: _transfers().verify_transfer(references[d.id]),
+        provider=PROVIDER, deadline=deadline,
+    )
+
+    settled = []
+    for d, result in outcome.results:
+        if result.get('success') and result.get('status') == 'success':
+            d.status, d.completed_at = 'completed', now
+            d.paystack_receipt = references[d.id]
+            d.transfer_code = result.get('transfer_code') or d.transfer_code
+        elif result.get('not_found') or result.get('status') in ('failed', 'reversed'):
+            _schedule_retry(d, f"Transfer {result.get('status') or 'not received by Paystack'}", now)
+        else:
+            continue
+        settled.append(d)
+    _save_disbursements(settled, now)
+
+    result = {
+        'completed': sum(1 for d in settled if d.status == 'completed'),
+        'rescheduled': sum(1 for d in settled if d.status != 'completed'),
+        'pending': len(stalled) - len(settled),
+    }
+    logger.info(f"Stalled disbursement check: {result} in {outcome.seconds:.1f}s")
+    return result
@@ -0,0 +1,288 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def drain_webhook_inbox():
+    """Queue processing for every reference with due webhook events"""
+    try:
+        from .webhooks import due_references
+        
+        references = due_references()
+        for provider, reference in references:
+            process_webhook_reference.delay(provider, reference)
+        
+        if references:
+            logger.info(f"Queued webhook processing for {len(references)} references")
+        return len(references)
+        
+    except Exception as e:
+        logger.error(f"Error draining webhook inbox: {str(e)}")
+
+
+@shared_task
+def process_webhook_reference(provider, reference):
+    """Process the due webhook events of one provider reference, in order"""
+    try:
+        from .webhooks import process_reference
+        
+        return process_reference(provider, reference)
+        
+    except Exception as e:
+        # Claimed events become due again when their lease expires
+        logger.error(f"Error processing webhook events for {provider} {reference}: {str(e)}")
+
+
+@shared_task
+def purge_webhook_events():
+    """Delete processed webhook events past their retention period"""
+    try:
+        from .webhooks import purge
+        
+        deleted = purge()
+        logger.info(f"Purged {deleted} processed webhook events")
+        
+    except Exception as e:
+        logger.error(f"Error purging webhook events: {str(e)}")
+
+
+@shared_task
+def close_settlement_window():
+    """Batch the gifts of closed settlement windows for payout (batched disbursement mode)"""
+    try:
+        from .settlement import batching_enabled, close_window
+        
+        if not batching_enabled():
+            return None
+        
+        batch = close_window()
+        return batch.id if batch else None
+        
+    except Exception as e:
+        logger.error(f"Error closing settlement window: {str(e)}")
+
+
+@shared_task
+def submit_settlement_batch(batch_id):
+    """Send a settlement batch's due transfers to Paystack"""
+    try:
+        from .models import PaymentBatch
+        from .services import SettlementService
+        
+        try:
+            batch = PaymentBatch.objects.get(id=batch_id)
+        except PaymentBatch.DoesNotExist:
+            logger.error(f"Payment batch {batch_id} not found")
+            return
+        
+        return SettlementService.process_settlement_batch(batch)
+        
+    except Exception as e:
+        logger.error(f"Error submitting settlement batch {batch_id}: {str(e)}")
+
+
+@shared_task
+def process_payment_batches():
+    """Submit due payment batches and retry failed settlement transfers"""
+    try:
+        from .services import PaymentSchedulerService
+        
+        PaymentSchedulerService.process_payment_batches()
+        
+    except Exception as e:
+        logger.error(f"Error processing payment batches: {str(e)}")
+
+
+@shared_task
+def reconcile_settlement_batches():
+    """Reconcile settlement batches with transfers in flight"""
+    try:
+        from .settlement import batches_to_reconcile, reconcile_batch
+        
+        batches = list(batches_to_reconcile())
+        mismatched = 0
+        for batch in batches:
+            if reconcile_batch(batch)['mismatches']:
+                mismatched += 1
+        
+        logger.info(f"Reconciled {len(batches)} settlement batches, {mismatched} with mismatches")
+        
+    except Exception as e:
+        logger.error(f"Error reconciling settlement batches: {str(e)}")
+
+
+@shared_task
+def sync_bank_directory():
+    """Refresh the local Paystack bank directory"""
+    try:
+        from .banks import sync_banks
+        
+        stored = sync_banks()
+        logger.info(f"Bank directory sync stored {stored} banks")
+        return stored
+        
+    except Exception as e:
+        logger.error(f"Error syncing bank directory: {str(e)}")
+
+
+@shared_task
+def sync_paystack_transactions():
+    """Mirror Paystack transactions created since the last sync"""
+    try:
+        from .transaction_sync import sync_transactions
+        
+        return sync_transactions()
+        
+    except Exception as e:
+        logger.error(f"Error syncing Paystack transactions: {str(e)}")
+
+
+@shared_task
+def reconcile_payment_statements():
+    """Match open statement lines with payments completed since the last run"""
+    try:
+        from .reconciliation_service import AutoReconciliationService
+        
+        result = AutoReconciliationService.run_daily_reconciliation()
+        return result
+        
+    except Exception as e:
+        logger.error(f"Error reconciling payment statements: {str(e)}")
+
+
+@shared_task
+def check_pending_payments():
+    """Verify gifts stuck in pending with Paystack"""
+    try:
+        from .services import PaymentSchedulerService
+        
+        return PaymentSchedulerService.check_transaction_status()
+        
+    except Exception as e:
+        logger.error(f"Error checking pending payments: {str(e)}")
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def initiate_church_transfer(self, transaction_id):
+    """Pay a church its share of one online gift with a Paystack transfer"""
+    from giving.models import GivingTransaction
+    from .paystack_service import paystack_transfer_service
+    
+    try:
+        giving_tx = (
+            GivingTransaction.objects
+            .select_related('church', 'category', 'member__user')
+            .filter(id=transaction_id)
+            .first()
+        )
+        if not giving_tx:
+            logger.error(f"Transaction {transaction_id} not found")
+            return
+        
+        # Skip if already disbursed
+        if giving_tx.disbursement_status == 'completed':
+            return
+        
+        success, msg = paystack_transfer_service.initiate_transfer(giving_tx)
+        if success:
+            logger.info(f"Disbursement initiated for transaction {transaction_id}: {msg}")
+        else:
+            logger.error(f"Disbursement failed for transaction {transaction_id}: {msg}")
+        return success
+        
+    except Exception as e:
+        # The transfer reference is fixed per gift, so Paystack ignores a resend
+        logger.error(f"Error initiating transfer for transaction {transaction_id}: {str(e)}")
+        raise self.retry(exc=e)
+
+
+@shared_task
+def retry_failed_disbursements():
+    """Settle stalled per-gift transfers and resend the ones due for a retry"""
+    try:
+        from .paystack_service import paystack_transfer_service
+        
+        retried, failed = paystack_transfer_service.retry_failed_disbursements()
+        return {'retried': retried, 'failed': failed}
+        
+    except Exception as e:
+        logger.error(f"Error retrying disbursements: {str(e)}")
+
+
+# Schedule periodic tasks
+from celery.schedules import crontab
+from celery import current_app
+
+@current_app.on_after_finalize.connect
+def setup_periodic_tasks(sender, **kwargs):
+    # Sweep the webhook inbox every minute (new events also kick it directly)
+    sender.add_periodic_task(
+        crontab(),
+        drain_webhook_inbox.s(),
+        name='drain-webhook-inbox'
+    )
+    
+    # Purge processed webhook events daily at 4 AM
+    sender.add_periodic_task(
+        crontab(hour=4, minute=0),
+        purge_webhook_events.s(),
+        name='purge-webhook-events'
+    )
+    
+    # Close settlement windows every 5 minutes (no-op unless DISBURSEMENT_MODE is 'batched')
+    sender.add_periodic_task(
+        crontab(minute='*/5'),
+        close_settlement_window.s(),
+        name='close-settlement-window'
+    )
+    
+    # Submit due payment batches and settlement retries every 10 minutes
+    sender.add_periodic_task(
+        crontab(minute='*/10'),
+        process_payment_batches.s(),
+        name='process-payment-batches'
+    )
+    
+    # Reconcile settlement batches every 30 minutes
+    sender.add_periodic_task(
+        crontab(minute='*/30'),
+        reconcile_settlement_batches.s(),
+        name='reconcile-settlement-batches'
+    )
+    
+    # Refresh the Paystack bank directory daily at 3:30 AM
+    sender.add_periodic_task(
+        crontab(hour=3, minute=30),
+        sync_bank_directory.s(),
+        name='sync-bank-directory'
+    )
+    
+    # Mirror new Paystack transactions every 10 minutes
+    sender.add_periodic_task(
+        crontab(minute='*/10'),
+        sync_paystack_transactions.s(),
+        name='sync-paystack-transactions'
+    )
+    
+    # Match imported provider statements with payments daily at 4:00 AM
+    sender.add_periodic_task(
+        crontab(hour=4, minute=0),
+        reconcile_payment_statements.s(),
+        name='reconcile-payment-statements'
+    )
+    
+    # Verify gifts stuck in pending every 15 minutes
+    sender.add_periodic_task(
+        crontab(minute='*/15'),
+        check_pending_payments.s(),
+        name='check-pending-payments'
+    )
+    
+    # Retry failed per-gift disbursements every 15 minutes
+    sender.add_periodic_task(
+        crontab(minute='7-59/15'),
+        retry_failed_disbursements.s(),
+        name='retry-failed-disbursements'
+    )
@@ -0,0 +1,164 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+import requests
+
+from django.test import TestCase
+from django.utils import timezone
+
+from churches.models import Church
+from giving.models import ChurchDisbursement
+from payments import banks, settlement
+from payments.models import PaymentBatch, PaystackBank
+from payments.paystack_service import paystack_transfer_service
+
+
+class SettlementVerificationTests(TestCase):
+    """Settlement transfers stuck in ``processing`` are found and settled."""
+
+    def setUp(self):
+        self.church = Church.objects.create(
+            name='Grace Chapel',
+            church_code='GRACE01',
+            phone_number='0700000000',
+            email='grace@example.com',
+            address_line1='Ngong Road',
+            city='Nairobi',
+            county='Nairobi',
+            senior_pastor_name='Pastor',
+            senior_pastor_phone='0700000000',
+        )
+        self.now = timezone.now()
+
+    def _batch(self, status, processed_ago):
+        batch = PaymentBatch.objects.create(batch_id=f"STL-{status.upper()}", status=status)
+        disbursement = ChurchDisbursement.objects.create(
+            batch=batch,
+            church=self.church,
+            transaction_count=0,
+            amount=Decimal('1000.00'),
+            platform_fee=Decimal('30.00'),
+            status='processing',
+            transfer_reference=f"stl-{status}-{self.church.id}-0",
+            processed_at=self.now - processed_ago,
+        )
+        return batch, disbursement
+
+    def test_stale_processing_transfers_are_reconciled_whatever_the_batch_status(self):
+        stuck, _ = self._batch('pending', processed_ago=settlement.VERIFY_AFTER + timedelta(minutes=1))
+        recent, _ = self._batch('completed', processed_ago=timedelta(minutes=1))
+        PaymentBatch.objects.filter(pk=recent.pk).update(reconciled_at=self.now)
+
+        batches = list(settlement.batches_to_reconcile(now=self.now))
+
+        self.assertEqual(batches, [stuck])
+
+    def test_transfer_unknown_to_paystack_is_due_again_with_the_same_reference(self):
+        batch, disbursement = self._batch('processing', processed_ago=settlement.VERIFY_AFTER + timedelta(minutes=1))
+        reference = disbursement.transfer_reference
+
+        with mock.patch.object(paystack_transfer_service, 'verify_transfer',
+                               return_value={'success': False, 'not_found': True}):
+            settlement.reconcile_batch(batch)
+
+        disbursement.refresh_from_db()
+        self.assertEqual(disbursement.status, 'pending_retry')
+        self.assertEqual(disbursement.retry_count, 0)
+        self.assertLessEqual(disbursement.next_retry_at, timezone.now())
+        self.assertIn(batch, settlement.batches_due_for_submission())
+        self.assertEqual(settlement._transfer_reference(batch, disbursement), reference)
+
+
+class SettlementSubmissionTests(TestCase):
+    """Only transfers Paystack declined are retried with a new reference."""
+
+    def setUp(self):
+        self.church = Church.objects.create(
+            name='Hope Church',
+            church_code='HOPE01',
+            phone_number='0700000000',
+            email='hope@example.com',
+            address_line1='Thika Road',
+            city='Nairobi',
+            county='Nairobi',
+            senior_pastor_name='Pastor',
+            senior_pastor_phone='0700000000',
+        )
+        self.batch = PaymentBatch.objects.create(batch_id='STL-SUBMIT')
+        self.disbursement = ChurchDisbursement.objects.create(
+            batch=self.batch,
+            church=self.church,
+            transaction_count=0,
+            amount=Decimal('1000.00'),
+            platform_fee=Decimal('30.00'),
+        )
+
+    def _submit(self, **post):
+        with mock.patch.object(settlement, 'recipient_codes', return_value={self.church.id: 'RCP_hope'}), \
+                mock.patch.object(paystack_transfer_service.http, 'post', **post):
+            settlement.submit_batch(self.batch)
+        self.disbursement.refresh_from_db()
+
+    def test_timed_out_transfers_stay_processing_with_their_reference(self):
+        self._submit(side_effect=requests.exceptions.Timeout('read timed out'))
+
+        self.assertEqual(self.disbursement.status, 'processing')
+        self.assertEqual(self.disbursement.retry_count, 0)
+        self.assertEqual(self.disbursement.transfer_reference, f"stl-submit-{self.church.id}-0")
+        self.assertNotIn(self.batch, settlement.batches_due_for_submission())
+
+    def test_declined_transfers_are_scheduled_for_retry(self):
+        declined = mock.Mock(status_code=400)
+        declined.json.return_value = {'status': False, 'message': 'Insufficient balance'}
+        self._submit(return_value=declined)
+
+        self.assertEqual(self.disbursement.status, 'pending_retry')
+        self.assertEqual(self.disbursement.retry_count, 1)
+        self.assertEqual(self.disbursement.error_message, 'Insufficient balance')
+
+
+class BankResolutionTests(TestCase):
+    """Names church admins type resolve to the right Paystack bank."""
+
+    DIRECTORY = (
+        ('Kenya Commercial Bank', 'kcb-bank-kenya', '01'),
+        ('Diamond Trust Bank Kenya Ltd', 'diamond-trust-bank-kenya', '63'),
+        ('Co-operative Bank of Kenya', 'co-operative-bank-of-kenya', '11'),
+        ('Absa Bank Kenya Plc', 'absa-bank-kenya', '03'),
+        ('Standard Chartered Bank Kenya Ltd', 'standard-chartered-bank-kenya', '02'),
+        ('Equity Bank Kenya Limited', 'equity-bank-kenya', '68'),
+        ('NCBA Bank Kenya PLC', 'ncba-bank-kenya', '07'),
+        ('Consolidated Bank of Kenya', 'consolidated-bank-of-kenya', '23'),
+        ('Family Bank', 'family-bank', '70'),
+    )
+
+    def setUp(self):
+        for paystack_id, (name, slug, code) in enumerate(self.DIRECTORY, start=1):
+            PaystackBank.objects.create(paystack_id=paystack_id, country='kenya', name=name, slug=slug, code=code)
+        banks._directories.clear()
+
+    def tearDown(self):
+        banks._directories.clear()
+
+    def test_common_names_and_acronyms(self):
+        expected = {
+            'KCB': '01',
+            'Kenya Commercial Bank': '01',
+            'DTB': '63',
+            'Diamond Trust Bank': '63',
+            'Co-op Bank': '11',
+            'Cooperative Bank': '11',
+            'Barclays': '03',
+            'Barclays Bank': '03',
+            'StanChart': '02',
+            'Standard Chartered': '02',
+        }
+        for name, code in expected.items():
+            with self.subTest(name=name):
+                self.assertEqual(banks.resolve_bank_code(name, 'kenya'), code)
+
+    def test_unknown_and_generic_names_do_not_resolve(self):
+        for name in ('Bank', 'Kenya Bank Ltd', 'Imaginary Savings'):
+            with self.subTest(name=name):
+                self.assertIsNone(banks.resolve_bank(name, 'kenya'))
@@ -0,0 +1,210 @@
+"""
+Incremental local mirror of Paystack transactions.
+
+``sync_transactions`` pages through ``GET /transaction`` for the window
+between the last synced time (the high-water mark, less an overlap for late
+status changes) and now, and upserts every page into ``PaystackTransaction``
+with one bulk statement. Progress is kept in ``ProviderSyncState``: the
+window and the next page are saved after each stored page, so a run that
+fails (or reaches its page budget) resumes where it stopped, and the
+high-water mark only moves once the whole window is stored. Charge webhooks
+and API verifications write through to the mirror as well.
+
+Lookups read the mirror first: a transaction in a final state is served
+locally, anything else is verified with Paystack (and stored).
+
+Usage:
+    from payments.transaction_sync import sync_transactions, local_transaction
+
+    sync_transactions()                       # from the periodic task
+    transaction = local_transaction(reference)
+"""
+from datetime import timedelta
+from decimal import Decimal
+import logging
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import PaystackTransaction, ProviderSyncState
+
+logger = logging.getLogger('altar_funds')
+
+SYNC_NAME = 'paystack_transactions'
+PAGE_SIZE = 100
+MAX_PAGES_PER_RUN = 50
+LEASE = timedelta(minutes=5)          # how long a run may hold the sync without progress
+# Statuses Paystack no longer changes (short of a refund or chargeback)
+FINAL_STATUSES = ('success', 'failed', 'reversed')
+
+
+def backfill_days():
+    return getattr(settings, 'PAYSTACK_SYNC_BACKFILL_DAYS', 30)
+
+
+def overlap():
+    return timedelta(minutes=getattr(settings, 'PAYSTACK_SYNC_OVERLAP_MINUTES', 60))
+
+
+def _datetime(value):
+    if not value:
+        return None
+    try:
+        return parse_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _major(amount):
+    return (Decimal(amount) / 100).quantize(Decimal('0.01')) if amount is not None else None
+
+
+def _mirror_row(data):
+    customer = data.get('customer') or {}
+    return PaystackTransaction(
+        paystack_id=data['id'],
+        reference=(data.get('reference') or '')[:100],
+        status=(data.get('status') or '')[:20],
+        amount=_major(data.get('amount') or 0),
+        fees=_major(data.get('fees')),
+        currency=(data.get('currency') or '')[:10],
+        channel=(data.get('channel') or '')[:30],
+        customer_email=(customer.get('email') or '')[:254],
+        transaction_date=_datetime(data.get('createdAt') or data.get('created_at')),
+        paid_at=_datetime(data.get('paid_at') or data.get('paidAt')),
+        data=data,
+        synced_at=timezone.now(),
+    )
+
+
+def store_transactions(rows):
+    """Upsert Paystack transaction objects into the mirror; returns the number stored."""
+    transactions = {}
+    for data in rows:
+        if data.get('id') and data.get('reference'):
+            transactions[data['id']] = _mirror_row(data)
+    PaystackTransaction.objects.bulk_create(
+        list(transactions.values()),
+        update_conflicts=True,
+        unique_fields=['paystack_id'],
+        update_fields=[
+            'reference', 'status', 'amount', 'fees', 'currency', 'channel',
+            'customer_email', 'transaction_date', 'paid_at', 'data', 'synced_at',
+        ],
+        batch_size=500,
+    )
+    return len(transactions)
+
+
+def record_transaction(data):
+    """Write one transaction object through to the mirror (best effort)."""
+    try:
+        store_transactions([data])
+    except Exception as e:
+        logger.warning(f"Could not mirror Paystack transaction {data.get('reference')}: {str(e)}")
+
+
+def local_transaction(reference, final_only=True):
+    """The mirrored transaction for ``reference`` (only in a final state by default), or None."""
+    transactions = PaystackTransaction.objects.filter(reference=reference)
+    if final_only:
+        transactions = transactions.filter(status__in=FINAL_STATUSES)
+    return transactions.order_by('-transaction_date').first()
+
+
+def sync_state():
+    state, _ = ProviderSyncState.objects.get_or_create(name=SYNC_NAME)
+    return state
+
+
+def _claim():
+    """The sync state, leased to this run; None while another run holds it."""
+    state = sync_state()
+    now = timezone.now()
+    claimed = ProviderSyncState.objects.filter(pk=state.pk).filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+    ).update(locked_until=now + LEASE)
+    if not claimed:
+        return None
+    state.refresh_from_db()
+    return state
+
+
+def sync_transactions(max_pages=None):
+    """
+    Mirror Paystack transactions created since the high-water mark.
+
+    Fetches at most ``max_pages`` pages; an unfinished window is continued by
+    the next run. Returns the number of transactions stored and whether the
+    mirror is caught up.
+    """
+    from .paystack_service import paystack_service as service
+
+    state = _claim()
+    if state is None:
+        logger.info("Paystack transaction sync already running")
+        return {'success': False, 'message': 'Sync already running'}
+
+    max_pages = max_pages or MAX_PAGES_PER_RUN
+    started = timezone.now()
+    stored = pages = 0
+    try:
+        if state.window_end is None:
+            start = (
+                state.high_water_mark - overlap() if state.high_water_mark
+                else started - timedelta(days=backfill_days())
+            )
+            state.window_start, state.window_end, state.next_page = start, started, 1
+            state.save(update_fields=['window_start', 'window_end', 'next_page'])
+
+        while pages < max_pages:
+            result = service.list_transactions(
+                per_page=PAGE_SIZE,
+                page=state.next_page,
+                from_date=state.window_start,
+                to_date=state.window_end,
+            )
+            if not result['success']:
+                raise ValueError(result['message'])
+            rows = result['data'] or []
+            stored += store_transactions(rows)
+            pages += 1
+
+            page_count = (result['meta'] or {}).get('pageCount')
+            if not rows or (page_count is not None and state.next_page >= int(page_count)) or (
+                page_count is None and len(rows) < PAGE_SIZE
+            ):
+                # Window complete: everything up to its end is mirrored
+                state.high_water_mark = state.window_end
+                state.window_start = state.window_end = None
+                state.next_page = 1
+                state.last_success_at = timezone.now()
+                break
+
+            state.next_page += 1
+            state.locked_until = timezone.now() + LEASE
+            state.save(update_fields=['next_page', 'locked_until'])
+        state.last_error = ''
+
+    except Exception as e:
+        state.last_error = str(e)
+        logger.error(f"Paystack transaction sync failed on page {state.next_page}: {str(e)}")
+
+    finally:
+        state.records_synced += stored
+        state.last_run_at = started
+        state.locked_until = None
+        state.save()
+
+    caught_up = state.window_end is None
+    logger.info(f"Paystack transaction sync stored {stored} transactions from {pages} pages")
+    return {
+        'success': not state.last_error,
+        'stored': stored,
+        'pages': pages,
+        'caught_up': caught_up,
+        'high_water_mark': state.high_water_mark,
+        'next_page': None if caught_up else state.next_page,
+    }
@@ -15,6 +15,8 @@ from .views import (
     verify_bank_account,
     list_banks,
     get_disbursement_status,
+    provider_http_metrics,
+    upload_settlement_statement,
 )
 
 app_name = 'payments'
@@ -45,4 +47,10 @@ urlpatterns = [
     path('list-banks/',                 list_banks,                 name='list-banks'),
     # Check disbursement status for a giving transaction
     path('disbursement/<str:transaction_id>/', get_disbursement_status, name='disbursement-status'),
+
+    # ── Outbound provider call metrics (system admins) ─────────────────────
+    path('provider-metrics/',           provider_http_metrics,      name='provider-http-metrics'),
+
+    # ── Provider statement import and reconciliation (system admins) ──────
+    path('statements/',                 upload_settlement_statement, name='upload-settlement-statement'),
 ]
@@ -12,7 +12,9 @@ from .serializers import (
     PaystackAccountSerializer, ChurchAccountListSerializer
 )
 from .paystack_service import paystack_service, paystack_transfer_service
+from .webhooks import paystack_event_fields, store_event
 from common.permissions import CanViewPayments, IsChurchAdmin, IsSystemAdmin
+from common.idempotency import idempotent
 import json
 import uuid
 import logging
@@ -143,11 +145,10 @@ class PaymentViewSet(viewsets.ModelViewSet):
 
                 # ── Update Payment record ─────────────────────────────────
                 try:
-                    payment = Payment.objects.get(reference=reference)
+                    payment = Payment.objects.get(transaction_reference=reference)
                     if paystack_status == 'success':
                         payment.status = 'completed'
-                        payment.paid_at = timezone.now()
-                        payment.transaction_id = result.get('reference')
+                        payment.processed_at = timezone.now()
                         payment.save()
                 except Payment.DoesNotExist:
                     pass  # not every flow creates a Payment row
@@ -193,7 +194,12 @@ class TransactionViewSet(viewsets.ModelViewSet):
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def paystack_webhook(request):
-    """Handle Paystack webhook events"""
+    """
+    Handle Paystack webhook events
+    
+    The event is verified and stored in the webhook inbox; processing
+    happens asynchronously (see payments.webhooks).
+    """
     try:
         # Get webhook signature
         signature = request.headers.get('X-Paystack-Signature')
@@ -213,41 +219,21 @@ def paystack_webhook(request):
                 'message': 'Invalid signature'
             }, status=status.HTTP_401_UNAUTHORIZED)
         
-        # Parse webhook data
-        data = json.loads(payload)
-        event_type = data.get('event')
-        event_data = data.get('data', {})
-
-        logger.info(f"Paystack webhook received: {event_type}")
-
-        # ── Route event to the correct handler ──────────────────────────
-        if event_type == 'charge.success':
-            # 1. Mark the payment as complete (existing logic)
-            result = paystack_service.process_webhook(event_type, event_data)
-
-            # 2. Initiate disbursement to church via Paystack Transfer
-            reference = event_data.get('reference', '')
-            _trigger_disbursement_for_charge(reference, event_data)
-
-        elif event_type in ('transfer.success',):
-            result = paystack_transfer_service.handle_transfer_success(event_data)
-
-        elif event_type in ('transfer.failed', 'transfer.reversed'):
-            result = paystack_transfer_service.handle_transfer_failed(event_data)
-
-        else:
-            result = paystack_service.process_webhook(event_type, event_data)
-
-        return Response(result, status=status.HTTP_200_OK)
+        event_type, event_key, reference, data = paystack_event_fields('paystack', payload)
+        store_event('paystack', 'paystack', event_type, event_key, reference, data)
+        
+        logger.info(f"Paystack webhook received: {event_type} {reference}")
+        return Response({'success': True, 'message': 'Event received'}, status=status.HTTP_200_OK)
         
-    except json.JSONDecodeError:
+    except ValueError:
+        # json.JSONDecodeError is a ValueError
         logger.error("Invalid JSON in webhook payload")
         return Response({
             'success': False,
             'message': 'Invalid JSON'
         }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
-        logger.error(f"Webhook processing error: {str(e)}")
+        logger.error(f"Webhook storage error: {str(e)}")
         return Response({
             'success': False,
             'message': 'Webhook processing failed'
@@ -416,6 +402,7 @@ def create_paystack_account(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent(key_prefix='initiate_giving_with_account')
 def initiate_giving_with_account(request):
     """Initiate giving with Paystack account selection"""
     user = request.user
@@ -514,72 +501,6 @@ def initiate_giving_with_account(request):
         )
 
 
-# ════════════════════════════════════════════════════════════════════════════
-#  INTERNAL HELPER
-# ════════════════════════════════════════════════════════════════════════════
-
-def _trigger_disbursement_for_charge(reference, event_data):
-    """
-    After a successful Paystack charge, find the related GivingTransaction
-    and initiate a Transfer to the church's bank account.
-
-    Called inside the webhook view — runs synchronously.
-    For high-volume production systems consider offloading to a Celery task.
-    """
-    try:
-        # Find giving transaction by payment reference
-        from giving.models import GivingTransaction
-
-        giving_tx = (
-            GivingTransaction.objects
-            .select_related('church', 'category', 'member__user')
-            .filter(payment_reference=reference)
-            .first()
-        )
-
-        if not giving_tx:
-            # Try looking up via the Payment model
-            try:
-                payment = Payment.objects.get(reference=reference)
-                # Check if there's a giving transaction linked via metadata
-                metadata = event_data.get('metadata', {})
-                church_id = metadata.get('church_id')
-                if church_id:
-                    giving_tx = (
-                        GivingTransaction.objects
-                        .select_related('church', 'category', 'member__user')
-                        .filter(
-                            church_id=church_id,
-                            status='completed',
-                            disbursement_status='pending'
-                        )
-                        .order_by('-transaction_date')
-                        .first()
-                    )
-            except Payment.DoesNotExist:
-                pass
-
-        if not giving_tx:
-            logger.warning(
-                f"No GivingTransaction found for charge reference '{reference}' — "
-                "disbursement skipped."
-            )
-            return
-
-        # Skip if already disbursed
-        if giving_tx.disbursement_status == 'completed':
-            return
-
-        success, msg = paystack_transfer_service.initiate_transfer(giving_tx)
-        if success:
-            logger.info(f"Disbursement initiated for {reference}: {msg}")
-        else:
-            logger.error(f"Disbursement failed for {reference}: {msg}")
-
-    except Exception as e:
-        logger.error(f"_trigger_disbursement_for_charge error ({reference}): {e}")
-
-
 # ════════════════════════════════════════════════════════════════════════════
 #  ADMIN: TRANSFER RECIPIENT MANAGEMENT
 # ════════════════════════════════════════════════════════════════════════════
@@ -664,7 +585,9 @@ def verify_bank_account(request):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    result = paystack_transfer_service.verify_bank_account(account_number, bank_code)
+    from .banks import verify_account
+
+    result = verify_account(account_number, bank_code)
     if result['success']:
         return Response({'success': True, 'data': result})
     return Response({'success': False, 'message': result['message']}, status=status.HTTP_400_BAD_REQUEST)
@@ -677,9 +600,9 @@ def list_banks(request):
     Return Paystack's list of supported banks and their codes.
 
     Query param:
-        country=nigeria  (default)  or  country=kenya
+        country=kenya  (default: settings.PAYSTACK_COUNTRY)  or  country=nigeria
     """
-    country = request.query_params.get('country', 'nigeria')
+    country = request.query_params.get('country')
     result  = paystack_transfer_service.list_banks(country)
     if result['success']:
         return Response({'success': True, 'banks': result['banks']})
@@ -733,3 +656,77 @@ def get_disbursement_status(request, transaction_id):
                 'message':  'Disbursement record not yet created',
             },
         })
+
+
+@api_view(['GET'])
+@permission_classes([IsSystemAdmin])
+def provider_http_metrics(request):
+    """
+    GET /api/payments/provider-metrics/
+
+    Request count, error rate and latency of outbound calls per payment
+    provider (Paystack, M-Pesa), aggregated across all processes.
+    """
+    from common.http import provider_metrics
+
+    try:
+        providers = request.query_params.getlist('provider') or ['paystack', 'mpesa']
+        return Response({
+            'success': True,
+            'data': provider_metrics(providers)
+        })
+    except Exception as e:
+        logger.error(f"Error reading provider HTTP metrics: {str(e)}")
+        return Response({
+            'success': False,
+            'message': 'Failed to read provider metrics'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsSystemAdmin])
+def upload_settlement_statement(request):
+    """
+    POST /api/payments/statements/  (multipart)
+
+    Import a Paystack settlement export or M-Pesa statement (CSV) and match
+    its lines with completed payments.
+
+    Form fields:
+        provider  "paystack" or "mpesa"
+        file      the CSV export
+    """
+    from .reconciliation import StatementImportError, import_statement, reconcile
+
+    provider = request.data.get('provider')
+    upload = request.FILES.get('file')
+    if provider not in ('paystack', 'mpesa') or not upload:
+        return Response({
+            'success': False,
+            'message': 'provider (paystack or mpesa) and file are required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        statement = import_statement(provider, upload, request.user)
+        result = reconcile(statements=[statement], user=request.user)
+        return Response({
+            'success': True,
+            'data': {
+                'statement_id': statement.id,
+                'lines': statement.line_count,
+                'duplicates': statement.summary.get('duplicates', 0),
+                'reconciliation': result,
+            }
+        }, status=status.HTTP_201_CREATED)
+    except StatementImportError as e:
+        return Response({
+            'success': False,
+            'message': str(e),
+            'errors': e.errors[:100]
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error importing settlement statement: {str(e)}")
+        return Response({
+            'success': False,
+            'message': 'Failed to import statement'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
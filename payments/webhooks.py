@@ -0,0 +1,417 @@
+"""
+Durable inbox for Paystack webhooks and M-Pesa callbacks.
+
+Webhook views only authenticate the request, ``store_event`` the raw
+payload and return 200. Processing (completing transactions, queueing
+church disbursements, notifications) happens in Celery:
+
+* ``store_event`` inserts one ``WebhookEvent`` per ``event_key``. Providers
+  retry until they get a 200, so a repeated delivery only bumps
+  ``duplicate_count``.
+* ``drain_webhook_inbox`` (kicked after every stored event and swept every
+  minute) queues ``process_webhook_reference`` for each provider reference
+  with due events.
+* ``process_reference`` claims the reference's due events — its row lock
+  makes sure only one worker handles a reference at a time — and runs them
+  in the order received. A failing event is retried with exponential
+  backoff and holds back later events of the same reference until it
+  succeeds or is moved to the dead letter (``status='dead'``) after
+  ``MAX_ATTEMPTS``. ``requeue_dead_events`` puts dead events back in line.
+
+Each handler runs in its own database transaction, so a failed attempt
+leaves no partial writes behind.
+"""
+from datetime import timedelta
+import hashlib
+import json
+import logging
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Payment, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+LEASE = timedelta(minutes=5)        # how long a claimed reference is reserved for its worker
+MAX_ATTEMPTS = 8
+RETRY_BASE_DELAY = 30               # seconds; doubled per attempt
+RETRY_MAX_DELAY = 3600
+DRAIN_BATCH = 500                   # references queued per drain
+KICK_KEY = 'webhook_inbox_kick'
+KICK_INTERVAL = 1                   # seconds; events within this window share one drain
+RETENTION_DAYS = 30
+
+
+def _body_digest(body):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return hashlib.sha256(body).hexdigest()
+
+
+def paystack_event_fields(source, body):
+    """
+    ``(event_type, event_key, reference, payload)`` of a raw Paystack webhook body.
+
+    Raises ``ValueError`` for bodies that are not a JSON object.
+    """
+    payload = json.loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError('Webhook payload must be a JSON object')
+    event_type = payload.get('event') or ''
+    data = payload.get('data') or {}
+    reference = str(data.get('reference') or data.get('transfer_code') or '')
+    identity = data.get('id') or reference or _body_digest(body)
+    return event_type, f"{source}:{event_type}:{identity}", reference, payload
+
+
+def mpesa_event_fields(source, body):
+    """``(event_type, event_key, reference, payload)`` of a raw M-Pesa callback body."""
+    payload = json.loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError('Callback payload must be a JSON object')
+    result = payload.get('Result') if isinstance(payload.get('Result'), dict) else payload
+    reference = str(result.get('ConversationID') or result.get('OriginatorConversationID') or '')
+    identity = reference or _body_digest(body)
+    return source, f"{source}:{identity}", reference, payload
+
+
+def store_event(provider, source, event_type, event_key, reference, payload):
+    """
+    Save a received event for asynchronous processing.
+
+    Returns ``True`` for a new event and ``False`` for a duplicate delivery.
+    """
+    try:
+        with transaction.atomic():
+            WebhookEvent.objects.create(
+                provider=provider,
+                source=source,
+                event_type=event_type[:100],
+                event_key=event_key[:255],
+                reference=reference[:100],
+                payload=payload,
+            )
+    except IntegrityError:
+        WebhookEvent.objects.filter(event_key=event_key[:255]).update(
+            duplicate_count=F('duplicate_count') + 1
+        )
+        logger.info(f"Duplicate {source} webhook ignored: {event_key}")
+        return False
+
+    transaction.on_commit(kick)
+    return True
+
+
+def kick():
+    """Schedule an inbox drain soon, at most once per ``KICK_INTERVAL``."""
+    try:
+        if cache.add(KICK_KEY, 1, KICK_INTERVAL):
+            from .tasks import drain_webhook_inbox
+            drain_webhook_inbox.delay()
+    except Exception as e:
+        # The periodic sweep picks the event up anyway
+        logger.warning(f"Could not schedule webhook inbox drain: {str(e)}")
+
+
+# ── Handlers ────────────────────────────────────────────────────────────────
+
+def trigger_disbursement_for_charge(reference, event_data):
+    """
+    After a successful Paystack charge, find the related GivingTransaction
+    and queue a Transfer to the church's bank account.
+    """
+    from giving.models import GivingTransaction
+    from .settlement import batching_enabled
+    from .tasks import initiate_church_transfer
+
+    if batching_enabled():
+        # Paid out with the church's next settlement batch
+        return
+
+    try:
+        # Find giving transaction by payment reference
+        giving_tx = (
+            GivingTransaction.objects
+            .select_related('church', 'category', 'member__user')
+            .filter(payment_reference=reference)
+            .first()
+        )
+
+        if not giving_tx:
+            # Try looking up via the Payment model
+            try:
+                Payment.objects.get(transaction_reference=reference)
+                # Check if there's a giving transaction linked via metadata
+                metadata = event_data.get('metadata') or {}
+                church_id = metadata.get('church_id')
+                if church_id:
+                    giving_tx = (
+                        GivingTransaction.objects
+                        .select_related('church', 'category', 'member__user')
+                        .filter(
+                            church_id=church_id,
+                            status='completed',
+                            disbursement_status='pending'
+                        )
+                        .order_by('-transaction_date')
+                        .first()
+                    )
+            except Payment.DoesNotExist:
+                pass
+
+        if not giving_tx:
+            logger.warning(
+                f"No GivingTransaction found for charge reference '{reference}' — "
+                "disbursement skipped."
+            )
+            return
+
+        # Skip if already disbursed
+        if giving_tx.disbursement_status == 'completed':
+            return
+
+        # Queued once the inbox transaction commits: no provider call runs
+        # while the event's row locks are held
+        transaction.on_commit(lambda gift_id=giving_tx.id: initiate_church_transfer.delay(gift_id))
+        logger.info(f"Disbursement queued for {reference}")
+
+    except Exception as e:
+        logger.error(f"trigger_disbursement_for_charge error ({reference}): {e}")
+
+
+def mirror_charge(event):
+    """Keep the local transaction mirror current with charge events."""
+    from .transaction_sync import record_transaction
+
+    data = event.payload.get('data') or {}
+    if event.event_type.startswith('charge.') and data.get('id'):
+        record_transaction(data)
+
+
+def handle_paystack(event):
+    """Events from the payments Paystack webhook."""
+    from .paystack_service import paystack_service, paystack_transfer_service
+
+    event_type = event.event_type
+    event_data = event.payload.get('data') or {}
+    mirror_charge(event)
+
+    if event_type == 'charge.success':
+        # 1. Mark the payment as complete
+        result = paystack_service.process_webhook(event_type, event_data, raise_errors=True)
+
+        # 2. Initiate disbursement to church via Paystack Transfer
+        trigger_disbursement_for_charge(event_data.get('reference', ''), event_data)
+        return result
+
+    if event_type == 'transfer.success':
+        return paystack_transfer_service.handle_transfer_success(event_data)
+
+    if event_type in ('transfer.failed', 'transfer.reversed'):
+        return paystack_transfer_service.handle_transfer_failed(event_data)
+
+    return paystack_service.process_webhook(event_type, event_data, raise_errors=True)
+
+
+def handle_giving_paystack(event):
+    """Events from the giving Paystack webhook."""
+    from giving.models import GivingTransaction
+    from giving.paystack_service import PaystackService
+
+    data = event.payload.get('data') or {}
+    reference = data.get('reference')
+    mirror_charge(event)
+
+    if event.event_type == 'charge.success':
+        giving = GivingTransaction.objects.select_related(
+            'member__user', 'church', 'category'
+        ).filter(payment_reference=reference, status='pending').first()
+        if not giving:
+            logger.warning(f"Transaction not found for webhook reference: {reference}")
+            return {'success': False, 'message': 'Transaction not found'}
+
+        result = PaystackService.process_payment(
+            transaction_id=reference,
+            user=giving.member.user,
+            church=giving.church,
+            category=giving.category,
+            amount=float(data.get('amount')) / 100,
+            metadata=data.get('metadata')
+        )
+        if not result['success']:
+            raise RuntimeError(f"Failed to process payment {reference}: {result['error']}")
+        logger.info(f"Webhook processed payment {reference} successfully")
+        return {'success': True, 'message': 'Payment processed'}
+
+    if event.event_type == 'charge.failed':
+        giving = GivingTransaction.objects.filter(payment_reference=reference, status='pending').first()
+        if not giving:
+            logger.warning(f"Transaction not found for webhook reference: {reference}")
+            return {'success': False, 'message': 'Transaction not found'}
+
+        giving.status = 'failed'
+        giving.notes = f"Payment failed: {data.get('gateway_response', 'Unknown error')}"
+        giving.save()
+        logger.info(f"Webhook marked payment {reference} as failed")
+        return {'success': True, 'message': 'Failed payment processed'}
+
+    return {'success': True, 'message': 'Event acknowledged'}
+
+
+def handle_mpesa_result(event):
+    """M-Pesa disbursement result callback."""
+    from giving.paystack_disbursement import PaystackDisbursementService
+
+    PaystackDisbursementService.handle_transfer_webhook(event.payload)
+    return {'success': True, 'message': 'Result processed'}
+
+
+def handle_mpesa_timeout(event):
+    """M-Pesa disbursement timeout: mark the disbursement failed so it is retried."""
+    from giving.models import ChurchDisbursement
+
+    if not event.reference:
+        return {'success': False, 'message': 'No ConversationID'}
+
+    disbursement = ChurchDisbursement.objects.filter(conversation_id=event.reference).first()
+    if not disbursement:
+        logger.error(f"No disbursement found for timeout conversation ID: {event.reference}")
+        return {'success': False, 'message': 'Disbursement not found'}
+
+    disbursement.mark_failed("Transaction timeout")
+    logger.info(f"Marked disbursement {disbursement.id} for retry due to timeout")
+    return {'success': True, 'message': 'Timeout processed'}
+
+
+HANDLERS = {
+    'paystack': handle_paystack,
+    'giving_paystack': handle_giving_paystack,
+    'mpesa_result': handle_mpesa_result,
+    'mpesa_timeout': handle_mpesa_timeout,
+}
+
+
+# ── Processing ──────────────────────────────────────────────────────────────
+
+def _retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), RETRY_MAX_DELAY))
+
+
+def _due(now):
+    return Q(status='pending', available_at__lte=now) | Q(status='processing', locked_until__lt=now)
+
+
+def due_references(limit=DRAIN_BATCH):
+    """``(provider, reference)`` pairs with due events, oldest first."""
+    references = []
+    seen = set()
+    rows = WebhookEvent.objects.filter(_due(timezone.now())).order_by('id').values_list('provider', 'reference')
+    for pair in rows.iterator():
+        if pair not in seen:
+            seen.add(pair)
+            references.append(pair)
+            if len(references) >= limit:
+                break
+    return references
+
+
+def claim_reference(provider, reference):
+    """
+    Reserve the leading due events of one reference for this worker.
+
+    Returns an empty list if another worker holds the reference or its
+    oldest unfinished event is waiting for a retry.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            WebhookEvent.objects.filter(
+                provider=provider, reference=reference, status__in=['pending', 'processing']
+            ).select_for_update().order_by('id')
+        )
+        if any(event.status == 'processing' and event.locked_until and event.locked_until >= now for event in events):
+            return []
+
+        claimed = []
+        for event in events:
+            if event.status == 'pending' and event.available_at > now:
+                break
+            claimed.append(event)
+        for event in claimed:
+            event.status = 'processing'
+            event.locked_until = now + LEASE
+        WebhookEvent.objects.bulk_update(claimed, ['status', 'locked_until'])
+    return claimed
+
+
+def process_event(event):
+    """Run one claimed event's handler; returns ``True`` if it succeeded."""
+    handler = HANDLERS.get(event.source)
+    event.attempts += 1
+    try:
+        if handler is None:
+            raise ValueError(f"No handler for webhook source {event.source}")
+        with transaction.atomic():
+            result = handler(event)
+    except Exception as e:
+        event.last_error = str(e)
+        event.locked_until = None
+        if event.attempts >= MAX_ATTEMPTS:
+            event.status = 'dead'
+            logger.error(f"Webhook event {event.event_key} moved to dead letter: {str(e)}")
+        else:
+            event.status = 'pending'
+            event.available_at = timezone.now() + _retry_delay(event.attempts)
+            logger.warning(f"Webhook event {event.event_key} failed (attempt {event.attempts}): {str(e)}")
+        event.save(update_fields=['status', 'attempts', 'available_at', 'locked_until', 'last_error'])
+        return False
+
+    event.status = 'processed'
+    event.processed_at = timezone.now()
+    event.locked_until = None
+    event.result = result if isinstance(result, dict) else None
+    event.last_error = ''
+    event.save(update_fields=['status', 'attempts', 'processed_at', 'locked_until', 'result', 'last_error'])
+    return True
+
+
+def process_reference(provider, reference):
+    """
+    Process the due events of one reference in order.
+
+    Stops at the first event that will be retried, releasing the later ones
+    so they wait for it. Returns the number of events processed.
+    """
+    events = claim_reference(provider, reference)
+    processed = 0
+    for index, event in enumerate(events):
+        if process_event(event) or event.status == 'dead':
+            processed += 1
+            continue
+        # Keep later events of this reference behind the failed one
+        WebhookEvent.objects.filter(id__in=[later.id for later in events[index + 1:]]).update(
+            status='pending', locked_until=None
+        )
+        break
+    return processed
+
+
+def requeue_dead_events(queryset=None):
+    """Move dead-lettered events back into the inbox; returns the number requeued."""
+    queryset = WebhookEvent.objects.all() if queryset is None else queryset
+    count = queryset.filter(status='dead').update(
+        status='pending', attempts=0, available_at=timezone.now(), last_error=''
+    )
+    if count:
+        transaction.on_commit(kick)
+    return count
+
+
+def purge(days=RETENTION_DAYS):
+    """Delete processed events older than ``days``; returns the number deleted."""
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = WebhookEvent.objects.filter(status='processed', processed_at__lt=cutoff).delete()
+    return deleted
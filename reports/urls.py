@@ -4,7 +4,8 @@ from .views import (
     giving_trends,
     member_statistics,
     church_performance,
-    system_overview
+    system_overview,
+    cache_statistics
 )
 
 app_name = 'altarfunds_reports'
@@ -15,4 +16,5 @@ urlpatterns = [
     path('member-statistics/', member_statistics, name='member_statistics'),
     path('church-performance/', church_performance, name='church_performance'),
     path('system-overview/', system_overview, name='system_overview'),
+    path('cache-stats/', cache_statistics, name='cache_statistics'),
 ]
@@ -8,18 +8,39 @@ from datetime import datetime, timedelta
 from decimal import Decimal
 
 from giving.models import GivingTransaction
+from giving.rollups import completed_giving, total_given, totals_by, local_day
 from expenses.models import Expense
 from budgets.models import Budget
 from churches.models import Church
 from accounts.models import Member
 from common.permissions import IsChurchAdmin, IsSystemAdmin
+from common.cache import cache_response, cache_stats
+from common.timeseries import bucketed_totals, financial_year_range
 import logging
 
 logger = logging.getLogger(__name__)
 
+CHURCH_ADMIN_ROLES = ['pastor', 'treasurer', 'auditor', 'system_admin']
+
+
+def _member_scoped(request):
+    """Members see only their own giving in some reports, so their cache entries are per user"""
+    return request.user.role not in CHURCH_ADMIN_ROLES
+
+
+# ``period`` query parameter → common.timeseries granularity
+PERIOD_GRANULARITIES = {
+    'daily': 'day',
+    'weekly': 'week',
+    'monthly': 'month',
+    'quarterly': 'quarter',
+    'yearly': 'year',
+}
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response(timeout=300, key_prefix='report_financial_summary')
 def financial_summary(request):
     """Get financial summary for dashboard"""
     try:
@@ -46,24 +67,20 @@ def financial_summary(request):
         expense_date_filter = Q()
         
         if start_date:
-            giving_date_filter &= Q(transaction_date__gte=start_date)
+            giving_date_filter &= Q(day__gte=local_day(start_date))
             expense_date_filter &= Q(date__gte=start_date)
         if end_date:
-            giving_date_filter &= Q(transaction_date__lte=end_date)
+            giving_date_filter &= Q(day__lte=local_day(end_date))
             expense_date_filter &= Q(date__lte=end_date)
         else:
             # Default to current month
-            start_of_month = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            giving_date_filter &= Q(transaction_date__gte=start_of_month)
+            start_of_month = timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            giving_date_filter &= Q(day__gte=start_of_month.date())
             expense_date_filter &= Q(date__gte=start_of_month)
         
-        # Calculate income (givings)
-        givings = GivingTransaction.objects.filter(
-            church_filter,
-            giving_date_filter,
-            status='completed'
-        )
-        total_income = givings.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        # Calculate income (completed givings) from the daily rollups
+        givings = completed_giving(church_filter).filter(giving_date_filter)
+        total_income = total_given(givings)
         
         # Calculate expenses
         expenses = Expense.objects.filter(
@@ -90,10 +107,7 @@ def financial_summary(request):
         budget_utilization = (float(budget_spent) / float(total_budget) * 100) if total_budget > 0 else 0
         
         # Income by category
-        income_by_category = givings.values('category__name').annotate(
-            total=Sum('amount'),
-            count=Count('id')
-        )
+        income_by_category = totals_by(givings, 'category__name')
         
         # Expenses by category
         expenses_by_category = expenses.values('category__name').annotate(
@@ -129,6 +143,7 @@ def financial_summary(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response(timeout=300, key_prefix='report_giving_trends', per_user=_member_scoped)
 def giving_trends(request):
     """Get giving trends analysis"""
     try:
@@ -136,7 +151,7 @@ def giving_trends(request):
         
         # Get query parameters
         church_id = request.query_params.get('church_id')
-        period = request.query_params.get('period', 'monthly')  # monthly, quarterly, yearly
+        period = request.query_params.get('period', 'monthly')  # daily, weekly, monthly, quarterly, yearly
         
         # Determine church filter
         if user.role == 'system_admin':
@@ -146,46 +161,45 @@ def giving_trends(request):
         else:
             church_filter = Q(member__user=user)
         
-        # Get current year data
-        current_year = timezone.now().year
+        # Current financial year (FINANCIAL_YEAR_START_MONTH)
+        year_start, year_end = financial_year_range()
+        current_year = year_start.year
         givings = GivingTransaction.objects.filter(
             church_filter,
-            transaction_date__year=current_year,
+            transaction_date__date__gte=year_start,
+            transaction_date__date__lte=year_end,
             status='completed'
         )
         
-        # Calculate trends based on period
+        # Church-wide figures come from the daily rollups; a member's own
+        # giving is not rolled up, so it is read from the ledger.
+        if user.role in ['pastor', 'treasurer', 'auditor', 'system_admin']:
+            source = completed_giving(church_filter, start=year_start, end=year_end)
+            amount_field, count_agg = 'total_amount', Sum('transaction_count')
+        else:
+            source = givings
+            amount_field, count_agg = 'amount', Count('id')
+        
+        # Calculate trends based on period — one grouped query for all buckets
         trends = []
-        if period == 'monthly':
-            for month in range(1, 13):
-                month_givings = givings.filter(transaction_date__month=month)
-                total = month_givings.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-                trends.append({
-                    'period': f"{current_year}-{month:02d}",
-                    'total': float(total),
-                    'count': month_givings.count()
-                })
-        elif period == 'quarterly':
-            for quarter in range(1, 5):
-                start_month = (quarter - 1) * 3 + 1
-                end_month = quarter * 3
-                quarter_givings = givings.filter(
-                    transaction_date__month__gte=start_month,
-                    transaction_date__month__lte=end_month
-                )
-                total = quarter_givings.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-                trends.append({
-                    'period': f"{current_year}-Q{quarter}",
-                    'total': float(total),
-                    'count': quarter_givings.count()
-                })
+        granularity = PERIOD_GRANULARITIES.get(period)
+        if granularity:
+            trends = [
+                {
+                    'period': bucket['period'],
+                    'total': float(bucket['total']),
+                    'count': bucket['count']
+                }
+                for bucket in bucketed_totals(source, granularity, year_start, year_end)
+            ]
         
         # Giving by type
-        by_type = givings.values('category__name').annotate(
-            total=Sum('amount'),
-            count=Count('id'),
-            avg=Avg('amount')
-        )
+        by_type = list(source.values('category__name').annotate(
+            total=Sum(amount_field),
+            count=count_agg
+        ))
+        for row in by_type:
+            row['avg'] = (row['total'] / row['count']) if row['count'] else Decimal('0.00')
         
         # Top givers (for church admins only)
         top_givers = []
@@ -206,7 +220,7 @@ def giving_trends(request):
             'success': True,
             'data': {
                 'trends': trends,
-                'by_type': list(by_type),
+                'by_type': by_type,
                 'top_givers': top_givers,
                 'period': period,
                 'year': current_year
@@ -319,6 +333,7 @@ def member_statistics(request):
 
 @api_view(['GET'])
 @permission_classes([IsChurchAdmin])
+@cache_response(timeout=300, key_prefix='report_church_performance')
 def church_performance(request):
     """Get church performance metrics (Church Admin only)"""
     try:
@@ -334,28 +349,24 @@ def church_performance(request):
             church = user.church
         
         # Get current month and year
-        current_month = timezone.now().month
-        current_year = timezone.now().year
+        current_month = timezone.localdate().month
+        current_year = timezone.localdate().year
         
         # This month's givings
-        this_month_givings = GivingTransaction.objects.filter(
-            church=church,
-            transaction_date__month=current_month,
-            transaction_date__year=current_year,
-            status='completed'
-        )
-        this_month_total = this_month_givings.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        this_month_total = total_given(completed_giving(
+            Q(church=church),
+            day__month=current_month,
+            day__year=current_year
+        ))
         
         # Last month's givings
         last_month = current_month - 1 if current_month > 1 else 12
         last_month_year = current_year if current_month > 1 else current_year - 1
-        last_month_givings = GivingTransaction.objects.filter(
-            church=church,
-            transaction_date__month=last_month,
-            transaction_date__year=last_month_year,
-            status='completed'
-        )
-        last_month_total = last_month_givings.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        last_month_total = total_given(completed_giving(
+            Q(church=church),
+            day__month=last_month,
+            day__year=last_month_year
+        ))
         
         # Calculate growth
         growth_percentage = 0
@@ -367,16 +378,16 @@ def church_performance(request):
         avg_giving_per_member = (this_month_total / total_members) if total_members > 0 else Decimal('0.00')
         
         # Budget performance
-        budgets = Budget.objects.filter(church=church, isActive=True)
-        total_budget = budgets.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        budget_spent = budgets.aggregate(total=Sum('spent'))['total'] or Decimal('0.00')
+        budgets = Budget.objects.filter(user__church=church)
+        total_budget = budgets.aggregate(total=Sum('allocated_amount'))['total'] or Decimal('0.00')
+        budget_spent = budgets.aggregate(total=Sum('spent_amount'))['total'] or Decimal('0.00')
         budget_remaining = total_budget - budget_spent
         
         # Expenses this month
         this_month_expenses = Expense.objects.filter(
-            church=church,
-            expense_date__month=current_month,
-            expense_date__year=current_year,
+            user__church=church,
+            date__month=current_month,
+            date__year=current_year,
             status='approved'
         )
         expenses_total = this_month_expenses.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
@@ -424,6 +435,7 @@ def church_performance(request):
 
 @api_view(['GET'])
 @permission_classes([IsSystemAdmin])
+@cache_response(timeout=300, key_prefix='report_system_overview', platform_wide=True)
 def system_overview(request):
     """Get system-wide overview (Super Admin only)"""
     try:
@@ -436,14 +448,13 @@ def system_overview(request):
         total_members = Member.objects.count()
         
         # Total givings (this month)
-        current_month = timezone.now().month
-        current_year = timezone.now().year
-        this_month_givings = GivingTransaction.objects.filter(
-            transaction_date__month=current_month,
-            transaction_date__year=current_year,
-            status='completed'
+        current_month = timezone.localdate().month
+        current_year = timezone.localdate().year
+        this_month_givings = completed_giving(
+            day__month=current_month,
+            day__year=current_year
         )
-        total_givings = this_month_givings.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        total_givings = total_given(this_month_givings)
         
         # Total expenses (this month)
         this_month_expenses = Expense.objects.filter(
@@ -454,19 +465,12 @@ def system_overview(request):
         total_expenses = this_month_expenses.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
         
         # Top performing churches
-        top_churches = GivingTransaction.objects.filter(
-            transaction_date__month=current_month,
-            transaction_date__year=current_year,
-            status='completed'
-        ).values('church__name').annotate(
-            total=Sum('amount'),
-            count=Count('id')
-        ).order_by('-total')[:10]
+        top_churches = totals_by(this_month_givings, 'church__name')[:10]
         
         # Recent activities
         recent_givings = GivingTransaction.objects.filter(
             status='completed'
-        ).order_by('-transaction_date')[:5]
+        ).select_related('church').order_by('-transaction_date')[:5]
         
         recent_activities = []
         for giving in recent_givings:
@@ -504,3 +508,21 @@ def system_overview(request):
             'success': False,
             'message': 'Failed to fetch system overview'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsSystemAdmin])
+def cache_statistics(request):
+    """Hit/miss counters of the dashboard and report response cache (System Admin only)"""
+    try:
+        return Response({
+            'success': True,
+            'data': cache_stats()
+        }, status=status.HTTP_200_OK)
+        
+    except Exception as e:
+        logger.error(f"Error fetching cache statistics: {str(e)}")
+        return Response({
+            'success': False,
+            'message': 'Failed to fetch cache statistics'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)